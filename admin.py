@@ -12,6 +12,7 @@ from keyboards import (
 )
 from utils import format_price, format_date
 from localization import t
+from state_store import get_state_store
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,7 @@ class AdminHandler:
     def __init__(self, bot, db):
         self.bot = bot
         self.db = db
-        self.admin_states = {}
+        self.admin_states = get_state_store(db).namespace('admin_states')
         self.notification_manager = None
     
     def is_admin(self, telegram_id):
@@ -78,8 +79,8 @@ class AdminHandler:
                     COUNT(*) as orders_today,
                     COALESCE(SUM(total_amount), 0) as revenue_today,
                     COUNT(DISTINCT user_id) as customers_today
-                FROM orders 
-                WHERE DATE(created_at) = %s
+                FROM public.orders 
+                WHERE created_at::date = %s
             ''', (today,))
             
             if stats:
@@ -106,8 +107,8 @@ class AdminHandler:
             # Получаем последние заказы
             recent_orders = self.db.execute_query('''
                 SELECT o.id, o.total_amount, o.status, o.created_at, u.name
-                FROM orders o
-                JOIN users u ON o.user_id = u.id
+                FROM public.orders o
+                JOIN public.users u ON o.user_id = u.id
                 ORDER BY o.created_at DESC
                 LIMIT 10
             ''')
@@ -135,8 +136,8 @@ class AdminHandler:
     def show_products_management(self, chat_id):
         """Управление товарами"""
         try:
-            products_count = self.db.execute_query('SELECT COUNT(*) FROM products WHERE is_active = true')[0][0]
-            low_stock = self.db.execute_query('SELECT COUNT(*) FROM products WHERE stock <= 5 AND is_active = true')[0][0]
+            products_count = self.db.execute_query('SELECT COUNT(*) FROM public.products WHERE is_active = true')[0][0]
+            low_stock = self.db.execute_query('SELECT COUNT(*) FROM public.products WHERE stock <= 5 AND is_active = true')[0][0]
             
             products_text = f"🛠 <b>Управление товарами</b>\n\n"
             products_text += f"📦 Активных товаров: {products_count}\n"
@@ -160,10 +161,10 @@ class AdminHandler:
                     COUNT(*) as total_users,
                     COUNT(CASE WHEN created_at >= (NOW() - INTERVAL '7 day') THEN 1 END) as new_users,
                     COUNT(CASE WHEN id IN (
-                        SELECT DISTINCT user_id FROM orders 
+                        SELECT DISTINCT user_id FROM public.orders 
                         WHERE created_at >= (NOW() - INTERVAL '30 day')
                     ) THEN 1 END) as active_users
-                FROM users 
+                FROM public.users 
                 WHERE is_admin = false
             ''')[0]
             
@@ -195,7 +196,7 @@ class AdminHandler:
                     COUNT(*) as total_logs,
                     COUNT(CASE WHEN severity = 'high' THEN 1 END) as high_severity,
                     COUNT(CASE WHEN created_at >= (NOW() - INTERVAL '1 day') THEN 1 END) as today_events
-                FROM security_logs
+                FROM public.security_logs
             ''')
             
             if security_stats:
@@ -224,7 +225,7 @@ class AdminHandler:
                     COUNT(*) as orders_count,
                     SUM(total_amount) as total_revenue,
                     AVG(total_amount) as avg_order
-                FROM orders 
+                FROM public.orders 
                 WHERE created_at >= (NOW() - INTERVAL '30 day')
                 AND status != 'cancelled'
             ''')[0]
@@ -252,7 +253,7 @@ class AdminHandler:
                     SUM(stock) as total_units,
                     COUNT(CASE WHEN stock = 0 THEN 1 END) as out_of_stock,
                     COUNT(CASE WHEN stock <= 5 THEN 1 END) as low_stock
-                FROM products
+                FROM public.products
                 WHERE is_active = true
             ''')[0]
             
@@ -415,7 +416,7 @@ class AdminHandler:
                     SUM(total_amount) as revenue,
                     AVG(total_amount) as avg_order,
                     COUNT(DISTINCT user_id) as customers
-                FROM orders 
+                FROM public.orders 
                 WHERE created_at >= %s AND status != 'cancelled'
             ''', (date_filter,))[0]
             
@@ -437,11 +438,16 @@ class AdminHandler:
         text = message.get('text', '')
         chat_id = message['chat']['id']
         
+        if not self.is_admin(message['from']['id']):
+            self.bot.send_message(chat_id, "❌ У вас нет прав администратора")
+            return
+        
         if text.startswith('/admin_order_'):
-            try:
-                order_id = int(text.split('_')[2])
+            # id заказа — UUID, как в списке «Последние заказы»
+            order_id = text[len('/admin_order_'):].split('@')[0].strip()
+            if order_id:
                 self.show_order_details(chat_id, order_id)
-            except (ValueError, IndexError):
+            else:
                 self.bot.send_message(chat_id, "❌ Неверный формат команды")
     
     def show_order_details(self, chat_id, order_id):
@@ -458,7 +464,7 @@ class AdminHandler:
             
             # Получаем информацию о клиенте
             user = self.db.execute_query(
-                'SELECT name, phone, email FROM users WHERE id = %s',
+                'SELECT name, phone, email FROM public.users WHERE id = %s',
                 (order[1],)
             )[0]
             
@@ -15,9 +15,9 @@ class AIRecommendationEngine:
         # Анализируем историю покупок пользователя
         user_purchases = self.db.execute_query('''
             SELECT p.category_id, p.price, oi.quantity
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
         ''', (user_id,))
         
@@ -72,8 +72,8 @@ class AIRecommendationEngine:
         return self.db.execute_query('''
             SELECT p.*, c.name as category_name,
                    (p.views * 0.4 + p.sales_count * 0.6) as trend_score
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
+            FROM public.products p
+            JOIN public.categories c ON p.category_id = c.id
             WHERE p.is_active = true
             ORDER BY trend_score DESC, p.created_at DESC
             LIMIT %s
@@ -84,10 +84,10 @@ class AIRecommendationEngine:
         # Находим похожих пользователей
         similar_users = self.db.execute_query('''
             SELECT DISTINCT o2.user_id, COUNT(*) as common_products
-            FROM order_items oi1
-            JOIN orders o1 ON oi1.order_id = o1.id
-            JOIN order_items oi2 ON oi1.product_id = oi2.product_id
-            JOIN orders o2 ON oi2.order_id = o2.id
+            FROM public.order_items oi1
+            JOIN public.orders o1 ON oi1.order_id = o1.id
+            JOIN public.order_items oi2 ON oi1.product_id = oi2.product_id
+            JOIN public.orders o2 ON oi2.order_id = o2.id
             WHERE o1.user_id = %s AND o2.user_id != %s 
             AND o1.status != 'cancelled' AND o2.status != 'cancelled'
             GROUP BY o2.user_id
@@ -209,8 +209,9 @@ class AIRecommendationEngine:
         return None, 0
 
 class ChatbotSupport:
-    def __init__(self, db):
+    def __init__(self, db, product_search=None):
         self.db = db
+        self.product_search = product_search
         self.faq_data = self.load_faq()
         self.context_memory = {}
     
@@ -384,18 +385,22 @@ class ChatbotSupport:
         if corrected_query != query.lower():
             suggestions.append(f"Возможно, вы имели в виду: <b>{corrected_query}</b>")
         
-        # Похожие запросы
-        similar_products = self.db.execute_query('''
-            SELECT name FROM products 
-            WHERE name LIKE %s AND is_active = true
-            ORDER BY views DESC
-            LIMIT 3
-        ''', (f'%{query[:5]}%',))
+        # Похожие товары: префиксы и опечатки по индексу каталога в памяти
+        if self.product_search is not None:
+            similar_names = self.product_search.suggest(corrected_query, 3)
+        else:
+            similar_products = self.db.execute_query('''
+                SELECT name FROM public.products 
+                WHERE name LIKE %s AND is_active = true
+                ORDER BY views DESC
+                LIMIT 3
+            ''', (f'%{query[:5]}%',))
+            similar_names = [product[0] for product in similar_products or []]
         
-        if similar_products:
+        if similar_names:
             suggestions.append("Похожие товары:")
-            for product in similar_products:
-                suggestions.append(f"• {product[0]}")
+            for name in similar_names:
+                suggestions.append(f"• {name}")
         
         return suggestions
     
@@ -404,9 +409,9 @@ class ChatbotSupport:
         # История покупок
         purchase_history = self.db.execute_query('''
             SELECT p.category_id, p.price, p.name, oi.quantity
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
             ORDER BY o.created_at DESC
         ''', (user_id,))
@@ -414,7 +419,7 @@ class ChatbotSupport:
         # История поиска (если есть)
         search_history = self.db.execute_query('''
             SELECT search_query, created_at
-            FROM user_activity_logs
+            FROM public.user_activity_logs
             WHERE user_id = %s AND action = 'search'
             ORDER BY created_at DESC
             LIMIT 20
@@ -493,7 +498,7 @@ class ChatbotSupport:
         seasonal_products = []
         for keyword in seasonal_keywords:
             products = self.db.execute_query('''
-                SELECT * FROM products 
+                SELECT * FROM public.products 
                 WHERE (name LIKE %s OR description LIKE %s) 
                 AND is_active = true
                 ORDER BY views DESC
@@ -520,8 +525,8 @@ class SmartNotificationAI:
         """Определение лучшего времени для уведомлений"""
         # Анализируем активность пользователя
         activity_hours = self.db.execute_query('''
-            SELECT strftime('%H', created_at) as hour, COUNT(*) as activity_count
-            FROM user_activity_logs
+            SELECT to_char(created_at, 'HH24') as hour, COUNT(*) as activity_count
+            FROM public.user_activity_logs
             WHERE user_id = %s
             GROUP BY hour
             ORDER BY activity_count DESC
@@ -538,7 +543,7 @@ class SmartNotificationAI:
     def generate_personalized_message(self, user_id, message_type, context=None):
         """Генерация персонализированного сообщения"""
         user = self.db.execute_query(
-            'SELECT name, language FROM users WHERE id = %s',
+            'SELECT name, language FROM public.users WHERE id = %s',
             (user_id,)
         )[0]
         
@@ -577,7 +582,7 @@ class SmartNotificationAI:
     def get_category_name(self, category_id):
         """Получение названия категории"""
         category = self.db.execute_query(
-            'SELECT name FROM categories WHERE id = %s',
+            'SELECT name FROM public.categories WHERE id = %s',
             (category_id,)
         )
         return category[0][0] if category else "товары"
@@ -591,7 +596,7 @@ class SmartNotificationAI:
                 MAX(o.created_at) as last_order,
                 AVG(o.total_amount) as avg_order_value,
                 julianday('now') - julianday(MAX(o.created_at)) as days_since_last_order
-            FROM orders o
+            FROM public.orders o
             WHERE o.user_id = %s AND o.status != 'cancelled'
         ''', (user_id,))[0]
         
@@ -1,66 +1,117 @@
-"""Аналитика: сводные метрики, топы, временные ряды."""
-from datetime import datetime
+"""Аналитика: сводные метрики, топы, временные ряды.
+
+Все запросы читают дневную сводку sales_daily / sales_daily_customers /
+sales_daily_products (миграция 20251101_09), а не orders и order_items:
+стоимость отчёта зависит от числа дней в периоде, а не от истории заказов.
+Отменённые заказы в сводку не входят.
+"""
+
+# Формат корзины временного ряда для to_char
+_BUCKETS = {
+    'daily': 'YYYY-MM-DD',
+    'weekly': 'IYYY-IW',
+    'monthly': 'YYYY-MM',
+}
+
 
 def get_sales_report(db, start_date, end_date):
     """Сводные метрики за период: кол-во заказов, выручка, средний чек, уникальные клиенты, топ-товары и топ-клиенты."""
     sales = db.execute_query('''
-        SELECT 
-            COUNT(*) as orders_count,
-            COALESCE(SUM(total_amount), 0) as revenue,
-            COALESCE(AVG(total_amount), 0) as avg_order_value,
-            COUNT(DISTINCT user_id) as unique_customers
-        FROM orders
-        WHERE DATE(created_at) BETWEEN ? AND ?
-          AND status != 'cancelled'
-    ''', (start_date, end_date)) or [(0,0,0,0)]
+        SELECT
+            COALESCE(SUM(orders_count), 0) as orders_count,
+            COALESCE(SUM(revenue), 0) as revenue,
+            COALESCE(SUM(revenue) / NULLIF(SUM(orders_count), 0), 0) as avg_order_value,
+            (SELECT COUNT(DISTINCT user_id) FROM public.sales_daily_customers
+             WHERE day BETWEEN %s::date AND %s::date) as unique_customers
+        FROM public.sales_daily
+        WHERE day BETWEEN %s::date AND %s::date
+    ''', (start_date, end_date, start_date, end_date)) or [(0, 0, 0, 0)]
     sales_row = sales[0]
 
-    top_products = db.execute_query('''
-        SELECT p.id, p.name,
-               COALESCE(SUM(oi.quantity), 0) as qty,
-               COALESCE(SUM(oi.quantity * COALESCE(oi.price,0)), 0) as revenue
-        FROM order_items oi
-        JOIN products p ON p.id = oi.product_id
-        JOIN orders o ON o.id = oi.order_id
-        WHERE DATE(o.created_at) BETWEEN ? AND ?
-          AND o.status != 'cancelled'
-        GROUP BY p.id, p.name
-        ORDER BY revenue DESC
-        LIMIT 10
-    ''', (start_date, end_date)) or []
+    top_products = get_top_products(db, start_date, end_date, with_id=True)
 
     top_users = db.execute_query('''
-        SELECT u.id, u.name,
-               COALESCE(SUM(o.total_amount), 0) as spent,
-               COUNT(o.id) as orders
-        FROM users u
-        JOIN orders o ON o.user_id = u.id
-        WHERE DATE(o.created_at) BETWEEN ? AND ?
-          AND o.status != 'cancelled'
-        GROUP BY u.id, u.name
-        ORDER BY spent DESC
-        LIMIT 10
+        SELECT u.id, u.name, c.spent, c.orders
+        FROM (
+            SELECT user_id, SUM(revenue) as spent, SUM(orders_count) as orders
+            FROM public.sales_daily_customers
+            WHERE day BETWEEN %s::date AND %s::date
+            GROUP BY user_id
+            ORDER BY spent DESC
+            LIMIT 10
+        ) c
+        JOIN public.users u ON u.id = c.user_id
+        ORDER BY c.spent DESC
     ''', (start_date, end_date)) or []
 
     return type('SalesReport', (), {'sales_data':[sales_row], 'top_products': top_products, 'top_users': top_users})
 
+
+def get_top_products(db, start_date=None, end_date=None, limit=10, with_id=False):
+    """Топ товаров по выручке: (name, qty, revenue) или (id, name, qty, revenue); без дат — за всё время"""
+    where, params = '', []
+    if start_date is not None and end_date is not None:
+        where = 'WHERE day BETWEEN %s::date AND %s::date'
+        params = [start_date, end_date]
+    columns = 'p.id, p.name' if with_id else 'p.name'
+    return db.execute_query(f'''
+        SELECT {columns}, s.qty, s.revenue
+        FROM (
+            SELECT product_id, SUM(quantity) as qty, SUM(revenue) as revenue
+            FROM public.sales_daily_products
+            {where}
+            GROUP BY product_id
+            ORDER BY revenue DESC
+            LIMIT %s
+        ) s
+        JOIN public.products p ON p.id = s.product_id
+        ORDER BY s.revenue DESC
+    ''', tuple(params + [limit])) or []
+
+
+def get_daily_sales(db, start_date, end_date, newest_first=False):
+    """По дням: (day, orders, revenue, avg_order, customers)"""
+    order = 'DESC' if newest_first else 'ASC'
+    return db.execute_query(f'''
+        SELECT day, orders_count, revenue,
+               COALESCE(revenue / NULLIF(orders_count, 0), 0) as avg_order,
+               customers_count
+        FROM public.sales_daily
+        WHERE day BETWEEN %s::date AND %s::date
+        ORDER BY day {order}
+    ''', (start_date, end_date)) or []
+
+
+def get_sales_totals(db):
+    """За всё время: (customers, orders, revenue)"""
+    rows = db.execute_query('''
+        SELECT (SELECT COUNT(DISTINCT user_id) FROM public.sales_daily_customers),
+               COALESCE(SUM(orders_count), 0),
+               COALESCE(SUM(revenue), 0)
+        FROM public.sales_daily
+    ''')
+    return rows[0] if rows else (0, 0, 0)
+
+
 def get_timeseries(db, start_date, end_date, group='daily'):
     """Временной ряд по заказам и выручке для графиков. group: daily|weekly|monthly"""
-    if group == 'weekly':
-        fmt = '%Y-%W'
-    elif group == 'monthly':
-        fmt = '%Y-%m'
-    else:
-        fmt = '%Y-%m-%d'
-    rows = db.execute_query(f'''
-        SELECT strftime('{fmt}', created_at) as bucket,
-               COUNT(*) as orders,
-               COALESCE(SUM(total_amount), 0) as revenue,
-               COUNT(DISTINCT user_id) as customers
-        FROM orders
-        WHERE DATE(created_at) BETWEEN ? AND ?
-          AND status != 'cancelled'
-        GROUP BY bucket
-        ORDER BY bucket
-    ''', (start_date, end_date)) or []
+    fmt = _BUCKETS.get(group, _BUCKETS['daily'])
+    rows = db.execute_query('''
+        SELECT d.bucket, d.orders, d.revenue, COALESCE(c.customers, 0) as customers
+        FROM (
+            SELECT to_char(day, %s) as bucket,
+                   SUM(orders_count) as orders,
+                   SUM(revenue) as revenue
+            FROM public.sales_daily
+            WHERE day BETWEEN %s::date AND %s::date
+            GROUP BY bucket
+        ) d
+        LEFT JOIN (
+            SELECT to_char(day, %s) as bucket, COUNT(DISTINCT user_id) as customers
+            FROM public.sales_daily_customers
+            WHERE day BETWEEN %s::date AND %s::date
+            GROUP BY bucket
+        ) c ON c.bucket = d.bucket
+        ORDER BY d.bucket
+    ''', (fmt, start_date, end_date, fmt, start_date, end_date)) or []
     return rows
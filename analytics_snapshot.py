@@ -0,0 +1,638 @@
+"""
+Колоночный снимок для аналитики: orders, order_items, products и users
+в локальных файлах .npy, которые читаются через mmap.
+
+Сборка (scripts/build_analytics_snapshot.py, по расписанию) читает таблицы
+серверным курсором (SupabaseManager.iter_query). Заказы, позиции и
+пользователи дочитываются инкрементально: перечитываются только строки не
+старше «водяного знака» минус ANALYTICS_SNAPSHOT_REWRITE_DAYS — в этом окне
+ещё меняются статусы заказов. Правки старше окна подхватывает полная
+пересборка (--full). Товары перечитываются целиком.
+
+Каждая сборка пишет таблицы в новые каталоги и атомарно подменяет
+manifest.json, поэтому читатель не видит снимок наполовину.
+
+Отчёты ниже (RFM-сегменты, отток, ABC, оборачиваемость, когорты, метрики
+клиентов) считаются по снимку в NumPy и возвращают то же, что SQL-версии в
+CRMManager, InventoryManager и FinancialReportsManager. Менеджеры берут
+снимок через get_snapshot(); если он выключен, не собран или старше
+ANALYTICS_SNAPSHOT_MAX_AGE, отчёты считаются по базе, как раньше.
+
+NumPy — необязательная зависимость: без него снимок выключен.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from config import ANALYTICS_SNAPSHOT_CONFIG
+from pagination import as_timestamp
+
+logger = logging.getLogger('analytics_snapshot')
+
+MANIFEST = 'manifest.json'
+NAT = -(2 ** 63)  # NaT как int64: NULL во временных колонках
+DAY = 86400
+
+# Виды колонок: uuid -> S16, float -> f8 (NULL = nan), int -> i8 (NULL = 0),
+# bool -> bool (NULL = False), ts -> M8[s] (NULL = NaT),
+# dict -> i4 коды (NULL = -1) + список значений в <col>.values.json
+TableSpec = namedtuple('TableSpec', 'name query columns time_expr')
+
+TABLES = (
+    TableSpec('orders', '''
+        SELECT id, user_id, total_amount, status, created_at, promo_discount, delivery_cost
+        FROM public.orders
+        {where}
+        ORDER BY created_at NULLS FIRST, id
+    ''', (('id', 'uuid'), ('user_id', 'uuid'), ('total_amount', 'float'), ('status', 'dict'),
+          ('created_at', 'ts'), ('promo_discount', 'float'), ('delivery_cost', 'float')), 'created_at'),
+    TableSpec('order_items', '''
+        SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, oi.price, o.created_at
+        FROM public.order_items oi
+        JOIN public.orders o ON o.id = oi.order_id
+        {where}
+        ORDER BY o.created_at NULLS FIRST, oi.id
+    ''', (('id', 'uuid'), ('order_id', 'uuid'), ('product_id', 'uuid'), ('quantity', 'int'),
+          ('price', 'float'), ('order_created_at', 'ts')), 'o.created_at'),
+    TableSpec('users', '''
+        SELECT id, name, telegram_id, is_admin, language, created_at
+        FROM public.users
+        {where}
+        ORDER BY created_at NULLS FIRST, id
+    ''', (('id', 'uuid'), ('name', 'dict'), ('telegram_id', 'int'), ('is_admin', 'bool'),
+          ('language', 'dict'), ('created_at', 'ts')), 'created_at'),
+    TableSpec('products', '''
+        SELECT id, name, category_id, price, cost_price, stock, is_active, created_at
+        FROM public.products
+        ORDER BY id
+    ''', (('id', 'uuid'), ('name', 'dict'), ('category_id', 'uuid'), ('price', 'float'),
+          ('cost_price', 'float'), ('stock', 'int'), ('is_active', 'bool'), ('created_at', 'ts')), None),
+)
+
+_DTYPES = {'uuid': 'S16', 'float': 'f8', 'int': 'i8', 'bool': '?', 'ts': 'i8', 'dict': 'i4'}
+
+
+# --- преобразование значений из базы ---
+
+def _seconds(value):
+    value = as_timestamp(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+    return NAT
+
+
+def _uuid_bytes(value):
+    if value is None:
+        return b''
+    return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+
+
+def _float(value):
+    return float('nan') if value is None else float(value)
+
+
+def _int(value):
+    return 0 if value is None else int(value)
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 't', 'true', 'yes', 'on')
+    return bool(value)
+
+
+_CONVERTERS = {'uuid': _uuid_bytes, 'float': _float, 'int': _int, 'bool': _bool, 'ts': _seconds}
+
+
+def uuid_str(raw):
+    """Строка UUID из значения колонки S16 (numpy срезает нулевые байты в конце)"""
+    return str(uuid.UUID(bytes=bytes(raw).ljust(16, b'\0'))) if raw else None
+
+
+def iso(seconds):
+    """ISO-строка из секунд колонки ts; None для NaT"""
+    seconds = int(seconds)
+    return None if seconds == NAT else datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+# --- чтение снимка ---
+
+class Table:
+    """Колонки таблицы снимка (np.memmap) и словари dict-колонок"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.rows = meta['rows']
+        self.kinds = dict(meta['columns'])
+        self.dictionaries = {}
+        self._columns = {}
+        self._sorters = {}
+        for name, kind in meta['columns']:
+            column = np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if self.rows else None)
+            self._columns[name] = column.view('M8[s]') if kind == 'ts' else column
+            if kind == 'dict':
+                with open(os.path.join(path, f'{name}.values.json'), encoding='utf-8') as f:
+                    self.dictionaries[name] = json.load(f)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def seconds(self, name):
+        """Колонка ts как int64 секунд (NaT = NAT)"""
+        return self._columns[name].view('i8')
+
+    def code(self, name, value):
+        """Код значения dict-колонки; -1, если такого значения нет"""
+        try:
+            return self.dictionaries[name].index(value)
+        except ValueError:
+            return -1
+
+    def decode(self, name, codes):
+        """Значения dict-колонки по кодам (-1 -> None)"""
+        values = self.dictionaries[name]
+        return [values[c] if c >= 0 else None for c in np.asarray(codes).tolist()]
+
+    def index_of(self, name, keys):
+        """Номера строк, где колонка name (уникальный ключ) равна keys; -1 — нет такой"""
+        keys = np.asarray(keys)
+        if name not in self._sorters:
+            sorter = np.argsort(self._columns[name], kind='stable')
+            self._sorters[name] = (sorter, self._columns[name][sorter])
+        sorter, ordered = self._sorters[name]
+        if not len(sorter) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(ordered, keys), len(sorter) - 1)
+        return np.where(ordered[pos] == keys, sorter[pos], -1)
+
+
+class Snapshot:
+    """Снимок целиком: таблицы по manifest.json"""
+
+    def __init__(self, root, manifest):
+        self.root = root
+        self.manifest = manifest
+        self.built_at = manifest['built_at']
+        self.tables = {name: Table(os.path.join(root, meta['dir']), meta)
+                       for name, meta in manifest['tables'].items()}
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+    @classmethod
+    def open(cls, root=None):
+        root = root or snapshot_dir()
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return cls(root, json.load(f))
+
+
+def snapshot_dir():
+    path = ANALYTICS_SNAPSHOT_CONFIG['dir']
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+
+_snapshot = None
+_snapshot_mtime = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Снимок процесса (перечитывается после новой сборки); None — считать по базе"""
+    global _snapshot, _snapshot_mtime
+    if np is None or not ANALYTICS_SNAPSHOT_CONFIG['enabled']:
+        return None
+    root = snapshot_dir()
+    try:
+        mtime = os.stat(os.path.join(root, MANIFEST)).st_mtime
+    except OSError:
+        return None
+    with _snapshot_lock:
+        if mtime != _snapshot_mtime:
+            try:
+                _snapshot = Snapshot.open(root)
+            except Exception as e:
+                logger.error(f"Снимок аналитики не читается: {e}")
+                _snapshot = None
+            _snapshot_mtime = mtime
+        snapshot = _snapshot
+    if snapshot is None or snapshot.age > ANALYTICS_SNAPSHOT_CONFIG['max_age']:
+        return None
+    return snapshot
+
+
+# --- сборка ---
+
+def _fetch(db, spec, since, batch_size, dictionaries):
+    """Колонки (списки) новых строк; dict-колонки кодируются по dictionaries"""
+    if since is None:
+        query, params = spec.query.format(where=''), None
+    else:
+        query = spec.query.format(where=f'WHERE {spec.time_expr} >= %s::timestamptz')
+        params = (datetime.fromtimestamp(since, timezone.utc).isoformat(),)
+    kinds = [kind for _, kind in spec.columns]
+    columns = [[] for _ in kinds]
+    indexes = {name: {value: i for i, value in enumerate(dictionaries[name])}
+               for name, kind in spec.columns if kind == 'dict'}
+    encoders = []
+    for name, kind in spec.columns:
+        if kind == 'dict':
+            encoders.append(_dict_encoder(dictionaries[name], indexes[name]))
+        else:
+            encoders.append(_CONVERTERS[kind])
+    for row in db.iter_query(query, params, batch_size=batch_size):
+        for column, encode, value in zip(columns, encoders, row):
+            column.append(encode(value))
+    return {name: np.array(column, dtype=_DTYPES[kind])
+            for (name, kind), column in zip(spec.columns, columns)}
+
+
+def _dict_encoder(values, index):
+    def encode(value):
+        if value is None:
+            return -1
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+    return encode
+
+
+def _build_table(db, spec, old, full, rewrite_days, batch_size):
+    """Новые колонки таблицы и её метаданные (без записи на диск)"""
+    incremental = spec.time_expr is not None and old is not None and not full
+    dictionaries = {name: list(old.dictionaries.get(name, [])) if incremental else []
+                    for name, kind in spec.columns if kind == 'dict'}
+    time_column = _time_column(spec)
+    since = keep = None
+    if incremental:
+        watermark = old.meta.get('watermark')
+        if watermark is not None:
+            # Строки отсортированы по времени (NULL — в начале): старую часть
+            # до окна перезаписи оставляем, остальное перечитываем
+            since = watermark - rewrite_days * DAY
+            keep = int(np.searchsorted(old.seconds(time_column), since, side='left'))
+    fresh = _fetch(db, spec, since, batch_size, dictionaries)
+
+    columns = {}
+    for name, kind in spec.columns:
+        if keep:
+            previous = old.seconds(name) if kind == 'ts' else old[name]
+            columns[name] = np.concatenate([np.asarray(previous[:keep]), fresh[name]])
+        else:
+            columns[name] = fresh[name]
+    rows = len(next(iter(columns.values())))
+    watermark = None
+    if time_column is not None and rows:
+        last = int(columns[time_column][-1])
+        watermark = last if last != NAT else None
+    meta = {'rows': rows, 'columns': [list(c) for c in spec.columns], 'watermark': watermark,
+            'fetched': len(next(iter(fresh.values()))), 'kept': keep or 0}
+    return columns, dictionaries, meta
+
+
+def _time_column(spec):
+    """Колонка снимка, по которой идёт инкремент (значение time_expr)"""
+    if spec.time_expr is None:
+        return None
+    return 'order_created_at' if spec.name == 'order_items' else 'created_at'
+
+
+def build_snapshot(db, root=None, full=False, rewrite_days=None, batch_size=None):
+    """Собрать снимок и подменить manifest.json; возвращает метаданные таблиц"""
+    if np is None:
+        raise RuntimeError("Для снимка аналитики нужен numpy")
+    root = root or snapshot_dir()
+    rewrite_days = ANALYTICS_SNAPSHOT_CONFIG['rewrite_days'] if rewrite_days is None else rewrite_days
+    batch_size = batch_size or ANALYTICS_SNAPSHOT_CONFIG['batch_size']
+    os.makedirs(root, exist_ok=True)
+    try:
+        old = Snapshot.open(root)
+    except (OSError, ValueError, KeyError):
+        old = None
+
+    stamp = int(time.time() * 1000)
+    manifest = {'built_at': time.time(), 'tables': {}}
+    for spec in TABLES:
+        started = time.monotonic()
+        previous = old.tables.get(spec.name) if old is not None else None
+        columns, dictionaries, meta = _build_table(db, spec, previous, full, rewrite_days, batch_size)
+        meta['dir'] = f'{spec.name}-{stamp}'
+        path = os.path.join(root, meta['dir'])
+        os.makedirs(path)
+        for name, column in columns.items():
+            np.save(os.path.join(path, f'{name}.npy'), column)
+        for name, values in dictionaries.items():
+            with open(os.path.join(path, f'{name}.values.json'), 'w', encoding='utf-8') as f:
+                json.dump(values, f, ensure_ascii=False)
+        meta['seconds'] = round(time.monotonic() - started, 2)
+        manifest['tables'][spec.name] = meta
+
+    tmp = os.path.join(root, MANIFEST + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(root, MANIFEST))
+
+    # Предыдущую сборку оставляем: её мог только что открыть читатель
+    alive = {meta['dir'] for meta in manifest['tables'].values()}
+    if old is not None:
+        alive |= {meta['dir'] for meta in old.manifest['tables'].values()}
+    for entry in os.listdir(root):
+        if entry not in alive and entry not in (MANIFEST, MANIFEST + '.tmp') and \
+                os.path.isdir(os.path.join(root, entry)):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return manifest
+
+
+# --- векторные группировки ---
+
+def group_count(codes, n):
+    """Число строк на группу; codes < 0 пропускаются"""
+    codes = np.asarray(codes)
+    return np.bincount(codes[codes >= 0], minlength=n)
+
+
+def group_sum(codes, values, n):
+    codes = np.asarray(codes)
+    ok = codes >= 0
+    return np.bincount(codes[ok], weights=np.nan_to_num(np.asarray(values, dtype=float)[ok]), minlength=n)
+
+
+def group_max(codes, values, n, initial):
+    codes = np.asarray(codes)
+    ok = codes >= 0
+    out = np.full(n, initial, dtype=np.asarray(values).dtype)
+    np.maximum.at(out, codes[ok], np.asarray(values)[ok])
+    return out
+
+
+def group_min(codes, values, n, initial):
+    codes = np.asarray(codes)
+    ok = codes >= 0
+    out = np.full(n, initial, dtype=np.asarray(values).dtype)
+    np.minimum.at(out, codes[ok], np.asarray(values)[ok])
+    return out
+
+
+def _day_start(value):
+    """Секунды начала дня (UTC) для даты/datetime/'YYYY-MM-DD'"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        value = value.date()
+    return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+
+
+def _valid_orders(snapshot):
+    """Маска заказов не в статусе cancelled (NULL-статус, как в SQL !=, тоже не проходит)"""
+    orders = snapshot['orders']
+    status = np.asarray(orders['status'])
+    return (status >= 0) & (status != orders.code('status', 'cancelled'))
+
+
+def customer_stats(snapshot):
+    """По пользователям: число заказов, сумма, последний заказ (секунды, NAT — нет)"""
+    users, orders = snapshot['users'], snapshot['orders']
+    valid = _valid_orders(snapshot)
+    owner = users.index_of('id', orders['user_id'][valid])
+    n = len(users)
+    return {
+        'orders': group_count(owner, n),
+        'spent': group_sum(owner, orders['total_amount'][valid], n),
+        'last': group_max(owner, orders.seconds('created_at')[valid], n, NAT),
+    }
+
+
+# --- отчёты ---
+
+_SEGMENT_ORDER = ('champions', 'loyal', 'potential', 'new', 'promising',
+                  'need_attention', 'at_risk', 'hibernating', 'lost')
+
+
+def customer_segments(snapshot, now=None):
+    """RFM-сегменты как у CRMManager.segment_customers"""
+    users = snapshot['users']
+    stats = customer_stats(snapshot)
+    count, spent, last = stats['orders'], stats['spent'], stats['last']
+    now = time.time() if now is None else now
+    has_orders = count > 0
+    days = np.where(has_orders, (now - last) / DAY, np.nan)
+
+    recency = np.select([days <= 30, days <= 60, days <= 90, days <= 180], [5, 4, 3, 2], 1)
+    frequency = np.select([count >= 10, count >= 5, count >= 3, count >= 2], [5, 4, 3, 2], 1)
+    monetary = np.select([spent >= 1000, spent >= 500, spent >= 200, spent >= 50], [5, 4, 3, 2], 1)
+    score = (recency + frequency + monetary) / 3
+    segment = np.select(
+        [~has_orders, score >= 4.5, score >= 4, score >= 3.5, (score >= 3) & (count == 1), score >= 3,
+         score >= 2.5, score >= 2, days > 180],
+        [3, 0, 1, 2, 3, 4, 5, 6, 7], 8)
+
+    segments = {name: [] for name in _SEGMENT_ORDER}
+    names = users.decode('name', users['name'])
+    ids, telegram_ids, created = users['id'], users['telegram_id'], users.seconds('created_at')
+    for i in np.flatnonzero(~np.asarray(users['is_admin'])).tolist():
+        orders = int(count[i])
+        total = float(spent[i]) if orders else None
+        segments[_SEGMENT_ORDER[segment[i]]].append((
+            uuid_str(ids[i]), names[i], int(telegram_ids[i]), iso(created[i]), orders, total,
+            total / orders if orders else None, iso(last[i]) if orders else None,
+            float(days[i]) if orders else None,
+        ))
+    return segments
+
+
+def churn_risk_customers(snapshot, min_days=60, min_orders=2, now=None):
+    """Клиенты с риском оттока как у CRMManager.get_churn_risk_customers"""
+    users = snapshot['users']
+    stats = customer_stats(snapshot)
+    count, spent, last = stats['orders'], stats['spent'], stats['last']
+    now = time.time() if now is None else now
+    days = np.where(count > 0, (now - last) / DAY, 0)
+    picked = np.flatnonzero(~np.asarray(users['is_admin']) & (count >= min_orders) & (days > min_days))
+    picked = picked[np.argsort(-spent[picked], kind='stable')]
+    names = users.decode('name', users['name'][picked])
+    return [(uuid_str(users['id'][i]), name, int(users['telegram_id'][i]), iso(last[i]),
+             float(days[i]), int(count[i]), float(spent[i]))
+            for i, name in zip(picked.tolist(), names)]
+
+
+def abc_inventory(snapshot):
+    """ABC по стоимости запасов как у InventoryManager.get_abc_inventory_analysis"""
+    products = snapshot['products']
+    stock = np.asarray(products['stock'])
+    price = np.nan_to_num(np.asarray(products['price']))
+    picked = np.flatnonzero(np.asarray(products['is_active']) & (stock > 0))
+    value = stock[picked] * price[picked]
+    order = np.argsort(-value, kind='stable')
+    picked, value = picked[order], value[order]
+    if not len(picked):
+        return {'categories': {}, 'total_value': 0}
+
+    total = float(value.sum())
+    share = value / total * 100 if total else np.zeros(len(value))
+    cumulative = np.cumsum(share)
+    label = np.select([cumulative <= 80, cumulative <= 95], ['A', 'B'], 'C')
+    names = products.decode('name', products['name'][picked])
+    categories = {'A': [], 'B': [], 'C': []}
+    for j, i in enumerate(picked.tolist()):
+        categories[str(label[j])].append({
+            'id': uuid_str(products['id'][i]),
+            'name': names[j],
+            'stock': int(stock[i]),
+            'price': float(price[i]),
+            'inventory_value': float(value[j]),
+            'value_percentage': float(share[j]),
+        })
+    return {'categories': categories, 'total_value': total}
+
+
+def product_sales(snapshot, start=None, end=None):
+    """Продано штук и выручка по строкам products за [start, end) в секундах"""
+    products, items, orders = snapshot['products'], snapshot['order_items'], snapshot['orders']
+    valid_order = np.zeros(len(orders) + 1, dtype=bool)  # последний элемент — для «заказа нет»
+    valid_order[:len(orders)] = _valid_orders(snapshot)
+    ok = valid_order[orders.index_of('id', items['order_id'])]
+    created = items.seconds('order_created_at')
+    if start is not None:
+        ok &= created >= start
+    if end is not None:
+        ok &= created < end
+    product_row = np.where(ok, products.index_of('id', items['product_id']), -1)
+    quantity = np.asarray(items['quantity'])
+    n = len(products)
+    return {
+        'quantity': group_sum(product_row, quantity, n),
+        'revenue': group_sum(product_row, quantity * np.nan_to_num(np.asarray(items['price'])), n),
+    }
+
+
+def turnover_analysis(snapshot, days=90, now=None):
+    """Оборачиваемость как у InventoryManager.get_turnover_analysis"""
+    products = snapshot['products']
+    now = time.time() if now is None else now
+    start = _day_start(datetime.fromtimestamp(now, timezone.utc) - timedelta(days=days))
+    sold = product_sales(snapshot, start=start)['quantity']
+    stock = np.asarray(products['stock'])
+    price = np.asarray(products['price'])
+    active = np.flatnonzero(np.asarray(products['is_active']))
+    ratio = np.where(stock > 0, sold / np.maximum(stock, 1), 0.0)
+    status = np.select([sold == 0, stock <= 5, stock <= 10, stock >= 50],
+                       ['Не продается', 'Критический остаток', 'Низкий остаток', 'Избыток'], 'Нормальный')
+    active = active[np.argsort(-ratio[active], kind='stable')]
+    names = products.decode('name', products['name'][active])
+
+    result = {'fast_moving': [], 'slow_moving': [], 'dead_stock': [], 'analysis_period': days}
+    for i, name in zip(active.tolist(), names):
+        row = (uuid_str(products['id'][i]), name, int(stock[i]), int(sold[i]), float(price[i]),
+               float(ratio[i]), str(status[i]))
+        if ratio[i] >= 2:
+            result['fast_moving'].append(row)
+        elif ratio[i] > 0:
+            result['slow_moving'].append(row)
+        else:
+            result['dead_stock'].append(row)
+    return result
+
+
+def retention_table(cells, months=12, now=None):
+    """Таблица когорт из ячеек (когорта 'YYYY-MM', сдвиг в месяцах, клиентов).
+
+    Когорты — календарные месяцы первого заказа за последние months месяцев
+    (включая текущий, UTC); retention — доля клиентов когорты с заказом в
+    каждом наступившем месяце, %. Общая для снимка и SQL-версии в CRMManager.
+    """
+    now = datetime.fromtimestamp(time.time() if now is None else now, timezone.utc)
+    by_cohort = {}
+    for cohort, offset, customers in cells:
+        by_cohort.setdefault(cohort, {})[int(offset)] = int(customers)
+    result = []
+    for cohort in sorted(by_cohort):
+        row = by_cohort[cohort]
+        size = row.get(0)
+        elapsed = (now.year - int(cohort[:4])) * 12 + now.month - int(cohort[5:7])
+        if not size or not 0 <= elapsed < months:
+            continue
+        result.append({
+            'cohort': cohort,
+            'customers': size,
+            'retention': [round(row.get(k, 0) / size * 100, 1) for k in range(elapsed + 1)],
+        })
+    return result
+
+
+def cohorts(snapshot, months=12, now=None):
+    """Когорты по месяцу первого заказа (см. retention_table)"""
+    users, orders = snapshot['users'], snapshot['orders']
+    valid = _valid_orders(snapshot) & ~np.isnat(orders['created_at'])
+    owner = users.index_of('id', orders['user_id'][valid])
+    month = orders['created_at'][valid].astype('M8[M]').astype(np.int64)
+    month, owner = month[owner >= 0], owner[owner >= 0]
+    first = group_min(owner, month, len(users), np.iinfo(np.int64).max)[owner]
+    current = np.datetime64(int(time.time() if now is None else now), 's').astype('M8[M]').astype(np.int64)
+    recent = first > current - months
+    first, month, owner = first[recent], month[recent], owner[recent]
+    # Клиент считается в месяце один раз
+    visits = np.unique(np.stack([first, month - first, owner]), axis=1)
+    keys, counts = np.unique(visits[:2], axis=1, return_counts=True)
+    cells = [(str(np.datetime64(cohort, 'M')), offset, customers)
+             for (cohort, offset), customers in zip(keys.T.tolist(), counts.tolist())]
+    return retention_table(cells, months, now)
+
+
+def customer_metrics(snapshot, start_date):
+    """Метрики клиентов для FinancialReportsManager.calculate_business_metrics.
+
+    start_date — начало 30-дневного окна: новые клиенты, активные клиенты и
+    выручка в окне, активные за 30 дней до него; avg_ltv, avg_orders и
+    avg_order_value — по покупателям за всё время.
+    """
+    users, orders = snapshot['users'], snapshot['orders']
+    valid = _valid_orders(snapshot)
+    stats = customer_stats(snapshot)
+    buyers = stats['orders'] > 0
+    count, spent = stats['orders'][buyers], stats['spent'][buyers]
+
+    start = _day_start(start_date)
+    created = orders.seconds('created_at')
+    user_id = orders['user_id']
+
+    def active(mask):
+        ids = user_id[mask]
+        return int(len(np.unique(ids[ids != b''])))
+
+    window = valid & (created >= start)
+    previous = valid & (created >= start - 30 * DAY) & (created < start + DAY)
+    return {
+        'new_customers': int((~np.asarray(users['is_admin']) & (users.seconds('created_at') >= start)).sum()),
+        'avg_ltv': float(spent.mean()) if len(spent) else 0,
+        'avg_orders': float(count.mean()) if len(count) else 0,
+        'avg_order_value': float((spent / count).mean()) if len(count) else 0,
+        'active_previous': active(previous),
+        'active_now': active(window),
+        'revenue': float(np.nan_to_num(np.asarray(orders['total_amount'])[window]).sum()),
+    }
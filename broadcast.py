@@ -0,0 +1,369 @@
+"""
+Массовые рассылки с контрольными точками.
+
+Задание рассылки хранится в public.broadcast_jobs. Получатели читаются из
+users пачками по id (keyset, без загрузки всего списка), текст готовится
+один раз на язык, пачка целиком ставится в очередь отправки (outbound.py),
+после чего в задание пишутся последний id и счётчики. Процесс, выполняющий
+задание, держит аренду (lease_until) и продлевает её каждую треть срока, пока
+пачка уходит через очередь — на доле лимита веб-админки пачка может идти
+дольше аренды. Если процесс упал, задание подхватывает любой другой процесс
+(watcher в боте) и продолжает со следующей пачки.
+Пачка, прерванная падением, отправляется повторно (не более batch_size
+повторов на падение).
+
+По завершении итог пишется в post_statistics — одним INSERT на все
+завершённые за проход задания.
+
+Если миграция 20251101_07 не применена, рассылка идёт теми же пачками, но
+без сохранения прогресса.
+"""
+import os
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import wait
+
+from config import BROADCAST_CONFIG
+from outbound import MARKETING, delivery_counts
+
+logger = logging.getLogger('broadcast')
+
+# Сегменты аудитории: условие на users u
+AUDIENCES = {
+    'all': 'TRUE',
+    'new': "u.created_at >= NOW() - INTERVAL '7 days'",
+    'active': ("EXISTS (SELECT 1 FROM public.orders o WHERE o.user_id = u.id "
+               "AND o.created_at >= NOW() - INTERVAL '30 days')"),
+    'inactive': ("NOT EXISTS (SELECT 1 FROM public.orders o WHERE o.user_id = u.id "
+                 "AND o.created_at >= NOW() - INTERVAL '30 days')"),
+    'inactive_30d': ("NOT EXISTS (SELECT 1 FROM public.orders o WHERE o.user_id = u.id "
+                     "AND o.status != 'cancelled' AND o.created_at >= NOW() - INTERVAL '30 days')"),
+    'buyers': ("EXISTS (SELECT 1 FROM public.orders o WHERE o.user_id = u.id "
+               "AND o.status != 'cancelled')"),
+    'vip': ("(SELECT COALESCE(SUM(o.total_amount), 0) FROM public.orders o "
+            "WHERE o.user_id = u.id) >= 500"),
+}
+
+_BASE_CONDITION = 'u.is_admin = false AND u.telegram_id IS NOT NULL'
+
+_JOB_COLUMNS = ('id, kind, audience, message, image_url, reply_markup, post_id, time_period, '
+                'last_user_id, total_count, sent_count, error_count, started_at')
+
+
+def localize_message(message, language):
+    """Текст рассылки на языке получателя.
+
+    Один и тот же для всех процессов: задание, начатое в админке или
+    планировщике и продолженное ботом, не меняет вид посреди рассылки.
+    """
+    if language == 'uz':
+        # Простая замена ключевых слов для узбекского
+        message = message.replace('Скидка', 'Chegirma')
+        message = message.replace('Акция', 'Aksiya')
+        message = message.replace('Новинка', 'Yangilik')
+        message = message.replace('Товар', 'Mahsulot')
+    
+    return message
+
+
+def _job_from_row(row):
+    """Задание из строки broadcast_jobs.
+
+    UPDATE ... RETURNING приходит из execute_query списком dict (и из пула,
+    и из exec_sql), SELECT — кортежами в порядке _JOB_COLUMNS.
+    """
+    keys = [name.strip() for name in _JOB_COLUMNS.split(',')]
+    if isinstance(row, dict):
+        return {key: row.get(key) for key in keys}
+    return dict(zip(keys, row))
+
+
+class BroadcastEngine:
+    """Запуск, продолжение и прогресс заданий рассылки"""
+
+    def __init__(self, db, api, localize=None, batch_size=None, lease_seconds=None):
+        self.db = db
+        self.api = api
+        self.localize = localize or localize_message
+        self.batch_size = batch_size or BROADCAST_CONFIG['batch_size']
+        self.lease_seconds = lease_seconds or BROADCAST_CONFIG['lease_seconds']
+        # Аренда продлевается с запасом: не дожидаясь её истечения посреди пачки
+        self.heartbeat_seconds = self.lease_seconds / 3
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._progress = {}       # id задания -> прогресс в этом процессе
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    # --- создание ---
+
+    def create_job(self, audience, message, kind='broadcast', image_url=None, reply_markup=None,
+                   post_id=None, time_period=None):
+        """Новое задание (ещё не запущено); ValueError для неизвестного сегмента"""
+        if audience not in AUDIENCES:
+            raise ValueError(f"Неизвестная аудитория рассылки: {audience}")
+        total = self.db.execute_query(
+            f'SELECT COUNT(*) FROM public.users u WHERE {_BASE_CONDITION} AND {AUDIENCES[audience]}'
+        )
+        job = {
+            'id': None, 'kind': kind, 'audience': audience, 'message': message,
+            'image_url': image_url, 'reply_markup': reply_markup, 'post_id': post_id,
+            'time_period': time_period, 'last_user_id': None,
+            'total_count': int(total[0][0]) if total else 0,
+            'sent_count': 0, 'error_count': 0, 'started_at': None,
+        }
+        rows = self.db.execute_query(
+            'INSERT INTO public.broadcast_jobs (kind, audience, message, image_url, reply_markup, '
+            'post_id, time_period, total_count) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id',
+            (kind, audience, message, image_url, reply_markup, post_id, time_period, job['total_count'])
+        )
+        if rows and isinstance(rows, list):
+            job['id'] = str(rows[0]['id'])
+        else:
+            logger.warning("broadcast_jobs недоступна — рассылка без контрольных точек")
+        return job
+
+    def send(self, audience, message, **job_fields):
+        """Создать задание и выполнить его в текущем потоке; (отправлено, ошибок)"""
+        job = self.create_job(audience, message, **job_fields)
+        return self.run(job)
+
+    def start(self, audience, message, **job_fields):
+        """Создать задание и выполнить его в фоне; id задания (или None без таблицы)"""
+        job = self.create_job(audience, message, **job_fields)
+        threading.Thread(target=self.run, args=(job,), name='broadcast', daemon=True).start()
+        return job['id']
+
+    # --- выполнение ---
+
+    def _claim(self, job_id):
+        """Взять аренду задания; строка задания или None, если его выполняет другой процесс"""
+        rows = self.db.execute_query(
+            "UPDATE public.broadcast_jobs SET status = 'running', lease_owner = %s, "
+            "lease_until = NOW() + make_interval(secs => %s), "
+            "started_at = COALESCE(started_at, NOW()), updated_at = NOW() "
+            "WHERE id = %s AND (status = 'pending' OR (status = 'running' AND "
+            "(lease_until IS NULL OR lease_until < NOW() OR lease_owner = %s))) "
+            f"RETURNING {_JOB_COLUMNS}",
+            (self.owner, self.lease_seconds, job_id, self.owner)
+        )
+        if not rows or not isinstance(rows, list):
+            return None
+        return rows[0]
+
+    def _checkpoint(self, job):
+        """Сохранить прогресс и продлить аренду; False — задание отменено или перехвачено"""
+        rows = self.db.execute_query(
+            'UPDATE public.broadcast_jobs SET last_user_id = %s, sent_count = %s, error_count = %s, '
+            'lease_until = NOW() + make_interval(secs => %s), updated_at = NOW() '
+            "WHERE id = %s AND status = 'running' AND lease_owner = %s RETURNING id",
+            (job['last_user_id'], job['sent_count'], job['error_count'], self.lease_seconds,
+             job['id'], self.owner)
+        )
+        if rows is None:
+            # Ошибка базы — продолжаем, прогресс сохранится следующей пачкой
+            return True
+        return bool(rows)
+
+    def _await_batch(self, job, pending):
+        """Дождаться отправки пачки, продлевая аренду; (отправлено, ошибок).
+
+        None — задание отменено или перехвачено: неотправленное снимается с очереди.
+        """
+        waiting = pending
+        while True:
+            _, waiting = wait(waiting, timeout=self.heartbeat_seconds)
+            if not waiting:
+                return delivery_counts(pending)
+            # Прогресс в задании — на конец прошлой пачки, меняется только lease_until
+            if job['id'] is not None and not self._checkpoint(job):
+                for future in waiting:
+                    future.cancel()
+                return None
+
+    def _recipients(self, audience, after_id, limit):
+        """Пачка (id, telegram_id, language) по возрастанию id"""
+        query = (f'SELECT u.id, u.telegram_id, u.language FROM public.users u '
+                 f'WHERE {_BASE_CONDITION} AND {AUDIENCES[audience]}')
+        params = []
+        if after_id is not None:
+            query += ' AND u.id > %s'
+            params.append(after_id)
+        query += ' ORDER BY u.id LIMIT %s'
+        params.append(limit)
+        return self.db.execute_query(query, tuple(params))
+
+    def _send_one(self, job, telegram_id, text):
+        if job['image_url']:
+            return self.api.send_photo(telegram_id, job['image_url'], text, job['reply_markup'],
+                                       priority=MARKETING, wait=False)
+        return self.api.send_message(telegram_id, text, job['reply_markup'],
+                                     priority=MARKETING, wait=False)
+
+    def run(self, job, record_statistics=True):
+        """Выполнить (или продолжить) задание; (отправлено, ошибок)"""
+        if job['id'] is not None:
+            claimed = self._claim(job['id'])
+            if claimed is None:
+                logger.info(f"Рассылка {job['id']} уже выполняется другим процессом")
+                return job['sent_count'], job['error_count']
+            job = _job_from_row(claimed)
+            job['id'] = str(job['id'])
+        key = job['id'] or id(job)
+        started = time.monotonic()
+        done_before = job['sent_count'] + job['error_count']
+        rendered = {}             # язык -> готовый текст
+
+        while True:
+            rows = self._recipients(job['audience'], job['last_user_id'], self.batch_size)
+            if rows is None:
+                # Ошибка чтения: аренда истечёт, и задание продолжит watcher
+                logger.error(f"Рассылка {job['id']}: ошибка чтения получателей, прервана")
+                return job['sent_count'], job['error_count']
+            if not rows:
+                break
+            pending = []
+            for _user_id, telegram_id, language in rows:
+                language = language or 'ru'
+                text = rendered.get(language)
+                if text is None:
+                    text = rendered[language] = self.localize(job['message'], language)
+                pending.append(self._send_one(job, telegram_id, text))
+            counts = self._await_batch(job, pending)
+            if counts is None:
+                logger.info(f"Рассылка {job['id']} отменена или перехвачена, остановка")
+                return job['sent_count'], job['error_count']
+            sent, errors = counts
+            job['sent_count'] += sent
+            job['error_count'] += errors
+            job['last_user_id'] = rows[-1][0]
+            self._set_progress(key, job, done_before, started)
+            if job['id'] is not None and not self._checkpoint(job):
+                logger.info(f"Рассылка {job['id']} отменена или перехвачена, остановка")
+                return job['sent_count'], job['error_count']
+            if len(rows) < self.batch_size:
+                break
+
+        self._finish(job)
+        if record_statistics:
+            self.record_statistics([job])
+        with self._lock:
+            self._progress.pop(key, None)
+        logger.info(f"📊 Рассылка {job['id']} ({job['audience']}): отправлено {job['sent_count']}, "
+                    f"ошибок {job['error_count']}")
+        return job['sent_count'], job['error_count']
+
+    def _finish(self, job):
+        if job['id'] is None:
+            return
+        self.db.execute_query(
+            "UPDATE public.broadcast_jobs SET status = 'done', sent_count = %s, error_count = %s, "
+            "last_user_id = %s, lease_until = NULL, finished_at = NOW(), updated_at = NOW() "
+            "WHERE id = %s AND lease_owner = %s",
+            (job['sent_count'], job['error_count'], job['last_user_id'], job['id'], self.owner)
+        )
+
+    def record_statistics(self, jobs):
+        """Итоги заданий в post_statistics одним INSERT"""
+        if not jobs:
+            return
+        values = ', '.join(['(%s, %s, %s, %s, NOW())'] * len(jobs))
+        params = []
+        for job in jobs:
+            params.extend([job['post_id'], job['time_period'] or job['kind'],
+                           job['sent_count'], job['error_count']])
+        self.db.execute_query(
+            f'INSERT INTO public.post_statistics (post_id, time_period, sent_count, error_count, sent_at) '
+            f'VALUES {values}',
+            tuple(params)
+        )
+
+    def cancel(self, job_id):
+        """Отменить задание; выполняющий процесс остановится при следующем продлении аренды"""
+        return self.db.execute_query(
+            "UPDATE public.broadcast_jobs SET status = 'cancelled', lease_until = NULL, updated_at = NOW() "
+            "WHERE id = %s AND status IN ('pending', 'running')",
+            (job_id,)
+        ) is not None
+
+    # --- продолжение упавших заданий ---
+
+    def resume_pending(self):
+        """Продолжить задания, брошенные упавшими процессами; число завершённых"""
+        rows = self.db.execute_query(
+            f'SELECT {_JOB_COLUMNS} FROM public.broadcast_jobs '
+            "WHERE status IN ('pending', 'running') AND (lease_until IS NULL OR lease_until < NOW()) "
+            'ORDER BY created_at LIMIT 20'
+        )
+        finished = []
+        for row in rows or []:
+            job = _job_from_row(row)
+            job['id'] = str(job['id'])
+            logger.info(f"Продолжение рассылки {job['id']} с пользователя {job['last_user_id']}")
+            self.run(job, record_statistics=False)
+            state = self.db.execute_query(
+                'SELECT status, sent_count, error_count FROM public.broadcast_jobs WHERE id = %s',
+                (job['id'],)
+            )
+            if state and state[0][0] == 'done':
+                job['sent_count'], job['error_count'] = state[0][1], state[0][2]
+                finished.append(job)
+        self.record_statistics(finished)
+        return len(finished)
+
+    def start_watcher(self, interval=None):
+        """Фоновая проверка брошенных заданий (в боте — только шард 0)"""
+        interval = interval or BROADCAST_CONFIG['watch_interval']
+
+        def watch():
+            while True:
+                try:
+                    self.resume_pending()
+                except Exception as e:
+                    logger.error(f"Ошибка продолжения рассылок: {e}")
+                time.sleep(interval)
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=watch, name='broadcast-watcher', daemon=True)
+            self._watcher.start()
+
+    # --- прогресс ---
+
+    def _set_progress(self, key, job, done_before, started):
+        processed = job['sent_count'] + job['error_count']
+        elapsed = max(time.monotonic() - started, 1e-6)
+        with self._lock:
+            self._progress[key] = {
+                'id': job['id'], 'audience': job['audience'], 'status': 'running',
+                'total': job['total_count'], 'processed': processed,
+                'sent': job['sent_count'], 'errors': job['error_count'],
+                'per_second': round((processed - done_before) / elapsed, 2),
+            }
+
+    def get_progress(self, job_id):
+        """Прогресс задания: из памяти, если оно идёт в этом процессе, иначе из базы"""
+        with self._lock:
+            local = self._progress.get(job_id)
+            if local is not None:
+                return dict(local)
+        rows = self.db.execute_query(
+            'SELECT id, audience, status, total_count, sent_count, error_count, '
+            'EXTRACT(EPOCH FROM (COALESCE(finished_at, updated_at) - started_at)) '
+            'FROM public.broadcast_jobs WHERE id = %s',
+            (job_id,)
+        )
+        if not rows:
+            return None
+        _, audience, status, total, sent, errors, elapsed = rows[0]
+        processed = (sent or 0) + (errors or 0)
+        elapsed = float(elapsed or 0)
+        return {
+            'id': job_id, 'audience': audience, 'status': status, 'total': total,
+            'processed': processed, 'sent': sent, 'errors': errors,
+            'per_second': round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    def list_progress(self):
+        with self._lock:
+            return [dict(progress) for progress in self._progress.values()]
@@ -0,0 +1,424 @@
+"""
+Снимок каталога в памяти бота.
+
+Категории, подкатегории и активные товары загружаются одним проходом и
+складываются в неизменяемый CatalogSnapshot с индексами по id, по тексту
+кнопки, по нормализованному имени и по категории/подкатегории. Обработчики
+резолвят нажатия по снимку без обращения к БД. Новый снимок собирается в
+фоне и подменяет старый одним присваиванием ссылки — читатели всегда видят
+либо старую, либо новую версию целиком.
+
+Клавиатуры категорий, подкатегорий и страниц товаров собираются и
+сериализуются один раз на снимок: новая версия каталога начинает с
+пустого кэша клавиатур.
+
+События инвалидации копятся coalesce_delay секунд и применяются одним новым
+снимком: массовая правка N товаров — один запрос и одна пересборка, а не N.
+"""
+import re
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+from pagination import AFTER, BEFORE, Page, encode_cursor, split_cursor
+from keyboards import Markup, create_categories_keyboard, create_subcategories_keyboard, create_products_keyboard
+
+logger = logging.getLogger('catalog')
+
+CATEGORIES_SQL = (
+    'SELECT id, name, description, emoji, is_active, created_at '
+    'FROM public.categories WHERE is_active = true ORDER BY name'
+)
+SUBCATEGORIES_SQL = (
+    'SELECT id, name, emoji, category_id, is_active '
+    'FROM public.subcategories WHERE is_active = true ORDER BY name'
+)
+# Полная строка товара в порядке колонок таблицы — её ждут
+# show_product_details и create_product_card
+PRODUCTS_SQL = 'SELECT * FROM public.products WHERE is_active = true ORDER BY name'
+
+# Точечная перезагрузка записей по событиям инвалидации ({ids} — список %s)
+_ROW_SQL = {
+    'categories': (
+        'SELECT id, name, description, emoji, is_active, created_at '
+        'FROM public.categories WHERE id IN ({ids}) AND is_active = true'
+    ),
+    'subcategories': (
+        'SELECT id, name, emoji, category_id, is_active '
+        'FROM public.subcategories WHERE id IN ({ids}) AND is_active = true'
+    ),
+    'products': 'SELECT * FROM public.products WHERE id IN ({ids}) AND is_active = true',
+}
+
+# Индексы колонок в строках снимка
+CATEGORY_EMOJI = 3
+SUBCATEGORY_EMOJI = 2
+SUBCATEGORY_CATEGORY_ID = 3
+PRODUCT_PRICE = 3
+PRODUCT_CATEGORY_ID = 4
+PRODUCT_SUBCATEGORY_ID = 5
+
+_LEADING_SYMBOLS = re.compile(r'^[^\w]+', re.UNICODE)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_name(text):
+    """Имя без эмодзи в начале, пробелов по краям и регистра"""
+    text = _LEADING_SYMBOLS.sub('', str(text or ''))
+    return _SPACES.sub(' ', text).strip().casefold()
+
+
+def category_label(category):
+    """Текст кнопки категории, как в create_categories_keyboard"""
+    return f"{category[CATEGORY_EMOJI]} {category[1]}"
+
+
+def subcategory_label(subcategory):
+    """Текст кнопки подкатегории, как в create_subcategories_keyboard"""
+    return f"{subcategory[SUBCATEGORY_EMOJI]} {subcategory[1]}"
+
+
+def product_label(product):
+    """Текст кнопки товара, как в create_products_keyboard"""
+    return f"🛍 {product[1]} - ${float(product[PRODUCT_PRICE] or 0):.2f}"
+
+
+def _group(rows, column):
+    groups = {}
+    for row in rows:
+        groups.setdefault(str(row[column]), []).append(row)
+    return MappingProxyType({key: tuple(items) for key, items in groups.items()})
+
+
+def _positions(groups):
+    """id строки -> её номер внутри своей группы"""
+    return MappingProxyType({
+        str(row[0]): position
+        for rows in groups.values()
+        for position, row in enumerate(rows)
+    })
+
+
+def _index(rows, key_func):
+    index = {}
+    for row in rows:
+        # При совпадении имён выигрывает первая строка (ORDER BY name)
+        index.setdefault(key_func(row), row)
+    return MappingProxyType(index)
+
+
+class CatalogSnapshot:
+    """Неизменяемая версия каталога с индексами"""
+
+    __slots__ = (
+        'version', 'built_at', 'categories', 'subcategories', 'products',
+        'categories_by_id', 'categories_by_label', 'categories_by_name',
+        'subcategories_by_id', 'subcategories_by_label', 'subcategories_by_name',
+        'subcategories_by_category',
+        'products_by_id', 'products_by_label', 'products_by_name',
+        'products_by_category', 'products_by_subcategory',
+        'positions_in_category', 'positions_in_subcategory', 'keyboards',
+    )
+
+    def __init__(self, categories=(), subcategories=(), products=(), version=0):
+        categories = tuple(tuple(row) for row in categories or ())
+        subcategories = tuple(tuple(row) for row in subcategories or ())
+        products = tuple(tuple(row) for row in products or ())
+        set_ = object.__setattr__
+        set_(self, 'version', version)
+        set_(self, 'built_at', time.time())
+        set_(self, 'categories', categories)
+        set_(self, 'subcategories', subcategories)
+        set_(self, 'products', products)
+
+        set_(self, 'categories_by_id', _index(categories, lambda r: str(r[0])))
+        set_(self, 'categories_by_label', _index(categories, category_label))
+        set_(self, 'categories_by_name', _index(categories, lambda r: normalize_name(r[1])))
+
+        set_(self, 'subcategories_by_id', _index(subcategories, lambda r: str(r[0])))
+        set_(self, 'subcategories_by_label', _index(subcategories, subcategory_label))
+        set_(self, 'subcategories_by_name', _index(subcategories, lambda r: normalize_name(r[1])))
+        set_(self, 'subcategories_by_category', _group(subcategories, SUBCATEGORY_CATEGORY_ID))
+
+        set_(self, 'products_by_id', _index(products, lambda r: str(r[0])))
+        set_(self, 'products_by_label', _index(products, product_label))
+        set_(self, 'products_by_name', _index(products, lambda r: normalize_name(r[1])))
+        set_(self, 'products_by_category', _group(products, PRODUCT_CATEGORY_ID))
+        set_(self, 'products_by_subcategory', _group(products, PRODUCT_SUBCATEGORY_ID))
+        set_(self, 'positions_in_category', _positions(self.products_by_category))
+        set_(self, 'positions_in_subcategory', _positions(self.products_by_subcategory))
+        set_(self, 'keyboards', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogSnapshot is immutable")
+
+    @property
+    def is_empty(self):
+        return not (self.categories or self.products)
+
+    # --- резолв нажатий ---
+
+    def find_category(self, text):
+        """Категория по тексту кнопки, имени или части имени"""
+        return self._find(text, self.categories_by_label, self.categories_by_name)
+
+    def find_subcategory(self, text):
+        return self._find(text, self.subcategories_by_label, self.subcategories_by_name)
+
+    def find_product(self, text):
+        """Товар по тексту кнопки «🛍 Имя - $цена» или по имени"""
+        product = self.products_by_label.get(text)
+        if product is not None:
+            return product
+        name = text
+        if ' - $' in name:
+            name = name.rsplit(' - $', 1)[0]
+        return self.products_by_name.get(normalize_name(name))
+
+    @staticmethod
+    def _find(text, by_label, by_name):
+        row = by_label.get(text)
+        if row is not None:
+            return row
+        name = normalize_name(text)
+        if not name:
+            return None
+        row = by_name.get(name)
+        if row is not None:
+            return row
+        # Замена ILIKE '%name%': самое короткое имя, содержащее запрос
+        matches = [key for key in by_name if name in key]
+        return by_name[min(matches, key=len)] if matches else None
+
+    def category(self, category_id):
+        return self.categories_by_id.get(str(category_id))
+
+    def subcategory(self, subcategory_id):
+        return self.subcategories_by_id.get(str(subcategory_id))
+
+    def product(self, product_id):
+        return self.products_by_id.get(str(product_id))
+
+    def subcategories_of(self, category_id):
+        return self.subcategories_by_category.get(str(category_id), ())
+
+    def products_in_category(self, category_id):
+        return self.products_by_category.get(str(category_id), ())
+
+    def products_in_subcategory(self, subcategory_id):
+        return self.products_by_subcategory.get(str(subcategory_id), ())
+
+    def products_page(self, scope, scope_id, cursor=None, limit=10):
+        """Страница товаров категории (scope='c') или подкатегории ('s').
+
+        Курсор — направление и id крайнего товара страницы; его позиция
+        берётся из индекса, так что любая страница собирается срезом.
+        Товар из курсора пропал из снимка — показываем первую страницу.
+        """
+        if scope == 'c':
+            rows, positions = self.products_in_category(scope_id), self.positions_in_category
+        else:
+            rows, positions = self.products_in_subcategory(scope_id), self.positions_in_subcategory
+        direction, key = split_cursor(cursor)
+        anchor = positions.get(str(key[0])) if key else None
+        if anchor is None:
+            start = 0
+        elif direction == AFTER:
+            start = anchor + 1
+        else:
+            start = max(0, anchor - limit)
+        end = min(len(rows), start + limit if anchor is None or direction == AFTER else anchor)
+        items = list(rows[start:end])
+        if not items:
+            return Page([], None, None)
+        next_cursor = encode_cursor(AFTER, items[-1][0]) if end < len(rows) else None
+        prev_cursor = encode_cursor(BEFORE, items[0][0]) if start > 0 else None
+        return Page(items, next_cursor, prev_cursor)
+
+    def product_position(self, scope, product_id):
+        """Номер товара внутри его категории/подкатегории (с нуля)"""
+        positions = self.positions_in_category if scope == 'c' else self.positions_in_subcategory
+        return positions.get(str(product_id))
+
+    # --- клавиатуры этой версии ---
+
+    def _keyboard(self, key, build):
+        markup = self.keyboards.get(key)
+        if markup is None:
+            markup = self.keyboards.setdefault(key, Markup(build()))
+        return markup
+
+    def categories_keyboard(self):
+        return self._keyboard('categories', lambda: create_categories_keyboard(self.categories))
+
+    def subcategories_keyboard(self, category_id):
+        subcategories = self.subcategories_of(category_id)
+        return self._keyboard(('subcategories', str(category_id)),
+                              lambda: create_subcategories_keyboard(subcategories))
+
+    def products_keyboard(self, scope, scope_id, page):
+        """Клавиатура страницы products_page (страница определяется первым товаром)"""
+        key = ('products', scope, str(scope_id), str(page.items[0][0]), len(page.items))
+        return self._keyboard(key, lambda: create_products_keyboard(page.items))
+
+    def get_stats(self):
+        return {
+            'version': self.version,
+            'built_at': self.built_at,
+            'categories': len(self.categories),
+            'subcategories': len(self.subcategories),
+            'products': len(self.products),
+            'keyboards': len(self.keyboards),
+        }
+
+
+class CatalogManager:
+    """Держит текущий снимок и пересобирает его в фоне"""
+
+    def __init__(self, db, refresh_interval=300, coalesce_delay=0.5, coalesce_limit=500):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.coalesce_delay = coalesce_delay
+        # Больше изменённых записей за раз — дешевле полная пересборка
+        self.coalesce_limit = coalesce_limit
+        self.snapshot = CatalogSnapshot()
+        self._build_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}            # таблица -> id изменённых записей
+        self._pending_lock = threading.Lock()
+        self._rebuild_requested = False
+        self._thread = None
+        self._running = False
+
+    def get(self):
+        """Текущий снимок; при первом обращении собирается синхронно"""
+        snapshot = self.snapshot
+        if snapshot.version == 0:
+            self.rebuild()
+            snapshot = self.snapshot
+        return snapshot
+
+    def _load(self, sql):
+        rows = self.db.execute_query(sql)
+        if rows is None:
+            raise RuntimeError(f"catalog query failed: {sql}")
+        return rows
+
+    def rebuild(self):
+        """Сборка новой версии и атомарная подмена; при ошибке остаётся старая"""
+        with self._build_lock:
+            try:
+                started = time.monotonic()
+                snapshot = CatalogSnapshot(
+                    categories=self._load(CATEGORIES_SQL),
+                    subcategories=self._load(SUBCATEGORIES_SQL),
+                    products=self._load(PRODUCTS_SQL),
+                    version=self.snapshot.version + 1,
+                )
+            except Exception as e:
+                logger.error(f"Ошибка сборки снимка каталога: {e}")
+                return False
+            self.snapshot = snapshot
+            logger.info(
+                f"Каталог v{snapshot.version}: {len(snapshot.categories)} категорий, "
+                f"{len(snapshot.products)} товаров за {time.monotonic() - started:.2f}s"
+            )
+            return True
+
+    def refresh_entry(self, table, entity_id):
+        """Перечитать одну категорию/подкатегорию/товар и подменить снимок"""
+        if entity_id is None:
+            return False
+        return self.refresh_entries({table: {str(entity_id)}})
+
+    def refresh_entries(self, changes):
+        """Перечитать изменённые записи {таблица: id} и подменить снимок один раз.
+
+        Неактивные или удалённые записи убираются из снимка. Индексы
+        пересобираются в памяти, из базы читаются только эти строки —
+        один запрос на таблицу.
+        """
+        if not changes or any(table not in _ROW_SQL for table in changes):
+            return False
+        with self._build_lock:
+            current = self.snapshot
+            if current.version == 0:
+                return False
+            parts = {
+                'categories': current.categories,
+                'subcategories': current.subcategories,
+                'products': current.products,
+            }
+            for table, ids in changes.items():
+                ids = sorted(ids)
+                sql = _ROW_SQL[table].format(ids=', '.join(['%s'] * len(ids)))
+                rows = self.db.execute_query(sql, tuple(ids))
+                if rows is None:
+                    logger.error(f"Не удалось перечитать {table}: {len(ids)} записей")
+                    return False
+                changed = set(ids)
+                kept = [row for row in parts[table] if str(row[0]) not in changed]
+                kept.extend(rows)
+                kept.sort(key=lambda row: str(row[1] or ''))
+                parts[table] = kept
+            self.snapshot = CatalogSnapshot(version=current.version + 1, **parts)
+            return True
+
+    def invalidate(self, table, entity_id):
+        """Событие об изменении записи; применяется пачкой в фоновом потоке"""
+        if table not in _ROW_SQL or entity_id is None:
+            self.request_rebuild()
+            return
+        if not self._running:
+            if not self.refresh_entry(table, entity_id):
+                self.rebuild()
+            return
+        with self._pending_lock:
+            self._pending.setdefault(table, set()).add(str(entity_id))
+        self._wakeup.set()
+
+    def request_rebuild(self):
+        """Попросить фоновый поток пересобрать снимок"""
+        if self._running:
+            with self._pending_lock:
+                self._rebuild_requested = True
+            self._wakeup.set()
+        else:
+            self.rebuild()
+
+    def _apply_pending(self, full):
+        """Накопленные события — точечно, либо полной пересборкой"""
+        with self._pending_lock:
+            changes, self._pending = self._pending, {}
+            full = full or self._rebuild_requested
+            self._rebuild_requested = False
+        if not full and not changes:
+            return
+        if full or sum(len(ids) for ids in changes.values()) > self.coalesce_limit:
+            self.rebuild()
+        elif not self.refresh_entries(changes):
+            self.rebuild()
+
+    def start(self):
+        """Фоновая пересборка по таймеру и request_rebuild(), точечная — по invalidate()"""
+        if self._running:
+            return
+        self._running = True
+
+        def worker():
+            while self._running:
+                woken = self._wakeup.wait(self.refresh_interval)
+                if woken and self.coalesce_delay:
+                    # Даём серии уведомлений (массовая правка) собраться в одну пачку
+                    time.sleep(self.coalesce_delay)
+                self._wakeup.clear()
+                if self._running:
+                    self._apply_pending(full=not woken)
+
+        self._thread = threading.Thread(target=worker, name='catalog-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
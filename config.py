@@ -51,6 +51,20 @@ REDIS_CONFIG = {
     'enabled': os.getenv('REDIS_ENABLED', 'false').lower() == 'true'
 }
 
+# Снимок каталога в памяти бота
+CATALOG_CONFIG = {
+    'refresh_interval': int(os.getenv('CATALOG_REFRESH_INTERVAL', '300')),  # секунд
+    # События инвалидации копятся coalesce_delay секунд и применяются одним снимком;
+    # больше coalesce_limit записей за раз — полная пересборка
+    'coalesce_delay': float(os.getenv('CATALOG_COALESCE_DELAY', '0.5')),
+    'coalesce_limit': int(os.getenv('CATALOG_COALESCE_LIMIT', '500')),
+}
+
+# Поиск товаров: запросы не длиннее short_query_chars отвечает индекс в памяти
+SEARCH_CONFIG = {
+    'short_query_chars': int(os.getenv('SEARCH_SHORT_QUERY_CHARS', '12'))
+}
+
 # Настройки мониторинга
 MONITORING_CONFIG = {
     'health_check_interval': 60,
@@ -69,12 +83,98 @@ BOT_CONFIG = {
     'currency_symbol': os.getenv('CURRENCY_SYMBOL', '$'),
     'webhook_url': os.getenv('WEBHOOK_URL'),
     'webhook_secret': os.getenv('WEBHOOK_SECRET'),
+    # polling | webhook; адрес, который слушает webhook-сервер за балансировщиком
+    'mode': os.getenv('BOT_MODE', 'polling').strip().lower(),
+    'webhook_listen_host': os.getenv('WEBHOOK_LISTEN_HOST', '0.0.0.0'),
+    'webhook_listen_port': int(os.getenv('WEBHOOK_LISTEN_PORT', '8443')),
+    'webhook_max_connections': int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
     'max_message_length': 4096,
     'request_timeout': 30,
+    # Параллельная обработка апдейтов (dispatcher.py)
+    'dispatch_workers': int(os.getenv('DISPATCH_WORKERS', '8')),
+    'dispatch_queue_size': int(os.getenv('DISPATCH_QUEUE_SIZE', '1000')),
+    'dispatch_drain_timeout': float(os.getenv('DISPATCH_DRAIN_TIMEOUT', '10')),
+    # Процессы-шарды по chat_id (sharding.py); 1 — обычный однопроцессный запуск
+    'shards': int(os.getenv('BOT_SHARDS', '1')),
+    'shard_max_inflight': int(os.getenv('SHARD_MAX_INFLIGHT', '1000')),
     'admin_telegram_id': os.getenv('ADMIN_TELEGRAM_ID'),
     'admin_name': os.getenv('ADMIN_NAME', 'Admin')
 }
 
+# Клиент Telegram Bot API (telegram_api.py): keep-alive пул и таймауты
+TELEGRAM_API_CONFIG = {
+    'base_url': os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org'),
+    'pool_size': int(os.getenv('TELEGRAM_POOL_SIZE', '8')),
+    'connect_timeout': float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '5')),
+    'read_timeout': float(os.getenv('TELEGRAM_READ_TIMEOUT', '30')),
+}
+
+# Push-уведомления (notifications.py): очередь с задержкой и outbox в базе
+NOTIFICATION_CONFIG = {
+    'push_workers': int(os.getenv('PUSH_WORKERS', '4')),
+    'push_retry_delay': int(os.getenv('PUSH_RETRY_DELAY', '300')),  # секунд
+    'outbox_recovery_batch': int(os.getenv('PUSH_OUTBOX_BATCH', '5000')),
+}
+
+# Состояние диалогов (state_store.py): memory | sqlite | postgres
+STATE_CONFIG = {
+    'backend': os.getenv('STATE_STORE', 'memory').strip().lower(),
+    'ttl': int(os.getenv('STATE_TTL', '86400')),  # секунд с последнего изменения
+    'max_entries': int(os.getenv('STATE_MAX_ENTRIES', '10000')),  # на пространство имён
+    'sqlite_path': os.getenv('STATE_SQLITE_PATH', 'bot_state.sqlite3'),
+    'flush_interval': float(os.getenv('STATE_FLUSH_INTERVAL', '1')),
+    'flush_batch': int(os.getenv('STATE_FLUSH_BATCH', '500')),
+}
+
+# Кэш данных страниц веб-админки (web_admin/cache.py)
+WEB_CACHE_CONFIG = {
+    'enabled': os.getenv('WEB_CACHE_ENABLED', 'true').lower() == 'true',
+    'ttl': int(os.getenv('WEB_CACHE_TTL', '60')),  # секунд, запись свежая
+    'stale_ttl': int(os.getenv('WEB_CACHE_STALE_TTL', '300')),  # ещё столько отдаётся устаревшей
+    'max_entries': int(os.getenv('WEB_CACHE_MAX_ENTRIES', '256')),
+}
+
+# Выгрузки веб-админки (web_admin/exports.py): потоковые CSV/XLSX
+EXPORT_CONFIG = {
+    'batch_size': int(os.getenv('EXPORT_BATCH_SIZE', '2000')),  # строк за одно чтение курсора
+    'gzip': os.getenv('EXPORT_GZIP', 'true').lower() == 'true',  # CSV сжимается, если браузер принимает gzip
+}
+
+# Колоночный снимок для отчётов (analytics_snapshot.py, нужен numpy)
+ANALYTICS_SNAPSHOT_CONFIG = {
+    'enabled': os.getenv('ANALYTICS_SNAPSHOT', 'false').lower() == 'true',
+    'dir': os.getenv('ANALYTICS_SNAPSHOT_DIR', 'analytics_snapshot'),
+    'max_age': int(os.getenv('ANALYTICS_SNAPSHOT_MAX_AGE', '7200')),  # секунд; старше — отчёты по базе
+    'rewrite_days': int(os.getenv('ANALYTICS_SNAPSHOT_REWRITE_DAYS', '30')),  # окно перечитывания
+    'batch_size': int(os.getenv('ANALYTICS_SNAPSHOT_BATCH_SIZE', '5000')),
+}
+
+# Массовые рассылки (broadcast.py)
+BROADCAST_CONFIG = {
+    'batch_size': int(os.getenv('BROADCAST_BATCH_SIZE', '500')),
+    # Аренда задания; после её истечения задание упавшего процесса продолжит другой
+    'lease_seconds': int(os.getenv('BROADCAST_LEASE_SECONDS', '300')),
+    'watch_interval': int(os.getenv('BROADCAST_WATCH_INTERVAL', '60')),
+}
+
+# Очередь исходящих сообщений (outbound.py): лимиты Telegram и приоритеты.
+# global_rate — общий лимит токена; процессы делят его заранее
+# (outbound.process_global_rate): веб-админке web_share, боту остальное.
+OUTBOUND_CONFIG = {
+    'enabled': os.getenv('OUTBOUND_SCHEDULER', 'true').lower() == 'true',
+    'global_rate': float(os.getenv('OUTBOUND_GLOBAL_RATE', '30')),
+    'web_share': min(1.0, max(0.0, float(os.getenv('OUTBOUND_WEB_SHARE', '0.2')))),
+    'web_processes': int(os.getenv('OUTBOUND_WEB_PROCESSES', os.getenv('WEB_CONCURRENCY', '4'))),  # воркеров gunicorn
+    'private_rate': float(os.getenv('OUTBOUND_PRIVATE_RATE', '1')),
+    'private_burst': int(os.getenv('OUTBOUND_PRIVATE_BURST', '3')),
+    'group_rate_per_minute': float(os.getenv('OUTBOUND_GROUP_RATE_PER_MINUTE', '20')),
+    'group_burst': int(os.getenv('OUTBOUND_GROUP_BURST', '3')),
+    'senders': int(os.getenv('OUTBOUND_SENDERS', '4')),
+    'max_retries': int(os.getenv('OUTBOUND_MAX_RETRIES', '3')),
+    # Сколько ждёт отправитель, который ждёт ответа (ответы пользователям), секунд
+    'queue_timeout': float(os.getenv('OUTBOUND_QUEUE_TIMEOUT', '60')),
+}
+
 # Контактная информация
 CONTACT_INFO = {
     'support_phone': os.getenv('SUPPORT_PHONE', '+998901234567'),
@@ -4,6 +4,7 @@ CRM модуль для управления клиентами
 
 from datetime import datetime
 from utils import format_price, format_date
+from analytics_snapshot import get_snapshot, customer_segments, churn_risk_customers, cohorts, retention_table
 
 class CRMManager:
     def __init__(self, db):
@@ -11,6 +12,10 @@ class CRMManager:
     
     def segment_customers(self):
         """Сегментация клиентов по RFM анализу"""
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return customer_segments(snapshot)
+
         customers = self.db.execute_query('''
             SELECT 
                 u.id,
@@ -22,8 +27,8 @@ class CRMManager:
                 AVG(o.total_amount) as avg_order_value,
                 MAX(o.created_at) as last_order_date,
                 julianday('now') - julianday(MAX(o.created_at)) as days_since_last_order
-            FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id AND o.status != 'cancelled'
+            FROM public.users u
+            LEFT JOIN public.orders o ON u.id = o.user_id AND o.status != 'cancelled'
             WHERE u.is_admin = false
             GROUP BY u.id, u.name, u.telegram_id, u.created_at
         ''') or []
@@ -118,7 +123,7 @@ class CRMManager:
         """Получение полного профиля клиента"""
         # Основная информация
         user_info = self.db.execute_query(
-            'SELECT * FROM users WHERE id = %s',
+            'SELECT * FROM public.users WHERE id = %s',
             (user_id,)
         )[0]
         
@@ -130,7 +135,7 @@ class CRMManager:
                 AVG(total_amount) as avg_order_value,
                 MIN(created_at) as first_order,
                 MAX(created_at) as last_order
-            FROM orders 
+            FROM public.orders 
             WHERE user_id = %s AND status != 'cancelled'
         ''', (user_id,))[0]
         
@@ -141,10 +146,10 @@ class CRMManager:
                 c.emoji,
                 COUNT(*) as orders_count,
                 SUM(oi.quantity * oi.price) as spent_amount
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN categories c ON p.category_id = c.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.categories c ON p.category_id = c.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
             GROUP BY c.id, c.name, c.emoji
             ORDER BY spent_amount DESC
@@ -157,9 +162,9 @@ class CRMManager:
                 p.name,
                 SUM(oi.quantity) as total_bought,
                 SUM(oi.quantity * oi.price) as total_spent
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
             GROUP BY p.id, p.name
             ORDER BY total_bought DESC
@@ -234,7 +239,7 @@ class CRMManager:
         events = []
         
         # Регистрация
-        user = self.db.execute_query('SELECT created_at FROM users WHERE id = %s', (user_id,))[0]
+        user = self.db.execute_query('SELECT created_at FROM public.users WHERE id = %s', (user_id,))[0]
         events.append({
             'type': 'registration',
             'date': user[0],
@@ -267,7 +272,7 @@ class CRMManager:
         
         # Заказы
         orders = self.db.execute_query('''
-            SELECT created_at, total_amount, status FROM orders 
+            SELECT created_at, total_amount, status FROM public.orders 
             WHERE user_id = %s 
             ORDER BY created_at
         ''', (user_id,))
@@ -286,6 +291,10 @@ class CRMManager:
     
     def get_churn_risk_customers(self):
         """Получение клиентов с риском оттока"""
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return churn_risk_customers(snapshot)
+
         at_risk_customers = self.db.execute_query('''
             SELECT 
                 u.id,
@@ -295,8 +304,8 @@ class CRMManager:
                 julianday('now') - julianday(MAX(o.created_at)) as days_since_last_order,
                 COUNT(o.id) as total_orders,
                 SUM(o.total_amount) as total_spent
-            FROM users u
-            JOIN orders o ON u.id = o.user_id
+            FROM public.users u
+            JOIN public.orders o ON u.id = o.user_id
             WHERE u.is_admin = false AND o.status != 'cancelled'
             GROUP BY u.id, u.name, u.telegram_id
             HAVING days_since_last_order > 60 AND total_orders >= 2
@@ -305,6 +314,35 @@ class CRMManager:
         
         return at_risk_customers
     
+    def get_cohort_retention(self, months=12):
+        """Удержание когорт по месяцу первого заказа за последние months месяцев"""
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return cohorts(snapshot, months)
+        
+        cells = self.db.execute_query('''
+            WITH o AS (
+                SELECT user_id, date_trunc('month', created_at) as month
+                FROM public.orders
+                WHERE status != 'cancelled' AND user_id IS NOT NULL AND created_at IS NOT NULL
+            ), f AS (
+                SELECT user_id, MIN(month) as cohort
+                FROM o
+                GROUP BY user_id
+            )
+            SELECT 
+                to_char(f.cohort, 'YYYY-MM') as cohort,
+                ((EXTRACT(YEAR FROM o.month) - EXTRACT(YEAR FROM f.cohort)) * 12
+                 + EXTRACT(MONTH FROM o.month) - EXTRACT(MONTH FROM f.cohort))::int as month_offset,
+                COUNT(DISTINCT o.user_id) as customers
+            FROM o
+            JOIN f ON f.user_id = o.user_id
+            WHERE f.cohort > date_trunc('month', now()) - %s * INTERVAL '1 month'
+            GROUP BY 1, 2
+        ''', (months,)) or []
+        
+        return retention_table(cells, months)
+    
     def create_win_back_campaign(self, customer_ids):
         """Создание кампании возврата клиентов"""
         campaign_results = []
@@ -318,7 +356,7 @@ class CRMManager:
             
             # Получаем данные клиента
             customer = self.db.execute_query(
-                'SELECT telegram_id, name, language FROM users WHERE id = %s',
+                'SELECT telegram_id, name, language FROM public.users WHERE id = %s',
                 (customer_id,)
             )[0]
             
@@ -348,10 +386,10 @@ class CRMManager:
         # Паттерны покупок
         purchase_patterns = self.db.execute_query('''
             SELECT 
-                strftime('%w', created_at) as day_of_week,
-                strftime('%H', created_at) as hour_of_day,
+                EXTRACT(DOW FROM created_at)::int::text as day_of_week,
+                to_char(created_at, 'HH24') as hour_of_day,
                 COUNT(*) as orders_count
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s AND status != 'cancelled'
             GROUP BY day_of_week, hour_of_day
             ORDER BY orders_count DESC
@@ -360,10 +398,10 @@ class CRMManager:
         # Сезонность покупок
         seasonal_patterns = self.db.execute_query('''
             SELECT 
-                strftime('%m', created_at) as month,
+                to_char(created_at, 'MM') as month,
                 COUNT(*) as orders_count,
                 SUM(total_amount) as total_spent
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s AND status != 'cancelled'
             GROUP BY month
             ORDER BY month
@@ -373,7 +411,7 @@ class CRMManager:
         purchase_intervals = self.db.execute_query('''
             SELECT 
                 julianday(created_at) - julianday(LAG(created_at) OVER (ORDER BY created_at)) as days_between
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s AND status != 'cancelled'
             ORDER BY created_at
         ''', (user_id,))
@@ -395,8 +433,8 @@ class CRMManager:
                 END as price_segment,
                 COUNT(*) as items_bought,
                 SUM(oi.quantity * oi.price) as total_spent
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
             GROUP BY price_segment
             ORDER BY total_spent DESC
@@ -414,9 +452,9 @@ class CRMManager:
         # Анализируем историю покупок
         purchase_history = self.db.execute_query('''
             SELECT DISTINCT p.category_id
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
         ''', (user_id,))
         
@@ -424,8 +462,8 @@ class CRMManager:
             # Для новых клиентов - популярные товары
             recommendations = self.db.execute_query('''
                 SELECT p.*, c.name as category_name
-                FROM products p
-                JOIN categories c ON p.category_id = c.id
+                FROM public.products p
+                JOIN public.categories c ON p.category_id = c.id
                 WHERE p.is_active = true
                 ORDER BY p.views DESC, p.sales_count DESC
                 LIMIT 5
@@ -501,7 +539,7 @@ class CRMManager:
         # Получаем историю покупок
         orders = self.db.execute_query('''
             SELECT total_amount, created_at
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s AND status != 'cancelled'
             ORDER BY created_at
         ''', (user_id,))
@@ -587,7 +625,7 @@ class CRMManager:
         orders = self.db.execute_query('''
             SELECT 'order' as type, created_at, 
                    'Заказ #' || id || ' на ' || total_amount || '$' as description
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s
         ''', (user_id,))
         
@@ -595,7 +633,7 @@ class CRMManager:
         notifications = self.db.execute_query('''
             SELECT 'notification' as type, created_at, 
                    title || ': ' || message as description
-            FROM notifications
+            FROM public.notifications
             WHERE user_id = %s
         ''', (user_id,))
         
@@ -604,7 +642,7 @@ class CRMManager:
             SELECT 'review' as type, r.created_at,
                    'Отзыв на ' || p.name || ' (' || r.rating || '/5)' as description
             FROM reviews r
-            JOIN products p ON r.product_id = p.id
+            JOIN public.products p ON r.product_id = p.id
             WHERE r.user_id = ?
         ''', (user_id,))
         
@@ -626,13 +664,13 @@ class CRMManager:
         order_completion = self.db.execute_query('''
             SELECT 
                 COUNT(CASE WHEN status = 'delivered' THEN 1 END) * 100.0 / COUNT(*) as completion_rate
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s AND status != 'cancelled'
         ''', (user_id,))[0][0]
         
         # Частота повторных покупок
         repeat_purchase_rate = self.db.execute_query('''
-            SELECT COUNT(*) FROM orders WHERE user_id = %s AND status != 'cancelled'
+            SELECT COUNT(*) FROM public.orders WHERE user_id = %s AND status != 'cancelled'
         ''', (user_id,))[0][0]
         
         # Рассчитываем общий индекс (0-100)
@@ -674,10 +712,10 @@ class CRMManager:
         # Анализируем что покупал клиент
         purchased_categories = self.db.execute_query('''
             SELECT DISTINCT p.category_id, c.name
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN categories c ON p.category_id = c.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.categories c ON p.category_id = c.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.user_id = %s AND o.status != 'cancelled'
         ''', (user_id,))
         
@@ -721,7 +759,7 @@ class CRMManager:
     def create_loyalty_tier_upgrade_notification(self, user_id, new_tier):
         """Создание уведомления о повышении уровня лояльности"""
         user = self.db.execute_query(
-            'SELECT telegram_id, name, language FROM users WHERE id = %s',
+            'SELECT telegram_id, name, language FROM public.users WHERE id = %s',
             (user_id,)
         )[0]
         
@@ -762,9 +800,9 @@ class CRMManager:
                 SUM(p.price * c.quantity) as cart_value,
                 MAX(c.created_at) as last_activity,
                 julianday('now') - julianday(MAX(c.created_at)) as hours_since_activity
-            FROM users u
+            FROM public.users u
             JOIN cart c ON u.id = c.user_id
-            JOIN products p ON c.product_id = p.id
+            JOIN public.products p ON c.product_id = p.id
             WHERE u.is_admin = false
             GROUP BY u.id, u.name
             HAVING hours_since_activity > 1  # Более часа назад
@@ -814,7 +852,7 @@ class CRMManager:
             
             # Получаем telegram_id
             user = self.db.execute_query(
-                'SELECT telegram_id, language FROM users WHERE id = %s',
+                'SELECT telegram_id, language FROM public.users WHERE id = %s',
                 (user_id,)
             )[0]
             
@@ -0,0 +1,68 @@
+"""
+Очередь с задержкой: элементы выдаются по времени готовности.
+
+Куча (heapq) по (due, seq): put и get — O(log n), поток-получатель спит
+ровно до ближайшего срока или до появления более раннего элемента, без
+опроса раз в секунду. Несколько потоков могут вызывать get() одновременно.
+"""
+import time
+import heapq
+import threading
+
+
+class DelayQueue:
+    """Потокобезопасная очередь с отложенной выдачей (время — time.time())"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item, due=None):
+        """Добавить элемент, готовый к выдаче в момент due (по умолчанию сразу)"""
+        due = time.time() if due is None else due
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, item))
+            # Будим получателей, только если новый элемент стал ближайшим
+            if self._heap[0][1] == self._seq:
+                self._cond.notify()
+
+    def get(self, timeout=None):
+        """Следующий готовый элемент; None — очередь закрыта или истёк timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                wait = None
+                if self._heap:
+                    due = self._heap[0][0]
+                    if due <= now:
+                        item = heapq.heappop(self._heap)[2]
+                        if self._heap and self._heap[0][0] <= now:
+                            # Готовы ещё элементы — пусть их заберёт другой поток
+                            self._cond.notify()
+                        return item
+                    wait = due - now
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return None
+                    wait = left if wait is None else min(wait, left)
+                self._cond.wait(wait)
+            return None
+
+    def close(self):
+        """Разбудить и отпустить всех получателей"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
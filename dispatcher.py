@@ -0,0 +1,193 @@
+"""
+Параллельная обработка апдейтов Telegram.
+
+Апдейты раскладываются по очередям чатов, очереди обслуживает
+ограниченный пул потоков. Внутри одного чата апдейты обрабатываются
+строго по порядку (чат одновременно в работе не более чем у одного
+потока), разные чаты — параллельно, поэтому медленный запрос одного
+пользователя не задерживает остальных.
+
+Общее число принятых, но не обработанных апдейтов ограничено:
+submit() блокируется, пока очереди не освободятся (backpressure), и
+getUpdates не забирает новые апдейты, пока старые не разобраны.
+"""
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('dispatcher')
+
+
+def chat_key(update):
+    """Ключ упорядочивания: чат апдейта, иначе отправитель, иначе сам апдейт"""
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if field in update:
+            chat = update[field].get('chat') or {}
+            if 'id' in chat:
+                return chat['id']
+    callback = update.get('callback_query')
+    if callback:
+        chat = (callback.get('message') or {}).get('chat') or {}
+        if 'id' in chat:
+            return chat['id']
+    for field in ('callback_query', 'inline_query', 'pre_checkout_query', 'shipping_query',
+                  'my_chat_member', 'chat_member'):
+        sender = (update.get(field) or {}).get('from') or {}
+        if 'id' in sender:
+            return sender['id']
+    return ('update', update.get('update_id'))
+
+
+class UpdateDispatcher:
+    """Пул потоков с очередью на каждый чат"""
+
+    def __init__(self, handler, workers=8, max_pending=1000):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Condition()
+        self._chats = {}          # ключ чата -> deque апдейтов
+        self._ready = deque()     # чаты с апдейтами, которые никто не обрабатывает
+        self._pending = 0
+        self._threads = []
+        self._running = False
+        self.stats = {'submitted': 0, 'processed': 0, 'errors': 0,
+                      'backpressure_waits': 0, 'max_chat_depth': 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'dispatch-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update, timeout=None):
+        """Передать апдейт в обработку; блокируется, если очередь заполнена.
+
+        True — апдейт принят (можно сдвигать offset), False — диспетчер
+        остановлен или истёк timeout.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.stats['backpressure_waits'] += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                if not self._running:
+                    return False
+                wait = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+                if self._slots.acquire(timeout=wait):
+                    break
+        if not self._running:
+            self._slots.release()
+            return False
+
+        key = chat_key(update)
+        with self._lock:
+            queue = self._chats.get(key)
+            if queue is None:
+                queue = self._chats[key] = deque()
+                self._ready.append(key)
+                self._lock.notify()
+            queue.append(update)
+            self._pending += 1
+            self.stats['submitted'] += 1
+            if len(queue) > self.stats['max_chat_depth']:
+                self.stats['max_chat_depth'] = len(queue)
+        return True
+
+    def _next(self):
+        """Следующий (ключ, апдейт); чат остаётся закреплён за потоком до _done"""
+        with self._lock:
+            while not self._ready:
+                if not self._running:
+                    return None, None
+                self._lock.wait(1.0)
+            key = self._ready.popleft()
+            return key, self._chats[key].popleft()
+
+    def _done(self, key, ok):
+        with self._lock:
+            self._pending -= 1
+            self.stats['processed' if ok else 'errors'] += 1
+            queue = self._chats[key]
+            if queue:
+                # В конец списка — чаты обслуживаются по кругу
+                self._ready.append(key)
+                self._lock.notify()
+            else:
+                del self._chats[key]
+            if self._pending == 0:
+                self._lock.notify_all()
+        self._slots.release()
+
+    def _worker(self):
+        while True:
+            key, update = self._next()
+            if update is None:
+                return
+            ok = False
+            try:
+                self.handler(update)
+                ok = True
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}", exc_info=True)
+            finally:
+                self._done(key, ok)
+
+    def join(self, timeout=None):
+        """Дождаться обработки всех принятых апдейтов"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    return False
+                self._lock.wait(wait)
+        return True
+
+    def stop(self, timeout=10):
+        """Дообработать принятые апдейты (не дольше timeout) и остановить потоки"""
+        drained = self.join(timeout)
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+        if not drained:
+            logger.warning(f"Остановка диспетчера: не обработано {self._pending} апдейтов")
+        return drained
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pending=self._pending, active_chats=len(self._chats),
+                        workers=self.workers, max_pending=self.max_pending)
+
+
+def poll_updates(api, sink, is_running, offset=0, timeout=30):
+    """Цикл getUpdates: каждый апдейт передаётся в sink.submit().
+
+    offset сдвигается только после того, как sink принял апдейт, поэтому
+    непереданные апдейты Telegram отдаст снова. Возвращает последний offset.
+    """
+    while is_running():
+        updates = api.get_updates(offset, timeout=timeout)
+        if updates and updates.get('ok'):
+            for update in updates['result']:
+                # Блокируется, пока очереди заполнены
+                if not sink.submit(update):
+                    return offset
+                offset = update['update_id'] + 1
+        else:
+            if updates and updates.get('error_code') == 409:
+                logger.warning("getUpdates: установлен webhook — удалите его "
+                               "(scripts/manage_webhook.py delete) или запустите BOT_MODE=webhook")
+            else:
+                logger.warning("getUpdates returned empty/invalid — backing off")
+            time.sleep(3)
+    return offset
@@ -4,6 +4,7 @@
 
 from datetime import datetime, timedelta
 from utils import format_price
+from analytics_snapshot import get_snapshot, customer_metrics
 
 class FinancialReportsManager:
     def __init__(self, db):
@@ -25,17 +26,17 @@ class FinancialReportsManager:
                 SUM(promo_discount) as total_discounts,
                 COUNT(*) as orders_count,
                 SUM(delivery_cost) as delivery_revenue
-            FROM orders 
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            FROM public.orders 
+            WHERE created_at::date BETWEEN ? AND ?
             AND status IN ('confirmed', 'shipped', 'delivered')
         ''', (start_date, end_date))
         
         # Себестоимость товаров
         cogs_data = self.db.execute_query('''
             SELECT SUM(oi.quantity * p.cost_price) as total_cogs
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE DATE(o.created_at) BETWEEN ? AND ?
             AND o.status IN ('confirmed', 'shipped', 'delivered')
         ''', (start_date, end_date))
@@ -45,8 +46,8 @@ class FinancialReportsManager:
             SELECT 
                 expense_type,
                 SUM(amount) as total_amount
-            FROM business_expenses
-            WHERE DATE(expense_date) BETWEEN ? AND ?
+            FROM public.business_expenses
+            WHERE expense_date::date BETWEEN ? AND ?
             GROUP BY expense_type
         ''', (start_date, end_date))
         
@@ -89,35 +90,35 @@ class FinancialReportsManager:
         # Поступления
         cash_inflows = self.db.execute_query('''
             SELECT 
-                DATE(created_at) as date,
+                created_at::date as date,
                 SUM(total_amount - COALESCE(promo_discount, 0)) as daily_revenue
-            FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            FROM public.orders
+            WHERE created_at::date BETWEEN ? AND ?
             AND payment_status = 'paid'
-            GROUP BY DATE(created_at)
+            GROUP BY created_at::date
             ORDER BY date
         ''', (start_date, end_date))
         
         # Расходы
         cash_outflows = self.db.execute_query('''
             SELECT 
-                DATE(expense_date) as date,
+                expense_date::date as date,
                 SUM(amount) as daily_expenses
-            FROM business_expenses
-            WHERE DATE(expense_date) BETWEEN ? AND ?
-            GROUP BY DATE(expense_date)
+            FROM public.business_expenses
+            WHERE expense_date::date BETWEEN ? AND ?
+            GROUP BY expense_date::date
             ORDER BY date
         ''', (start_date, end_date))
         
         # Закупки товаров
         inventory_purchases = self.db.execute_query('''
             SELECT 
-                DATE(created_at) as date,
+                created_at::date as date,
                 SUM(total_amount) as daily_purchases
             FROM purchase_orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            WHERE created_at::date BETWEEN ? AND ?
             AND status = 'paid'
-            GROUP BY DATE(created_at)
+            GROUP BY created_at::date
             ORDER BY date
         ''', (start_date, end_date))
         
@@ -171,8 +172,8 @@ class FinancialReportsManager:
             SELECT 
                 SUM(total_amount - COALESCE(promo_discount, 0)) as net_revenue,
                 SUM(total_amount - COALESCE(promo_discount, 0)) * ? as vat_amount
-            FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            FROM public.orders
+            WHERE created_at::date BETWEEN ? AND ?
             AND status IN ('confirmed', 'shipped', 'delivered')
         ''', (self.tax_rate, start_date, end_date))
         
@@ -181,9 +182,9 @@ class FinancialReportsManager:
             SELECT 
                 expense_type,
                 SUM(amount) as total_amount
-            FROM business_expenses
-            WHERE DATE(expense_date) BETWEEN ? AND ?
-            AND is_tax_deductible = 1
+            FROM public.business_expenses
+            WHERE expense_date::date BETWEEN ? AND ?
+            AND is_tax_deductible = TRUE
             GROUP BY expense_type
         ''', (start_date, end_date))
         
@@ -214,8 +215,8 @@ class FinancialReportsManager:
                 COUNT(DISTINCT u.id) as users_acquired,
                 SUM(o.total_amount) as revenue_generated,
                 AVG(o.total_amount) as avg_order_value
-            FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id AND o.status != 'cancelled'
+            FROM public.users u
+            LEFT JOIN public.orders o ON u.id = o.user_id AND o.status != 'cancelled'
             WHERE u.acquisition_channel IS NOT NULL
             GROUP BY acquisition_channel
         ''')
@@ -229,9 +230,9 @@ class FinancialReportsManager:
                 SUM(oi.quantity * oi.price) - SUM(oi.quantity * p.cost_price) as profit,
                 (SUM(oi.quantity * oi.price) - SUM(oi.quantity * p.cost_price)) / 
                 NULLIF(SUM(oi.quantity * p.cost_price), 0) * 100 as roi_percentage
-            FROM products p
-            JOIN order_items oi ON p.id = oi.product_id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.products p
+            JOIN public.order_items oi ON p.id = oi.product_id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.status != 'cancelled'
             GROUP BY p.id, p.name
             ORDER BY roi_percentage DESC
@@ -247,10 +248,10 @@ class FinancialReportsManager:
                 SUM(oi.quantity * p.cost_price) as cost,
                 (SUM(oi.quantity * oi.price) - SUM(oi.quantity * p.cost_price)) / 
                 NULLIF(SUM(oi.quantity * p.cost_price), 0) * 100 as roi_percentage
-            FROM categories c
-            JOIN products p ON c.id = p.category_id
-            JOIN order_items oi ON p.id = oi.product_id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.categories c
+            JOIN public.products p ON c.id = p.category_id
+            JOIN public.order_items oi ON p.id = oi.product_id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE o.status != 'cancelled'
             GROUP BY c.id, c.name, c.emoji
             ORDER BY roi_percentage DESC
@@ -349,8 +350,8 @@ class FinancialReportsManager:
                     o.promo_discount,
                     o.payment_method,
                     o.status
-                FROM orders o
-                JOIN users u ON o.user_id = u.id
+                FROM public.orders o
+                JOIN public.users u ON o.user_id = u.id
                 WHERE DATE(o.created_at) BETWEEN ? AND ?
                 ORDER BY o.created_at DESC
             ''', (start_date, end_date))
@@ -374,9 +375,9 @@ class FinancialReportsManager:
                     SUM(oi.quantity * oi.price) - SUM(oi.quantity * p.cost_price) as profit,
                     p.stock,
                     p.views
-                FROM products p
-                LEFT JOIN order_items oi ON p.id = oi.product_id
-                LEFT JOIN orders o ON oi.order_id = o.id 
+                FROM public.products p
+                LEFT JOIN public.order_items oi ON p.id = oi.product_id
+                LEFT JOIN public.orders o ON oi.order_id = o.id 
                     AND DATE(o.created_at) BETWEEN ? AND ?
                     AND o.status != 'cancelled'
                 GROUP BY p.id, p.name, p.stock, p.views
@@ -401,20 +402,52 @@ class FinancialReportsManager:
         
         # Customer Acquisition Cost (CAC)
         marketing_spend = self.db.execute_query('''
-            SELECT SUM(amount) FROM business_expenses
+            SELECT SUM(amount) FROM public.business_expenses
             WHERE expense_type = 'marketing'
-            AND DATE(expense_date) >= %s
+            AND expense_date::date >= %s
         ''', (start_date.strftime('%Y-%m-%d'),))[0][0] or 0
         
-        new_customers = self.db.execute_query('''
-            SELECT COUNT(*) FROM users
-            WHERE DATE(created_at) >= %s
-            AND is_admin = false
-        ''', (start_date.strftime('%Y-%m-%d'),))[0][0]
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            metrics = customer_metrics(snapshot, start_date)
+        else:
+            metrics = self._customer_metrics(start_date)
         
+        new_customers = metrics['new_customers']
         cac = marketing_spend / new_customers if new_customers > 0 else 0
         
         # Customer Lifetime Value (CLV)
+        avg_clv = metrics['avg_ltv']
+        avg_order_value = metrics['avg_order_value']
+        
+        # Churn Rate (отток клиентов)
+        active_customers_30_days_ago = metrics['active_previous']
+        active_customers_now = metrics['active_now']
+        churn_rate = ((active_customers_30_days_ago - active_customers_now) / 
+                     active_customers_30_days_ago * 100) if active_customers_30_days_ago > 0 else 0
+        
+        # Monthly Recurring Revenue (MRR) - для подписочных товаров
+        mrr = metrics['revenue'] / 30
+        
+        return {
+            'cac': cac,
+            'clv': avg_clv,
+            'clv_cac_ratio': avg_clv / cac if cac > 0 else 0,
+            'avg_order_value': avg_order_value,
+            'churn_rate': max(0, churn_rate),
+            'mrr': mrr * 30,  # Месячная выручка
+            'new_customers_30d': new_customers
+        }
+    
+    def _customer_metrics(self, start_date):
+        """Метрики клиентов по базе (то же, что analytics_snapshot.customer_metrics)"""
+        day = start_date.strftime('%Y-%m-%d')
+        new_customers = self.db.execute_query('''
+            SELECT COUNT(*) FROM public.users
+            WHERE created_at::date >= %s
+            AND is_admin = false
+        ''', (day,))[0][0]
+        
         clv_data = self.db.execute_query('''
             SELECT 
                 AVG(total_spent) as avg_ltv,
@@ -425,51 +458,42 @@ class FinancialReportsManager:
                     u.id,
                     SUM(o.total_amount) as total_spent,
                     COUNT(o.id) as orders_count
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
+                FROM public.users u
+                JOIN public.orders o ON u.id = o.user_id
                 WHERE o.status != 'cancelled'
                 GROUP BY u.id
                 HAVING orders_count > 0
             ) customer_stats
         ''')[0]
         
-        avg_clv = clv_data[0] or 0
-        avg_orders = clv_data[1] or 0
-        avg_order_value = clv_data[2] or 0
-        
-        # Churn Rate (отток клиентов)
-        active_customers_30_days_ago = self.db.execute_query('''
-            SELECT COUNT(DISTINCT user_id) FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
+        active_previous = self.db.execute_query('''
+            SELECT COUNT(DISTINCT user_id) FROM public.orders
+            WHERE created_at::date BETWEEN ? AND ?
             AND status != 'cancelled'
         ''', (
             (start_date - timedelta(days=30)).strftime('%Y-%m-%d'),
-            start_date.strftime('%Y-%m-%d')
+            day
         ))[0][0]
         
-        active_customers_now = self.db.execute_query('''
-            SELECT COUNT(DISTINCT user_id) FROM orders
-            WHERE DATE(created_at) >= %s
+        active_now = self.db.execute_query('''
+            SELECT COUNT(DISTINCT user_id) FROM public.orders
+            WHERE created_at::date >= %s
             AND status != 'cancelled'
-        ''', (start_date.strftime('%Y-%m-%d'),))[0][0]
-        
-        churn_rate = ((active_customers_30_days_ago - active_customers_now) / 
-                     active_customers_30_days_ago * 100) if active_customers_30_days_ago > 0 else 0
+        ''', (day,))[0][0]
         
-        # Monthly Recurring Revenue (MRR) - для подписочных товаров
-        mrr = self.db.execute_query('''
-            SELECT SUM(total_amount) / 30 as daily_revenue
-            FROM orders
-            WHERE DATE(created_at) >= %s
+        revenue = self.db.execute_query('''
+            SELECT SUM(total_amount)
+            FROM public.orders
+            WHERE created_at::date >= %s
             AND status != 'cancelled'
-        ''', (start_date.strftime('%Y-%m-%d'),))[0][0] or 0
+        ''', (day,))[0][0] or 0
         
         return {
-            'cac': cac,
-            'clv': avg_clv,
-            'clv_cac_ratio': avg_clv / cac if cac > 0 else 0,
-            'avg_order_value': avg_order_value,
-            'churn_rate': max(0, churn_rate),
-            'mrr': mrr * 30,  # Месячная выручка
-            'new_customers_30d': new_customers
+            'new_customers': new_customers,
+            'avg_ltv': clv_data[0] or 0,
+            'avg_orders': clv_data[1] or 0,
+            'avg_order_value': clv_data[2] or 0,
+            'active_previous': active_previous,
+            'active_now': active_now,
+            'revenue': revenue
         }
\ No newline at end of file
@@ -85,7 +85,7 @@ except Exception:
 from utils import validate_phone, validate_email
 from datetime import datetime
 from keyboards import (
-    create_main_keyboard, create_categories_keyboard, create_subcategories_keyboard,
+    create_main_keyboard,
     create_products_keyboard, create_product_inline_keyboard, create_cart_keyboard,
     create_registration_keyboard, create_order_keyboard, create_back_keyboard,
     create_confirmation_keyboard, create_search_filters_keyboard,
@@ -100,21 +100,112 @@ from utils import (
     calculate_cart_total, format_cart_summary, get_order_status_emoji,
     get_order_status_text, create_product_card, create_stars_display
 )
-from localization import t, get_user_language
+from localization import t, get_user_language, set_current_language
+from pagination import encode_cursor, decode_cursor
+from router import Router
+from state_store import get_state_store
 from payments import PaymentProcessor, create_payment_keyboard, format_payment_info
 
 logger = logging.getLogger(__name__)
 
+# Размер страницы списков товаров и заказов в боте
+PRODUCTS_PAGE_SIZE = 10
+ORDERS_PAGE_SIZE = 10
+# Сколько результатов поиска запрашивать (показываются первые 10)
+SEARCH_RESULTS_LIMIT = 20
+
 class MessageHandler:
     def __init__(self, bot, db):
         # гарантируем наличие логгера
         self.logger = getattr(self, 'logger', None) or _logger
         self.bot = bot
         self.db = db
-        self.user_states = {}
+        # Шаги диалогов и введённые данные: TTL/LRU в памяти, при STATE_STORE — в базе
+        states = get_state_store(db)
+        self.user_states = states.namespace('user_states')
+        self.registration_data = states.namespace('registration_data')
+        self.order_data = states.namespace('order_data')
+        self.seller_data = states.namespace('seller_data')
         self.notification_manager = None
         self.payment_processor = PaymentProcessor()
-    
+        self.message_routes = self._build_message_routes()
+        self.callback_routes = self._build_callback_routes()
+
+    def _build_message_routes(self):
+        """Маршруты текстовых сообщений и состояний диалога.
+
+        Обработчики с pass_context=True получают язык пользователя.
+        """
+        routes = Router('message')
+
+        # Состояния диалога проверяются раньше текста
+        routes.state('registration_name', self.handle_registration_name)
+        routes.state('registration_phone', self.handle_registration_phone)
+        routes.state('registration_email', self.handle_registration_email)
+        routes.state('registration_language', self.handle_registration_language)
+        routes.state('seller_name', self.handle_seller_name)
+        routes.state('seller_phone', self.handle_seller_phone)
+        routes.state('seller_brand', self.handle_seller_brand)
+        routes.state('seller_products', self.handle_seller_products)
+        routes.state('searching', self.handle_search_query)
+        routes.state('order_address', self.handle_order_address)
+        routes.state('changing_language', self.handle_language_change)
+
+        # Команды
+        routes.exact('/start', self.handle_start_command)
+        routes.exact(['/help', 'ℹ️ Помощь', 'ℹ️ Yordam'], self.handle_help_command, pass_context=True)
+        routes.prefix('/order_', self.handle_order_command)
+        routes.prefix('/track_', self.handle_track_command)
+        routes.prefix('/promo_', self.handle_promo_command)
+        routes.prefix('/restore_', self.handle_restore_command)
+        routes.exact('/notifications', self.show_user_notifications)
+
+        # Кнопки меню
+        routes.exact(['🛍 Каталог', '🛍 Katalog', '🛍 Перейти в каталог', '🔙 К категориям', '➕ Добавить товары'],
+                     self.show_catalog)
+        routes.exact(['🛒 Корзина', '🛒 Savat'], self.show_cart)
+        routes.exact(['📋 Мои заказы', '📋 Mening buyurtmalarim'], self.show_user_orders)
+        routes.exact(['👤 Профиль', '👤 Profil'], self.show_user_profile)
+        routes.exact(['🔍 Поиск', '🔍 Qidiruv'], self.start_product_search)
+        routes.exact(['🧑‍💼 Стать продавцом', "🧑‍💼 Sotuvchi bo'lish"], self.start_seller_application)
+        routes.exact(['📞 Связаться с нами', "📞 Biz bilan bog'lanish"], self.handle_contact_request, pass_context=True)
+        routes.exact(['🔙 Главная', '🏠 Главная', '🏠 Bosh sahifa'], self.show_main_menu)
+        routes.exact('🌍 Сменить язык', self.start_language_change)
+
+        # Каталог: категория, подкатегория/бренд, товар — по эмодзи кнопки
+        routes.prefix(['📱 ', '👕 ', '🏠 ', '⚽ ', '💄 ', '📚 '], self.handle_category_selection)
+        routes.prefix(['🍎 ', '✔️ ', '👖 ', '☕ ', '👟 ', '💎 ', '📖 '], self.handle_subcategory_selection)
+        routes.prefix('🛍 ', self.handle_product_selection)
+
+        # Оформление заказа и корзина
+        routes.exact('📦 Оформить заказ', self.start_order_process)
+        routes.exact(['💳 Онлайн оплата', '💵 Наличными при получении'], self.handle_payment_method_selection)
+        routes.exact('🗑 Очистить корзину', self.clear_user_cart)
+        return routes
+
+    def _build_callback_routes(self):
+        """Маршруты callback_data inline-кнопок"""
+        routes = Router('callback')
+        routes.exact('back_to_categories', self._cb_back_to_categories)
+        routes.prefix('back_to_category_', self._cb_back_to_category)
+        routes.prefix('back_to_subcategory_', self._cb_back_to_subcategory)
+        routes.exact('go_to_cart', self._cb_go_to_cart)
+        routes.prefix(['plc_', 'pls_'], self._cb_products_page)
+        routes.prefix('orders_page_', self._cb_orders_page)
+        routes.prefix(['qty_inc_', 'qty_dec_'], self._cb_change_quantity)
+        routes.prefix('add_to_cart_', self.handle_add_to_cart)
+        routes.prefix('add_to_favorites_', self.handle_add_to_favorites)
+        routes.prefix('reviews_', self.handle_show_reviews)
+        routes.prefix('rate_product_', self.handle_rate_product)
+        routes.prefix('cart_', self.handle_cart_action)
+        routes.prefix('pay_', self.handle_payment_selection)
+        routes.exact('cancel_payment', self._cb_cancel_payment)
+        return routes
+
+    def get_route_stats(self):
+        """Вызовы и время обработки по маршрутам"""
+        return {'message': self.message_routes.get_stats(), 'callback': self.callback_routes.get_stats()}
+
     def handle_message(self, message):
         """Главный обработчик сообщений"""
         try:
@@ -137,6 +228,7 @@ class MessageHandler:
             user_language = 'ru'
             if user_data:
                 user_language = user_data[0][5] or 'ru'
+            set_current_language(user_language)
 
             # Проверяем статус регистрации
             is_registered = False
@@ -151,80 +243,10 @@ class MessageHandler:
                 self.send_registration_prompt(chat_id)
                 return
 
-            # Обрабатываем команды
-            if text == '/start':
-                self.handle_start_command(message)
-            elif text == '/help':
-                self.handle_help_command(message, user_language)
-            elif text.startswith('/order_'):
-                self.handle_order_command(message)
-            elif text.startswith('/track_'):
-                self.handle_track_command(message)
-            elif text.startswith('/promo_'):
-                self.handle_promo_command(message)
-            elif text.startswith('/restore_'):
-                self.handle_restore_command(message)
-            elif text == '/notifications':
-                self.show_user_notifications(message)
-
-            # Обрабатываем кнопки меню
-            elif text in ['🛍 Каталог', '🛍 Katalog', '🛍 Перейти в каталог']:
-                self.show_catalog(message)
-            elif text == '🔙 К категориям':
-                self.show_catalog(message)
-            elif text.startswith('🛍 '):
-                self.handle_product_selection(message)
-            elif text in ['🛒 Корзина', '🛒 Savat']:
-                self.show_cart(message)
-            elif text in ['📋 Мои заказы', '📋 Mening buyurtmalarim']:
-                self.show_user_orders(message)
-            elif text in ['👤 Профиль', '👤 Profil']:
-                self.show_user_profile(message)
-            elif text in ['🔍 Поиск', '🔍 Qidiruv']:
-                self.start_product_search(message)
-            elif text in ['🧑‍💼 Стать продавцом', "🧑‍💼 Sotuvchi bo'lish"]:
-                self.start_seller_application(message)
-            elif text in ['ℹ️ Помощь', 'ℹ️ Yordam']:
-                self.handle_help_command(message, user_language)
-            elif text in ['📞 Связаться с нами', '📞 Biz bilan bog\'lanish']:
-                self.handle_contact_request(message, user_language)
-            elif text == '🔙 Главная' or text == '🏠 Главная' or text == '🏠 Bosh sahifa':
-                self.show_main_menu(message)
-            elif text == '🌍 Сменить язык':
-                self.start_language_change(message)
-            
-            # Обрабатываем выбор категории
-            elif text.startswith('📱 ') or text.startswith('👕 ') or text.startswith('🏠 ') or text.startswith('⚽ ') or text.startswith('💄 ') or text.startswith('📚 '):
-                self.handle_category_selection(message)
-            
-            # Обрабатываем выбор подкатегории/бренда
-            elif text.startswith('🍎 ') or text.startswith('📱 ') or text.startswith('✔️ ') or text.startswith('👖 ') or text.startswith('☕ ') or text.startswith('👟 ') or text.startswith('💎 ') or text.startswith('📖 '):
-                self.handle_subcategory_selection(message)
-            
-            # Обрабатываем выбор товара
-            elif text.startswith('🛍 '):
-                self.handle_product_selection(message)
-            
-            # Обрабатываем поиск
-            elif telegram_id in self.user_states and self.user_states[telegram_id] == 'searching':
-                self.handle_search_query(message)
-            
-            # Обрабатываем оформление заказа
-            elif text == '📦 Оформить заказ':
-                self.start_order_process(message)
-            elif text in ['💳 Онлайн оплата', '💵 Наличными при получении']:
-                self.handle_payment_method_selection(message)
-            
-            # Обрабатываем управление корзиной
-            elif text == '🗑 Очистить корзину':
-                self.clear_user_cart(message)
-            elif text == '➕ Добавить товары' or text == '🛍 Перейти в каталог':
-                self.show_catalog(message)
-            
-            # Неизвестная команда
-            else:
+            # Команды и кнопки меню — таблица маршрутов (_build_message_routes)
+            if not self.message_routes.handle(text, message, user_language):
                 self.handle_unknown_command(message, user_language)
-                
+
         except Exception as e:
             logger.error(f"Ошибка обработки сообщения: {e}", exc_info=True)
             self.bot.send_message(message['chat']['id'], "❌ Произошла ошибка. Попробуйте еще раз.")
@@ -272,33 +294,10 @@ class MessageHandler:
     def handle_user_state(self, message):
         """Обработка состояний пользователя"""
         telegram_id = message['from']['id']
-        state = self.user_states.get(telegram_id)
-        
-        if state == 'registration_name':
-            self.handle_registration_name(message)
-        elif state == 'registration_phone':
-            self.handle_registration_phone(message)
-        elif state == 'registration_email':
-            self.handle_registration_email(message)
-        elif state == 'registration_language':
-            self.handle_registration_language(message)
-        elif state == 'seller_name':
-            self.handle_seller_name(message)
-        elif state == 'seller_phone':
-            self.handle_seller_phone(message)
-        elif state == 'seller_brand':
-            self.handle_seller_brand(message)
-        elif state == 'seller_products':
-            self.handle_seller_products(message)
-        elif state == 'searching':
-            self.handle_search_query(message)
-        elif state == 'order_address':
-            self.handle_order_address(message)
-        elif state == 'changing_language':
-            self.handle_language_change(message)
-        elif state.startswith('rating_product_'):
-            self.handle_product_rating(message)
-    
+        route = self.message_routes.resolve_state(self.user_states.get(telegram_id))
+        if route is not None:
+            self.message_routes.dispatch(route, message)
+
     def handle_registration_name(self, message):
         """Обработка ввода имени при регистрации"""
         text = message.get('text', '')
@@ -315,8 +314,6 @@ class MessageHandler:
             return
         
         # Сохраняем имя и переходим к телефону
-        if not hasattr(self, 'registration_data'):
-            self.registration_data = {}
         self.registration_data[telegram_id] = {'name': text}
         
         phone_text = "📱 Поделитесь номером телефона или пропустите этот шаг:"
@@ -336,8 +333,7 @@ class MessageHandler:
             phone = None
         elif text == '❌ Отмена':
             del self.user_states[telegram_id]
-            if hasattr(self, 'registration_data') and telegram_id in self.registration_data:
-                del self.registration_data[telegram_id]
+            self.registration_data.pop(telegram_id, None)
             self.bot.send_message(chat_id, "❌ Регистрация отменена")
             return
         elif 'contact' in message:
@@ -348,7 +344,7 @@ class MessageHandler:
                 self.bot.send_message(chat_id, "❌ Неверный формат телефона. Попробуйте еще раз:")
                 return
         
-        self.registration_data[telegram_id]['phone'] = phone
+        self.registration_data.merge(telegram_id, phone=phone)
         
         email_text = "📧 Введите email или пропустите:"
         self.bot.send_message(chat_id, email_text, create_registration_keyboard('email'))
@@ -367,8 +363,7 @@ class MessageHandler:
             email = None
         elif text == '❌ Отмена':
             del self.user_states[telegram_id]
-            if hasattr(self, 'registration_data') and telegram_id in self.registration_data:
-                del self.registration_data[telegram_id]
+            self.registration_data.pop(telegram_id, None)
             self.bot.send_message(chat_id, "❌ Регистрация отменена")
             return
         else:
@@ -377,7 +372,7 @@ class MessageHandler:
                 return
             email = text
         
-        self.registration_data[telegram_id]['email'] = email
+        self.registration_data.merge(telegram_id, email=email)
         
         language_text = "🌍 Выберите язык / Tilni tanlang:"
         self.bot.send_message(chat_id, language_text, create_registration_keyboard('language'))
@@ -410,6 +405,7 @@ class MessageHandler:
         )
         
         if user_id:
+            set_current_language(language)
             # Создаем запись баллов лояльности
             self.db.get_user_loyalty_points(user_id)
 
@@ -425,8 +421,7 @@ class MessageHandler:
         
         # Очищаем состояние
         del self.user_states[telegram_id]
-        if hasattr(self, 'registration_data') and telegram_id in self.registration_data:
-            del self.registration_data[telegram_id]
+        self.registration_data.pop(telegram_id, None)
     
     def send_registration_prompt(self, chat_id):
         """Приглашение к регистрации"""
@@ -513,15 +508,26 @@ Biz doimo yordam berishga tayyormiz! 🤝
 
         self.bot.send_message(chat_id, welcome_text, create_main_keyboard(language))
     
+    def _catalog(self):
+        """Текущий снимок каталога бота"""
+        return self.bot.catalog.get()
+
+    def _search_products(self, text, limit):
+        """Поиск через индекс бота, без него — запросом в БД"""
+        search = getattr(self.bot, 'product_search', None)
+        if search is not None:
+            return search.search(text, limit)
+        return self.db.search_products(text, limit) or []
+
     def show_catalog(self, message):
         """Показ каталога товаров"""
         chat_id = message['chat']['id']
         
-        categories = self.db.get_categories()
+        catalog = self._catalog()
         
-        if categories:
+        if catalog.categories:
             catalog_text = "🛍 <b>Каталог товаров</b>\n\nВыберите категорию:"
-            self.bot.send_message(chat_id, catalog_text, create_categories_keyboard(categories))
+            self.bot.send_message(chat_id, catalog_text, catalog.categories_keyboard())
         else:
             self.bot.send_message(chat_id, "❌ Каталог временно недоступен")
     
@@ -530,121 +536,86 @@ Biz doimo yordam berishga tayyormiz! 🤝
         if chat_id is None:
             logging.error('Cannot determine chat_id for message: %r', message)
             return
-        category_name_raw = getattr(message, "text", "") or ""
-        category_name = _clean_category_text(category_name_raw)
-
-        sql_exact = f"""
-            SELECT id
-            FROM categories
-            WHERE name = {_sql_quote(category_name)}
-            LIMIT 1
-        """
-        rows = _as_list(self.db.execute_query(sql_exact))
-
-        if not rows:
-            sql_like = f"""
-                SELECT id
-                FROM categories
-                WHERE name ILIKE {_sql_quote('%' + category_name + '%')}
-                ORDER BY length(name) ASC
-                LIMIT 1
-            """
-            rows = _as_list(self.db.execute_query(sql_like))
-
-        category_id = _first_val(rows, keys=("id", "category_id"), idx=0, default=None)
-        if not category_id:
-            self.logger.error(f"Категория не найдена: raw={category_name_raw!r}, parsed={category_name!r}")
+        category_name_raw = message.get("text", "") or ""
+
+        catalog = self._catalog()
+        category = catalog.find_category(category_name_raw)
+        if not category:
+            self.logger.error(f"Категория не найдена: raw={category_name_raw!r}")
             self.bot.send_message(chat_id, "Категория не найдена. Попробуйте обновить каталог.")
             return
 
-        try:
-            category_id_int = category_id if str(category_id).isdigit() else None
-        except Exception:
-            self.logger.exception(f"Некорректный category_id: {category_id!r}")
-            self.bot.send_message(chat_id, "Ошибка категории. Попробуйте позже.")
+        self.show_category(chat_id, category)
+
+    def show_category(self, chat_id, category):
+        """Подкатегории категории, а если их нет — товары"""
+        catalog = self._catalog()
+        subcategories = catalog.subcategories_of(category[0])
+        if subcategories:
+            self.bot.send_message(chat_id, f"📂 <b>{category[1]}</b>\n\nВыберите бренд или подкатегорию:",
+                                  catalog.subcategories_keyboard(category[0]))
             return
 
-        products_sql = f"""
-            SELECT id, name, price, stock
-            FROM products
-            WHERE category_id = %s
-            ORDER BY id DESC
-            LIMIT 10
-        """
-        products = _as_list(self.db.execute_query(products_sql, (category_id_str,)))
+        if not self.show_products_page(chat_id, 'c', category[0]):
+            self.bot.send_message(chat_id, f"❌ В категории '{category[1]}' пока нет товаров")
 
-        if hasattr(self, "show_products_list"):
-            try:
-                self.show_products_list(chat_id, products)
-            except Exception:
-                self.logger.exception("Ошибка показа товаров.")
-                self.bot.send_message(chat_id, "Не удалось показать товары. Попробуйте позже.")
-        else:
-            if not products:
-                self.bot.send_message(chat_id, "В этой категории пока нет товаров.")
-            else:
-                lines = []
-                for p in products:
-                    if isinstance(p, dict):
-                        name = p.get("name") or p.get("product_name") or "Товар"
-                        price = float(p.get("price") or 0)
-                        stock = int(p.get("stock") or 0)
-                    else:
-                        name = p[1] if len(p) > 1 else "Товар"
-                        price = float(p[2] if len(p) > 2 and p[2] is not None else 0)
-                        stock = int(p[3] if len(p) > 3 and p[3] is not None else 0)
-                    lines.append(f"• {name} — ${price:.2f} ({stock} шт.)")
-                self.bot.send_message(chat_id, "\n".join(lines))
     def handle_subcategory_selection(self, message):
         """Обработка выбора подкатегории"""
         text = message.get('text', '')
         chat_id = message['chat']['id']
         
-        # Извлекаем название подкатегории
-        subcategory_name = text.split(' ', 1)[-1].strip()  # Убираем эмодзи
-        
-        # Находим подкатегорию
-        subcategory = self.db.execute_query(
-            'SELECT id FROM subcategories WHERE name = %s AND is_active = true',
-            (subcategory_name,)
-        )
+        subcategory = self._catalog().find_subcategory(text)
         
         if subcategory:
-            subcategory_id = subcategory[0][0]
-            
-            # Получаем товары подкатегории
-            products = self.db.get_products_by_subcategory(subcategory_id)
-            
-            if products:
-                products_text = f"🛍 <b>{subcategory_name}</b>\n\nВыберите товар:"
-                self.bot.send_message(chat_id, products_text, create_products_keyboard(products))
-            else:
-                self.bot.send_message(chat_id, f"❌ В подкатегории '{subcategory_name}' пока нет товаров")
+            self.show_subcategory(chat_id, subcategory)
         else:
             self.bot.send_message(chat_id, "❌ Подкатегория не найдена")
+
+    def show_subcategory(self, chat_id, subcategory):
+        """Товары подкатегории"""
+        if not self.show_products_page(chat_id, 's', subcategory[0]):
+            self.bot.send_message(chat_id, f"❌ В подкатегории '{subcategory[1]}' пока нет товаров")
+
+    def show_products_page(self, chat_id, scope, scope_id, cursor=None):
+        """Страница товаров категории (scope='c') или подкатегории ('s').
+
+        Товары — обычная клавиатура, листание — inline-кнопки с курсором
+        в callback_data: plc_/pls_ + id раздела + '.' + курсор страницы.
+        Возвращает False, если товаров нет.
+        """
+        catalog = self._catalog()
+        owner = catalog.category(scope_id) if scope == 'c' else catalog.subcategory(scope_id)
+        page = catalog.products_page(scope, scope_id, cursor, PRODUCTS_PAGE_SIZE)
+        if not page.items and cursor:
+            page = catalog.products_page(scope, scope_id, None, PRODUCTS_PAGE_SIZE)
+        if not owner or not page.items:
+            return False
+
+        self.bot.send_message(chat_id, f"🛍 <b>{owner[1]}</b>\n\nВыберите товар:",
+                              catalog.products_keyboard(scope, scope_id, page))
+        if page.next_cursor or page.prev_cursor:
+            total = len(catalog.products_in_category(scope_id) if scope == 'c'
+                        else catalog.products_in_subcategory(scope_id))
+            first = catalog.product_position(scope, page.items[0][0]) + 1
+            last = first + len(page.items) - 1
+            prefix = f"pl{scope}_{encode_cursor(scope_id)}."
+            self.bot.send_message(chat_id, f"📄 Товары {first}–{last} из {total}", {
+                'inline_keyboard': create_pagination_keyboard(page.prev_cursor, page.next_cursor, prefix)
+            })
+        return True
     
     def handle_product_selection(self, message):
         """Обработка выбора товара"""
         text = message.get('text', '')
         chat_id = message['chat']['id']
         
-        # Извлекаем название товара и цену
-        product_info = text.split(' ', 1)[-1].strip()  # Убираем "🛍 "
-        
-        # Разделяем название и цену
-        if ' - $' in product_info:
-            product_name = product_info.split(' - $')[0]
-        else:
-            product_name = product_info
-        
-        # Находим товар
-        product = self.db.execute_query(
-            'SELECT * FROM products WHERE name = %s AND is_active = true',
-            (product_name,)
-        )
+        # Кнопка «🛍 Имя - $цена» или просто имя товара
+        product_info = text.split(' ', 1)[-1].strip() if text.startswith('🛍 ') else text
+        catalog = self._catalog()
+        product = catalog.find_product(text) or catalog.find_product(product_info)
         
         if product:
-            self.show_product_details(chat_id, product[0])
+            self.show_product_details(chat_id, product)
         else:
             self.bot.send_message(chat_id, "❌ Товар не найден")
     
@@ -694,7 +665,8 @@ Biz doimo yordam berishga tayyormiz! 🤝
             return
         
         user_id = user_data[0][0]
-        cart_items = self.db.get_cart_items(user_id)
+        cart = self.db.get_cart_with_totals(user_id) or {}
+        cart_items = self.db.cart_items_as_tuples(cart)
         
         if not cart_items:
             empty_cart_text = t('empty_cart', language=user_data[0][5])
@@ -703,21 +675,19 @@ Biz doimo yordam berishga tayyormiz! 🤝
         
         # Формируем текст корзины
         cart_text = "🛒 <b>Ваша корзина:</b>\n\n"
-        total_amount = 0
         
         for item in cart_items:
             item_total = item[2] * item[3]  # price * quantity
-            total_amount += item_total
             
             cart_text += f"🛍 <b>{item[1]}</b>\n"
             cart_text += f"💰 {format_price(item[2])} × {item[3]} = {format_price(item_total)}\n\n"
         
-        cart_text += f"💳 <b>Итого: {format_price(total_amount)}</b>"
+        cart_text += f"💳 <b>Итого: {format_price(float(cart.get('total_amount') or 0))}</b>"
         
         self.bot.send_message(chat_id, cart_text, create_cart_keyboard(True))
     
-    def show_user_orders(self, message):
-        """Показ заказов пользователя"""
+    def show_user_orders(self, message, cursor=None):
+        """Показ заказов пользователя (страница по курсору, новые первыми)"""
         chat_id = message['chat']['id']
         telegram_id = message['from']['id']
         
@@ -726,15 +696,15 @@ Biz doimo yordam berishga tayyormiz! 🤝
             return
         
         user_id = user_data[0][0]
-        orders = self.db.get_user_orders(user_id)
+        page = self.db.get_user_orders_page(user_id, ORDERS_PAGE_SIZE, cursor)
         
-        if not orders:
+        if not page or not page.items:
             self.bot.send_message(chat_id, "📋 У вас пока нет заказов")
             return
         
         orders_text = "📋 <b>Ваши заказы:</b>\n\n"
         
-        for order in orders[:10]:  # Показываем последние 10
+        for order in page.items:
             status_emoji = get_order_status_emoji(order[3])
             status_text = get_order_status_text(order[3])
             
@@ -745,7 +715,12 @@ Biz doimo yordam berishga tayyormiz! 🤝
         
         orders_text += "👆 Используйте /order_ID для деталей заказа"
         
-        self.bot.send_message(chat_id, orders_text, create_back_keyboard())
+        if page.next_cursor or page.prev_cursor:
+            self.bot.send_message(chat_id, orders_text, {
+                'inline_keyboard': create_pagination_keyboard(page.prev_cursor, page.next_cursor, 'orders_page_')
+            })
+        else:
+            self.bot.send_message(chat_id, orders_text, create_back_keyboard())
     
     def show_user_profile(self, message):
         """Показ профиля пользователя"""
@@ -829,15 +804,15 @@ Biz doimo yordam berishga tayyormiz! 🤝
             return
         
         # Выполняем поиск
-        products = self.db.search_products(text)
+        products = self._search_products(text, SEARCH_RESULTS_LIMIT)
         
         if products:
             search_results = f"🔍 <b>Результаты поиска:</b> '{text}'\n\n"
             
             for product in products[:10]:  # Показываем первые 10
                 search_results += f"🛍 <b>{product[1]}</b>\n"
-                search_results += f"💰 {format_price(product[3])}\n"
-                search_results += f"📦 В наличии: {product[6]} шт.\n\n"
+                search_results += f"💰 {format_price(float(product[3] or 0))}\n"
+                search_results += f"📦 В наличии: {product[8]} шт.\n\n"
             
             if len(products) > 10:
                 search_results += f"... и еще {len(products) - 10} товаров\n\n"
@@ -852,6 +827,11 @@ Biz doimo yordam berishga tayyormiz! 🤝
             no_results += "• Использовать другие ключевые слова\n"
             no_results += "• Просмотреть каталог"
             
+            chatbot = getattr(self.bot, 'chatbot_support', None)
+            suggestions = chatbot.get_smart_search_suggestions(text) if chatbot else []
+            if suggestions:
+                no_results += "\n\n" + "\n".join(suggestions)
+            
             self.bot.send_message(chat_id, no_results, create_back_keyboard())
         
         # Сбрасываем состояние поиска
@@ -898,13 +878,11 @@ Biz doimo yordam berishga tayyormiz! 🤝
         location = message.get('location')
         if location and isinstance(location, dict) and 'latitude' in location and 'longitude' in location:
             # Сохраняем координаты и двигаемся к выбору оплаты
-            if not hasattr(self, 'order_data'):
-                self.order_data = {}
-            self.order_data[telegram_id] = self.order_data.get(telegram_id, {})
-            self.order_data[telegram_id]['lat'] = float(location.get('latitude'))
-            self.order_data[telegram_id]['lon'] = float(location.get('longitude'))
+            order = self.order_data.merge(telegram_id, lat=float(location.get('latitude')),
+                                          lon=float(location.get('longitude')))
             # Если адрес текстом не задан — ставим пометку
-            self.order_data[telegram_id].setdefault('address', 'Геолокация отправлена')
+            if 'address' not in order:
+                self.order_data.merge(telegram_id, address='Геолокация отправлена')
 
             user_data = self.db.get_user_by_telegram_id(telegram_id)
             language = user_data[0][5] if user_data else 'ru'
@@ -928,9 +906,6 @@ Biz doimo yordam berishga tayyormiz! 🤝
             return
         
         # Сохраняем адрес и показываем способы оплаты
-        if not hasattr(self, 'order_data'):
-            self.order_data = {}
-        
         self.order_data[telegram_id] = {'address': text}
         
         user_data = self.db.get_user_by_telegram_id(telegram_id)
@@ -952,11 +927,6 @@ Biz doimo yordam berishga tayyormiz! 🤝
             return
         
         user_id = user_data[0][0]
-        cart_items = self.db.get_cart_items(user_id)
-        
-        if not cart_items:
-            self.bot.send_message(chat_id, "❌ Корзина пуста")
-            return
         
         # Определяем способ оплаты
         if text in ['💳 Payme', '🔵 Click', '💎 Stripe', '🟡 PayPal', '🦓 ZoodPay']:
@@ -967,48 +937,83 @@ Biz doimo yordam berishga tayyormiz! 🤝
             self.bot.send_message(chat_id, "❌ Выберите способ оплаты из предложенных")
             return
         
-        # Создаем заказ
-        total_amount = calculate_cart_total(cart_items)
-        order_data = getattr(self, 'order_data', {}).get(telegram_id, {})
+        order_data = self.order_data.get(telegram_id, {})
         delivery_address = order_data.get('address', 'Не указан')
         
-        order_id = self.db.create_order(user_id, total_amount, delivery_address, payment_method, order_data.get('lat'), order_data.get('lon'))
+        # Весь чекаут — одна транзакция в базе. Ключ из апдейта: повторная
+        # доставка того же сообщения вернёт уже созданный заказ
+        idempotency_key = f"tg:{chat_id}:{message.get('message_id', '')}"
+        result = self.db.place_order(user_id, idempotency_key, delivery_address, payment_method,
+                                     order_data.get('lat'), order_data.get('lon'))
         
-        if order_id:
-            # Добавляем товары в заказ
-            self.db.add_order_items(order_id, cart_items)
-            
-            # Очищаем корзину
-            self.db.clear_cart(user_id)
-            
-            # Начисляем баллы лояльности
-            points_earned = int(total_amount * 0.05)  # 5% от суммы
-            self.db.update_loyalty_points(user_id, points_earned)
-            
-            # Уведомляем клиента
-            success_text = f"✅ <b>Заказ #{order_id} оформлен!</b>\n\n"
-            success_text += f"💰 Сумма: {format_price(total_amount)}\n"
-            success_text += f"📍 Адрес: {delivery_address}\n"
-            success_text += f"💳 Оплата: {payment_method}\n"
-            success_text += f"⭐ Начислено баллов: {points_earned}\n\n"
-            
-            if payment_method == 'online':
-                success_text += "💳 Ссылка для оплаты будет отправлена отдельно"
-            else:
-                success_text += "📞 Мы свяжемся с вами для подтверждения"
-
-            user_language = user_data[0][5] or 'ru'
-            self.bot.send_message(chat_id, success_text, create_main_keyboard(user_language))
-            
-            # Уведомляем админов
-            if self.notification_manager:
-                self.notification_manager.send_order_notification_to_admins(order_id)
-            
-            # Очищаем данные заказа
-            if hasattr(self, 'order_data') and telegram_id in self.order_data:
-                del self.order_data[telegram_id]
-        else:
+        if result is None:
+            if self.db.rpc_available('place_order'):
+                self.bot.send_message(chat_id, "❌ Ошибка создания заказа. Попробуйте еще раз.")
+                return
+            result = self._place_order_legacy(user_id, delivery_address, payment_method, order_data)
+        
+        if result.get('error') == 'empty_cart':
+            self.bot.send_message(chat_id, "❌ Корзина пуста")
+            return
+        if result.get('error') == 'out_of_stock':
+            shortage_text = "❌ <b>Недостаточно товара на складе:</b>\n\n"
+            for item in result.get('shortages') or []:
+                shortage_text += f"• {item.get('name')}: в корзине {item.get('requested')}, доступно {item.get('available')}\n"
+            self.bot.send_message(chat_id, shortage_text)
+            return
+        if not result.get('ok') or not result.get('order_id'):
             self.bot.send_message(chat_id, "❌ Ошибка создания заказа")
+            return
+        
+        order_id = result['order_id']
+        total_amount = float(result.get('total_amount') or 0)
+        points_earned = int(result.get('points_earned') or 0)
+        
+        # Уведомляем клиента
+        success_text = f"✅ <b>Заказ #{order_id} оформлен!</b>\n\n"
+        success_text += f"💰 Сумма: {format_price(total_amount)}\n"
+        success_text += f"📍 Адрес: {delivery_address}\n"
+        success_text += f"💳 Оплата: {payment_method}\n"
+        success_text += f"⭐ Начислено баллов: {points_earned}\n\n"
+        
+        if payment_method == 'online':
+            success_text += "💳 Ссылка для оплаты будет отправлена отдельно"
+        else:
+            success_text += "📞 Мы свяжемся с вами для подтверждения"
+
+        user_language = user_data[0][5] or 'ru'
+        self.bot.send_message(chat_id, success_text, create_main_keyboard(user_language))
+        
+        # Уведомляем админов (повтор запроса не дублирует уведомление)
+        if self.notification_manager and not result.get('replayed'):
+            self.notification_manager.send_order_notification_to_admins(order_id)
+        
+        # Очищаем данные заказа
+        self.order_data.pop(telegram_id, None)
+    
+    def _place_order_legacy(self, user_id, delivery_address, payment_method, order_data):
+        """Оформление заказа отдельными запросами, если RPC place_order не развернут"""
+        cart_items = self.db.get_cart_items(user_id)
+        if not cart_items:
+            return {'ok': False, 'error': 'empty_cart'}
+        
+        total_amount = calculate_cart_total(cart_items)
+        order_id = self.db.create_order(user_id, total_amount, delivery_address, payment_method, order_data.get('lat'), order_data.get('lon'))
+        if not order_id:
+            return {'ok': False, 'error': 'create_failed'}
+        
+        # Добавляем товары в заказ
+        self.db.add_order_items(order_id, cart_items)
+        
+        # Очищаем корзину
+        self.db.clear_cart(user_id)
+        
+        # Начисляем баллы лояльности
+        points_earned = int(total_amount * 0.05)  # 5% от суммы
+        self.db.update_loyalty_points(user_id, points_earned)
+        
+        return {'ok': True, 'order_id': order_id, 'total_amount': total_amount,
+                'points_earned': points_earned, 'replayed': False}
     
     def clear_user_cart(self, message):
         """Очистка корзины пользователя"""
@@ -1137,6 +1142,7 @@ Biz doimo yordam berishga tayyormiz! 🤝
         if user_data:
             user_id = user_data[0][0]
             self.db.update_user_language(user_id, new_language)
+            set_current_language(new_language)
             
             success_text = t('language_changed', language=new_language)
             self.bot.send_message(chat_id, success_text, create_main_keyboard(new_language))
@@ -1159,7 +1165,7 @@ Biz doimo yordam berishga tayyormiz! 🤝
             
             user_id = user_data[0][0]
             order = self.db.execute_query(
-                'SELECT * FROM orders WHERE id = %s AND user_id = %s',
+                'SELECT * FROM public.orders WHERE id = %s AND user_id = %s',
                 (order_id, user_id)
             )
             
@@ -1331,75 +1337,63 @@ Biz doimo yordam berishga tayyormiz! 🤝
             chat_id = callback_query['message']['chat']['id']
             telegram_id = callback_query['from']['id']
             
-            if data == 'back_to_categories':
-                msg = {'chat': {'id': chat_id}}
-                self.show_catalog(msg)
-            elif data.startswith('back_to_category_'):
-                try:
-                    cid = int(data.split('_')[-1])
-                except Exception:
-                    cid = None
-                if cid:
-                    # Показ подкатегорий
-                    cat_row = self.db.execute_query('SELECT name FROM categories WHERE id=%s', (cid,))
-                    name = cat_row[0][0] if cat_row else ''
-                    subs = self.db.get_products_by_category(cid)
-                    if subs:
-                        self.bot.send_message(chat_id, f"📂 <b>{name}</b>\n\nВыберите бренд или подкатегорию:", create_subcategories_keyboard(subs))
-                    else:
-                        self.bot.send_message(chat_id, f"❌ В категории '{name}' пока нет товаров")
-                else:
-                    msg = {'chat': {'id': chat_id}}
-                    self.show_catalog(msg)
-            elif data == 'go_to_cart':
-                # Переход в корзину
-                msg = {'chat': {'id': chat_id}, 'from': {'id': telegram_id}}
-                self.show_cart(msg)
-            elif data.startswith('back_to_subcategory_'):
-                try:
-                    sid = int(data.split('_')[-1])
-                except Exception:
-                    sid = None
-                if sid:
-                    # Показ товаров в подкатегории
-                    sub_row = self.db.execute_query('SELECT name FROM subcategories WHERE id=%s', (sid,))
-                    subname = sub_row[0][0] if sub_row else 'Подкатегория'
-                    products = self.db.get_products_by_subcategory(sid)
-                    if products:
-                        self.bot.send_message(chat_id, f"🛍 <b>{subname}</b>\n\nВыберите товар:", create_products_keyboard(products))
-                    else:
-                        self.bot.send_message(chat_id, f"❌ В подкатегории '{subname}' пока нет товаров")
-                else:
-                    msg = {'chat': {'id': chat_id}}
-                    self.show_catalog(msg)
-            elif data.startswith('qty_inc_') or data.startswith('qty_dec_'):
-                parts = data.split('_')
-                try:
-                    pid = int(parts[2]); qty = int(parts[3])
-                except (ValueError, IndexError):
-                    return
-                new_qty = qty + 1 if data.startswith('qty_inc_') else max(1, qty - 1)
-                kb = create_product_inline_keyboard_with_qty(pid, new_qty)
-                message_id = callback_query['message']['message_id']
-                self.bot.edit_message_reply_markup(chat_id, message_id, kb)
-            elif data.startswith('add_to_cart_'):
-                self.handle_add_to_cart(callback_query)
-            elif data.startswith('add_to_favorites_'):
-                self.handle_add_to_favorites(callback_query)
-            elif data.startswith('reviews_'):
-                self.handle_show_reviews(callback_query)
-            elif data.startswith('rate_product_'):
-                self.handle_rate_product(callback_query)
-            elif data.startswith('cart_'):
-                self.handle_cart_action(callback_query)
-            elif data.startswith('pay_'):
-                self.handle_payment_selection(callback_query)
-            elif data == 'cancel_payment':
-                self.bot.send_message(chat_id, "❌ Оплата отменена")
-            
+            self.callback_routes.handle(data, callback_query)
+
         except Exception as e:
             logger.error(f"Ошибка обработки callback: {e}")
     
+    def _cb_back_to_categories(self, callback_query):
+        self.show_catalog({'chat': {'id': callback_query['message']['chat']['id']}})
+
+    def _cb_back_to_category(self, callback_query):
+        chat_id = callback_query['message']['chat']['id']
+        category = self._catalog().category(callback_query['data'][len('back_to_category_'):])
+        if category:
+            self.show_category(chat_id, category)
+        else:
+            self.show_catalog({'chat': {'id': chat_id}})
+
+    def _cb_back_to_subcategory(self, callback_query):
+        chat_id = callback_query['message']['chat']['id']
+        subcategory = self._catalog().subcategory(callback_query['data'][len('back_to_subcategory_'):])
+        if subcategory:
+            self.show_subcategory(chat_id, subcategory)
+        else:
+            self.show_catalog({'chat': {'id': chat_id}})
+
+    def _cb_go_to_cart(self, callback_query):
+        # Переход в корзину
+        self.show_cart({'chat': {'id': callback_query['message']['chat']['id']},
+                        'from': {'id': callback_query['from']['id']}})
+
+    def _cb_products_page(self, callback_query):
+        # plc_/pls_{id раздела}.{курсор}
+        data = callback_query['data']
+        chat_id = callback_query['message']['chat']['id']
+        scope_token, _, cursor = data[4:].partition('.')
+        scope_id = (decode_cursor(scope_token) or (None,))[0]
+        if scope_id is None or not self.show_products_page(chat_id, data[2], scope_id, cursor):
+            self.show_catalog({'chat': {'id': chat_id}})
+
+    def _cb_orders_page(self, callback_query):
+        msg = {'chat': {'id': callback_query['message']['chat']['id']}, 'from': {'id': callback_query['from']['id']}}
+        self.show_user_orders(msg, callback_query['data'][len('orders_page_'):])
+
+    def _cb_change_quantity(self, callback_query):
+        data = callback_query['data']
+        parts = data.split('_')
+        try:
+            pid = int(parts[2]); qty = int(parts[3])
+        except (ValueError, IndexError):
+            return
+        new_qty = qty + 1 if data.startswith('qty_inc_') else max(1, qty - 1)
+        kb = create_product_inline_keyboard_with_qty(pid, new_qty)
+        message = callback_query['message']
+        self.bot.edit_message_reply_markup(message['chat']['id'], message['message_id'], kb)
+
+    def _cb_cancel_payment(self, callback_query):
+        self.bot.send_message(callback_query['message']['chat']['id'], "❌ Оплата отменена")
+
     def handle_add_to_cart(self, callback_query):
         """Добавление товара в корзину"""
         data = callback_query['data']
@@ -1407,7 +1401,9 @@ Biz doimo yordam berishga tayyormiz! 🤝
         telegram_id = callback_query['from']['id']
         
         try:
-            product_id = (int(data.split('_')[3]).partition(':')[2])
+            # add_to_cart_{product_id} или add_to_cart_{product_id}_{qty}
+            product_id, _, qty = data[len('add_to_cart_'):].partition('_')
+            quantity = max(1, int(qty)) if qty else 1
             
             user_data = self.db.get_user_by_telegram_id(telegram_id)
             if not user_data:
@@ -1415,12 +1411,24 @@ Biz doimo yordam berishga tayyormiz! 🤝
             
             user_id = user_data[0][0]
             
-            # Добавляем в корзину
-            result = self.db.add_to_cart(user_id, product_id, 1)
-            
-            if result:
-                product = self.db.get_product_by_id(product_id)
-                success_text = f"✅ <b>{product[1]}</b> добавлен в корзину!"
+            # Проверка остатка и добавление — один вызов RPC
+            result = self.db.cart_add(user_id, product_id, quantity)
+            if result is None:
+                if self.db.rpc_available('cart_add_item'):
+                    self.bot.send_message(chat_id, "❌ Не удалось добавить товар. Попробуйте еще раз.")
+                    return
+                ok = bool(self.db.add_to_cart(user_id, product_id, quantity))
+                error = None if ok else 'out_of_stock'
+            else:
+                ok, error = bool(result.get('ok')), result.get('error')
+            
+            if ok:
+                product = self._catalog().product(product_id)
+                product_name = product[1] if product else 'Товар'
+                success_text = f"✅ <b>{product_name}</b> добавлен в корзину!"
+                if result is not None:
+                    cart = result.get('cart') or {}
+                    success_text += f"\n🛒 В корзине: {cart.get('total_quantity', 0)} шт. на {format_price(float(cart.get('total_amount') or 0))}"
                 
                 # Показываем кнопку перехода в корзину
                 cart_keyboard = {
@@ -1433,6 +1441,8 @@ Biz doimo yordam berishga tayyormiz! 🤝
                 }
                 
                 self.bot.send_message(chat_id, success_text, cart_keyboard)
+            elif error == 'out_of_stock':
+                self.bot.send_message(chat_id, "❌ Недостаточно товара на складе")
             else:
                 self.bot.send_message(chat_id, "❌ Товар недоступен или закончился")
                 
@@ -1521,8 +1531,8 @@ Biz doimo yordam berishga tayyormiz! 🤝
             
             # Проверяем, покупал ли пользователь этот товар
             purchased = self.db.execute_query('''
-                SELECT COUNT(*) FROM order_items oi
-                JOIN orders o ON oi.order_id = o.id
+                SELECT COUNT(*) FROM public.order_items oi
+                JOIN public.orders o ON oi.order_id = o.id
                 WHERE o.user_id = %s AND oi.product_id = (%s AND o.status != 'cancelled'.partition(':')[2])
             ''', (user_id, product_id))[0][0]
             
@@ -1546,44 +1556,84 @@ Biz doimo yordam berishga tayyormiz! 🤝
         telegram_id = callback_query['from']['id']
         
         try:
-            action = data.split('_')[1]
-            cart_item_id = int(data.split('_')[2])
+            # cart_{action}_{cart_item_id}
+            _, action, cart_item_id = data.split('_', 2)
+            if action not in ('increase', 'decrease', 'remove'):
+                return
             
-            if action == 'increase':
-                # Увеличиваем количество
-                current_quantity = self.get_cart_item_quantity(cart_item_id)
-                self.db.update_cart_quantity(cart_item_id, current_quantity + 1)
-                self.update_cart_message(callback_query, cart_item_id)
-                
-            elif action == 'decrease':
-                # Уменьшаем количество
-                current_quantity = self.get_cart_item_quantity(cart_item_id)
-                if current_quantity > 1:
-                    self.db.update_cart_quantity(cart_item_id, current_quantity - 1)
-                    self.update_cart_message(callback_query, cart_item_id)
-                else:
-                    self.bot.send_message(chat_id, "❌ Минимальное количество: 1")
-                
-            elif action == 'remove':
-                # Удаляем товар
-                self.db.remove_from_cart(cart_item_id)
+            user_data = self.db.get_user_by_telegram_id(telegram_id)
+            if not user_data:
+                return
+            user_id = user_data[0][0]
+            
+            # Изменение и свежая корзина — один вызов RPC
+            if action == 'remove':
+                result = self.db.cart_remove(user_id, cart_item_id)
+            else:
+                delta = 1 if action == 'increase' else -1
+                result = self.db.cart_set_quantity(user_id, cart_item_id, delta, relative=True)
+            
+            if result is None:
+                rpc = 'cart_remove_item' if action == 'remove' else 'cart_set_quantity'
+                if self.db.rpc_available(rpc):
+                    # Ошибка вызова, а не отсутствие функции: изменение могло
+                    # уже примениться, старый путь повторил бы его
+                    self.bot.send_message(chat_id, "❌ Не удалось изменить корзину. Попробуйте еще раз.")
+                    return
+                self._handle_cart_action_legacy(callback_query, action, cart_item_id)
+                return
+            
+            error = result.get('error')
+            if action == 'remove' and result.get('ok'):
                 self.bot.send_message(chat_id, "🗑 Товар удален из корзины")
+            elif result.get('ok'):
+                self.update_cart_message(callback_query, cart_item_id, result.get('quantity'))
+            elif error == 'min_quantity':
+                self.bot.send_message(chat_id, "❌ Минимальное количество: 1")
+            elif error == 'out_of_stock':
+                self.bot.send_message(chat_id, "❌ Недостаточно товара на складе")
+            elif error == 'not_found':
+                self.bot.send_message(chat_id, "❌ Товар уже удален из корзины")
                 
         except (ValueError, IndexError) as e:
             logger.error(f"Ошибка действия с корзиной: {e}")
     
+    def _handle_cart_action_legacy(self, callback_query, action, cart_item_id):
+        """Действия с корзиной без cart_* RPC (миграция не применена)"""
+        chat_id = callback_query['message']['chat']['id']
+        if action == 'increase':
+            # Увеличиваем количество
+            current_quantity = self.get_cart_item_quantity(cart_item_id)
+            self.db.update_cart_quantity(cart_item_id, current_quantity + 1)
+            self.update_cart_message(callback_query, cart_item_id)
+            
+        elif action == 'decrease':
+            # Уменьшаем количество
+            current_quantity = self.get_cart_item_quantity(cart_item_id)
+            if current_quantity > 1:
+                self.db.update_cart_quantity(cart_item_id, current_quantity - 1)
+                self.update_cart_message(callback_query, cart_item_id)
+            else:
+                self.bot.send_message(chat_id, "❌ Минимальное количество: 1")
+            
+        elif action == 'remove':
+            # Удаляем товар
+            self.db.remove_from_cart(cart_item_id)
+            self.bot.send_message(chat_id, "🗑 Товар удален из корзины")
+    
     def get_cart_item_quantity(self, cart_item_id):
         """Получение количества товара в корзине"""
         result = self.db.execute_query(
-            'SELECT quantity FROM cart WHERE id = %s',
+            'SELECT quantity FROM public.cart WHERE id = %s',
             (cart_item_id,)
         )
         return result[0][0] if result else 1
     
-    def update_cart_message(self, callback_query, cart_item_id):
+    def update_cart_message(self, callback_query, cart_item_id, new_quantity=None):
         """Обновление сообщения корзины"""
         try:
-            new_quantity = self.get_cart_item_quantity(cart_item_id)
+            if new_quantity is None:
+                new_quantity = self.get_cart_item_quantity(cart_item_id)
             new_keyboard = create_cart_item_keyboard(cart_item_id, new_quantity)
             
             self.bot.edit_message_reply_markup(
@@ -1643,13 +1693,13 @@ Biz doimo yordam berishga tayyormiz! 🤝
         # Проверяем, может быть это поисковый запрос
         if len(text) > 2 and not text.startswith('/'):
             # Выполняем поиск
-            products = self.db.search_products(text, 5)
+            products = self._search_products(text, 5)
             
             if products:
                 search_text = f"🔍 Найдено по запросу '{text}':\n\n"
                 
                 for product in products:
-                    search_text += f"🛍 {product[1]} - {format_price(product[3])}\n"
+                    search_text += f"🛍 {product[1]} - {format_price(float(product[3] or 0))}\n"
                 
                 search_text += f"\n💡 Используйте 🔍 Поиск для расширенного поиска"
 
@@ -1724,8 +1774,6 @@ def start_seller_application(self, message):
     telegram_id = message['from']['id']
     user_data = self.db.get_user_by_telegram_id(telegram_id)
     language = (user_data[0][5] if user_data else 'ru') or 'ru'
-    if not hasattr(self, 'seller_data'):
-        self.seller_data = {}
     self.seller_data[telegram_id] = {}
     prompt = "👤 Как вас зовут?" if language == 'ru' else "👤 Ismingiz nima?"
     self.bot.send_message(chat_id, prompt, create_back_keyboard())
@@ -1737,15 +1785,13 @@ def handle_seller_name(self, message):
     telegram_id = message['from']['id']
     if text in ['❌ Отмена', '🔙 Назад']:
         self.user_states.pop(telegram_id, None)
-        if hasattr(self, 'seller_data'): self.seller_data.pop(telegram_id, None)
+        self.seller_data.pop(telegram_id, None)
         self.bot.send_message(chat_id, "Отменено.", create_main_keyboard('ru'))
         return
     if not text or len(text) < 2:
         self.bot.send_message(chat_id, "❌ Имя слишком короткое. Попробуйте ещё раз:")
         return
-    if not hasattr(self, 'seller_data'):
-        self.seller_data = {}
-    self.seller_data.setdefault(telegram_id, {})['name'] = text
+    self.seller_data.merge(telegram_id, name=text)
     self.bot.send_message(chat_id, "📱 Укажите ваш номер телефона (например, +998 90 123 45 67):")
     self.user_states[telegram_id] = 'seller_phone'
 
@@ -1757,7 +1803,7 @@ def handle_seller_phone(self, message):
     if not phone:
         self.bot.send_message(chat_id, "❌ Неверный формат телефона. Попробуйте ещё раз:")
         return
-    self.seller_data.setdefault(telegram_id, {})['phone'] = phone
+    self.seller_data.merge(telegram_id, phone=phone)
     self.bot.send_message(chat_id, "🏷️ Название вашего бренда или компании:")
     self.user_states[telegram_id] = 'seller_brand'
 
@@ -1768,7 +1814,7 @@ def handle_seller_brand(self, message):
     if len(text) < 2:
         self.bot.send_message(chat_id, "❌ Слишком коротко. Введите название бренда/компании:")
         return
-    self.seller_data.setdefault(telegram_id, {})['brand'] = text
+    self.seller_data.merge(telegram_id, brand=text)
     self.bot.send_message(chat_id, "🛍 Что вы продаёте? Кратко опишите товары/категории:")
     self.user_states[telegram_id] = 'seller_products'
 
@@ -1782,7 +1828,7 @@ def handle_seller_products(self, message):
     data = self.seller_data.get(telegram_id, {})
     data['products'] = text
     try:
-        admins = self.db.execute_query('SELECT telegram_id FROM users WHERE is_admin = true')
+        admins = self.db.execute_query('SELECT telegram_id FROM public.users WHERE is_admin = true')
         if not admins:
             from config import BOT_CONFIG
             admin_id = int(BOT_CONFIG.get('admin_telegram_id', '0') or 0)
@@ -1804,8 +1850,7 @@ def handle_seller_products(self, message):
         logging.error(f"Ошибка подготовки уведомления админа: {e}")
     self.bot.send_message(chat_id, "✅ Спасибо! Ваша заявка отправлена. Мы свяжемся с вами в ближайшее время.", create_main_keyboard('ru'))
     self.user_states.pop(telegram_id, None)
-    if hasattr(self, 'seller_data'):
-        self.seller_data.pop(telegram_id, None)
+    self.seller_data.pop(telegram_id, None)
 
 # === Привязка новых методов к классу MessageHandler ===
 MessageHandler.start_seller_application = start_seller_application
@@ -86,7 +86,7 @@ class HealthMonitor:
     def send_alert_to_admins(self, issues):
         """Отправка алертов админам"""
         try:
-            admins = self.db.execute_query('SELECT telegram_id FROM users WHERE is_admin = true')
+            admins = self.db.execute_query('SELECT telegram_id FROM public.users WHERE is_admin = true')
             
             alert_message = "🚨 <b>СИСТЕМНОЕ ПРЕДУПРЕЖДЕНИЕ</b>\n\n"
             alert_message += "Обнаружены проблемы:\n"
@@ -120,7 +120,7 @@ class HealthMonitor:
     
     def get_health_status(self):
         """Получить статус здоровья"""
-        return {
+        status = {
             'status': 'healthy' if self.metrics['database_status'] == 'healthy' else 'unhealthy',
             'uptime': self.metrics['uptime_hours'],
             'memory_mb': self.metrics['memory_usage'],
@@ -129,6 +129,16 @@ class HealthMonitor:
             'errors_count': self.metrics['errors_count'],
             'database_status': self.metrics['database_status']
         }
+        user_cache = getattr(self.db, 'user_cache', None)
+        if user_cache is not None:
+            status['user_cache'] = user_cache.get_stats()
+        from telegram_api import get_all_stats
+        status['telegram'] = get_all_stats()
+        from state_store import get_state_store
+        status['state_store'] = get_state_store().get_stats()
+        if hasattr(self.bot, 'get_route_stats'):
+            status['routes'] = self.bot.get_route_stats()
+        return status
     
     def create_health_endpoint(self):
         """Создание HTTP endpoint для проверки здоровья"""
@@ -0,0 +1,285 @@
+"""
+Шина инвалидации кэшей бота.
+
+Триггеры в базе (supabase/migrations/..._cache_invalidation_notify.sql) на
+products, categories, subcategories, scheduled_posts и automation_rules
+шлют pg_notify в канал cache_invalidation с JSON {"table", "op", "id"}
+(товары — только при изменении видимых каталогу колонок, миграция 20251101_11).
+Бот слушает канал и обновляет только затронутые записи.
+
+Реализации:
+- PgNotifyBus — LISTEN/NOTIFY через отдельное соединение psycopg;
+- FileFlagBus — файлы в общем каталоге, для локального запуска (понимает и
+  старые data_update_flag.txt / force_reload_flag.txt);
+- InMemoryBus — синхронная доставка в том же процессе, для тестов.
+"""
+import os
+import json
+import time
+import select
+import logging
+import threading
+from collections import namedtuple
+
+try:
+    import psycopg
+except Exception:
+    try:
+        import psycopg2 as psycopg
+    except Exception:  # pragma: no cover
+        psycopg = None
+
+logger = logging.getLogger('invalidation_bus')
+
+CHANNEL = 'cache_invalidation'
+WATCHED_TABLES = ('products', 'categories', 'subcategories', 'scheduled_posts', 'automation_rules')
+# table='*' — сбросить всё: op RELOAD — ручная перезагрузка,
+# RESYNC — переподключение слушателя (уведомления могли потеряться)
+ALL = '*'
+
+InvalidationEvent = namedtuple('InvalidationEvent', 'table op id')
+
+
+def encode_event(table, id=None, op='UPDATE'):
+    return json.dumps({'table': table, 'op': op, 'id': None if id is None else str(id)})
+
+
+def decode_event(payload):
+    """InvalidationEvent из JSON; битый payload превращается в полный сброс"""
+    try:
+        data = json.loads(payload)
+        return InvalidationEvent(data.get('table') or ALL, (data.get('op') or 'UPDATE').upper(), data.get('id'))
+    except Exception:
+        logger.warning(f"Непонятное уведомление инвалидации: {payload!r}")
+        return InvalidationEvent(ALL, 'RELOAD', None)
+
+
+class InvalidationBus:
+    """Базовая шина: подписчики и доставка событий"""
+
+    def __init__(self):
+        self._subscribers = []
+        self._running = False
+        self.stats = {'received': 0, 'published': 0, 'publish_errors': 0, 'dispatch_errors': 0}
+
+    def subscribe(self, callback):
+        """callback(event: InvalidationEvent)"""
+        self._subscribers.append(callback)
+
+    def publish(self, table, id=None, op='UPDATE'):
+        """Отправить событие; если отправить не удалось — исключение"""
+        raise NotImplementedError
+
+    def publish_reload(self):
+        """Полная перезагрузка всех кэшей (ошибка отправки — исключение)"""
+        self.publish(ALL, op='RELOAD')
+
+    def _dispatch(self, event):
+        self.stats['received'] += 1
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                self.stats['dispatch_errors'] += 1
+                logger.error(f"Ошибка обработчика инвалидации {event}: {e}", exc_info=True)
+
+    def start(self):
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def get_stats(self):
+        return dict(self.stats, backend=type(self).__name__, running=self._running)
+
+
+class InMemoryBus(InvalidationBus):
+    """Тестовый дубль: publish сразу доставляет событие подписчикам"""
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, table, id=None, op='UPDATE'):
+        event = InvalidationEvent(table, op.upper(), None if id is None else str(id))
+        self.published.append(event)
+        self.stats['published'] += 1
+        self._dispatch(event)
+
+
+class PgNotifyBus(InvalidationBus):
+    """LISTEN cache_invalidation на выделенном соединении с переподключением"""
+
+    def __init__(self, dsn, poll_timeout=1.0, reconnect_delay=5):
+        super().__init__()
+        if psycopg is None:
+            raise RuntimeError("psycopg/psycopg2 не установлен")
+        self.dsn = dsn
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self._thread = None
+        self._publish_conn = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self):
+        conn = psycopg.connect(self.dsn, connect_timeout=5)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, table, id=None, op='UPDATE'):
+        with self._publish_lock:
+            try:
+                if self._publish_conn is None or getattr(self._publish_conn, 'closed', False):
+                    self._publish_conn = self._connect()
+                with self._publish_conn.cursor() as cur:
+                    cur.execute('SELECT pg_notify(%s, %s)', (CHANNEL, encode_event(table, id, op)))
+                self.stats['published'] += 1
+            except Exception as e:
+                # Соединение переоткроется при следующей отправке; вызывающий
+                # (force_bot_reload) должен узнать, что сигнал не ушёл
+                logger.error(f"Не удалось отправить уведомление инвалидации: {e}")
+                self._publish_conn = None
+                self.stats['publish_errors'] += 1
+                raise
+
+    def _drain(self, conn):
+        """Уведомления, пришедшие на соединение (psycopg 3 и psycopg2)"""
+        if hasattr(conn, 'poll'):
+            conn.poll()
+            while conn.notifies:
+                yield conn.notifies.pop(0).payload
+        else:
+            for notify in conn.notifies(timeout=0):
+                yield notify.payload
+
+    def _listen(self):
+        first = True
+        while self._running:
+            conn = None
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN {CHANNEL}')
+                logger.info(f"Подписка на {CHANNEL} установлена")
+                if not first:
+                    # Пока соединения не было, уведомления могли потеряться
+                    self._dispatch(InvalidationEvent(ALL, 'RESYNC', None))
+                first = False
+                while self._running:
+                    readable, _, _ = select.select([conn], [], [], self.poll_timeout)
+                    if not readable:
+                        continue
+                    for payload in self._drain(conn):
+                        self._dispatch(decode_event(payload))
+            except Exception as e:
+                if self._running:
+                    logger.warning(f"Соединение LISTEN потеряно: {e}; повтор через {self.reconnect_delay}s")
+                    time.sleep(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if self._running:
+            return
+        super().start()
+        self._thread = threading.Thread(target=self._listen, name='invalidation-listen', daemon=True)
+        self._thread.start()
+
+
+class FileFlagBus(InvalidationBus):
+    """События в файле cache_invalidation.jsonl в общем каталоге (локальный запуск)"""
+
+    EVENTS_FILE = 'cache_invalidation.jsonl'
+    UPDATE_FLAG = 'data_update_flag.txt'
+    FORCE_FLAG = 'force_reload_flag.txt'
+    MAX_EVENTS_FILE_SIZE = 1024 * 1024
+
+    def __init__(self, directory='.', poll_interval=2.0):
+        super().__init__()
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._events_path = os.path.join(directory, self.EVENTS_FILE)
+        self._offset = self._size()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _size(self):
+        try:
+            return os.path.getsize(self._events_path)
+        except OSError:
+            return 0
+
+    def publish(self, table, id=None, op='UPDATE'):
+        with self._lock:
+            # Слишком длинный журнал начинаем заново; читатель заметит
+            # уменьшение размера и перечитает с начала
+            mode = 'w' if self._size() > self.MAX_EVENTS_FILE_SIZE else 'a'
+            with open(self._events_path, mode, encoding='utf-8') as f:
+                f.write(encode_event(table, id, op) + '\n')
+        self.stats['published'] += 1
+
+    def poll(self):
+        """Одна проверка файлов; возвращает число доставленных событий"""
+        delivered = 0
+        for flag in (self.FORCE_FLAG, self.UPDATE_FLAG):
+            path = os.path.join(self.directory, flag)
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self._dispatch(InvalidationEvent(ALL, 'RELOAD', None))
+                delivered += 1
+                break
+
+        size = self._size()
+        if size < self._offset:
+            self._offset = 0
+        if size > self._offset:
+            with open(self._events_path, 'r', encoding='utf-8') as f:
+                f.seek(self._offset)
+                chunk = f.read()
+            # Незаконченную строку дочитаем в следующий раз
+            complete, _, _ = chunk.rpartition('\n')
+            if complete:
+                self._offset += len((complete + '\n').encode('utf-8'))
+                for line in complete.split('\n'):
+                    if line.strip():
+                        self._dispatch(decode_event(line))
+                        delivered += 1
+        return delivered
+
+    def start(self):
+        if self._running:
+            return
+        super().start()
+
+        def worker():
+            while self._running:
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Ошибка чтения файлов инвалидации: {e}")
+                time.sleep(self.poll_interval)
+
+        self._thread = threading.Thread(target=worker, name='invalidation-files', daemon=True)
+        self._thread.start()
+
+
+def create_bus(backend=None, dsn=None, directory=None):
+    """Шина по CACHE_BUS (auto | pg | file | memory)"""
+    backend = (backend or os.getenv('CACHE_BUS', 'auto')).strip().lower()
+    dsn = dsn or os.getenv('DATABASE_URL')
+    if directory is None:
+        directory = os.getenv('CACHE_BUS_DIR') or os.path.dirname(os.path.abspath(__file__))
+    if backend == 'memory':
+        return InMemoryBus()
+    if backend in ('auto', 'pg') and dsn and psycopg is not None:
+        return PgNotifyBus(dsn)
+    if backend == 'pg':
+        logger.warning("CACHE_BUS=pg, но DATABASE_URL/psycopg недоступны — используем файлы")
+    return FileFlagBus(directory)
@@ -5,6 +5,7 @@ import logging
 
 from datetime import datetime, timedelta
 from utils import format_price, format_date
+from analytics_snapshot import get_snapshot, abc_inventory, turnover_analysis
 
 class InventoryManager:
     def __init__(self, db):
@@ -16,7 +17,7 @@ class InventoryManager:
         """Загрузка правил автопополнения"""
         rules = self.db.execute_query('''
             SELECT product_id, reorder_point, reorder_quantity, supplier_id
-            FROM inventory_rules
+            FROM public.inventory_rules
             WHERE is_active = true
         ''')
 
@@ -48,7 +49,7 @@ class InventoryManager:
         """Проверка уровней остатков"""
         low_stock_products = self.db.execute_query('''
             SELECT id, name, stock, category_id
-            FROM products
+            FROM public.products
             WHERE stock <= 5 AND is_active = true
             ORDER BY stock ASC
         ''')
@@ -72,7 +73,7 @@ class InventoryManager:
         """Обновление остатков товара"""
         # Получаем текущий остаток. Сравнение через id::text во избежание ошибок приведения типов UUID
         current_stock = self.db.execute_query(
-            'SELECT stock FROM products WHERE id::text = %s',
+            'SELECT stock FROM public.products WHERE id::text = %s',
             (str(product_id),)
         )
         
@@ -84,7 +85,7 @@ class InventoryManager:
         
         # Обновляем остаток
         self.db.execute_query(
-            'UPDATE products SET stock = %s, updated_at = NOW() WHERE id::text = %s',
+            'UPDATE public.products SET stock = %s, updated_at = NOW() WHERE id::text = %s',
             (new_quantity, product_id)
         )
         
@@ -109,7 +110,7 @@ class InventoryManager:
     def add_stock(self, product_id, quantity, supplier_id=None, cost_per_unit=None, reason="Поступление"):
         """Добавление товара на склад"""
         current_stock_rows = self.db.execute_query(
-            'SELECT stock FROM products WHERE id::text = %s',
+            'SELECT stock FROM public.products WHERE id::text = %s',
             (str(product_id),)
         )
         if not current_stock_rows:
@@ -120,7 +121,7 @@ class InventoryManager:
         
         # Обновляем остаток
         self.db.execute_query(
-            'UPDATE products SET stock = %s WHERE id::text = %s',
+            'UPDATE public.products SET stock = %s WHERE id::text = %s',
             (new_stock, product_id)
         )
         
@@ -144,7 +145,7 @@ class InventoryManager:
     def reserve_stock(self, product_id, quantity, order_id):
         """Резервирование товара для заказа"""
         current_stock_rows = self.db.execute_query(
-            'SELECT stock FROM products WHERE id::text = %s',
+            'SELECT stock FROM public.products WHERE id::text = %s',
             (str(product_id),)
         )
         if not current_stock_rows:
@@ -156,7 +157,7 @@ class InventoryManager:
         
         # Создаем резерв
         self.db.execute_query('''
-            INSERT INTO stock_reservations (
+            INSERT INTO public.stock_reservations (
                 product_id, order_id, quantity, expires_at, created_at
             ) VALUES (%s, %s, %s, %s, %s)
         ''', (
@@ -167,7 +168,7 @@ class InventoryManager:
         
         # Уменьшаем доступный остаток
         self.db.execute_query(
-            'UPDATE products SET stock = stock - ? WHERE id = %s',
+            'UPDATE public.products SET stock = stock - ? WHERE id = %s',
             (quantity, product_id)
         )
         
@@ -176,7 +177,7 @@ class InventoryManager:
     def release_reservation(self, order_id):
         """Освобождение резерва при отмене заказа"""
         reservations = self.db.execute_query(
-            'SELECT product_id, quantity FROM stock_reservations WHERE order_id = %s',
+            'SELECT product_id, quantity FROM public.stock_reservations WHERE order_id = %s',
             (order_id,)
         )
         
@@ -185,13 +186,13 @@ class InventoryManager:
             
             # Возвращаем товар на склад
             self.db.execute_query(
-                'UPDATE products SET stock = stock + ? WHERE id = %s',
+                'UPDATE public.products SET stock = stock + ? WHERE id = %s',
                 (quantity, product_id)
             )
         
         # Удаляем резервы
         self.db.execute_query(
-            'DELETE FROM stock_reservations WHERE order_id = %s',
+            'DELETE FROM public.stock_reservations WHERE order_id = %s',
             (order_id,)
         )
     
@@ -231,7 +232,7 @@ class InventoryManager:
         
         # Получаем данные поставщика
         supplier = self.db.execute_query(
-            'SELECT name, contact_email, cost_per_unit FROM suppliers WHERE id = %s',
+            'SELECT name, contact_email, cost_per_unit FROM public.suppliers WHERE id = %s',
             (supplier_id,)
         )
         
@@ -267,7 +268,7 @@ class InventoryManager:
         notification_text += f"✅ Заказ отправлен поставщику автоматически"
         
         # Отправляем всем админам
-        admins = self.db.execute_query('SELECT telegram_id FROM users WHERE is_admin = true')
+        admins = self.db.execute_query('SELECT telegram_id FROM public.users WHERE is_admin = true')
         for admin in admins:
             try:
                 # Используем метод бота для отправки
@@ -281,8 +282,8 @@ class InventoryManager:
         # Находим пользователей, которые добавляли товар в избранное
         interested_users = self.db.execute_query('''
             SELECT u.telegram_id, u.name, u.language
-            FROM users u
-            JOIN favorites f ON u.id = f.user_id
+            FROM public.users u
+            JOIN public.favorites f ON u.id = f.user_id
             WHERE f.product_id = %s
         ''', (product_id,))
         
@@ -326,14 +327,14 @@ class InventoryManager:
                 SUM(stock * price) as total_value,
                 COUNT(CASE WHEN stock = 0 THEN 1 END) as out_of_stock,
                 COUNT(CASE WHEN stock <= 5 THEN 1 END) as low_stock
-            FROM products
+            FROM public.products
             WHERE is_active = true
         ''')[0]
         
         # Топ товары по стоимости запасов
         top_value_products = self.db.execute_query('''
             SELECT name, stock, price, (stock * price) as inventory_value
-            FROM products
+            FROM public.products
             WHERE is_active = true AND stock > 0
             ORDER BY inventory_value DESC
             LIMIT 10
@@ -361,8 +362,8 @@ class InventoryManager:
                 im.reason,
                 s.name as supplier_name
             FROM inventory_movements im
-            JOIN products p ON im.product_id = p.id
-            LEFT JOIN suppliers s ON im.supplier_id = s.id
+            JOIN public.products p ON im.product_id = p.id
+            LEFT JOIN public.suppliers s ON im.supplier_id = s.id
             WHERE DATE(im.created_at) >= %s
             ORDER BY im.created_at DESC
         ''', (start_date,))
@@ -374,7 +375,7 @@ class InventoryManager:
                 COUNT(*) as count,
                 SUM(ABS(quantity_change)) as total_quantity
             FROM inventory_movements
-            WHERE DATE(created_at) >= %s
+            WHERE created_at::date >= %s
             GROUP BY movement_type
         ''', (start_date,))
         
@@ -386,10 +387,14 @@ class InventoryManager:
     
     def get_abc_inventory_analysis(self):
         """ABC анализ товаров по стоимости запасов"""
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return abc_inventory(snapshot)
+
         inventory_data = self.db.execute_query('''
             SELECT 
                 id, name, stock, price, (stock * price) as inventory_value
-            FROM products
+            FROM public.products
             WHERE is_active = true AND stock > 0
             ORDER BY inventory_value DESC
         ''')
@@ -430,6 +435,10 @@ class InventoryManager:
     
     def get_turnover_analysis(self, days=90):
         """Анализ оборачиваемости товаров"""
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return turnover_analysis(snapshot, days)
+
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
         
         turnover_data = self.db.execute_query('''
@@ -437,25 +446,29 @@ class InventoryManager:
                 p.id,
                 p.name,
                 p.stock,
-                COALESCE(SUM(oi.quantity), 0) as sold_quantity,
+                COALESCE(s.sold, 0) as sold_quantity,
                 p.price,
                 CASE 
-                    WHEN p.stock > 0 THEN COALESCE(SUM(oi.quantity), 0) * 1.0 / p.stock
+                    WHEN p.stock > 0 THEN COALESCE(s.sold, 0) * 1.0 / p.stock
                     ELSE 0 
                 END as turnover_ratio,
                 CASE
-                    WHEN COALESCE(SUM(oi.quantity), 0) = 0 THEN 'Не продается'
+                    WHEN COALESCE(s.sold, 0) = 0 THEN 'Не продается'
                     WHEN p.stock <= 5 THEN 'Критический остаток'
                     WHEN p.stock <= 10 THEN 'Низкий остаток'
                     WHEN p.stock >= 50 THEN 'Избыток'
                     ELSE 'Нормальный'
                 END as stock_status
-            FROM products p
-            LEFT JOIN order_items oi ON p.id = oi.product_id
-            LEFT JOIN orders o ON oi.order_id = o.id AND o.status != 'cancelled'
-                AND DATE(o.created_at) >= %s
+            FROM public.products p
+            -- Только позиции неотменённых заказов за период (как в analytics_snapshot)
+            LEFT JOIN (
+                SELECT oi.product_id, SUM(oi.quantity) as sold
+                FROM public.order_items oi
+                JOIN public.orders o ON oi.order_id = o.id
+                WHERE o.status != 'cancelled' AND DATE(o.created_at) >= %s
+                GROUP BY oi.product_id
+            ) s ON s.product_id = p.id
             WHERE p.is_active = true
-            GROUP BY p.id, p.name, p.stock, p.price
             ORDER BY turnover_ratio DESC
         ''', (start_date,))
         
@@ -486,8 +499,8 @@ class InventoryManager:
             SELECT 
                 DATE(o.created_at) as sale_date,
                 SUM(oi.quantity) as daily_sales
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE oi.product_id = %s
             AND o.created_at >= NOW() - INTERVAL '90 days'
             AND o.status != 'cancelled'
@@ -530,7 +543,7 @@ class InventoryManager:
     def create_reorder_rule(self, product_id, reorder_point, reorder_quantity, supplier_id):
         """Создание правила автопополнения"""
         return self.db.execute_query('''
-            INSERT INTO inventory_rules (
+            INSERT INTO public.inventory_rules (
                 product_id, reorder_point, reorder_quantity, supplier_id, is_active, created_at
             ) VALUES (%s, %s, %s, %s, true, %s)
         ''', (
@@ -541,7 +554,7 @@ class InventoryManager:
     def add_supplier(self, name, contact_email, phone, address, payment_terms):
         """Добавление поставщика"""
         return self.db.execute_query('''
-            INSERT INTO suppliers (
+            INSERT INTO public.suppliers (
                 name, contact_email, phone, address, payment_terms, created_at
             ) VALUES (%s, %s, %s, %s, %s, %s)
         ''', (
@@ -588,7 +601,7 @@ class InventoryManager:
         
         for product_id, rule in self.reorder_rules.items():
             current_stock = self.db.execute_query(
-            'SELECT stock, name FROM products WHERE id::text = %s',
+            'SELECT stock, name FROM public.products WHERE id::text = %s',
             (str(product_id),)
         )
             
@@ -643,7 +656,7 @@ class InventoryManager:
                     SUM(po.total_amount) as total_spent,
                     AVG(julianday(po.delivered_at) - julianday(po.created_at)) as avg_delivery_days,
                     COUNT(CASE WHEN po.status = 'completed' THEN 1 END) * 100.0 / COUNT(po.id) as completion_rate
-                FROM suppliers s
+                FROM public.suppliers s
                 LEFT JOIN purchase_orders po ON s.id = po.supplier_id
                     AND DATE(po.created_at) >= %s
                 WHERE s.id = %s
@@ -657,7 +670,7 @@ class InventoryManager:
                     SUM(po.total_amount) as total_spent,
                     AVG(julianday(po.delivered_at) - julianday(po.created_at)) as avg_delivery_days,
                     COUNT(CASE WHEN po.status = 'completed' THEN 1 END) * 100.0 / COUNT(po.id) as completion_rate
-                FROM suppliers s
+                FROM public.suppliers s
                 LEFT JOIN purchase_orders po ON s.id = po.supplier_id
                     AND DATE(po.created_at) >= %s
                 GROUP BY s.id, s.name
@@ -673,7 +686,7 @@ class InventoryManager:
         # Анализируем каждый товар
         products = self.db.execute_query('''
             SELECT id, name, stock, price
-            FROM products
+            FROM public.products
             WHERE is_active = true
         ''')
         
@@ -710,19 +723,19 @@ class InventoryManager:
     def create_stocktaking_session(self, location="Основной склад"):
         """Создание сессии инвентаризации"""
         session_id = self.db.execute_query('''
-            INSERT INTO stocktaking_sessions (
+            INSERT INTO public.stocktaking_sessions (
                 location, status, started_at, created_by
             ) VALUES (%s, 'active', %s, true)
         ''', (location, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         
         # Создаем записи для всех товаров
         products = self.db.execute_query(
-            'SELECT id, stock FROM products WHERE is_active = true'
+            'SELECT id, stock FROM public.products WHERE is_active = true'
         )
         
         for product in products:
             self.db.execute_query('''
-                INSERT INTO stocktaking_items (
+                INSERT INTO public.stocktaking_items (
                     session_id, product_id, system_quantity, counted_quantity
                 ) VALUES (%s, %s, %s, NULL)
             ''', (session_id, product[0], product[1]))
@@ -732,7 +745,7 @@ class InventoryManager:
     def update_stocktaking_count(self, session_id, product_id, counted_quantity):
         """Обновление подсчета при инвентаризации"""
         return self.db.execute_query('''
-            UPDATE stocktaking_items 
+            UPDATE public.stocktaking_items 
             SET counted_quantity = %s, counted_at = %s
             WHERE session_id = %s AND product_id = %s
         ''', (
@@ -748,8 +761,8 @@ class InventoryManager:
             SELECT 
                 si.product_id, p.name, si.system_quantity, si.counted_quantity,
                 (si.counted_quantity - si.system_quantity) as difference
-            FROM stocktaking_items si
-            JOIN products p ON si.product_id = p.id
+            FROM public.stocktaking_items si
+            JOIN public.products p ON si.product_id = p.id
             WHERE si.session_id = %s AND si.counted_quantity IS NOT NULL
             AND si.counted_quantity != si.system_quantity
         ''', (session_id,))
@@ -760,7 +773,7 @@ class InventoryManager:
             
             # Обновляем остаток
             self.db.execute_query(
-                'UPDATE products SET stock = %s WHERE id::text = %s',
+                'UPDATE public.products SET stock = %s WHERE id::text = %s',
                 (counted_qty, product_id)
             )
             
@@ -778,7 +791,7 @@ class InventoryManager:
         
         # Закрываем сессию
         self.db.execute_query('''
-            UPDATE stocktaking_sessions 
+            UPDATE public.stocktaking_sessions 
             SET status = 'completed', completed_at = %s
             WHERE id = %s
         ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), session_id))
@@ -797,7 +810,7 @@ class InventoryManager:
                     p.id, p.name, p.stock,
                     AVG(im.cost_per_unit) as avg_cost,
                     p.stock * AVG(im.cost_per_unit) as inventory_value
-                FROM products p
+                FROM public.products p
                 LEFT JOIN inventory_movements im ON p.id = im.product_id
                     AND im.movement_type = 'inbound'
                     AND im.cost_per_unit IS NOT NULL
@@ -811,7 +824,7 @@ class InventoryManager:
                 SELECT 
                     id, name, stock, price as avg_cost,
                     stock * price as inventory_value
-                FROM products
+                FROM public.products
                 WHERE is_active = true AND stock > 0
                 ORDER BY inventory_value DESC
             ''')
@@ -833,8 +846,8 @@ class InventoryManager:
                 p.name as product_name, p.description,
                 s.name as supplier_name, s.contact_email, s.phone, s.address
             FROM purchase_orders po
-            JOIN products p ON po.product_id = p.id
-            JOIN suppliers s ON po.supplier_id = s.id
+            JOIN public.products p ON po.product_id = p.id
+            JOIN public.suppliers s ON po.supplier_id = s.id
             WHERE po.id = %s
         ''', (purchase_order_id,))
         
@@ -936,8 +949,8 @@ Email: {order[8]}
                     p.id, p.name, p.stock, p.price,
                     (p.stock * p.price) as inventory_value,
                     c.name as category
-                FROM products p
-                JOIN categories c ON p.category_id = c.id
+                FROM public.products p
+                JOIN public.categories c ON p.category_id = c.id
                 WHERE p.is_active = true
                 ORDER BY inventory_value DESC
             ''')
@@ -955,8 +968,8 @@ Email: {order[8]}
                     im.created_at, p.name, im.movement_type,
                     im.quantity_change, im.reason, s.name
                 FROM inventory_movements im
-                JOIN products p ON im.product_id = p.id
-                LEFT JOIN suppliers s ON im.supplier_id = s.id
+                JOIN public.products p ON im.product_id = p.id
+                LEFT JOIN public.suppliers s ON im.supplier_id = s.id
                 WHERE DATE(im.created_at) >= (NOW() - INTERVAL '30 day')
                 ORDER BY im.created_at DESC
             ''')
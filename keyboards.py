@@ -1,7 +1,56 @@
 """
 Клавиатуры для телеграм-бота
+
+Статические и языковые клавиатуры собираются один раз (@cached_keyboard) и
+хранятся как Markup — неизменяемый dict с готовым JSON. telegram_api
+вставляет эти байты в тело запроса без повторной сериализации. Клавиатуры
+из данных каталога кэширует снимок каталога (catalog.py) — до новой версии.
 """
+import json
+import functools
+
+# Разных наборов аргументов на одну кэшируемую клавиатуру
+KEYBOARD_CACHE_SIZE = 64
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError("Клавиатура из кэша общая для всех — соберите новую вместо изменения")
+
+
+class _FrozenDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class Markup(_FrozenDict):
+    """Готовая reply_markup: неизменяемый dict и его JSON в json_bytes"""
+
+    __slots__ = ('json_bytes',)
+
+    def __init__(self, markup):
+        dict.__init__(self, ((key, _freeze(value)) for key, value in markup.items()))
+        self.json_bytes = json.dumps(self, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def cached_keyboard(func):
+    """Клавиатура собирается и сериализуется один раз на набор аргументов"""
+    @functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def build(*args, **kwargs):
+        markup = func(*args, **kwargs)
+        return Markup(markup) if markup is not None else None
+    return functools.wraps(func)(build)
+
 
+@cached_keyboard
 def create_main_keyboard(language='ru'):
     """Главная клавиатура"""
     if language == 'uz':
@@ -101,6 +150,7 @@ def create_product_inline_keyboard(product_id):
         ]
     }
 
+@cached_keyboard
 def create_cart_keyboard(has_items=False):
     """Клавиатура для корзины"""
     keyboard = []
@@ -121,6 +171,7 @@ def create_cart_keyboard(has_items=False):
         'one_time_keyboard': False
     }
 
+@cached_keyboard
 def create_registration_keyboard(step, suggested_value=None):
     """Клавиатура для регистрации"""
     keyboard = []
@@ -144,6 +195,7 @@ def create_registration_keyboard(step, suggested_value=None):
         'one_time_keyboard': True
     }
 
+@cached_keyboard
 def create_order_keyboard():
     """Клавиатура для оформления заказа"""
     return {
@@ -155,6 +207,7 @@ def create_order_keyboard():
         'one_time_keyboard': True
     }
 
+@cached_keyboard
 def create_admin_keyboard():
     """Клавиатура для администратора"""
     return {
@@ -171,6 +224,7 @@ def create_admin_keyboard():
         'one_time_keyboard': False
     }
 
+@cached_keyboard
 def create_back_keyboard():
     """Простая клавиатура "Назад"""
     return {
@@ -181,6 +235,7 @@ def create_back_keyboard():
         'one_time_keyboard': False
     }
 
+@cached_keyboard
 def create_confirmation_keyboard():
     """Клавиатура подтверждения"""
     return {
@@ -191,6 +246,7 @@ def create_confirmation_keyboard():
         'one_time_keyboard': True
     }
 
+@cached_keyboard
 def create_search_filters_keyboard():
     """Клавиатура для фильтров поиска"""
     return {
@@ -210,6 +266,7 @@ def create_search_filters_keyboard():
         ]
     }
 
+@cached_keyboard
 def create_price_filter_keyboard():
     """Клавиатура для фильтра по цене"""
     return {
@@ -261,6 +318,7 @@ def create_order_details_keyboard(order_id):
         ]
     }
 
+@cached_keyboard
 def create_language_keyboard():
     """Клавиатура выбора языка"""
     return {
@@ -272,6 +330,7 @@ def create_language_keyboard():
         'one_time_keyboard': True
     }
 
+@cached_keyboard
 def create_payment_methods_keyboard(language='ru'):
     """Клавиатура способов оплаты"""
     if language == 'uz':
@@ -331,6 +390,7 @@ def create_admin_products_keyboard(products):
     
     return {'inline_keyboard': keyboard}
 
+@cached_keyboard
 def create_notifications_keyboard():
     """Клавиатура для управления уведомлениями"""
     return {
@@ -350,6 +410,7 @@ def create_notifications_keyboard():
         ]
     }
 
+@cached_keyboard
 def create_analytics_keyboard():
     """Клавиатура для аналитики"""
     return {
@@ -372,6 +433,7 @@ def create_analytics_keyboard():
         ]
     }
 
+@cached_keyboard
 def create_period_selection_keyboard():
     """Клавиатура выбора периода для отчетов"""
     return {
@@ -395,6 +457,7 @@ def create_period_selection_keyboard():
     }
 
 
+@cached_keyboard
 def create_address_location_keyboard():
     """Клавиатура для ввода адреса или отправки локации"""
     return {
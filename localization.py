@@ -1,6 +1,61 @@
 """
 Модуль локализации для поддержки русского и узбекского языков
+
+Переводы компилируются при импорте: для каждого языка — неизменяемая
+таблица, где недостающие ключи уже заполнены текстом языка по умолчанию,
+а строки с {полями} разобраны в шаблоны. Недостающие ключи и расхождения
+полей между языками попадают в лог при загрузке. Язык пользователя
+определяется один раз на апдейт (language_scope) — t() без language
+берёт его оттуда, так что сборка сообщения не ходит в базу.
 """
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from string import Formatter
+from types import MappingProxyType
+
+logger = logging.getLogger('localization')
+
+DEFAULT_LANGUAGE = 'ru'
+
+# Язык текущего апдейта: {'language', 'telegram_id', 'db'}; определяется при первом t()
+_update_language = ContextVar('update_language', default=None)
+
+
+class Template:
+    """Строка с {полями}, разобранная один раз"""
+
+    __slots__ = ('text', 'parts', 'fields')
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = tuple((literal, field) for literal, field, _, _ in Formatter().parse(text))
+        self.fields = frozenset(field for _, field in self.parts if field)
+
+    def render(self, params):
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field:
+                out.append(str(params.get(field, '{' + field + '}')))
+        return ''.join(out)
+
+    def __str__(self):
+        return self.text
+
+
+def _compile(text):
+    if '{' not in text:
+        return text
+    try:
+        template = Template(text)
+    except ValueError:
+        return text  # фигурные скобки не как поля — строка как есть
+    if any(not field.isidentifier() for field in template.fields):
+        return text
+    return template if template.fields else text
+
 
 class Localization:
     def __init__(self):
@@ -198,9 +253,56 @@ Mahsulot qo'shish uchun katalogga o'ting!
             }
         }
     
-    def get_text(self, key, language='ru'):
+        self.tables, self.missing = self.compile(self.translations)
+        self._reported = set()
+        self._reported_lock = threading.Lock()
+
+    @staticmethod
+    def compile(translations):
+        """Таблицы по языкам и недостающие в каждом языке ключи"""
+        default = translations[DEFAULT_LANGUAGE]
+        all_keys = set()
+        for table in translations.values():
+            all_keys.update(table)
+
+        tables, missing = {}, {}
+        for language, table in translations.items():
+            gaps = all_keys - set(table)
+            if gaps:
+                logger.warning(f"Локализация {language}: нет ключей {', '.join(sorted(gaps))}")
+            missing[language] = frozenset(gaps)
+            compiled = {}
+            for key in all_keys:
+                text = table.get(key)
+                if text is None:
+                    text = default.get(key, key)
+                compiled[key] = _compile(text)
+            tables[language] = MappingProxyType(compiled)
+
+        # Шаблон с разными полями в разных языках — ошибка перевода
+        for key in all_keys:
+            fields = {language: getattr(tables[language][key], 'fields', frozenset()) for language in tables}
+            if len(set(fields.values())) > 1:
+                logger.warning(f"Локализация: поля ключа {key} различаются по языкам: {fields}")
+        return MappingProxyType(tables), MappingProxyType(missing)
+
+    def get_text(self, key, language='ru', **params):
         """Получение переведенного текста"""
-        return self.translations.get(language, self.translations['ru']).get(key, key)
+        table = self.tables.get(language) or self.tables[DEFAULT_LANGUAGE]
+        text = table.get(key)
+        if text is None:
+            self._report_unknown(key)
+            return key
+        if isinstance(text, Template):
+            return text.render(params) if params else text.text
+        return text
+
+    def _report_unknown(self, key):
+        with self._reported_lock:
+            if key in self._reported:
+                return
+            self._reported.add(key)
+        logger.warning(f"Локализация: неизвестный ключ {key}")
 
 # Глобальный экземпляр локализации
 localization = Localization()
@@ -210,16 +312,43 @@ def get_user_language(db, telegram_id):
     try:
         user_data = db.get_user_by_telegram_id(telegram_id)
         if user_data:
-            return user_data[0][5]  # language поле
+            return user_data[0][5] or DEFAULT_LANGUAGE  # language поле
     except Exception:
         pass
-    return 'ru'  # По умолчанию русский
+    return DEFAULT_LANGUAGE  # По умолчанию русский
 
-def t(key, telegram_id=None, db=None, language=None):
+@contextmanager
+def language_scope(telegram_id=None, db=None, language=None):
+    """Язык на время обработки одного апдейта; без language — из базы при первом t()"""
+    token = _update_language.set({'language': language, 'telegram_id': telegram_id, 'db': db})
+    try:
+        yield
+    finally:
+        _update_language.reset(token)
+
+def set_current_language(language):
+    """Запомнить язык апдейта (обработчик уже знает его или пользователь сменил язык)"""
+    scope = _update_language.get()
+    if scope is not None and language:
+        scope['language'] = language
+
+def current_language():
+    """Язык текущего апдейта; вне апдейта — язык по умолчанию"""
+    scope = _update_language.get()
+    if scope is None:
+        return DEFAULT_LANGUAGE
+    if scope['language'] is None:
+        if scope['telegram_id'] and scope['db'] is not None:
+            scope['language'] = get_user_language(scope['db'], scope['telegram_id'])
+        else:
+            scope['language'] = DEFAULT_LANGUAGE
+    return scope['language']
+
+def t(key, telegram_id=None, db=None, language=None, **params):
     """Быстрая функция для получения переведенного текста"""
-    if language is None and telegram_id and db:
-        language = get_user_language(db, telegram_id)
-    elif language is None:
-        language = 'ru'
-    
-    return localization.get_text(key, language)
\ No newline at end of file
+    if language is None:
+        if telegram_id and db:
+            language = get_user_language(db, telegram_id)
+        else:
+            language = current_language()
+    return localization.get_text(key, language, **params)
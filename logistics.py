@@ -82,7 +82,7 @@ class LogisticsManager:
         
         # Сохраняем информацию о доставке
         shipment_id = self.db.execute_query('''
-            INSERT INTO shipments (
+            INSERT INTO public.shipments (
                 order_id, tracking_number, delivery_provider, 
                 delivery_option, time_slot, status, estimated_delivery
             ) VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -135,7 +135,7 @@ class LogisticsManager:
     def track_shipment(self, tracking_number):
         """Отслеживание посылки"""
         shipment = self.db.execute_query(
-            'SELECT * FROM shipments WHERE tracking_number = ?',
+            'SELECT * FROM public.shipments WHERE tracking_number = ?',
             (tracking_number,)
         )
         
@@ -220,7 +220,7 @@ class LogisticsManager:
     def schedule_delivery(self, order_id, delivery_date, time_slot):
         """Планирование доставки"""
         return self.db.execute_query('''
-            UPDATE shipments 
+            UPDATE public.shipments 
             SET scheduled_date = %s, time_slot = %s, status = 'scheduled'
             WHERE order_id = %s
         ''', (delivery_date, time_slot, order_id))
@@ -229,9 +229,9 @@ class LogisticsManager:
         """Уведомление об обновлении доставки"""
         shipment = self.db.execute_query('''
             SELECT s.order_id, u.telegram_id, u.name, u.language
-            FROM shipments s
-            JOIN orders o ON s.order_id = o.id
-            JOIN users u ON o.user_id = u.id
+            FROM public.shipments s
+            JOIN public.orders o ON s.order_id = o.id
+            JOIN public.users u ON o.user_id = u.id
             WHERE s.tracking_number = ?
         ''', (tracking_number,))
         
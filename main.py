@@ -4,8 +4,6 @@
 import logging
 
 import json
-import urllib.request
-import urllib.parse
 import os
 import time
 import signal
@@ -14,7 +12,7 @@ import threading
 from supabase_db import SupabaseManager as DatabaseManager
 from handlers import MessageHandler
 from notifications import NotificationManager
-from utils import format_date
+from localization import language_scope
 from payments import PaymentProcessor
 from logistics import LogisticsManager
 from promotions import PromotionManager
@@ -22,7 +20,16 @@ from crm import CRMManager
 from logger import logger
 from health_check import HealthMonitor
 from scheduled_posts import ScheduledPostsManager
-from config import BOT_CONFIG, BOT_TOKEN
+from config import BOT_CONFIG, BOT_TOKEN, CATALOG_CONFIG, SEARCH_CONFIG, OUTBOUND_CONFIG
+from catalog import CatalogManager
+from product_search import ProductSearch
+from telegram_api import get_client
+from outbound import TRANSACTIONAL, process_global_rate
+from dispatcher import UpdateDispatcher, poll_updates
+from webhook import WebhookServer, webhook_path
+from router import Router
+from state_store import close_state_store
+from invalidation_bus import create_bus, ALL as INVALIDATE_ALL
 
 # Импорты с обработкой ошибок
 from datetime import datetime
@@ -77,21 +84,36 @@ except ImportError:
     logging.info("⚠️ MarketingAutomationManager не найден, автоматизация недоступна")
 
 class TelegramShopBot:
-    def __init__(self, token):
+    def __init__(self, token, shard_id=None, shard_count=1):
         self.token = token
+        # В шардированном режиме (sharding.py) фоновые задачи — рассылки,
+        # автопосты, отчёты, проверки склада — выполняет только шард 0
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.runs_background_jobs = not shard_id
         self.base_url = f"https://api.telegram.org/bot{token}"
+        self.api = get_client(token)
+        if self.api.scheduler is not None:
+            # Лимит Telegram общий с веб-админкой и другими шардами
+            self.api.scheduler.set_global_rate(process_global_rate(OUTBOUND_CONFIG, 'bot', shard_count))
         self.offset = 0
         self.running = True
         self.error_count = 0
         self.max_errors = 10
-        self.data_cache = {}
         self.last_data_reload = time.time()
         
         # Инициализация компонентов
         self.db = DatabaseManager()
         self.setup_admin_from_env()
+        self.catalog = CatalogManager(self.db, CATALOG_CONFIG['refresh_interval'],
+                                      CATALOG_CONFIG['coalesce_delay'], CATALOG_CONFIG['coalesce_limit'])
+        self.product_search = ProductSearch(self.db, self.catalog, SEARCH_CONFIG['short_query_chars'])
+        self.invalidation_bus = create_bus()
         self.backup_manager = None
         self.message_handler = MessageHandler(self, self.db)
+        self.dispatcher = UpdateDispatcher(self.process_update, BOT_CONFIG['dispatch_workers'],
+                                           BOT_CONFIG['dispatch_queue_size'])
+        self.webhook_server = None
         self.notification_manager = NotificationManager(self, self.db)
         self.payment_processor = PaymentProcessor()
         
@@ -103,6 +125,7 @@ class TelegramShopBot:
             self.admin_handler = AdminHandler(self, self.db)
         else:
             self.admin_handler = None
+        self.admin_routes, self.admin_callback_routes = self._build_admin_routes()
         
         # Инициализация бизнес-модулей
         self.logistics_manager = LogisticsManager(self.db)
@@ -129,7 +152,8 @@ class TelegramShopBot:
         # Запускаем аналитические отчеты
         if AnalyticsManager:
             self.analytics = AnalyticsManager(self.db)
-            self.analytics.schedule_analytics_reports()
+            if self.runs_background_jobs:
+                self.analytics.schedule_analytics_reports()
         else:
             self.analytics = None
         
@@ -153,7 +177,7 @@ class TelegramShopBot:
             self.ai_recommendations = None
             
         if ChatbotSupport:
-            self.chatbot_support = ChatbotSupport(self.db)
+            self.chatbot_support = ChatbotSupport(self.db, self.product_search)
         else:
             self.chatbot_support = None
             
@@ -164,14 +188,15 @@ class TelegramShopBot:
         
         # Инициализируем маркетинговую автоматизацию
         if MarketingAutomationManager:
-            self.marketing_automation = MarketingAutomationManager(self.db, self.notification_manager)
+            self.marketing_automation = MarketingAutomationManager(self.db, self.notification_manager,
+                                                                   start_engine=self.runs_background_jobs)
         else:
             self.marketing_automation = None
         
         # Инициализируем систему автоматических постов
         try:
             from scheduled_posts import ScheduledPostsManager
-            self.scheduled_posts = ScheduledPostsManager(self, self.db)
+            self.scheduled_posts = ScheduledPostsManager(self, self.db, autostart=self.runs_background_jobs)
             # Передаем ссылку на бота в менеджер постов
             self.scheduled_posts.bot = self
             logger.info("✅ Система автоматических постов инициализирована")
@@ -179,89 +204,70 @@ class TelegramShopBot:
             logger.warning(f"⚠️ Автопосты недоступны (модуль schedule не установлен): {e}")
             self.scheduled_posts = None
         
-        # Запускаем автоматические проверки склада ПОСЛЕ инициализации всех компонентов
-        self.schedule_inventory_checks()
-        
-        # Инициализируем автоматизацию маркетинга только если модуль доступен
-        if self.marketing_automation:
-            self.setup_default_automation_rules()
+        if self.runs_background_jobs:
+            # Продолжение рассылок, брошенных упавшими процессами (бот, веб-админка)
+            self.notification_manager.broadcasts.start_watcher()
+            
+            # Запускаем автоматические проверки склада ПОСЛЕ инициализации всех компонентов
+            self.schedule_inventory_checks()
+            
+            # Инициализируем автоматизацию маркетинга только если модуль доступен
+            if self.marketing_automation:
+                self.setup_default_automation_rules()
         
         # Настройка обработчиков сигналов
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
+        # Снимок каталога: первая сборка сразу, дальше в фоне
+        self.catalog.rebuild()
+        self.catalog.start()
+
         # Запускаем проверку обновлений данных
         self.start_data_sync_monitor()
         
         logger.info("✅ Бот инициализирован успешно")
     
     def start_data_sync_monitor(self):
-        """Запуск мониторинга обновлений данных"""
-        def sync_worker():
-            while self.running:
-                try:
-                    self.check_for_data_updates()
-                    time.sleep(5)  # Проверяем каждые 5 секунд
-                except Exception as e:
-                    logger.error(f"Ошибка синхронизации данных: {e}")
-                    time.sleep(30)
-        
-        sync_thread = threading.Thread(target=sync_worker, daemon=True)
-        sync_thread.start()
-        logger.info("Мониторинг синхронизации данных запущен")
+        """Подписка на шину инвалидации кэшей (LISTEN/NOTIFY или файлы)"""
+        self.invalidation_bus.subscribe(self.handle_cache_invalidation)
+        self.invalidation_bus.start()
+        logger.info(f"Шина инвалидации запущена: {type(self.invalidation_bus).__name__}")
     
-    def check_for_data_updates(self):
-        """Проверка обновлений данных"""
-        # Проверяем обычный флаг обновления
-        update_flag_file = 'data_update_flag.txt'
-        force_reload_flag = 'force_reload_flag.txt'
-        
-        # Проверяем принудительную перезагрузку
-        if os.path.exists(force_reload_flag):
-            try:
-                logger.info("🔄 ПРИНУДИТЕЛЬНАЯ ПЕРЕЗАГРУЗКА данных...")
-                self.full_data_reload()
-                os.remove(force_reload_flag)
-                logger.info("✅ Принудительная перезагрузка завершена")
-            except Exception as e:
-                logger.error(f"Ошибка принудительной перезагрузки: {e}")
-                try:
-                    os.remove(force_reload_flag)
-                except Exception:
-                    pass
+    def handle_cache_invalidation(self, event):
+        """Обновление только тех кэшей, которых касается событие"""
+        if event.table == INVALIDATE_ALL:
+            if event.op == 'RESYNC':
+                # Переподключение шины: тихо догоняем пропущенные изменения
+                self.catalog.request_rebuild()
+                if self.scheduled_posts:
+                    self.scheduled_posts.load_schedule_from_database()
+            else:
+                logger.info("🔄 Полная перезагрузка данных по сигналу...")
+                self.reload_data_cache()
+            self.last_data_reload = time.time()
+            return
         
-        # Проверяем обычное обновление
-        elif os.path.exists(update_flag_file):
-            try:
-                # Читаем время последнего обновления
-                with open(update_flag_file, 'r') as f:
-                    update_time_str = f.read().strip()
-                
-                update_time = float(update_time_str)
-                
-                # Если обновление новее нашего последнего обновления
-                if update_time > self.last_data_reload:
-                    logger.info("🔄 Обнаружено обновление данных, перезагружаем...")
-                    self.reload_data_cache()
-                    self.last_data_reload = update_time
-                    
-                    # Удаляем флаг
-                    os.remove(update_flag_file)
-                    logger.info("✅ Данные обновлены в боте")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка обработки флага обновления: {e}")
-                # Удаляем поврежденный флаг
-                try:
-                    os.remove(update_flag_file)
-                except Exception:
-                    pass
+        if event.table in ('products', 'categories', 'subcategories'):
+            # Серия событий (массовая правка) применяется одной пересборкой
+            self.catalog.invalidate(event.table, event.id)
+        elif event.table == 'scheduled_posts':
+            if self.scheduled_posts:
+                if event.id:
+                    self.scheduled_posts.reload_post(event.id)
+                else:
+                    self.scheduled_posts.load_schedule_from_database()
+        elif event.table == 'automation_rules':
+            # Движок автоматизации читает правила из базы на каждом цикле
+            logger.debug(f"Изменено правило автоматизации {event.id}")
+        self.last_data_reload = time.time()
     
     def full_data_reload(self):
         """Полная перезагрузка всех данных и компонентов"""
         try:
             # Перезагружаем базу данных
             self.db = DatabaseManager()
+            self.catalog.db = self.db
             
             # Перезагружаем кэш
             self.reload_data_cache()
@@ -282,16 +288,8 @@ class TelegramShopBot:
     def reload_data_cache(self):
         """Перезагрузка кэша данных"""
         try:
-            # Очищаем кэш
-            self.data_cache.clear()
-            
-            # Перезагружаем категории
-            self.data_cache['categories'] = self.db.get_categories()
-            
-            # Перезагружаем товары
-            self.data_cache['products'] = self.db.execute_query(
-                'SELECT * FROM products WHERE is_active = true ORDER BY name'
-            )
+            # Пересобираем снимок каталога (категории, подкатегории, товары)
+            self.catalog.rebuild()
             
             # Перезагружаем автопосты если есть модуль
             if hasattr(self, 'scheduled_posts') and self.scheduled_posts:
@@ -306,7 +304,7 @@ class TelegramShopBot:
     def notify_admins_about_update(self):
         """Уведомление админов об обновлении данных"""
         try:
-            admins = self.db.execute_query('SELECT telegram_id FROM users WHERE is_admin = true')
+            admins = self.db.execute_query('SELECT telegram_id FROM public.users WHERE is_admin = true')
             
             update_message = "🔄 <b>Данные обновлены!</b>\n\n"
             update_message += "✅ Каталог товаров синхронизирован\n"
@@ -325,11 +323,9 @@ class TelegramShopBot:
     
     def trigger_data_update(self):
         """Принудительное обновление данных"""
-        update_flag_file = 'data_update_flag.txt'
         try:
-            with open(update_flag_file, 'w') as f:
-                f.write(str(time.time()))
-            logger.info("Флаг обновления данных установлен")
+            self.invalidation_bus.publish_reload()
+            logger.info("Сигнал обновления данных отправлен")
         except Exception as e:
             logger.error(f"Ошибка установки флага обновления: {e}")
     
@@ -357,6 +353,7 @@ class TelegramShopBot:
                             'UPDATE public.users SET is_admin = true WHERE telegram_id = %s',
                             (admin_telegram_id,)
                         )
+                        self.db.user_cache.invalidate(telegram_id=admin_telegram_id)
                         logger.info(f"✅ Права админа обновлены для {admin_name}")
                     else:
                         logger.info(f"✅ Админ уже существует: {admin_name}")
@@ -436,68 +433,35 @@ class TelegramShopBot:
         except Exception as e:
             logging.info(f"⚠️ Ошибка настройки автоматизации: {e}")
     
-    def send_message(self, chat_id, text, reply_markup=None):
-        """Отправка сообщения"""
-        url = f"{self.base_url}/sendMessage"
-        data = {
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': 'HTML'
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        try:
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_encoded, method='POST')
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                if not result.get('ok'):
-                    logging.info(f"Ошибка отправки сообщения: {result}")
-                return result
-        except Exception as e:
-            logging.info(f"Ошибка отправки сообщения: {e}")
-            return None
+    def send_message(self, chat_id, text, reply_markup=None, priority=TRANSACTIONAL, wait=True):
+        """Отправка сообщения (wait=False — Future, для рассылок)"""
+        result = self.api.send_message(chat_id, text, reply_markup, priority=priority, wait=wait)
+        if wait and result is not None and not result.get('ok'):
+            logging.info(f"Ошибка отправки сообщения: {result}")
+        return result
     
-    def send_photo(self, chat_id, photo_url, caption="", reply_markup=None):
-        """Отправка фото"""
-        url = f"{self.base_url}/sendPhoto"
-        data = {
-            'chat_id': chat_id,
-            'photo': photo_url,
-            'caption': caption,
-            'parse_mode': 'HTML'
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        try:
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_encoded, method='POST')
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                if not result.get('ok'):
-                    logging.info(f"Ошибка отправки фото: {result}")
-                return result
-        except Exception as e:
-            logging.info(f"Ошибка отправки фото: {e}")
-            return None
+    def send_photo(self, chat_id, photo_url, caption="", reply_markup=None, priority=TRANSACTIONAL, wait=True):
+        """Отправка фото (wait=False — Future, для рассылок)"""
+        result = self.api.send_photo(chat_id, photo_url, caption, reply_markup, priority=priority, wait=wait)
+        if wait and result is not None and not result.get('ok'):
+            logging.info(f"Ошибка отправки фото: {result}")
+        return result
+    
+    def send_media_group(self, chat_id, media):
+        """Отправка альбома (список InputMedia)"""
+        result = self.api.send_media_group(chat_id, media)
+        if result is not None and not result.get('ok'):
+            logging.info(f"Ошибка отправки альбома: {result}")
+        return result
+    
+    def answer_callback_query(self, callback_query_id, text=None, show_alert=False):
+        """Ответ на нажатие inline-кнопки"""
+        result = self.api.answer_callback_query(callback_query_id, text, show_alert or None)
+        return bool(result and result.get('ok'))
     
     def get_updates(self):
         """Получение обновлений"""
-        url = f"{self.base_url}/getUpdates"
-        params = {'offset': self.offset, 'timeout': 30}
-        
-        try:
-            url_with_params = f"{url}?{urllib.parse.urlencode(params)}"
-            with urllib.request.urlopen(url_with_params) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                return data
-        except Exception as e:
-            logging.info(f"Ошибка получения обновлений: {e}")
-            return None
+        return self.api.get_updates(self.offset, timeout=30)
     
     def run(self):
         """Запуск бота"""
@@ -505,125 +469,128 @@ class TelegramShopBot:
         logger.info("📱 Ожидание сообщений...")
         logger.info("Нажмите Ctrl+C для остановки")
         
+        self.dispatcher.start()
         try:
-            while self.running:
-                updates = self.get_updates()
-                
-                if updates and updates.get('ok'):
-                    self.error_count = 0  # Сбрасываем счетчик ошибок при успехе
-                    
-                    for update in updates['result']:
-                        self.offset = update['update_id'] + 1
-                        
-                        try:
-                            self.health_monitor.increment_messages()
-                            
-                            if 'message' in update:
-                                message = update['message']
-                                text = message.get('text', '')
-                                telegram_id = message['from']['id']
-                                
-                                # Логируем сообщение
-                                logger.info(f"Сообщение от {telegram_id}: {text[:50]}...")
-                                
-                                # Проверяем админ команды
-                                if self.admin_handler and (text.startswith('/admin') or text in ['📊 Статистика', '📦 Заказы', '🛠 Товары', '👥 Пользователи', '🔙 Пользовательский режим']):
-                                    self.admin_handler.handle_admin_command(message)
-                                elif self.admin_handler and text in ['📈 Аналитика', '🛡 Безопасность', '💰 Финансы', '📦 Склад', '🤖 AI', '🎯 Автоматизация', '👥 CRM', '📢 Рассылка']:
-                                    self.admin_handler.handle_admin_command(message)
-                                elif self.admin_handler and text.startswith('/admin_order_'):
-                                    self.admin_handler.handle_order_management(message)
-                                elif self.admin_handler and (text.startswith('/edit_product_') or text.startswith('/delete_product_')):
-                                    self.admin_handler.handle_product_commands(message)
-                                elif self.admin_handler and hasattr(self.admin_handler, 'admin_states') and self.admin_handler.admin_states.get(telegram_id):
-                                    state = self.admin_handler.admin_states.get(telegram_id, '')
-                                    if state.startswith('adding_product_'):
-                                        self.admin_handler.handle_add_product_process(message)
-                                    elif state.startswith('creating_broadcast_'):
-                                        self.admin_handler.handle_broadcast_creation(message)
-                                elif text == '/notifications':
-                                    self.show_user_notifications(message)
-                                else:
-                                    self.message_handler.handle_message(message)
-                            elif 'callback_query' in update:
-                                callback_query = update['callback_query']
-                                data = callback_query['data']
-                                telegram_id = callback_query['from']['id']
-                                
-                                # Проверяем админ callback'и
-                                if self.admin_handler and (data.startswith('admin_') or data.startswith('change_status_') or data.startswith('order_details_')):
-                                    self.admin_handler.handle_callback_query(callback_query)
-                                elif self.admin_handler and (data.startswith('analytics_') or data.startswith('period_')):
-                                    self.admin_handler.handle_analytics_callback(callback_query)
-                                elif self.admin_handler and data.startswith('export_'):
-                                    self.admin_handler.handle_export_callback(callback_query)
-                                elif self.admin_handler and (data.startswith('security_') or data.startswith('unblock_user_')):
-                                    if hasattr(self.admin_handler, 'handle_security_callback'):
-                                        self.admin_handler.handle_security_callback(callback_query)
-                                    else:
-                                        self.admin_handler.handle_callback_query(callback_query)
-                                elif self.admin_handler and data.startswith('broadcast_'):
-                                    if hasattr(self.admin_handler, 'handle_broadcast_callback'):
-                                        self.admin_handler.handle_broadcast_callback(callback_query)
-                                    else:
-                                        self.admin_handler.handle_callback_query(callback_query)
-                                else:
-                                    self.message_handler.handle_callback_query(callback_query)
-                        except Exception as e:
-                            logger.error(f"Ошибка обработки обновления: {e}", exc_info=True)
-                            self.health_monitor.increment_errors(str(e))
-                else:
-                    logger.warning("getUpdates returned empty/invalid — backing off")
-                    time.sleep(3)
-                
-                time.sleep(1)
-                
+            if BOT_CONFIG['mode'] == 'webhook':
+                self.run_webhook()
+            else:
+                self.run_polling()
         except KeyboardInterrupt:
             logger.info("🛑 Бот остановлен пользователем")
         except Exception as e:
             logger.critical(f"Критическая ошибка: {e}", exc_info=True)
         finally:
-            logger.info("🔄 Закрытие соединений...")
-            self.running = False
+            self.shutdown()
     
-    def show_user_notifications(self, message):
-        """Показ уведомлений пользователя"""
-        chat_id = message['chat']['id']
-        telegram_id = message['from']['id']
-        
-        user_data = self.db.get_user_by_telegram_id(telegram_id)
-        if not user_data:
-            return
-        
-        user_id = user_data[0][0]
-        notifications = self.db.get_unread_notifications(user_id)
-        
-        if not notifications:
-            self.send_message(
-                chat_id,
-                "🔔 У вас нет новых уведомлений"
-            )
-            return
-        
-        # Показываем все уведомления
-        for notif in notifications:
-            type_emoji = {
-                'order': '📦',
-                'order_status': '📋',
-                'promotion': '🎁',
-                'system': '⚙️',
-                'info': 'ℹ️'
-            }.get(notif[4], 'ℹ️')
-            
-            notif_text = f"{type_emoji} <b>{notif[2]}</b>\n\n"
-            notif_text += f"{notif[3]}\n\n"
-            notif_text += f"📅 {format_date(notif[6])}"
-            
-            self.send_message(chat_id, notif_text)
-            
-            # Отмечаем как прочитанное
-            self.db.mark_notification_read(notif[0])
+    def shutdown(self):
+        """Остановка приёма и сброс очередей: пуши, исходящие, write-behind состояний"""
+        logger.info("🔄 Закрытие соединений...")
+        self.running = False
+        if self.webhook_server is not None:
+            self.webhook_server.shutdown()
+        self.dispatcher.stop(BOT_CONFIG['dispatch_drain_timeout'])
+        self.notification_manager.push_queue.close()
+        if self.api.scheduler is not None:
+            self.api.scheduler.stop(BOT_CONFIG['dispatch_drain_timeout'])
+        close_state_store()
     
+    def run_webhook(self):
+        """Приём апдейтов HTTP-сервером webhook (BOT_MODE=webhook).
+
+        Сам webhook регистрируется командой scripts/manage_webhook.py set.
+        """
+        self.webhook_server = WebhookServer(
+            self.dispatcher,
+            BOT_CONFIG['webhook_secret'],
+            path=webhook_path(BOT_CONFIG['webhook_url']),
+            host=BOT_CONFIG['webhook_listen_host'],
+            port=BOT_CONFIG['webhook_listen_port'],
+        )
+        self.webhook_server.serve_forever()
+    
+    def run_polling(self):
+        """Long polling через getUpdates"""
+        self.offset = poll_updates(self.api, self.dispatcher, lambda: self.running, self.offset)
+    
+    def process_update(self, update):
+        """Обработка одного апдейта в потоке диспетчера"""
+        try:
+            self.health_monitor.increment_messages()
+            # Пользователь и его язык резолвятся один раз на апдейт
+            event = update.get('message') or update.get('callback_query') or {}
+            telegram_id = (event.get('from') or {}).get('id')
+            with self.db.user_cache.request_scope(), language_scope(telegram_id, self.db):
+                self.handle_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления: {e}", exc_info=True)
+            self.health_monitor.increment_errors(str(e))
+    
+    def _build_admin_routes(self):
+        """Маршруты админ-панели: (текст и состояния, callback_data)"""
+        routes = Router('admin')
+        callbacks = Router('admin_callback')
+        admin = self.admin_handler
+        if not admin:
+            return routes, callbacks
+
+        # Самый длинный префикс выигрывает: /admin_order_<id> не уходит в /admin.
+        # Права проверяют сами обработчики
+        routes.prefix('/admin', admin.handle_admin_command)
+        routes.prefix('/admin_order_', admin.handle_order_management)
+        routes.exact(['📊 Статистика', '📦 Заказы', '🛠 Товары', '👥 Пользователи', '🔙 Пользовательский режим',
+                      '📈 Аналитика', '🛡 Безопасность', '💰 Финансы', '📦 Склад', '🤖 AI', '🎯 Автоматизация',
+                      '👥 CRM', '📢 Рассылка'], admin.handle_admin_command)
+        routes.prefix(['/edit_product_', '/delete_product_'], admin.handle_product_commands)
+        # Обработчики есть не во всех версиях AdminHandler — регистрируем имеющиеся
+        if hasattr(admin, 'handle_add_product_process'):
+            routes.state('adding_product_', admin.handle_add_product_process, prefix=True)
+        if hasattr(admin, 'handle_broadcast_creation'):
+            routes.state('creating_broadcast_', admin.handle_broadcast_creation, prefix=True)
+
+        callbacks.prefix(['admin_', 'change_status_', 'order_details_'], admin.handle_callback_query)
+        callbacks.prefix(['analytics_', 'period_'], admin.handle_analytics_callback)
+        if hasattr(admin, 'handle_export_callback'):
+            callbacks.prefix('export_', admin.handle_export_callback)
+        callbacks.prefix(['security_', 'unblock_user_'],
+                         getattr(admin, 'handle_security_callback', admin.handle_callback_query),
+                         name='handle_security_callback')
+        callbacks.prefix('broadcast_',
+                         getattr(admin, 'handle_broadcast_callback', admin.handle_callback_query),
+                         name='handle_broadcast_callback')
+        return routes, callbacks
+
+    def get_route_stats(self):
+        """Статистика маршрутов бота и админки"""
+        stats = self.message_handler.get_route_stats()
+        stats['admin'] = self.admin_routes.get_stats()
+        stats['admin_callback'] = self.admin_callback_routes.get_stats()
+        return stats
+
+    def handle_update(self, update):
+        """Маршрутизация одного апдейта Telegram"""
+        if 'message' in update:
+            message = update['message']
+            text = message.get('text', '')
+            telegram_id = message['from']['id']
+
+            # Логируем сообщение
+            logger.info(f"Сообщение от {telegram_id}: {text[:50]}...")
+
+            # Админ команды, затем незавершённые админ-диалоги
+            if self.admin_routes.handle(text, message):
+                return
+            admin_state = self.admin_handler and getattr(self.admin_handler, 'admin_states', {}).get(telegram_id)
+            if admin_state:
+                route = self.admin_routes.resolve_state(admin_state)
+                if route is not None:
+                    self.admin_routes.dispatch(route, message)
+            else:
+                self.message_handler.handle_message(message)
+        elif 'callback_query' in update:
+            callback_query = update['callback_query']
+            if not self.admin_callback_routes.handle(callback_query['data'], callback_query):
+                self.message_handler.handle_callback_query(callback_query)
+
     def handle_webhook(self, provider, payload, signature=None):
         """Обработка входящих webhook'ов"""
         if not self.webhook_manager:
@@ -659,22 +626,10 @@ class TelegramShopBot:
     
     def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
         """Редактирование клавиатуры сообщения"""
-        url = f"{self.base_url}/editMessageReplyMarkup"
-        data = {
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'reply_markup': json.dumps(reply_markup)
-        }
-        
-        try:
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_encoded, method='POST')
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result.get('ok', False)
-        except Exception as e:
-            logging.info(f"Ошибка редактирования клавиатуры: {e}")
-            return False
+        result = self.api.edit_message_reply_markup(chat_id, message_id, reply_markup)
+        if result is None:
+            logging.info("Ошибка редактирования клавиатуры")
+        return bool(result and result.get('ok', False))
 
 def main():
     """Главная функция"""
@@ -10,11 +10,12 @@ import threading
 import time
 
 class MarketingAutomationManager:
-    def __init__(self, db, notification_manager):
+    def __init__(self, db, notification_manager, start_engine=True):
         self.db = db
         self.notification_manager = notification_manager
         self.automation_rules = {}
-        self.start_automation_engine()
+        if start_engine:
+            self.start_automation_engine()
     
     def start_automation_engine(self):
         """Запуск движка автоматизации"""
@@ -33,7 +34,7 @@ class MarketingAutomationManager:
     def create_automation_rule(self, rule_name, trigger_type, conditions, actions):
         """Создание правила автоматизации"""
         rule_id = self.db.execute_query('''
-            INSERT INTO automation_rules (
+            INSERT INTO public.automation_rules (
                 name, trigger_type, conditions, actions, is_active, created_at
             ) VALUES (%s, %s, %s, %s, true, %s)
         ''', (
@@ -57,7 +58,7 @@ class MarketingAutomationManager:
         # Загружаем активные правила
         active_rules = self.db.execute_query('''
             SELECT id, name, trigger_type, conditions, actions
-            FROM automation_rules
+            FROM public.automation_rules
             WHERE is_active = true
         ''')
         
@@ -85,10 +86,10 @@ class MarketingAutomationManager:
             abandoned_carts = self.db.execute_query('''
                 SELECT DISTINCT c.user_id
                 FROM cart c
-                JOIN products p ON c.product_id = p.id
+                JOIN public.products p ON c.product_id = p.id
                 WHERE c.created_at <= NOW() - INTERVAL '{} hours'
                 AND c.user_id NOT IN (
-                    SELECT DISTINCT user_id FROM orders 
+                    SELECT DISTINCT user_id FROM public.orders 
                     WHERE created_at >= NOW() - INTERVAL '{} hours'
                 )
                 GROUP BY c.user_id
@@ -104,10 +105,10 @@ class MarketingAutomationManager:
             if milestone_type == 'first_order':
                 # Клиенты, сделавшие первый заказ за последний час
                 first_orders = self.db.execute_query('''
-                    SELECT user_id FROM orders
+                    SELECT user_id FROM public.orders
                     WHERE created_at >= NOW() - INTERVAL '1 hour'
                     AND user_id NOT IN (
-                        SELECT DISTINCT user_id FROM orders
+                        SELECT DISTINCT user_id FROM public.orders
                         WHERE created_at < NOW() - INTERVAL '1 hour'
                     )
                 ''')
@@ -118,12 +119,12 @@ class MarketingAutomationManager:
                 # Клиенты, достигшие порога трат
                 milestone_customers = self.db.execute_query('''
                     SELECT user_id, SUM(total_amount) as total_spent
-                    FROM orders
+                    FROM public.orders
                     WHERE status != 'cancelled'
                     GROUP BY user_id
                     HAVING SUM(total_amount) >= %s
                     AND user_id NOT IN (
-                        SELECT user_id FROM automation_executions
+                        SELECT user_id FROM public.automation_executions
                         WHERE rule_type = 'spending_milestone'
                         AND created_at >= NOW() - INTERVAL '30 days'
                     )
@@ -171,7 +172,7 @@ class MarketingAutomationManager:
         
         # Записываем выполнение
         self.db.execute_query('''
-            INSERT INTO automation_executions (rule_id, executed_at)
+            INSERT INTO public.automation_executions (rule_id, executed_at)
             VALUES (%s, %s)
         ''', (rule_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
     
@@ -188,16 +189,16 @@ class MarketingAutomationManager:
                 FROM cart c
                 WHERE c.created_at <= NOW() - INTERVAL '24 hours'
                 AND c.user_id NOT IN (
-                    SELECT DISTINCT user_id FROM orders 
+                    SELECT DISTINCT user_id FROM public.orders 
                     WHERE created_at >= NOW() - INTERVAL '24 hours'
                 )
             ''')
         elif target_audience == 'first_time_buyers':
             target_users = self.db.execute_query('''
-                SELECT user_id FROM orders
+                SELECT user_id FROM public.orders
                 WHERE created_at >= NOW() - INTERVAL '1 hour'
                 AND user_id NOT IN (
-                    SELECT DISTINCT user_id FROM orders
+                    SELECT DISTINCT user_id FROM public.orders
                     WHERE created_at < NOW() - INTERVAL '1 hour'
                 )
             ''')
@@ -205,7 +206,7 @@ class MarketingAutomationManager:
             target_users = self.db.execute_query('''
                 SELECT user_id FROM (
                     SELECT user_id, SUM(total_amount) as total_spent
-                    FROM orders
+                    FROM public.orders
                     WHERE status != 'cancelled'
                     GROUP BY user_id
                     HAVING SUM(total_amount) >= 500
@@ -213,7 +214,7 @@ class MarketingAutomationManager:
             ''')
         else:
             target_users = self.db.execute_query(
-                'SELECT id FROM users WHERE is_admin = false'
+                'SELECT id FROM public.users WHERE is_admin = false'
             )
         
         # Отправляем уведомления
@@ -253,7 +254,7 @@ class MarketingAutomationManager:
         admin_message += f"💰 Скидка: {promo_config.get('discount_value', 10)}%\n"
         admin_message += f"🎯 Правило: {rule_id}"
         
-        admins = self.db.execute_query('SELECT telegram_id FROM users WHERE is_admin = true')
+        admins = self.db.execute_query('SELECT telegram_id FROM public.users WHERE is_admin = true')
         for admin in admins:
             try:
                 self.notification_manager.bot.send_message(admin[0], admin_message)
@@ -272,7 +273,7 @@ class MarketingAutomationManager:
             
             if category_id:
                 self.db.execute_query('''
-                    UPDATE products 
+                    UPDATE public.products 
                     SET price = price * (1 - %s / 100.0),
                         original_price = CASE WHEN original_price IS NULL THEN price ELSE original_price END
                     WHERE category_id = %s AND is_active = true
@@ -282,9 +283,9 @@ class MarketingAutomationManager:
             # Динамическое ценообразование на основе спроса
             high_demand_products = self.db.execute_query('''
                 SELECT p.id, p.price
-                FROM products p
-                JOIN order_items oi ON p.id = oi.product_id
-                JOIN orders o ON oi.order_id = o.id
+                FROM public.products p
+                JOIN public.order_items oi ON p.id = oi.product_id
+                JOIN public.orders o ON oi.order_id = o.id
                 WHERE o.created_at >= NOW() - INTERVAL '7 days'
                 AND o.status != 'cancelled'
                 GROUP BY p.id, p.price
@@ -296,7 +297,7 @@ class MarketingAutomationManager:
                 new_price = current_price * 1.05  # Увеличиваем на 5%
                 
                 self.db.execute_query(
-                    'UPDATE products SET price = %s WHERE id = %s',
+                    'UPDATE public.products SET price = %s WHERE id = %s',
                     (new_price, product_id)
                 )
     
@@ -337,7 +338,7 @@ class MarketingAutomationManager:
     def personalize_message(self, user_id, message_template):
         """Персонализация сообщения"""
         user = self.db.execute_query(
-            'SELECT name, language FROM users WHERE id = %s',
+            'SELECT name, language FROM public.users WHERE id = %s',
             (user_id,)
         )[0]
         
@@ -400,8 +401,8 @@ class MarketingAutomationManager:
                 u.id, u.name, u.telegram_id,
                 MAX(o.created_at) as last_order,
                 SUM(o.total_amount) as total_spent
-            FROM users u
-            JOIN orders o ON u.id = o.user_id
+            FROM public.users u
+            JOIN public.orders o ON u.id = o.user_id
             WHERE u.is_admin = false
             AND o.status != 'cancelled'
             GROUP BY u.id, u.name, u.telegram_id
@@ -459,9 +460,9 @@ class MarketingAutomationManager:
             # Анализируем историю покупок
             purchase_history = self.db.execute_query('''
                 SELECT p.category_id, AVG(p.price) as avg_price
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                JOIN orders o ON oi.order_id = o.id
+                FROM public.order_items oi
+                JOIN public.products p ON oi.product_id = p.id
+                JOIN public.orders o ON oi.order_id = o.id
                 WHERE o.user_id = %s AND o.status != 'cancelled'
                 GROUP BY p.category_id
                 ORDER BY COUNT(*) DESC
@@ -474,7 +475,7 @@ class MarketingAutomationManager:
                 # Находим товары дороже обычных покупок
                 upsell_products = self.db.execute_query('''
                     SELECT id, name, price
-                    FROM products
+                    FROM public.products
                     WHERE category_id = %s 
                     AND price > %s * 1.5
                     AND is_active = true
@@ -484,7 +485,7 @@ class MarketingAutomationManager:
                 
                 if upsell_products:
                     user_data = self.db.execute_query(
-                        'SELECT name FROM users WHERE id = %s',
+                        'SELECT name FROM public.users WHERE id = %s',
                         (user_id,)
                     )[0]
                     
@@ -512,8 +513,8 @@ class MarketingAutomationManager:
         # Находим клиентов с недавними заказами
         recent_buyers = self.db.execute_query('''
             SELECT DISTINCT o.user_id, u.name
-            FROM orders o
-            JOIN users u ON o.user_id = u.id
+            FROM public.orders o
+            JOIN public.users u ON o.user_id = u.id
             WHERE o.created_at >= NOW() - INTERVAL '7 days'
             AND o.status IN ('confirmed', 'shipped')
         ''')
@@ -572,7 +573,7 @@ class MarketingAutomationManager:
             category_products = []
             for cat_id in campaign['categories']:
                 products = self.db.execute_query(
-                    'SELECT id FROM products WHERE category_id = %s AND is_active = true',
+                    'SELECT id FROM public.products WHERE category_id = %s AND is_active = true',
                     (cat_id,)
                 )
                 category_products.extend([p[0] for p in products])
@@ -635,9 +636,9 @@ class MarketingAutomationManager:
                 MAX(c.created_at) as last_activity,
                 SUM(p.price * c.quantity) as cart_value
             FROM cart c
-            JOIN products p ON c.product_id = p.id
+            JOIN public.products p ON c.product_id = p.id
             WHERE c.user_id NOT IN (
-                SELECT DISTINCT user_id FROM orders 
+                SELECT DISTINCT user_id FROM public.orders 
                 WHERE created_at >= NOW() - INTERVAL '1 hour'
             )
             GROUP BY c.user_id
@@ -653,7 +654,7 @@ class MarketingAutomationManager:
                 if hours_since >= sequence['delay_hours']:
                     # Проверяем, не отправляли ли уже это сообщение
                     already_sent = self.db.execute_query('''
-                        SELECT COUNT(*) FROM automation_executions
+                        SELECT COUNT(*) FROM public.automation_executions
                         WHERE user_id = %s AND rule_type = %s
                         AND created_at >= NOW() - INTERVAL '{} hours'
                     '''.format(sequence['delay_hours'] + 12), (user_id, f"cart_abandonment_{sequence['delay_hours']}"))
@@ -661,7 +662,7 @@ class MarketingAutomationManager:
                     if already_sent[0][0] == 0:
                         # Персонализируем сообщение
                         user_data = self.db.execute_query(
-                            'SELECT name FROM users WHERE id = %s',
+                            'SELECT name FROM public.users WHERE id = %s',
                             (user_id,)
                         )[0]
                         
@@ -674,7 +675,7 @@ class MarketingAutomationManager:
                         
                         # Записываем выполнение
                         self.db.execute_query('''
-                            INSERT INTO automation_executions (
+                            INSERT INTO public.automation_executions (
                                 user_id, rule_type, executed_at
                             ) VALUES (%s, %s, %s)
                         ''', (
@@ -692,9 +693,9 @@ class MarketingAutomationManager:
                 u.id, u.name, u.telegram_id,
                 lp.current_points, lp.current_tier,
                 SUM(o.total_amount) as total_spent
-            FROM users u
-            JOIN loyalty_points lp ON u.id = lp.user_id
-            LEFT JOIN orders o ON u.id = o.user_id AND o.status != 'cancelled'
+            FROM public.users u
+            JOIN public.loyalty_points lp ON u.id = lp.user_id
+            LEFT JOIN public.orders o ON u.id = o.user_id AND o.status != 'cancelled'
             WHERE u.is_admin = false
             GROUP BY u.id, u.name, u.telegram_id, lp.current_points, lp.current_tier
         ''')
@@ -722,7 +723,7 @@ class MarketingAutomationManager:
             if new_tier != current_tier:
                 # Обновляем в базе
                 self.db.execute_query(
-                    'UPDATE loyalty_points SET current_tier = %s WHERE user_id = %s',
+                    'UPDATE public.loyalty_points SET current_tier = %s WHERE user_id = %s',
                     (new_tier, user_id)
                 )
                 
@@ -742,7 +743,7 @@ class MarketingAutomationManager:
         campaign_data = self.db.execute_query('''
             SELECT 
                 name, created_at, target_count,
-                (SELECT COUNT(*) FROM automation_executions WHERE rule_id = %s) as executions
+                (SELECT COUNT(*) FROM public.automation_executions WHERE rule_id = %s) as executions
             FROM marketing_campaigns
             WHERE id = %s
         ''', (campaign_id, campaign_id))
@@ -758,8 +759,8 @@ class MarketingAutomationManager:
                 COUNT(DISTINCT o.user_id) as converted_users,
                 SUM(o.total_amount) as generated_revenue,
                 AVG(o.total_amount) as avg_order_value
-            FROM orders o
-            JOIN automation_executions ae ON o.user_id = ae.user_id
+            FROM public.orders o
+            JOIN public.automation_executions ae ON o.user_id = ae.user_id
             WHERE ae.rule_id = ?
             AND o.created_at >= ae.executed_at
             AND o.created_at <= ae.executed_at + INTERVAL '7 days'
@@ -788,10 +789,10 @@ class MarketingAutomationManager:
             SELECT 
                 rule_type,
                 COUNT(*) as executions_count,
-                DATE(executed_at) as date
-            FROM automation_executions
+                executed_at::date as date
+            FROM public.automation_executions
             WHERE executed_at >= NOW() - INTERVAL '30 days'
-            GROUP BY rule_type, DATE(executed_at)
+            GROUP BY rule_type, executed_at::date
             ORDER BY date DESC, executions_count DESC
         ''')
         
@@ -801,8 +802,8 @@ class MarketingAutomationManager:
                 ar.name,
                 COUNT(ae.id) as total_executions,
                 COUNT(DISTINCT ae.user_id) as unique_users_reached
-            FROM automation_rules ar
-            LEFT JOIN automation_executions ae ON ar.id = ae.rule_id
+            FROM public.automation_rules ar
+            LEFT JOIN public.automation_executions ae ON ar.id = ae.rule_id
             WHERE ar.is_active = true
             GROUP BY ar.id, ar.name
             ORDER BY total_executions DESC
@@ -3,8 +3,13 @@
 """
 import logging
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from utils import format_date, format_price
+from config import NOTIFICATION_CONFIG
+from delay_queue import DelayQueue
+from outbound import MARKETING, NOTIFICATION, delivery_counts
+from broadcast import BroadcastEngine, localize_message
+from pagination import as_timestamp
 import threading
 import time
 
@@ -12,97 +17,159 @@ class NotificationManager:
     def __init__(self, bot, db):
         self.bot = bot
         self.db = db
-        self.push_queue = []
+        # Куча по времени отправки; невыполненные уведомления дублируются
+        # в public.push_outbox и переживают рестарт
+        self.push_queue = DelayQueue()
+        self.push_workers = NOTIFICATION_CONFIG['push_workers']
+        self.retry_delay = NOTIFICATION_CONFIG['push_retry_delay']
+        self.shard_id = getattr(bot, 'shard_id', None) or 0
+        self.shard_count = getattr(bot, 'shard_count', 1)
+        # Массовые рассылки — заданиями с контрольными точками (broadcast.py)
+        self.broadcasts = BroadcastEngine(db, bot.api, localize_message)
         self.start_push_service()
     
     def start_push_service(self):
         """Запуск службы push-уведомлений"""
         def push_worker():
             while True:
+                notification = self.push_queue.get()
+                if notification is None:
+                    return
                 try:
-                    if self.push_queue:
-                        notification = self.push_queue.pop(0)
-                        self.send_push_notification(notification)
-                    time.sleep(1)
+                    self.send_push_notification(notification)
                 except Exception as e:
                     logging.info(f"Ошибка push-службы: {e}")
         
-        push_thread = threading.Thread(target=push_worker, daemon=True)
-        push_thread.start()
+        for number in range(self.push_workers):
+            threading.Thread(target=push_worker, name=f'push-{number}', daemon=True).start()
+        # Граница берётся до первой живой постановки: строки новее неё уже
+        # стоят в очереди, и восстановление не должно загрузить их ещё раз
+        until_id = self.db.outbox_max_id()
+        if until_id is None:
+            logging.info("Outbox недоступен — push-уведомления не восстановлены")
+            return
+        # Восстановление outbox не задерживает запуск бота
+        threading.Thread(target=self.recover_push_outbox, args=(until_id,),
+                         name='push-recovery', daemon=True).start()
+    
+    def recover_push_outbox(self, until_id):
+        """Загрузить в очередь невыполненные уведомления своего шарда с id <= until_id"""
+        batch_size = NOTIFICATION_CONFIG['outbox_recovery_batch']
+        after_id = 0
+        recovered = 0
+        while True:
+            rows = self.db.outbox_pending(self.shard_id, after_id, batch_size, self.shard_count, until_id)
+            if not rows:
+                break
+            for row in rows:
+                scheduled_at = as_timestamp(row[5])
+                due = scheduled_at.timestamp() if isinstance(scheduled_at, datetime) else time.time()
+                self.push_queue.put({
+                    'outbox_id': row[0],
+                    'user_id': row[1],
+                    'title': row[2],
+                    'message': row[3],
+                    'type': row[4],
+                    'attempts': row[6],
+                    'max_attempts': row[7],
+                }, due)
+            recovered += len(rows)
+            after_id = rows[-1][0]
+            if len(rows) < batch_size:
+                break
+        if recovered:
+            logging.info(f"📬 Восстановлено push-уведомлений из outbox: {recovered}")
     
     def queue_push_notification(self, user_id, title, message, notification_type='info', delay_seconds=0):
         """Добавление push-уведомления в очередь"""
+        due = time.time() + delay_seconds
         notification = {
             'user_id': user_id,
             'title': title,
             'message': message,
             'type': notification_type,
-            'scheduled_time': datetime.now() + timedelta(seconds=delay_seconds),
             'attempts': 0,
             'max_attempts': 3
         }
-        self.push_queue.append(notification)
+        notification['outbox_id'] = self.db.outbox_add(
+            user_id, title, message, notification_type,
+            datetime.fromtimestamp(due, timezone.utc), notification['max_attempts'], self.shard_id
+        )
+        if notification['outbox_id'] is None:
+            # Без outbox уведомление всё равно уйдёт, но не переживёт рестарт
+            logging.info("Не удалось сохранить push в outbox")
+        self.push_queue.put(notification, due)
+    
+    def _push_done(self, notification):
+        if notification.get('outbox_id'):
+            self.db.outbox_delete(notification['outbox_id'])
     
     def send_push_notification(self, notification):
-        """Отправка push-уведомления"""
-        if datetime.now() < notification['scheduled_time']:
-            # Возвращаем в очередь если время еще не пришло
-            self.push_queue.append(notification)
-            return
-        
+        """Отправка push-уведомления (время отправки уже наступило)"""
         try:
             # Получаем telegram_id пользователя
             user = self.db.execute_query(
-                'SELECT telegram_id, language FROM users WHERE id = %s',
+                'SELECT telegram_id, language FROM public.users WHERE id = %s',
                 (notification['user_id'],)
             )
             
-            if user:
-                telegram_id, language = user[0]
-                
-                # Локализуем сообщение
-                from localization import t
-                localized_title = t(notification['title'], language=language) if notification['title'].startswith('push_') else notification['title']
-                localized_message = t(notification['message'], language=language) if notification['message'].startswith('push_') else notification['message']
-                
-                # Добавляем эмодзи в зависимости от типа
-                type_emojis = {
-                    'order': '📦',
-                    'payment': '💳',
-                    'delivery': '🚚',
-                    'promotion': '🎁',
-                    'reminder': '⏰',
-                    'warning': '⚠️',
-                    'success': '✅',
-                    'info': 'ℹ️'
-                }
-                
-                emoji = type_emojis.get(notification['type'], '📱')
-                push_text = f"{emoji} <b>{localized_title}</b>\n\n{localized_message}"
-                
-                # Отправляем уведомление
-                result = self.bot.send_message(telegram_id, push_text)
-                
-                if result and result.get('ok'):
-                    # Сохраняем в базу как доставленное
-                    self.db.add_notification(
-                        notification['user_id'],
-                        localized_title,
-                        localized_message,
-                        notification['type']
-                    )
-                    logging.info(f"✅ Push отправлен пользователю {telegram_id}")
-                else:
-                    raise Exception("Не удалось отправить сообщение")
+            if not user:
+                # Пользователь удалён — доставлять некому
+                self._push_done(notification)
+                return
+            
+            telegram_id, language = user[0]
+            
+            # Локализуем сообщение
+            from localization import t
+            localized_title = t(notification['title'], language=language) if notification['title'].startswith('push_') else notification['title']
+            localized_message = t(notification['message'], language=language) if notification['message'].startswith('push_') else notification['message']
+            
+            # Добавляем эмодзи в зависимости от типа
+            type_emojis = {
+                'order': '📦',
+                'payment': '💳',
+                'delivery': '🚚',
+                'promotion': '🎁',
+                'reminder': '⏰',
+                'warning': '⚠️',
+                'success': '✅',
+                'info': 'ℹ️'
+            }
+            
+            emoji = type_emojis.get(notification['type'], '📱')
+            push_text = f"{emoji} <b>{localized_title}</b>\n\n{localized_message}"
+            
+            # Отправляем уведомление
+            result = self.bot.send_message(telegram_id, push_text, priority=NOTIFICATION)
+            
+            if result and result.get('ok'):
+                # Сохраняем в базу как доставленное
+                self.db.add_notification(
+                    notification['user_id'],
+                    localized_title,
+                    localized_message,
+                    notification['type']
+                )
+                self._push_done(notification)
+                logging.info(f"✅ Push отправлен пользователю {telegram_id}")
+            else:
+                raise Exception("Не удалось отправить сообщение")
                     
         except Exception as e:
             notification['attempts'] += 1
             logging.info(f"❌ Ошибка отправки push пользователю {notification['user_id']}: {e}")
+            outbox_id = notification.get('outbox_id')
             
             # Повторная попытка если не превышен лимит
             if notification['attempts'] < notification['max_attempts']:
-                notification['scheduled_time'] = datetime.now() + timedelta(minutes=5)
-                self.push_queue.append(notification)
+                due = time.time() + self.retry_delay
+                if outbox_id:
+                    self.db.outbox_reschedule(outbox_id, notification['attempts'],
+                                              datetime.fromtimestamp(due, timezone.utc), str(e))
+                self.push_queue.put(notification, due)
+            elif outbox_id:
+                self.db.outbox_fail(outbox_id, notification['attempts'], str(e))
     
     def send_instant_push(self, user_id, title, message, notification_type='info'):
         """Мгновенная отправка push-уведомления"""
@@ -123,7 +190,7 @@ class NotificationManager:
         
         # Получаем информацию о пользователе
         user = self.db.execute_query(
-            'SELECT name, phone, email FROM users WHERE id = %s',
+            'SELECT name, phone, email FROM public.users WHERE id = %s',
             (order[1],)
         )[0]
         
@@ -151,16 +218,16 @@ class NotificationManager:
         
         # Отправляем всем админам
         admins = self.db.execute_query(
-            'SELECT telegram_id FROM users WHERE is_admin = true'
+            'SELECT telegram_id FROM public.users WHERE is_admin = true'
         )
         
         for admin in admins:
             try:
-                self.bot.send_message(admin[0], notification_text)
+                self.bot.send_message(admin[0], notification_text, priority=NOTIFICATION)
                 
                 # Получаем ID админа в базе
                 admin_user = self.db.execute_query(
-                    'SELECT id FROM users WHERE telegram_id = %s',
+                    'SELECT id FROM public.users WHERE telegram_id = %s',
                     (admin[0],)
                 )
                 if admin_user:
@@ -184,7 +251,7 @@ class NotificationManager:
         
         # Получаем пользователя
         user = self.db.execute_query(
-            'SELECT telegram_id, name, language FROM users WHERE id = %s',
+            'SELECT telegram_id, name, language FROM public.users WHERE id = %s',
             (order[1],)
         )[0]
         
@@ -208,11 +275,11 @@ class NotificationManager:
             notification_text += t('status_cancelled_message', language=language)
         
         try:
-            self.bot.send_message(user[0], notification_text)
+            self.bot.send_message(user[0], notification_text, priority=NOTIFICATION)
             
             # Отправляем push-уведомление
             user_db_id = self.db.execute_query(
-                'SELECT id FROM users WHERE telegram_id = %s',
+                'SELECT id FROM public.users WHERE telegram_id = %s',
                 (user[0],)
             )[0][0]
             
@@ -240,7 +307,7 @@ class NotificationManager:
     def send_low_stock_alert(self):
         """Уведомление админам о товарах с низким остатком"""
         low_stock_products = self.db.execute_query(
-            'SELECT name, stock FROM products WHERE stock <= 5 AND is_active = true'
+            'SELECT name, stock FROM public.products WHERE stock <= 5 AND is_active = true'
         )
         
         if not low_stock_products:
@@ -259,12 +326,12 @@ class NotificationManager:
         
         # Отправляем всем админам
         admins = self.db.execute_query(
-            'SELECT telegram_id FROM users WHERE is_admin = true'
+            'SELECT telegram_id FROM public.users WHERE is_admin = true'
         )
         
         for admin in admins:
             try:
-                self.bot.send_message(admin[0], alert_text)
+                self.bot.send_message(admin[0], alert_text, priority=NOTIFICATION)
             except Exception as e:
                 logging.info(f"Ошибка отправки уведомления о складе админу {admin[0]}: {e}")
     
@@ -278,8 +345,8 @@ class NotificationManager:
                 COUNT(*) as orders_count,
                 SUM(total_amount) as revenue,
                 COUNT(DISTINCT user_id) as unique_customers
-            FROM orders 
-            WHERE DATE(created_at) = %s
+            FROM public.orders 
+            WHERE created_at::date = %s
         ''', (today,))
         
         if not daily_stats or daily_stats[0][0] == 0:
@@ -295,9 +362,9 @@ class NotificationManager:
         # Топ товары за день
         top_products = self.db.execute_query('''
             SELECT p.name, SUM(oi.quantity) as sold
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
+            FROM public.order_items oi
+            JOIN public.products p ON oi.product_id = p.id
+            JOIN public.orders o ON oi.order_id = o.id
             WHERE DATE(o.created_at) = ?
             GROUP BY p.id, p.name
             ORDER BY sold DESC
@@ -311,65 +378,26 @@ class NotificationManager:
         
         # Отправляем админам
         admins = self.db.execute_query(
-            'SELECT telegram_id FROM users WHERE is_admin = true'
+            'SELECT telegram_id FROM public.users WHERE is_admin = true'
         )
         
         for admin in admins:
             try:
-                self.bot.send_message(admin[0], summary_text)
+                self.bot.send_message(admin[0], summary_text, priority=NOTIFICATION)
             except Exception as e:
                 logging.info(f"Ошибка отправки сводки админу {admin[0]}: {e}")
     
     def send_promotional_broadcast(self, message_text, target_group='all'):
-        """Рассылка промо-сообщений"""
-        if target_group == 'all':
-            users = self.db.execute_query(
-                'SELECT telegram_id, name, language FROM users WHERE is_admin = false'
-            )
-        elif target_group == 'active':
-            # Пользователи, делавшие заказы за последние 30 дней
-            users = self.db.execute_query('''
-                SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
-                WHERE u.is_admin = false AND o.created_at >= NOW() - INTERVAL '30 days'
-            ''')
-        elif target_group == 'inactive':
-            # Пользователи без заказов за последние 30 дней
-            users = self.db.execute_query('''
-                SELECT u.telegram_id, u.name, u.language
-                FROM users u
-                LEFT JOIN orders o ON u.id = o.user_id AND o.created_at >= NOW() - INTERVAL '30 days'
-                WHERE u.is_admin = false AND o.id IS NULL
-            ''')
-        else:
+        """Рассылка промо-сообщений: all, active (заказы за 30 дней) или inactive"""
+        if target_group not in ('all', 'active', 'inactive'):
             return 0, 0
-        
-        success_count = 0
-        error_count = 0
-        
-        for user in users:
-            try:
-                # Можно добавить локализацию сообщения по языку пользователя
-                localized_message = self.localize_broadcast_message(message_text, user[2])
-                self.bot.send_message(user[0], localized_message)
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                logging.info(f"Ошибка рассылки пользователю {user[0]}: {e}")
-        
-        return success_count, error_count
+        # Получатели читаются пачками, текст готовится один раз на язык,
+        # после падения задание продолжается с последней пачки
+        return self.broadcasts.send(target_group, message_text, kind='promo')
     
     def localize_broadcast_message(self, message, language):
         """Локализация рассылочного сообщения"""
-        if language == 'uz':
-            # Простая замена ключевых слов для узбекского
-            message = message.replace('Скидка', 'Chegirma')
-            message = message.replace('Акция', 'Aksiya')
-            message = message.replace('Новинка', 'Yangilik')
-            message = message.replace('Товар', 'Mahsulot')
-        
-        return message
+        return localize_message(message, language)
     
     def check_and_send_birthday_notifications(self):
         """Проверка и отправка поздравлений с днем рождения"""
@@ -392,7 +420,7 @@ class NotificationManager:
             birthday_text += "🛍 Приятных покупок!"
             
             try:
-                self.bot.send_message(user[0], birthday_text)
+                self.bot.send_message(user[0], birthday_text, priority=MARKETING)
             except Exception as e:
                 logging.info(f"Ошибка отправки поздравления {user[0]}: {e}")
     
@@ -403,9 +431,9 @@ class NotificationManager:
             SELECT DISTINCT u.telegram_id, u.name, u.language,
                    COUNT(c.id) as items_count,
                    SUM(p.price * c.quantity) as total_amount
-            FROM users u
+            FROM public.users u
             JOIN cart c ON u.id = c.user_id
-            JOIN products p ON c.product_id = p.id
+            JOIN public.products p ON c.product_id = p.id
             WHERE c.created_at <= NOW() - INTERVAL '1 day'
             GROUP BY u.id
         ''')
@@ -421,7 +449,7 @@ class NotificationManager:
             reminder_text += f"🎯 {t('cart_reminder_cta', language=language)}"
             
             try:
-                self.bot.send_message(user[0], reminder_text)
+                self.bot.send_message(user[0], reminder_text, priority=MARKETING)
             except Exception as e:
                 logging.info(f"Ошибка отправки напоминания {user[0]}: {e}")
     
@@ -434,8 +462,8 @@ class NotificationManager:
         # Находим пользователей, которые добавляли этот товар в избранное
         interested_users = self.db.execute_query('''
             SELECT u.telegram_id, u.name, u.language
-            FROM users u
-            JOIN favorites f ON u.id = f.user_id
+            FROM public.users u
+            JOIN public.favorites f ON u.id = f.user_id
             WHERE f.product_id = ?
         ''', (product_id,))
         
@@ -450,7 +478,7 @@ class NotificationManager:
             restock_text += f"🏃‍♂️ {t('order_now', language=language)}"
             
             try:
-                self.bot.send_message(user[0], restock_text)
+                self.bot.send_message(user[0], restock_text, priority=MARKETING)
             except Exception as e:
                 logging.info(f"Ошибка уведомления о поступлении {user[0]}: {e}")
     
@@ -459,8 +487,8 @@ class NotificationManager:
         # Получаем активных пользователей
         active_users = self.db.execute_query('''
             SELECT DISTINCT u.telegram_id, u.name, u.language, u.id
-            FROM users u
-            JOIN orders o ON u.id = o.user_id
+            FROM public.users u
+            JOIN public.orders o ON u.id = o.user_id
             WHERE u.is_admin = false AND o.created_at >= NOW() - INTERVAL '30 days'
         ''')
         
@@ -468,20 +496,20 @@ class NotificationManager:
             # Получаем рекомендации на основе истории покупок
             recommendations = self.db.execute_query('''
                 SELECT DISTINCT p.id, p.name, p.price, p.image_url
-                FROM products p
-                JOIN categories c ON p.category_id = c.id
+                FROM public.products p
+                JOIN public.categories c ON p.category_id = c.id
                 WHERE p.is_active = true 
                 AND p.id NOT IN (
                     SELECT DISTINCT oi.product_id
-                    FROM order_items oi
-                    JOIN orders o ON oi.order_id = o.id
+                    FROM public.order_items oi
+                    JOIN public.orders o ON oi.order_id = o.id
                     WHERE o.user_id = %s
                 )
                 AND c.id IN (
                     SELECT DISTINCT p2.category_id
-                    FROM products p2
-                    JOIN order_items oi2 ON p2.id = oi2.product_id
-                    JOIN orders o2 ON oi2.order_id = o2.id
+                    FROM public.products p2
+                    JOIN public.order_items oi2 ON p2.id = oi2.product_id
+                    JOIN public.orders o2 ON oi2.order_id = o2.id
                     WHERE o2.user_id = %s
                 )
                 ORDER BY p.views DESC, p.sales_count DESC
@@ -502,7 +530,7 @@ class NotificationManager:
                 rec_text += f"🎯 {t('check_catalog', language=language)}"
                 
                 try:
-                    self.bot.send_message(user[0], rec_text)
+                    self.bot.send_message(user[0], rec_text, priority=MARKETING)
                 except Exception as e:
                     logging.info(f"Ошибка отправки рекомендаций {user[0]}: {e}")
     
@@ -515,40 +543,36 @@ class NotificationManager:
             # Новые пользователи (зарегистрированы за последние 7 дней)
             target_users = self.db.execute_query('''
                 SELECT telegram_id, name, language
-                FROM users
+                FROM public.users
                 WHERE is_admin = false AND created_at >= NOW() - INTERVAL '7 days'
             ''')
         elif campaign_data['target'] == 'big_spenders':
             # Пользователи с заказами на сумму больше $100
             target_users = self.db.execute_query('''
                 SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
+                FROM public.users u
+                JOIN public.orders o ON u.id = o.user_id
                 WHERE u.is_admin = false AND o.total_amount >= 100
             ''')
         elif campaign_data['target'] == 'category_buyers':
             # Покупатели определенной категории
             target_users = self.db.execute_query('''
                 SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
-                JOIN order_items oi ON o.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
+                FROM public.users u
+                JOIN public.orders o ON u.id = o.user_id
+                JOIN public.order_items oi ON o.id = oi.order_id
+                JOIN public.products p ON oi.product_id = p.id
                 WHERE u.is_admin = false AND p.category_id = ?
             ''', (campaign_data.get('category_id'),))
         
-        success_count = 0
+        pending = []
         for user in target_users:
-            try:
-                # Локализуем сообщение
-                localized_message = self.localize_broadcast_message(
-                    campaign_data['message'], 
-                    user[2]
-                )
-                
-                self.bot.send_message(user[0], localized_message)
-                success_count += 1
-            except Exception as e:
-                logging.info(f"Ошибка рассылки кампании {user[0]}: {e}")
+            # Локализуем сообщение
+            localized_message = self.localize_broadcast_message(
+                campaign_data['message'], 
+                user[2]
+            )
+            pending.append(self.bot.send_message(user[0], localized_message, priority=MARKETING, wait=False))
         
+        success_count, _ = delivery_counts(pending)
         return success_count
\ No newline at end of file
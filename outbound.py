@@ -0,0 +1,352 @@
+"""
+Планировщик исходящих запросов к Telegram Bot API.
+
+Все отправки (ответы пользователям, уведомления, рассылки, автопосты)
+проходят через одну очередь с приоритетами и token bucket'ами:
+
+* общий лимит бота (по умолчанию 30 сообщений/с; делится между процессами,
+  см. process_global_rate);
+* лимит на личный чат (~1 сообщение/с, небольшой всплеск);
+* лимит на группу/канал (~20 сообщений/мин).
+
+Ответы пользователям (TRANSACTIONAL) всегда выбираются раньше
+уведомлений (NOTIFICATION), а те — раньше рассылок (MARKETING), поэтому
+большая рассылка не задерживает работу бота. Сообщения одного чата
+уходят по одному и в порядке выбора — параллельные отправители не
+переставляют их местами.
+
+Ответ 429 с parameters.retry_after блокирует чат на retry_after секунд
+(и ненадолго всю отправку), после чего сообщение отправляется повторно —
+раньше следующих сообщений того же чата.
+"""
+import time
+import heapq
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger('outbound')
+
+TRANSACTIONAL = 0
+NOTIFICATION = 1
+MARKETING = 2
+
+PRIORITY_NAMES = {TRANSACTIONAL: 'transactional', NOTIFICATION: 'notification', MARKETING: 'marketing'}
+
+
+def delivery_counts(futures):
+    """(доставлено, ошибок) по Future отправок рассылки"""
+    success_count = error_count = 0
+    for future in futures:
+        result = future.result()
+        if result and result.get('ok'):
+            success_count += 1
+        else:
+            error_count += 1
+    return success_count, error_count
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity; плюс блокировка до момента времени"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд ждать до свободного токена (0 — можно сейчас)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _Job:
+    __slots__ = ('priority', 'method', 'params', 'chat_id', 'future', 'attempts', 'queued_at', 'seq')
+
+    def __init__(self, priority, method, params, chat_id, seq):
+        self.priority = priority
+        self.method = method
+        self.params = params
+        self.chat_id = chat_id
+        self.future = Future()
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+        # Номер постановки: с ним задание возвращается в очередь после
+        # ожидания, иначе обгонит его более позднее сообщение того же чата
+        self.seq = seq
+
+
+def process_global_rate(config, role, processes=1):
+    """Доля общего лимита бота для одного процесса.
+
+    Лимит Telegram общий на токен, а бакеты у каждого процесса свои, поэтому
+    бюджет делится заранее: веб-админке — web_share от global_rate (поровну
+    между её воркерами), боту — остальное (поровну между шардами).
+    """
+    share = config['web_share'] if role == 'web' else 1 - config['web_share']
+    return max(0.1, config['global_rate'] * share / max(1, processes))
+
+
+class OutboundScheduler:
+    """Очередь отправок с приоритетами; sender(method, params) выполняет сам запрос"""
+
+    def __init__(self, sender, global_rate=30, private_rate=1, private_burst=3,
+                 group_rate=20 / 60, group_burst=3, senders=4, max_retries=3,
+                 global_pause_cap=1.0):
+        self.sender = sender
+        # Маленький всплеск: иначе в первую секунду уходит 2 × global_rate
+        self.global_bucket = TokenBucket(global_rate, global_rate * 0.1)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.senders = max(1, senders)
+        self.max_retries = max_retries
+        self.global_pause_cap = global_pause_cap
+        self._cond = threading.Condition()
+        self._ready = []          # (priority, seq, job)
+        self._delayed = []        # (not_before, seq, job) — ждут токен своего чата или retry_after
+        self._parked = {}         # chat_id -> deque заданий, пока предыдущее сообщение чата в отправке
+        self._busy = set()        # чаты, у которых сообщение сейчас в отправке
+        self._buckets = {}        # chat_id -> TokenBucket
+        self._outgoing = deque()  # выбранные задания для потоков-отправителей
+        self._seq = 0
+        self._inflight = 0
+        self._threads = []
+        self._running = False
+        self._last_prune = time.monotonic()
+        self.stats = {'submitted': 0, 'sent': 0, 'failed': 0, 'throttled': 0,
+                      'retry_after': 0, 'retried': 0, 'expired': 0}
+
+    # --- жизненный цикл ---
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        threads = [threading.Thread(target=self._schedule, name='outbound-scheduler', daemon=True)]
+        threads += [threading.Thread(target=self._send_loop, name=f'outbound-{number}', daemon=True)
+                    for number in range(self.senders)]
+        for thread in threads:
+            thread.start()
+        self._threads = threads
+
+    def stop(self, timeout=10):
+        """Дождаться отправки очереди (не дольше timeout) и остановить потоки"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queued() + self._inflight and time.monotonic() < deadline:
+                self._cond.wait(0.5)
+            self._running = False
+            leftovers = [job for _, _, job in self._ready + self._delayed]
+            leftovers += [job for queue in self._parked.values() for job in queue]
+            self._ready, self._delayed, self._parked = [], [], {}
+            self._cond.notify_all()
+        for job in leftovers:
+            # Повтор после 429 уже в состоянии running
+            if job.attempts or job.future.set_running_or_notify_cancel():
+                job.future.set_result(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+        if leftovers:
+            logger.warning(f"Остановка отправки: не отправлено {len(leftovers)} сообщений")
+
+    def set_global_rate(self, rate):
+        """Общий лимит этого процесса (например, доля лимита бота для шарда)"""
+        with self._cond:
+            self.global_bucket.rate = float(rate)
+            self.global_bucket.capacity = float(max(1, rate * 0.1))
+            self.global_bucket.tokens = min(self.global_bucket.tokens, self.global_bucket.capacity)
+
+    # --- постановка в очередь ---
+
+    def submit(self, method, params, priority=TRANSACTIONAL):
+        """Поставить запрос в очередь; Future с ответом API (или None)"""
+        if not self._running:
+            # Потоки поднимаются при первой отправке
+            self.start()
+        with self._cond:
+            self._seq += 1
+            job = _Job(priority, method, params, params.get('chat_id'), self._seq)
+            self.stats['submitted'] += 1
+            self._push_ready(job)
+            self._cond.notify_all()
+        return job.future
+
+    def call(self, method, params, priority=TRANSACTIONAL, timeout=None):
+        """Отправить и дождаться ответа; None, если не дождались за timeout"""
+        future = self.submit(method, params, priority)
+        try:
+            return future.result(timeout)
+        except Exception:
+            if future.cancel():
+                with self._cond:
+                    self.stats['expired'] += 1
+            else:
+                logger.warning(f"Telegram {method}: ответ не получен за {timeout} с")
+            return None
+
+    def _push_ready(self, job):
+        heapq.heappush(self._ready, (job.priority, job.seq, job))
+
+    def _push_delayed(self, job, not_before):
+        heapq.heappush(self._delayed, (not_before, job.seq, job))
+
+    def _queued(self):
+        return (len(self._ready) + len(self._delayed) + len(self._outgoing)
+                + sum(len(queue) for queue in self._parked.values()))
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id — группы и каналы
+            group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            if group:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    # --- выбор следующего задания ---
+
+    def _schedule(self):
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, job = heapq.heappop(self._delayed)
+                    self._push_ready(job)
+                if now - self._last_prune > 60:
+                    self._prune(now)
+
+                wait = self._delayed[0][0] - now if self._delayed else 1.0
+                if not self._ready or self._inflight + len(self._outgoing) >= self.senders:
+                    self._cond.wait(min(wait, 1.0))
+                    continue
+                global_wait = self.global_bucket.delay(now)
+                if global_wait > 0:
+                    self._cond.wait(min(global_wait, wait))
+                    continue
+
+                _, _, job = heapq.heappop(self._ready)
+                if job.future.cancelled():
+                    continue
+                if job.chat_id is not None:
+                    # Повтор после 429 сам держит чат занятым — его не паркуем
+                    if job.chat_id in self._busy and not job.attempts:
+                        self._parked.setdefault(job.chat_id, deque()).append(job)
+                        continue
+                    bucket = self._bucket(job.chat_id)
+                    chat_wait = bucket.delay(now)
+                    if chat_wait > 0:
+                        self.stats['throttled'] += 1
+                        self._push_delayed(job, now + chat_wait)
+                        continue
+                    bucket.take(now)
+                    self._busy.add(job.chat_id)
+                self.global_bucket.take(now)
+                self._outgoing.append(job)
+                self._cond.notify_all()
+
+    def _prune(self, now):
+        """Убрать бакеты чатов, которые давно ничего не отправляли"""
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items()
+                        if chat_id not in self._busy and bucket.idle(now)]:
+            del self._buckets[chat_id]
+        self._last_prune = now
+
+    # --- отправка ---
+
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while not self._outgoing:
+                    if not self._running:
+                        return
+                    self._cond.wait(1.0)
+                job = self._outgoing.popleft()
+                self._inflight += 1
+            result = None
+            # Повторная попытка после 429 — Future уже в состоянии running
+            if job.attempts or job.future.set_running_or_notify_cancel():
+                job.attempts += 1
+                try:
+                    result = self.sender(job.method, job.params)
+                except Exception as e:
+                    logger.error(f"Telegram {job.method}: {e}")
+            self._finish(job, result)
+
+    def _finish(self, job, result):
+        retry_after = None
+        if result and not result.get('ok') and result.get('error_code') == 429:
+            retry_after = (result.get('parameters') or {}).get('retry_after', 1)
+        with self._cond:
+            self._inflight -= 1
+            if retry_after is not None:
+                self.stats['retry_after'] += 1
+                now = time.monotonic()
+                until = now + retry_after
+                if job.chat_id is not None:
+                    self._bucket(job.chat_id).block(until)
+                self.global_bucket.block(now + min(retry_after, self.global_pause_cap))
+                logger.warning(f"Telegram {job.method}: 429, retry_after={retry_after} (чат {job.chat_id})")
+                if job.attempts <= self.max_retries and self._running:
+                    # Чат остаётся занятым: следующие сообщения ждут повтора
+                    self.stats['retried'] += 1
+                    self._push_delayed(job, until)
+                    self._cond.notify_all()
+                    return
+            if job.chat_id is not None:
+                self._busy.discard(job.chat_id)
+                parked = self._parked.get(job.chat_id)
+                if parked:
+                    # Следующее сообщение чата возвращается в общую очередь
+                    self._push_ready(parked.popleft())
+                    if not parked:
+                        del self._parked[job.chat_id]
+            if result and result.get('ok'):
+                self.stats['sent'] += 1
+            else:
+                self.stats['failed'] += 1
+            self._cond.notify_all()
+        if job.future.running():
+            job.future.set_result(result)
+
+    # --- статистика ---
+
+    def get_stats(self):
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            pending = [job for _, _, job in self._ready + self._delayed]
+            pending += [job for queue in self._parked.values() for job in queue]
+            for job in pending:
+                queued[PRIORITY_NAMES.get(job.priority, 'marketing')] += 1
+            return dict(self.stats, queued=sum(queued.values()), queued_by_priority=queued,
+                        delayed=len(self._delayed), in_flight=self._inflight + len(self._outgoing),
+                        chat_buckets=len(self._buckets), global_rate=self.global_bucket.rate)
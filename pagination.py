@@ -0,0 +1,155 @@
+"""
+Keyset-пагинация с непрозрачными курсорами.
+
+Курсор — значения ключа сортировки последней (или первой) строки страницы,
+упакованные в компактные байты и закодированные url-safe base64 без '='.
+UUID занимает 16 байт, метка времени — 8, поэтому курсор из направления и
+двух ключей помещается в callback_data Telegram (64 байта).
+
+Следующая страница читается условием (ключ) > (курсор) по индексу, а не
+OFFSET, поэтому любая страница стоит одинаково.
+"""
+import base64
+import struct
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# Направление чтения: после курсора (вперёд) или перед ним (назад)
+AFTER = 'a'
+BEFORE = 'b'
+
+# next_cursor/prev_cursor — None, если в эту сторону страниц больше нет
+Page = namedtuple('Page', 'items next_cursor prev_cursor')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_INT = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_LEN = struct.Struct('>H')
+
+
+def _as_uuid(value):
+    if isinstance(value, uuid.UUID):
+        return value
+    if isinstance(value, str) and len(value) == 36:
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def as_timestamp(value):
+    """datetime из значения колонки timestamptz (через RPC приходит ISO-строкой)"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    return value
+
+
+def encode_cursor(*values):
+    """Упаковать значения (str, int, float, UUID, datetime, None) в токен"""
+    out = bytearray()
+    for value in values:
+        as_uuid = _as_uuid(value)
+        as_dt = _as_datetime(value)
+        if value is None:
+            out += b'N'
+        elif as_uuid is not None:
+            out += b'U' + as_uuid.bytes
+        elif as_dt is not None:
+            delta = as_dt - _EPOCH
+            micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+            out += b'T' + _INT.pack(micros)
+        elif isinstance(value, bool):
+            raise TypeError("bool в курсоре не поддерживается")
+        elif isinstance(value, int):
+            out += b'I' + _INT.pack(value)
+        elif isinstance(value, float):
+            out += b'F' + _FLOAT.pack(value)
+        else:
+            data = str(value).encode('utf-8')
+            if len(data) > 0xFFFF:
+                raise ValueError("строка в курсоре слишком длинная")
+            out += b'S' + _LEN.pack(len(data)) + data
+    return base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    """Значения из токена; None для пустого или испорченного курсора"""
+    if not token:
+        return None
+    try:
+        # Без validate base64 молча выбрасывает посторонние символы
+        raw = base64.b64decode(token + '=' * (-len(token) % 4), altchars=b'-_', validate=True)
+        if not raw:
+            return None
+        values = []
+        pos = 0
+        while pos < len(raw):
+            tag = raw[pos:pos + 1]
+            pos += 1
+            if tag == b'N':
+                values.append(None)
+            elif tag == b'U':
+                values.append(str(uuid.UUID(bytes=raw[pos:pos + 16])))
+                pos += 16
+            elif tag == b'T':
+                micros = _INT.unpack_from(raw, pos)[0]
+                values.append(datetime.fromtimestamp(micros // 1000000, timezone.utc).replace(microsecond=micros % 1000000))
+                pos += 8
+            elif tag == b'I':
+                values.append(_INT.unpack_from(raw, pos)[0])
+                pos += 8
+            elif tag == b'F':
+                values.append(_FLOAT.unpack_from(raw, pos)[0])
+                pos += 8
+            elif tag == b'S':
+                size = _LEN.unpack_from(raw, pos)[0]
+                values.append(raw[pos + 2:pos + 2 + size].decode('utf-8'))
+                pos += 2 + size
+            else:
+                return None
+            if pos > len(raw):
+                return None
+        return tuple(values)
+    except (ValueError, TypeError, IndexError, struct.error, OverflowError):
+        return None
+
+
+def split_cursor(token):
+    """(направление, ключ) из курсора страницы; без курсора — (AFTER, None)"""
+    values = decode_cursor(token)
+    if not values or values[0] not in (AFTER, BEFORE) or len(values) < 2:
+        return AFTER, None
+    return values[0], values[1:]
+
+
+def make_page(rows, limit, direction=AFTER, key=None, key_func=None):
+    """Page из строк, прочитанных в направлении direction с LIMIT limit + 1.
+
+    key — ключ курсора, от которого читали (None — первая страница);
+    key_func(row) — кортеж значений ключа сортировки строки.
+    """
+    rows = list(rows or [])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == BEFORE:
+        rows.reverse()
+    if not rows:
+        return Page([], None, None)
+    if direction == BEFORE:
+        more_after, more_before = True, has_more
+    else:
+        more_after, more_before = has_more, key is not None
+    next_cursor = encode_cursor(AFTER, *key_func(rows[-1])) if more_after else None
+    prev_cursor = encode_cursor(BEFORE, *key_func(rows[0])) if more_before else None
+    return Page(rows, next_cursor, prev_cursor)
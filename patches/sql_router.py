@@ -21,6 +21,8 @@ import logging
 import json
 from typing import Any, List, Optional, Sequence, Union
 
+from sql_params import inline_params
+
 try:
     import httpx  # used for direct RPC calls when needed
 except Exception:  # pragma: no cover
@@ -49,50 +51,12 @@ if not SUPABASE_URL or not API_KEY:
     logging.warning("[sql_router] SUPABASE_URL or API key not set; execute_query will be a no-op.")
 
 def _param_substitute(sql: str, params: Optional[Sequence[Any]]) -> str:
-    """Very simple/unsafe parameter interpolation.
-    NOTE: For trusted internal calls only. Do NOT expose to user-input.
-    Supports placeholders: ?, %s, or $1..$n (first match style wins).
+    """Inline parameters as SQL literals for the exec_sql RPC.
+
+    Supports ?, %s and $1..$n placeholders; placeholders inside string
+    literals and comments are left alone. See `sql_params.inline_params`.
     """
-    if not params:
-        return sql
-    # Detect placeholder style per occurrence basis
-    style = None
-    if "%s" in sql:
-        style = "%s"
-    elif "?" in sql:
-        style = "?"
-    # Else we will try $1..$n
-    result = sql
-    if style in ("%s", "?"):
-        for p in params:
-            if isinstance(p, str):
-                safe = p.replace("'", "''")
-                rep = f"'{safe}'"
-            elif isinstance(p, bool):
-                rep = "true" if p else "false"
-            elif p is None:
-                rep = "NULL"
-            else:
-                rep = str(p)
-            result = result.replace(style, rep, 1)
-    else:
-        # $1..$n style
-        for i, p in enumerate(params, start=1):
-            token = f"${i}"
-            if token not in result:
-                # nothing to replace — continue
-                continue
-            if isinstance(p, str):
-                safe = p.replace("'", "''")
-                rep = f"'{safe}'"
-            elif isinstance(p, bool):
-                rep = "true" if p else "false"
-            elif p is None:
-                rep = "NULL"
-            else:
-                rep = str(p)
-            result = result.replace(token, rep)
-    return result
+    return inline_params(sql, params)
 
 def _rpc_exec_sql(sql: str) -> Optional[Union[List, dict]]:
     """Call the Postgres function `exec_sql(sql text)` via Supabase PostgREST.
@@ -0,0 +1,326 @@
+"""
+Пул прямых соединений с Postgres для SupabaseManager.
+
+Держит ограниченное число psycopg-соединений (DATABASE_URL), проверяет их
+здоровье перед выдачей и пересоздаёт по истечении max_lifetime. Если база
+недоступна, пул на время «остывает», и вызывающий код уходит на RPC exec_sql.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from uuid import UUID
+
+try:
+    import psycopg
+except Exception:
+    try:
+        import psycopg2 as psycopg
+    except Exception:  # pragma: no cover
+        psycopg = None
+
+logger = logging.getLogger('pg_pool')
+
+# psycopg 3 умеет серверные prepared statements; psycopg2 — нет
+SUPPORTS_PREPARE = psycopg is not None and hasattr(psycopg, 'Connection') and hasattr(psycopg.Connection, 'prepare_threshold')
+
+
+class PoolUnavailable(Exception):
+    """Пул не может выдать соединение (база недоступна или пул остывает)"""
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _json_value(value):
+    """Приводим значение к тому виду, в котором его вернул бы exec_sql (json)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, memoryview):
+        return bytes(value).hex()
+    return value
+
+
+def json_row(row):
+    """Кортеж строки с json-совместимыми значениями"""
+    return tuple(_json_value(v) for v in row)
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class PgConnectionPool:
+    """Ограниченный потокобезопасный пул соединений psycopg"""
+
+    def __init__(self, dsn, min_size=1, max_size=10, max_lifetime=1800,
+                 health_check_interval=30, connect_timeout=5, acquire_timeout=10,
+                 failure_cooldown=30, prepare_threshold=2, prepared_max=200):
+        if psycopg is None:
+            raise RuntimeError("psycopg/psycopg2 не установлен")
+        self.dsn = dsn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size)
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self.failure_cooldown = failure_cooldown
+        # Запрос готовится на соединении после prepare_threshold выполнений
+        # (None — не готовить вовсе, например за pgbouncer в transaction mode)
+        self.prepare_threshold = prepare_threshold
+        self.prepared_max = prepared_max
+
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._unavailable_until = 0.0
+
+        self.stats = {
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'connect_failures': 0,
+            'acquired': 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Создание пула по DATABASE_URL и PG_POOL_* переменным; None если не настроен"""
+        dsn = os.getenv('DATABASE_URL')
+        if not dsn or psycopg is None:
+            return None
+        return cls(
+            dsn,
+            min_size=_env_int('PG_POOL_MIN_SIZE', 1),
+            max_size=_env_int('PG_POOL_MAX_SIZE', 10),
+            max_lifetime=_env_int('PG_POOL_MAX_LIFETIME', 1800),
+            health_check_interval=_env_int('PG_POOL_HEALTH_CHECK_INTERVAL', 30),
+            connect_timeout=_env_int('PG_POOL_CONNECT_TIMEOUT', 5),
+            acquire_timeout=_env_int('PG_POOL_ACQUIRE_TIMEOUT', 10),
+            failure_cooldown=_env_int('PG_POOL_FAILURE_COOLDOWN', 30),
+            prepare_threshold=(_env_int('PG_PREPARE_THRESHOLD', 2)
+                               if os.getenv('PG_PREPARE', 'true').lower() == 'true' else None),
+            prepared_max=_env_int('PG_PREPARED_MAX', 200),
+        )
+
+    @property
+    def available(self):
+        """Можно ли сейчас пытаться работать через пул"""
+        return not self._closed and time.monotonic() >= self._unavailable_until
+
+    def mark_unavailable(self):
+        """Временно отключаем пул после сетевой ошибки"""
+        self._unavailable_until = time.monotonic() + self.failure_cooldown
+        logger.warning(f"Пул Postgres недоступен, переходим на RPC на {self.failure_cooldown}s")
+
+    # --- жизненный цикл соединений ---
+
+    def _connect(self):
+        try:
+            conn = psycopg.connect(self.dsn, connect_timeout=self.connect_timeout)
+            conn.autocommit = True
+            if SUPPORTS_PREPARE:
+                conn.prepare_threshold = self.prepare_threshold
+                conn.prepared_max = self.prepared_max
+        except Exception as e:
+            self.stats['connect_failures'] += 1
+            self.mark_unavailable()
+            raise PoolUnavailable(f"Не удалось подключиться к Postgres: {e}") from e
+        self.stats['created'] += 1
+        return _PooledConnection(conn)
+
+    @staticmethod
+    def _is_closed(conn):
+        closed = getattr(conn, 'closed', False)
+        return bool(closed) or bool(getattr(conn, 'broken', False))
+
+    @staticmethod
+    def _close(pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, pooled):
+        """Проверка соединения: время жизни, состояние, SELECT 1 после простоя"""
+        now = time.monotonic()
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            self.stats['recycled'] += 1
+            return False
+        if self._is_closed(pooled.conn):
+            return False
+        if self.health_check_interval and now - pooled.last_used > self.health_check_interval:
+            try:
+                with pooled.conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                    cur.fetchone()
+            except Exception:
+                self.stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def _acquire(self):
+        if not self.available:
+            raise PoolUnavailable("Пул Postgres временно отключен")
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolUnavailable("Пул Postgres закрыт")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolUnavailable("Нет свободных соединений в пуле Postgres")
+                self._cond.wait(remaining)
+
+        # Проверки и подключение выполняем вне блокировки
+        if pooled is not None and not self._is_healthy(pooled):
+            self._close(pooled)
+            pooled = None
+        if pooled is None:
+            try:
+                pooled = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        self.stats['acquired'] += 1
+        return pooled
+
+    def _release(self, pooled, discard=False):
+        with self._cond:
+            if discard or self._closed or self._is_closed(pooled.conn):
+                self._size -= 1
+                self._close(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: выдаёт соединение и возвращает его в пул"""
+        pooled = self._acquire()
+        discard = False
+        try:
+            yield pooled.conn
+        except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+            # Оборванное соединение — не ошибка запроса: выбрасываем его и
+            # даём вызывающему коду уйти на RPC
+            if self._is_closed(pooled.conn):
+                discard = True
+                raise PoolUnavailable(f"Соединение с Postgres потеряно: {e}") from e
+            raise
+        finally:
+            self._release(pooled, discard=discard)
+
+    def warm_up(self):
+        """Открываем min_size соединений заранее"""
+        opened = []
+        try:
+            for _ in range(min(self.min_size, self.max_size)):
+                opened.append(self._acquire())
+        except PoolUnavailable as e:
+            logger.warning(f"Прогрев пула Postgres не удался: {e}")
+        finally:
+            for pooled in opened:
+                self._release(pooled)
+
+    def close(self):
+        """Закрытие всех простаивающих соединений"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def get_stats(self):
+        """Текущее состояние пула"""
+        with self._cond:
+            return dict(self.stats, size=self._size, idle=len(self._idle),
+                        max_size=self.max_size, available=self.available)
+
+    # --- выполнение запросов ---
+
+    def execute(self, sql, params=None, is_select=True, prepare=None):
+        """Выполнение запроса с результатом в формате execute_query.
+
+        Параметры привязываются на сервере (плейсхолдеры %s). prepare=True
+        готовит запрос сразу, None — по порогу prepare_threshold соединения.
+        SELECT -> список кортежей; DML с RETURNING -> список dict;
+        прочее -> {'rows_affected': N}, как у RPC exec_sql.
+        """
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                if SUPPORTS_PREPARE and self.prepare_threshold is not None:
+                    cur.execute(sql, params or None, prepare=prepare)
+                else:
+                    cur.execute(sql, params or None)
+                if cur.description is None:
+                    if is_select:
+                        return []
+                    return {'rows_affected': max(cur.rowcount or 0, 0)}
+                rows = cur.fetchall()
+                if is_select:
+                    return [json_row(row) for row in rows]
+                columns = [col[0] for col in cur.description]
+                return [dict(zip(columns, json_row(row))) for row in rows]
+
+    def iter_batches(self, sql, params=None, batch_size=1000, name=None):
+        """SELECT пачками по batch_size строк через серверный курсор.
+
+        Курсор живёт в транзакции только для чтения на время обхода; в памяти
+        одна пачка. Соединение занято, пока генератор не исчерпан или не закрыт.
+        """
+        with self.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as tx:
+                    tx.execute('SET TRANSACTION READ ONLY')
+                # Имя курсора действует в пределах сессии, одно соединение — один обход
+                with conn.cursor(name or 'batches') as cur:
+                    cur.execute(sql, params or None)
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield [json_row(row) for row in rows]
+            finally:
+                try:
+                    conn.rollback()
+                    conn.autocommit = True
+                except Exception as e:
+                    # Соединение в неизвестном состоянии транзакции в пул не вернётся
+                    logger.warning(f"Не удалось закрыть транзакцию курсора: {e}")
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
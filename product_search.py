@@ -0,0 +1,208 @@
+"""
+Поиск товаров.
+
+Две части:
+- SearchIndex — префиксный и триграммный индекс по снимку каталога в памяти.
+  Короткие запросы («айф», «кросс») и опечатки решаются без обращения к БД.
+- RPC search_products_ranked (supabase/migrations/..._product_search.sql) —
+  полнотекстовый поиск по tsvector (русская морфология + simple для
+  узбекского) с ранжированием и pg_trgm для нечётких совпадений.
+
+ProductSearch выбирает источник: короткий запрос с локальными результатами
+отвечает индекс, остальное — RPC; результаты всегда отдаются строками из
+снимка каталога (тот же формат, что и в остальном боте).
+"""
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger('product_search')
+
+# Индексы колонок полной строки товара (SELECT * FROM products)
+PRODUCT_NAME = 1
+PRODUCT_DESCRIPTION = 2
+PRODUCT_BRAND = 6
+PRODUCT_VIEWS = 9
+PRODUCT_SALES = 10
+
+# Вес поля: совпадение в названии/бренде важнее, чем в описании
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+# Длина префиксов, которые хранятся в индексе явно; более длинные
+# префиксы дофильтровываются по startswith
+MAX_PREFIX = 6
+# Порог похожести по триграммам, как pg_trgm.similarity_threshold
+TRIGRAM_THRESHOLD = 0.3
+
+_APOSTROPHES = re.compile(r"[‘’ʻʼ'`]")
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Слова в нижнем регистре; ё -> е, узбекские апострофы (o‘, g‘) убираются"""
+    text = _APOSTROPHES.sub('', str(text or '')).casefold().replace('ё', 'е')
+    return _TOKEN.findall(text)
+
+
+def trigrams(token):
+    """Триграммы слова с отступами, как в pg_trgm"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Неизменяемый индекс по кортежу строк товаров"""
+
+    def __init__(self, products, version=0):
+        self.products = tuple(products)
+        self.version = version
+        postings = {}
+        for position, row in enumerate(self.products):
+            fields = (
+                (row[PRODUCT_NAME], NAME_WEIGHT),
+                (row[PRODUCT_BRAND] if len(row) > PRODUCT_BRAND else None, NAME_WEIGHT),
+                (row[PRODUCT_DESCRIPTION], DESCRIPTION_WEIGHT),
+            )
+            for text, weight in fields:
+                for token in tokenize(text):
+                    entry = postings.setdefault(token, {})
+                    if entry.get(position, 0) < weight:
+                        entry[position] = weight
+        self._postings = postings
+
+        prefixes = {}
+        grams = {}
+        for token in postings:
+            for size in range(1, min(len(token), MAX_PREFIX) + 1):
+                prefixes.setdefault(token[:size], []).append(token)
+            for gram in trigrams(token):
+                grams.setdefault(gram, []).append(token)
+        self._prefixes = prefixes
+        self._trigrams = grams
+
+    def _prefix_tokens(self, term):
+        tokens = self._prefixes.get(term[:MAX_PREFIX], ())
+        if len(term) <= MAX_PREFIX:
+            return tokens
+        return [token for token in tokens if token.startswith(term)]
+
+    def _similar_tokens(self, term):
+        """Слова индекса, похожие на term по триграммам (опечатки)"""
+        term_grams = trigrams(term)
+        shared = {}
+        for gram in term_grams:
+            for token in self._trigrams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        result = []
+        for token, common in shared.items():
+            similarity = common / (len(term_grams) + len(trigrams(token)) - common)
+            if similarity >= TRIGRAM_THRESHOLD:
+                result.append((token, similarity))
+        return result
+
+    def _term_scores(self, term, fuzzy):
+        """Позиция товара -> вклад одного слова запроса"""
+        scores = {}
+
+        def add(tokens_with_factor):
+            for token, factor in tokens_with_factor:
+                for position, weight in self._postings[token].items():
+                    value = weight * factor
+                    if scores.get(position, 0) < value:
+                        scores[position] = value
+
+        add((token, 3.0 if token == term else 2.0) for token in self._prefix_tokens(term))
+        if fuzzy and not scores and len(term) >= 3:
+            add(self._similar_tokens(term))
+        return scores
+
+    def search(self, query, limit=10, fuzzy=True):
+        """Строки товаров, отсортированные по релевантности.
+
+        Все слова запроса ищутся как префиксы слов товара; если так ничего
+        не нашлось — засчитывается совпадение хотя бы одного слова.
+        """
+        terms = tokenize(query)
+        if not terms or not self.products:
+            return []
+        per_term = [self._term_scores(term, fuzzy) for term in terms]
+        matched = set.intersection(*(set(scores) for scores in per_term))
+        if not matched:
+            matched = set().union(*per_term)
+        if not matched:
+            return []
+
+        phrase = ' '.join(terms)
+
+        def rank(position):
+            row = self.products[position]
+            score = sum(scores.get(position, 0) for scores in per_term)
+            starts = ' '.join(tokenize(row[PRODUCT_NAME])).startswith(phrase)
+            popularity = (row[PRODUCT_SALES] or 0, row[PRODUCT_VIEWS] or 0) if len(row) > PRODUCT_SALES else (0, 0)
+            return (-score, not starts, -popularity[0], -popularity[1], str(row[PRODUCT_NAME]))
+
+        return [self.products[position] for position in sorted(matched, key=rank)[:limit]]
+
+
+class ProductSearch:
+    """Поиск товаров для бота: индекс в памяти + ранжированный RPC"""
+
+    def __init__(self, db, catalog, short_query_chars=12):
+        self.db = db
+        self.catalog = catalog
+        self.short_query_chars = short_query_chars
+        self._index = SearchIndex(())
+        self._lock = threading.Lock()
+        self.stats = {'local': 0, 'rpc': 0, 'legacy': 0, 'empty': 0}
+
+    def index(self):
+        """Индекс текущего снимка каталога; пересобирается при смене версии"""
+        snapshot = self.catalog.get()
+        index = self._index
+        if index.version != snapshot.version:
+            with self._lock:
+                index = self._index
+                if index.version != snapshot.version:
+                    started = time.monotonic()
+                    index = SearchIndex(snapshot.products, snapshot.version)
+                    self._index = index
+                    logger.info(f"Поисковый индекс v{index.version}: {len(index.products)} товаров "
+                                f"за {time.monotonic() - started:.3f}s")
+        return index
+
+    def search(self, query, limit=10):
+        query = (query or '').strip()
+        if not query:
+            return []
+        local = self.index().search(query, limit)
+        if local and len(query) <= self.short_query_chars:
+            self.stats['local'] += 1
+            return local
+
+        ranked = self.db.search_products_ranked(query, limit)
+        if ranked is not None:
+            snapshot = self.catalog.get()
+            rows = [row for row in (snapshot.product(product_id) for product_id, _ in ranked) if row is not None]
+            if rows:
+                self.stats['rpc'] += 1
+                return rows
+        if local:
+            self.stats['local'] += 1
+            return local
+        if ranked is None:
+            # RPC недоступен — старый поиск по ILIKE
+            rows = self.db.search_products(query, limit) or []
+            if rows:
+                self.stats['legacy'] += 1
+                return rows
+        self.stats['empty'] += 1
+        return []
+
+    def suggest(self, query, limit=3):
+        """Названия похожих товаров по индексу (без обращения к БД)"""
+        return [row[PRODUCT_NAME] for row in self.index().search(query, limit)]
+
+    def get_stats(self):
+        return dict(self.stats, index_version=self._index.version, indexed=len(self._index.products))
@@ -12,7 +12,7 @@ class PromotionManager:
     def create_promo_code(self, code, discount_type, discount_value, min_order_amount=0, max_uses=None, expires_at=None, description=""):
         """Создание промокода"""
         return self.db.execute_query('''
-            INSERT INTO promo_codes (
+            INSERT INTO public.promo_codes (
                 code, discount_type, discount_value, min_order_amount,
                 max_uses, expires_at, description
             ) VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -21,7 +21,7 @@ class PromotionManager:
     def validate_promo_code(self, code, user_id, order_amount):
         """Проверка промокода"""
         promo = self.db.execute_query(
-            'SELECT * FROM promo_codes WHERE code = %s AND is_active = true',
+            'SELECT * FROM public.promo_codes WHERE code = %s AND is_active = true',
             (code.upper(),)
         )
         
@@ -41,7 +41,7 @@ class PromotionManager:
         # Проверка лимита использований
         if promo_data[5]:
             uses_count = self.db.execute_query(
-                'SELECT COUNT(*) FROM promo_uses WHERE promo_code_id = ?',
+                'SELECT COUNT(*) FROM public.promo_uses WHERE promo_code_id = ?',
                 (promo_data[0],)
             )[0][0]
             
@@ -50,7 +50,7 @@ class PromotionManager:
         
         # Проверка использования пользователем
         user_uses = self.db.execute_query(
-            'SELECT COUNT(*) FROM promo_uses WHERE promo_code_id = ? AND user_id = ?',
+            'SELECT COUNT(*) FROM public.promo_uses WHERE promo_code_id = ? AND user_id = ?',
             (promo_data[0], user_id)
         )[0][0]
         
@@ -83,13 +83,13 @@ class PromotionManager:
         """Применение промокода к заказу"""
         # Записываем использование
         self.db.execute_query(
-            'INSERT INTO promo_uses (promo_code_id, user_id, order_id, discount_amount) VALUES (%s, %s, %s, %s)',
+            'INSERT INTO public.promo_uses (promo_code_id, user_id, order_id, discount_amount) VALUES (%s, %s, %s, %s)',
             (promo_id, user_id, order_id, discount_amount)
         )
         
         # Обновляем сумму заказа
         self.db.execute_query(
-            'UPDATE orders SET total_amount = total_amount - %s, promo_discount = %s WHERE id = %s',
+            'UPDATE public.orders SET total_amount = total_amount - %s, promo_discount = %s WHERE id = %s',
             (discount_amount, discount_amount, order_id)
         )
         
@@ -97,7 +97,7 @@ class PromotionManager:
     
     def generate_personal_promo(self, user_id, occasion='birthday'):
         """Генерация персонального промокода"""
-        user = self.db.execute_query('SELECT name FROM users WHERE id = %s', (user_id,))[0]
+        user = self.db.execute_query('SELECT name FROM public.users WHERE id = %s', (user_id,))[0]
         user_name = user[0].replace(' ', '').upper()[:6]
         
         if occasion == 'birthday':
@@ -133,11 +133,11 @@ class PromotionManager:
     def get_active_promotions(self):
         """Получение активных акций"""
         return self.db.execute_query('''
-            SELECT * FROM promo_codes 
+            SELECT * FROM public.promo_codes 
             WHERE is_active = true 
             AND (expires_at IS NULL OR expires_at > NOW())
             AND (max_uses IS NULL OR (
-                SELECT COUNT(*) FROM promo_uses WHERE promo_code_id = promo_codes.id
+                SELECT COUNT(*) FROM public.promo_uses WHERE promo_code_id = promo_codes.id
             ) < max_uses)
             ORDER BY created_at DESC
         ''')
@@ -176,14 +176,14 @@ class PromotionManager:
     def get_user_available_promos(self, user_id):
         """Получение доступных промокодов для пользователя"""
         return self.db.execute_query('''
-            SELECT pc.* FROM promo_codes pc
+            SELECT pc.* FROM public.promo_codes pc
             WHERE pc.is_active = true
             AND (pc.expires_at IS NULL OR pc.expires_at > NOW())
             AND (pc.max_uses IS NULL OR (
-                SELECT COUNT(*) FROM promo_uses pu WHERE pu.promo_code_id = pc.id
+                SELECT COUNT(*) FROM public.promo_uses pu WHERE pu.promo_code_id = pc.id
             ) < pc.max_uses)
             AND pc.id NOT IN (
-                SELECT promo_code_id FROM promo_uses WHERE user_id = %s
+                SELECT promo_code_id FROM public.promo_uses WHERE user_id = %s
             )
             ORDER BY pc.discount_value DESC
         ''', (user_id,))
\ No newline at end of file
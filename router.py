@@ -0,0 +1,178 @@
+"""
+Декларативная маршрутизация сообщений и callback_data.
+
+Маршрут регистрируется по точному тексту (словарь, O(1)), по префиксу
+(префиксное дерево, O(длина текста), побеждает самый длинный префикс) или
+по состоянию диалога. Точное совпадение всегда важнее префикса, поэтому
+порядок регистрации не влияет на результат — в отличие от цепочек
+if/elif, где ранняя ветка молча перекрывала позднюю.
+
+Для каждого маршрута считаются вызовы, ошибки и гистограмма времени
+обработки (get_stats), чтобы было видно, какие экраны медленные.
+"""
+import time
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger('router')
+
+# Верхние границы корзин гистограммы, мс (последняя — всё, что дольше)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Route:
+    """Обработчик и его статистика"""
+
+    __slots__ = ('name', 'handler', 'pass_context', 'count', 'errors', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self, name, handler, pass_context=False):
+        self.name = name
+        self.handler = handler
+        self.pass_context = pass_context
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms, ok):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def snapshot(self):
+        labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 2),
+            'histogram': {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+class PrefixTrie:
+    """Префиксное дерево по символам; match() — маршрут самого длинного префикса"""
+
+    _END = object()
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, prefix, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self._END] = value
+
+    def match(self, text):
+        node = self._root
+        found = node.get(self._END)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(self._END, found)
+        return found
+
+
+class Router:
+    """Таблица маршрутов: точные ключи, префиксы и состояния"""
+
+    def __init__(self, name):
+        self.name = name
+        self._exact = {}
+        self._prefixes = PrefixTrie()
+        self._states = {}
+        self._state_prefixes = PrefixTrie()
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def _route(self, name, handler, pass_context):
+        route = self._routes.get(name)
+        if route is None:
+            route = self._routes[name] = Route(name, handler, pass_context)
+        return route
+
+    @staticmethod
+    def _name(handler, name):
+        name = name or getattr(handler, '__name__', None)
+        if not name or name == '<lambda>':
+            raise ValueError("У маршрута с lambda должно быть имя (name=...)")
+        return name
+
+    def exact(self, keys, handler, name=None, pass_context=False):
+        """Маршрут для точных значений (один ключ или список)"""
+        route = self._route(self._name(handler, name), handler, pass_context)
+        for key in ([keys] if isinstance(keys, str) else keys):
+            if key in self._exact:
+                logger.warning(f"{self.name}: '{key}' уже занят маршрутом {self._exact[key].name}")
+            self._exact[key] = route
+        return route
+
+    def prefix(self, prefixes, handler, name=None, pass_context=False):
+        """Маршрут для значений, начинающихся с префикса"""
+        route = self._route(self._name(handler, name), handler, pass_context)
+        for prefix in ([prefixes] if isinstance(prefixes, str) else prefixes):
+            self._prefixes.add(prefix, route)
+        return route
+
+    def state(self, states, handler, name=None, pass_context=False, prefix=False):
+        """Маршрут для состояния диалога (prefix=True — для семейства состояний)"""
+        route = self._route(self._name(handler, name), handler, pass_context)
+        for state in ([states] if isinstance(states, str) else states):
+            if prefix:
+                self._state_prefixes.add(state, route)
+            else:
+                self._states[state] = route
+        return route
+
+    def resolve(self, key):
+        """Маршрут для текста/callback_data или None"""
+        if key is None:
+            return None
+        route = self._exact.get(key)
+        if route is None:
+            route = self._prefixes.match(key)
+        return route
+
+    def resolve_state(self, state):
+        if not state:
+            return None
+        route = self._states.get(state)
+        if route is None:
+            route = self._state_prefixes.match(state)
+        return route
+
+    def dispatch(self, route, payload, context=None):
+        """Вызвать обработчик маршрута с замером времени; исключения пробрасываются"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            if route.pass_context:
+                result = route.handler(payload, context)
+            else:
+                result = route.handler(payload)
+            ok = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                route.record(elapsed_ms, ok)
+
+    def handle(self, key, payload, context=None):
+        """resolve + dispatch; False, если маршрута нет"""
+        route = self.resolve(key)
+        if route is None:
+            return False
+        self.dispatch(route, payload, context)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            return {name: route.snapshot() for name, route in self._routes.items() if route.count}
@@ -14,12 +14,17 @@ load_dotenv()
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == '__main__':
-    from main import TelegramShopBot
-    from config import BOT_TOKEN
+    from config import BOT_CONFIG, BOT_TOKEN
 
     print("=" * 60)
     print("🤖 Starting Telegram Shop Bot...")
     print("=" * 60)
 
-    bot = TelegramShopBot(BOT_TOKEN)
-    bot.run()
+    if BOT_CONFIG['shards'] > 1:
+        # Процесс приёма + воркеры по chat_id
+        from sharding import run_sharded
+        run_sharded(BOT_TOKEN, BOT_CONFIG['shards'])
+    else:
+        from main import TelegramShopBot
+        bot = TelegramShopBot(BOT_TOKEN)
+        bot.run()
@@ -6,6 +6,8 @@ import logging
 import threading
 import time
 from logger import logger
+from outbound import NOTIFICATION
+from broadcast import AUDIENCES, BroadcastEngine, localize_message
 
 # Простой планировщик без внешних зависимостей
 class SimpleScheduler:
@@ -31,6 +33,10 @@ class SimpleScheduler:
     def clear(self):
         self.jobs.clear()
 
+    def cancel_jobs_for(self, first_arg):
+        """Удаление задач, у которых первый аргумент равен first_arg (id поста)"""
+        self.jobs = [job for job in self.jobs if not job.job_args or str(job.job_args[0]) != str(first_arg)]
+
 class ScheduleJob:
     def __init__(self, scheduler):
         self.scheduler = scheduler
@@ -75,6 +81,9 @@ schedule = SimpleScheduler()
 class ScheduledPostsManager:
     def __init__(self, *args, **kwargs):
         self.scheduler_running = False
+        # ScheduledPostsManager(bot, db)
+        self.bot = kwargs.get('bot', args[0] if args else None)
+        self.db = kwargs.get('db', args[1] if len(args) > 1 else None)
         from os import getenv
         # Конфигурируемый канал: POST_CHANNEL_ID (env) или BOT_CONFIG['post_channel_id']
         try:
@@ -83,7 +92,11 @@ class ScheduledPostsManager:
             BOT_CONFIG = {}
         cfg_channel = getenv('POST_CHANNEL_ID') or BOT_CONFIG.get('post_channel_id')
         self.channel_id = str(cfg_channel or '-1002566537425')  # можно задать @username или -100...
-        self.start_scheduler()
+        # Рассылки пользователям — заданиями с контрольными точками (broadcast.py)
+        self.broadcasts = BroadcastEngine(self.db, self.bot.api, localize_message) if getattr(self.bot, 'api', None) else None
+        # autostart=False — планировщик работает в другом процессе (шард 0)
+        if kwargs.get('autostart', True):
+            self.start_scheduler()
     
     def start_scheduler(self):
         """Запуск планировщика постов"""
@@ -117,36 +130,57 @@ class ScheduledPostsManager:
             scheduled_posts = self.db.execute_query('''
                 SELECT id, title, content, time_morning, time_afternoon, time_evening, 
                        target_audience, is_active
-                FROM scheduled_posts 
+                FROM public.scheduled_posts 
                 WHERE is_active = true
             ''') or []
             
             for post in scheduled_posts:
-                post_id, title, content, morning, afternoon, evening, audience, active = post
-                
-                # Планируем утренний пост
-                if morning:
-                    schedule.every().day.at(morning).do(
-                        self.send_scheduled_post, post_id, 'morning'
-                    )
-                
-                # Планируем дневной пост
-                if afternoon:
-                    schedule.every().day.at(afternoon).do(
-                        self.send_scheduled_post, post_id, 'afternoon'
-                    )
-                
-                # Планируем вечерний пост
-                if evening:
-                    schedule.every().day.at(evening).do(
-                        self.send_scheduled_post, post_id, 'evening'
-                    )
+                self._schedule_post(post)
             
             logger.info(f"Загружено {len(scheduled_posts)} автоматических постов")
             
         except Exception as e:
             logger.error(f"Ошибка загрузки расписания: {e}")
     
+    def _schedule_post(self, post):
+        """Постановка утреннего/дневного/вечернего запуска поста"""
+        post_id, title, content, morning, afternoon, evening, audience, active = post
+        
+        # Планируем утренний пост
+        if morning:
+            schedule.every().day.at(morning).do(
+                self.send_scheduled_post, post_id, 'morning'
+            )
+        
+        # Планируем дневной пост
+        if afternoon:
+            schedule.every().day.at(afternoon).do(
+                self.send_scheduled_post, post_id, 'afternoon'
+            )
+        
+        # Планируем вечерний пост
+        if evening:
+            schedule.every().day.at(evening).do(
+                self.send_scheduled_post, post_id, 'evening'
+            )
+    
+    def reload_post(self, post_id):
+        """Перепланирование одного поста после его изменения в базе"""
+        if not self.scheduler_running:
+            return
+        try:
+            schedule.cancel_jobs_for(post_id)
+            rows = self.db.execute_query('''
+                SELECT id, title, content, time_morning, time_afternoon, time_evening, 
+                       target_audience, is_active
+                FROM public.scheduled_posts 
+                WHERE id = %s AND is_active = true
+            ''', (post_id,)) or []
+            for post in rows:
+                self._schedule_post(post)
+        except Exception as e:
+            logger.error(f"Ошибка перепланирования поста {post_id}: {e}")
+    
     def send_scheduled_post(self, post_id, time_period):
         """Отправка запланированного поста"""
         try:
@@ -154,7 +188,7 @@ class ScheduledPostsManager:
             
             # Получаем данные поста
             post_data = self.db.execute_query(
-                'SELECT title, content, target_audience, image_url FROM scheduled_posts WHERE id = %s',
+                'SELECT title, content, target_audience, image_url FROM public.scheduled_posts WHERE id = %s',
                 (post_id,)
             )
             
@@ -165,15 +199,11 @@ class ScheduledPostsManager:
             title, content, target_audience, image_url = post_data[0]
             logging.info(f"📝 Пост: {title}, Аудитория: {target_audience}")
             
-            # Получаем список получателей
-            recipients = self.get_target_audience(target_audience)
-            
-            if not recipients:
+            # Пользователей не загружаем целиком: задание рассылки читает их пачками
+            if target_audience != 'channel' and (target_audience not in AUDIENCES or self.broadcasts is None):
                 logging.info(f"⚠️ Нет получателей для поста {post_id}")
                 return
             
-            logging.info(f"👥 Получателей: {len(recipients)}")
-            
             # Форматируем сообщение
             message_text = self.format_post_message(title, content, time_period)
             logging.info(f"📄 Сообщение готово: {len(message_text)} символов")
@@ -190,9 +220,11 @@ class ScheduledPostsManager:
                 logging.info(f"📺 Отправка в канал {self.channel_id}")
                 try:
                     if image_url:
-                        result = self.bot.send_photo(self.channel_id, image_url, message_text, keyboard)
+                        result = self.bot.send_photo(self.channel_id, image_url, message_text, keyboard,
+                                                     priority=NOTIFICATION)
                     else:
-                        result = self.bot.send_message(self.channel_id, message_text, keyboard)
+                        result = self.bot.send_message(self.channel_id, message_text, keyboard,
+                                                       priority=NOTIFICATION)
                     
                     if result and result.get('ok'):
                         success_count = 1
@@ -210,27 +242,19 @@ class ScheduledPostsManager:
                     error_count = 1
                     logging.info(f"❌ Ошибка отправки в канал: {e}")
             else:
-                # Отправляем пользователям
-                for recipient in recipients:
-                    try:
-                        telegram_id = recipient[0] if isinstance(recipient, (list, tuple)) else recipient.get('telegram_id')
-                        if image_url:
-                            result = self.bot.send_photo(telegram_id, image_url, message_text, keyboard)
-                        else:
-                            result = self.bot.send_message(telegram_id, message_text, keyboard)
-                        
-                        if result and result.get('ok'):
-                            success_count += 1
-                        else:
-                            error_count += 1
-                    except Exception as e:
-                        error_count += 1
-                        logging.info(f"❌ Ошибка отправки пользователю: {e}")
+                # Рассылка пользователям: пачками с контрольными точками,
+                # итог в post_statistics записывает задание
+                success_count, error_count = self.broadcasts.send(
+                    target_audience, message_text, kind='post', image_url=image_url,
+                    reply_markup=keyboard, post_id=post_id, time_period=time_period
+                )
+                logging.info(f"📊 Пост {post_id} ({time_period}): отправлен {success_count}, ошибок {error_count}")
+                return
             
             # Записываем статистику
             current_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
             self.db.execute_query('''
-                INSERT INTO post_statistics (
+                INSERT INTO public.post_statistics (
                     post_id, time_period, sent_count, error_count, sent_at
                 ) VALUES (%s, %s, %s, %s, %s)
             ''', (
@@ -249,20 +273,20 @@ class ScheduledPostsManager:
             return [(self.channel_id, 'Канал', 'ru')]
         elif audience_type == 'all':
             return self.db.execute_query(
-                'SELECT telegram_id, name, language FROM users WHERE is_admin = false'
+                'SELECT telegram_id, name, language FROM public.users WHERE is_admin = false'
             )
         elif audience_type == 'active':
             return self.db.execute_query('''
                 SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
+                FROM public.users u
+                JOIN public.orders o ON u.id = o.user_id
                 WHERE u.is_admin = false AND o.created_at >= NOW() - INTERVAL '30 days'
             ''')
         elif audience_type == 'vip':
             return self.db.execute_query('''
                 SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
+                FROM public.users u
+                JOIN public.orders o ON u.id = o.user_id
                 WHERE u.is_admin = false
                 GROUP BY u.id
                 HAVING SUM(o.total_amount) >= 500
@@ -270,7 +294,7 @@ class ScheduledPostsManager:
         elif audience_type == 'new':
             return self.db.execute_query('''
                 SELECT telegram_id, name, language
-                FROM users
+                FROM public.users
                 WHERE is_admin = false AND created_at >= NOW() - INTERVAL '7 days'
             ''')
         else:
@@ -329,7 +353,7 @@ class ScheduledPostsManager:
                     p.id, p.name, p.price, p.image_url,
                     AVG(r.rating) as avg_rating,
                     COUNT(r.id) as reviews_count
-                FROM products p
+                FROM public.products p
                 JOIN reviews r ON p.id = r.product_id
                 WHERE p.is_active = true
                 GROUP BY p.id, p.name, p.price, p.image_url
@@ -342,7 +366,7 @@ class ScheduledPostsManager:
                 # Если нет отзывов, отправляем просто популярные товары
                 popular_products = self.db.execute_query('''
                     SELECT id, name, price, image_url, views, sales_count
-                    FROM products
+                    FROM public.products
                     WHERE is_active = true
                     ORDER BY views DESC, sales_count DESC
                     LIMIT 3
@@ -369,7 +393,7 @@ class ScheduledPostsManager:
                 recent_reviews = self.db.execute_query('''
                     SELECT r.rating, r.comment, r.created_at, u.name
                     FROM reviews r
-                    JOIN users u ON r.user_id = u.id
+                    JOIN public.users u ON r.user_id = u.id
                     WHERE r.product_id = ? AND r.comment IS NOT NULL AND r.comment != ''
                     ORDER BY r.created_at DESC
                     LIMIT 3
@@ -428,7 +452,7 @@ class ScheduledPostsManager:
         """Создание нового запланированного поста"""
         current_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
         return self.db.execute_query('''
-            INSERT INTO scheduled_posts (
+            INSERT INTO public.scheduled_posts (
                 title, content, time_morning, time_afternoon, time_evening,
                 target_audience, is_active, created_at
             ) VALUES (%s, %s, %s, %s, %s, %s, true, %s)
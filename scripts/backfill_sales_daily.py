@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Заполнение дневной сводки продаж (sales_daily*, миграция 20251101_09).
+
+Использование:
+    python scripts/backfill_sales_daily.py                     # вся история заказов
+    python scripts/backfill_sales_daily.py --from 2025-01-01   # с даты до сегодня
+    python scripts/backfill_sales_daily.py --from 2025-10-01 --to 2025-10-31
+
+Сводка пересчитывается из orders/order_items отрезками по --chunk-days дней:
+каждый отрезок — отдельная транзакция rebuild_sales_daily(), запись заказов
+блокируется только на его время. Повторный запуск безопасен. Дальше сводку
+поддерживают триггеры.
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from supabase_db import SupabaseManager  # noqa: E402
+
+
+def _date(value):
+    return date.fromisoformat(value)
+
+
+def first_order_date(db):
+    rows = db.execute_query('SELECT MIN(created_at)::date FROM public.orders')
+    value = rows[0][0] if rows else None
+    if value is None:
+        return None
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from', dest='start', type=_date, help='первый день (по умолчанию — первый заказ)')
+    parser.add_argument('--to', dest='end', type=_date, default=date.today(), help='последний день (по умолчанию — сегодня)')
+    parser.add_argument('--chunk-days', type=int, default=31, help='дней в одной транзакции')
+    args = parser.parse_args(argv)
+
+    db = SupabaseManager()
+    start = args.start or first_order_date(db)
+    if start is None:
+        print('Заказов нет — заполнять нечего')
+        return 0
+    if start > args.end:
+        parser.error('--from позже --to')
+
+    chunk = timedelta(days=max(1, args.chunk_days))
+    total_days = 0
+    current = start
+    while current <= args.end:
+        chunk_end = min(args.end, current + chunk - timedelta(days=1))
+        started = time.monotonic()
+        rows = db.execute_query('SELECT public.rebuild_sales_daily(%s, %s)',
+                                (current.isoformat(), chunk_end.isoformat()))
+        if rows is None:
+            print(f'Ошибка пересчёта {current}..{chunk_end}', file=sys.stderr)
+            return 1
+        days = rows[0][0] if rows else 0
+        total_days += days or 0
+        print(f'{current}..{chunk_end}: дней с продажами {days}, {time.monotonic() - started:.1f}s')
+        current = chunk_end + timedelta(days=1)
+
+    print(f'Готово: {start}..{args.end}, дней с продажами {total_days}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
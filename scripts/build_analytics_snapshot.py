@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Сборка колоночного снимка для отчётов (analytics_snapshot.py).
+
+Использование:
+    python scripts/build_analytics_snapshot.py              # инкрементально
+    python scripts/build_analytics_snapshot.py --full       # пересобрать всё
+    python scripts/build_analytics_snapshot.py --dir /var/lib/shop/snapshot
+
+Заказы, позиции и пользователи дочитываются с «водяного знака» прошлой
+сборки минус --rewrite-days дней, товары перечитываются целиком. Запускать
+по расписанию чаще, чем ANALYTICS_SNAPSHOT_MAX_AGE, и раз в сутки с --full.
+Нужен numpy.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from supabase_db import SupabaseManager  # noqa: E402
+from analytics_snapshot import build_snapshot, np  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='перечитать все таблицы целиком')
+    parser.add_argument('--dir', help='каталог снимка (по умолчанию — ANALYTICS_SNAPSHOT_DIR)')
+    parser.add_argument('--rewrite-days', type=int, help='окно перечитывания, дней (по умолчанию — ANALYTICS_SNAPSHOT_REWRITE_DAYS)')
+    parser.add_argument('--batch-size', type=int, help='строк за одно чтение курсора')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print('Нужен numpy: pip install numpy', file=sys.stderr)
+        return 1
+
+    started = time.monotonic()
+    try:
+        manifest = build_snapshot(SupabaseManager(), root=args.dir, full=args.full,
+                                  rewrite_days=args.rewrite_days, batch_size=args.batch_size)
+    except Exception as e:
+        print(f'Ошибка сборки снимка: {e}', file=sys.stderr)
+        return 1
+
+    for name, meta in manifest['tables'].items():
+        print(f"{name}: строк {meta['rows']} (оставлено {meta['kept']}, прочитано {meta['fetched']}), "
+              f"{meta['seconds']:.1f}s")
+    print(f'Готово за {time.monotonic() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
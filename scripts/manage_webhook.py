@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Управление webhook бота.
+
+Использование:
+    python scripts/manage_webhook.py set      # setWebhook на WEBHOOK_URL с WEBHOOK_SECRET
+    python scripts/manage_webhook.py delete   # deleteWebhook — вернуться к polling
+    python scripts/manage_webhook.py info     # getWebhookInfo
+
+После set запускайте бота с BOT_MODE=webhook; после delete — BOT_MODE=polling.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import BOT_CONFIG, BOT_TOKEN  # noqa: E402
+from telegram_api import get_client  # noqa: E402
+
+ALLOWED_UPDATES = ['message', 'edited_message', 'callback_query', 'pre_checkout_query']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['set', 'delete', 'info'])
+    parser.add_argument('--url', default=BOT_CONFIG['webhook_url'], help='публичный HTTPS URL (по умолчанию WEBHOOK_URL)')
+    parser.add_argument('--drop-pending', action='store_true', help='сбросить накопившиеся апдейты')
+    args = parser.parse_args(argv)
+
+    api = get_client(BOT_TOKEN)
+    if args.command == 'set':
+        if not args.url or not BOT_CONFIG['webhook_secret']:
+            parser.error('нужны WEBHOOK_URL (или --url) и WEBHOOK_SECRET')
+        result = api.set_webhook(
+            args.url,
+            secret_token=BOT_CONFIG['webhook_secret'],
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=BOT_CONFIG['webhook_max_connections'],
+            drop_pending_updates=args.drop_pending or None,
+        )
+    elif args.command == 'delete':
+        result = api.delete_webhook(drop_pending_updates=args.drop_pending or None)
+    else:
+        result = api.get_webhook_info()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result and result.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
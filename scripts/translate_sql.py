@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Статический перевод SQL-литералов в исходниках из SQLite-диалекта в Postgres.
+
+Находит строковые литералы, которые передаются в execute_query(...) или
+выглядят как SQL, и переписывает их правилами sql_dialect (те же, что
+применяет рантайм). f-строки и прочий динамический SQL не трогает — они
+попадают в отчёт и остаются на мемоизированный рантайм-перевод.
+
+Использование:
+    python scripts/translate_sql.py                # переписать модули проекта
+    python scripts/translate_sql.py --check        # только отчёт, код выхода 1 если есть что менять
+    python scripts/translate_sql.py crm.py web_admin/app.py
+
+После полного перевода бота можно запускать с SQL_STRICT_POSTGRES=true.
+"""
+import argparse
+import ast
+import json
+import re
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sql_dialect import translate_query, unsupported_constructs  # noqa: E402
+
+SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", "scripts", "patches", "supabase", "supabase_migrations", "sql"}
+SKIP_FILES = {"sql_dialect.py", "check_imports.py", "check_syntax.py", "compile_project.py", "test_bot.py"}
+
+_SQL_HEAD = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_SQL_BODY = re.compile(r"\b(FROM|INTO|SET|VALUES)\b", re.IGNORECASE)
+
+
+def looks_like_sql(text):
+    return bool(_SQL_HEAD.match(text) and _SQL_BODY.search(text))
+
+
+def default_targets(root):
+    """Все .py модули проекта, кроме служебных"""
+    targets = []
+    for path in sorted(root.rglob("*.py")):
+        rel = path.relative_to(root)
+        if any(part in SKIP_DIRS for part in rel.parts[:-1]) or rel.name in SKIP_FILES:
+            continue
+        targets.append(path)
+    return targets
+
+
+class _SqlLiteralCollector(ast.NodeVisitor):
+    """Сбор строковых литералов с SQL и динамических (f-string) запросов"""
+
+    def __init__(self):
+        self.literals = {}
+        self.dynamic = []
+
+    def visit_Call(self, node):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+        if name == "execute_query" and node.args:
+            query = node.args[0]
+            if isinstance(query, ast.Constant) and isinstance(query.value, str):
+                self.literals[id(query)] = query
+            elif isinstance(query, ast.JoinedStr):
+                self.dynamic.append(query)
+        self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str) and looks_like_sql(node.value):
+            self.literals[id(node)] = node
+
+    def visit_JoinedStr(self, node):
+        static = "".join(v.value for v in node.values if isinstance(v, ast.Constant))
+        if looks_like_sql(static) and node not in self.dynamic:
+            self.dynamic.append(node)
+        # Вложенные литералы внутри f-строк не переписываем
+
+
+def _line_offsets(source):
+    offsets = [0]
+    for line in source.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def _char_offset(lines, offsets, lineno, col):
+    # col_offset в ast — в байтах UTF-8
+    line = lines[lineno - 1]
+    return offsets[lineno - 1] + len(line.encode("utf-8")[:col].decode("utf-8", errors="ignore"))
+
+
+def translate_file(path):
+    """Перевод одного файла: (новый исходник, изменения, проблемы)"""
+    source = path.read_text(encoding="utf-8")
+    tree = ast.parse(source, filename=str(path))
+    collector = _SqlLiteralCollector()
+    collector.visit(tree)
+
+    lines = source.splitlines(keepends=True)
+    offsets = _line_offsets(source)
+    edits = []
+    changes = []
+    problems = []
+
+    for node in collector.literals.values():
+        original = node.value
+        translated = translate_query(original)
+        leftovers = unsupported_constructs(translated)
+        if leftovers:
+            problems.append({"line": node.lineno, "reason": "unsupported", "constructs": leftovers})
+        if translated == original:
+            continue
+
+        start = _char_offset(lines, offsets, node.lineno, node.col_offset)
+        end = _char_offset(lines, offsets, node.end_lineno, node.end_col_offset)
+        segment = source[start:end]
+        # Правила применяются к исходному тексту литерала; результат
+        # проверяем обратным разбором, чтобы не сломать экранирование
+        new_segment = translate_query(segment)
+        try:
+            ok = ast.literal_eval(new_segment) == translated
+        except Exception:
+            ok = False
+        if not ok:
+            problems.append({"line": node.lineno, "reason": "literal escaping prevents rewrite"})
+            continue
+        edits.append((start, end, new_segment))
+        changes.append({"line": node.lineno})
+
+    for node in collector.dynamic:
+        static = "".join(v.value for v in node.values if isinstance(v, ast.Constant))
+        problems.append({
+            "line": node.lineno,
+            "reason": "dynamic f-string (runtime translation)",
+            "constructs": unsupported_constructs(translate_query(static)),
+        })
+
+    for start, end, new_segment in sorted(edits, reverse=True):
+        source = source[:start] + new_segment + source[end:]
+    return source, sorted(changes, key=lambda c: c["line"]), sorted(problems, key=lambda p: p["line"])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Translate SQLite SQL literals in sources to canonical Postgres")
+    ap.add_argument("paths", nargs="*", help="files to translate (default: project modules)")
+    ap.add_argument("--check", action="store_true", help="report only, exit 1 if any literal needs rewriting")
+    ap.add_argument("--quiet", "-q", action="store_true", help="print only the summary")
+    args = ap.parse_args(argv)
+
+    targets = [Path(p).resolve() for p in args.paths] if args.paths else default_targets(ROOT)
+    report = {"changed_files": 0, "rewritten_literals": 0, "unconverted": 0, "files": []}
+
+    for path in targets:
+        try:
+            new_source, changes, problems = translate_file(path)
+        except SyntaxError as e:
+            report["files"].append({"file": str(path), "error": f"syntax error: {e}"})
+            continue
+        if not changes and not problems:
+            continue
+        try:
+            rel = str(path.relative_to(ROOT))
+        except ValueError:
+            rel = str(path)
+        entry = {"file": rel, "rewritten": [c["line"] for c in changes], "unconverted": problems}
+        report["files"].append(entry)
+        report["rewritten_literals"] += len(changes)
+        report["unconverted"] += sum(1 for p in problems if p.get("constructs") or p["reason"] != "dynamic f-string (runtime translation)")
+        if changes:
+            report["changed_files"] += 1
+            if not args.check:
+                path.write_text(new_source, encoding="utf-8")
+
+    if args.quiet:
+        report.pop("files")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.check and report["rewritten_literals"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
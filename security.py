@@ -87,7 +87,7 @@ class SecurityManager:
         # Сохраняем в базу
         try:
             self.db.execute_query('''
-                INSERT INTO security_logs (user_id, activity_type, details, severity, created_at)
+                INSERT INTO public.security_logs (user_id, activity_type, details, severity, created_at)
                 VALUES (%s, %s, %s, %s, %s)
             ''', (
                 user_id,
@@ -117,7 +117,7 @@ class SecurityManager:
         
         try:
             self.db.execute_query('''
-                INSERT INTO security_logs (user_id, activity_type, details, severity, created_at)
+                INSERT INTO public.security_logs (user_id, activity_type, details, severity, created_at)
                 VALUES (%s, %s, %s, %s, %s)
             ''', (
                 user_id,
@@ -219,7 +219,7 @@ class ActivityLogger:
         """Логирование действий пользователя"""
         try:
             self.db.execute_query('''
-                INSERT INTO user_activity_logs (user_id, action, search_query, created_at)
+                INSERT INTO public.user_activity_logs (user_id, action, search_query, created_at)
                 VALUES (%s, %s, %s, %s)
             ''', (
                 user_id,
@@ -0,0 +1,230 @@
+"""
+Шардированный запуск бота на нескольких процессах.
+
+Процесс приёма (polling или webhook) не обрабатывает апдейты сам: он
+направляет каждый в один из N процессов-воркеров по crc32(chat_id) % N.
+Все апдейты чата попадают в один процесс, поэтому состояния диалогов
+(user_states, order_data, admin_states) кэшируются в памяти своего шарда
+(state_store.py; при STATE_STORE=sqlite|postgres переживают перезапуск).
+
+Апдейт считается выполненным, когда воркер прислал подтверждение. Если
+процесс воркера упал, он перезапускается, а все неподтверждённые апдейты
+его шарда отправляются новому процессу в исходном порядке (доставка
+«хотя бы один раз»; оформление заказа защищено ключом идемпотентности).
+
+Фоновые задачи (автопосты, рассылки, отчёты) запускает только шард 0.
+"""
+import sys
+import time
+import zlib
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+
+from dispatcher import chat_key, poll_updates
+
+logger = logging.getLogger('sharding')
+
+_STOP = None
+
+
+def shard_for(key, shards):
+    """Номер шарда для ключа чата (стабилен между процессами и перезапусками)"""
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+def _worker_main(token, shard_id, shards, generation, inbox, acks):
+    """Точка входа процесса-воркера"""
+    from main import TelegramShopBot
+
+    # Доля общего лимита отправки для шарда выставляет сам TelegramShopBot
+    bot = TelegramShopBot(token, shard_id=shard_id, shard_count=shards)
+
+    def handle(update):
+        try:
+            bot.process_update(update)
+        finally:
+            acks.put((shard_id, generation, update['update_id']))
+
+    bot.dispatcher.handler = handle
+    bot.dispatcher.start()
+    logger.info(f"Шард {shard_id}/{shards} (поколение {generation}) запущен")
+    try:
+        while bot.running:
+            update = inbox.get()
+            if update is _STOP:
+                break
+            bot.dispatcher.submit(update)
+    finally:
+        bot.shutdown()
+
+
+class _Shard:
+    """Процесс-воркер и его неподтверждённые апдейты (на стороне приёма)"""
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.generation = 0
+        self.process = None
+        self.inbox = None
+        self.inflight = OrderedDict()   # update_id -> update, в порядке отправки
+        self.restarts = 0
+        self.started_at = 0.0
+
+
+class ShardRouter:
+    """Раздача апдейтов процессам-воркерам; тот же интерфейс submit(), что у UpdateDispatcher"""
+
+    def __init__(self, token, shards, max_inflight=1000, restart_delay=1.0):
+        self.token = token
+        self.shards = [_Shard(number) for number in range(max(1, shards))]
+        self.max_inflight = max(1, max_inflight)
+        self.restart_delay = restart_delay
+        self._ctx = multiprocessing.get_context('spawn')
+        self._acks = self._ctx.Queue()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+        self.stats = {'routed': 0, 'acked': 0, 'redelivered': 0, 'restarts': 0, 'backpressure_waits': 0}
+
+    # --- процессы ---
+
+    def _spawn(self, shard):
+        shard.generation += 1
+        shard.inbox = self._ctx.Queue()
+        shard.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.token, shard.shard_id, len(self.shards), shard.generation, shard.inbox, self._acks),
+            name=f'bot-shard-{shard.shard_id}',
+            daemon=False,
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        # Всё, что старый процесс не подтвердил, — новому, в исходном порядке
+        for update in shard.inflight.values():
+            shard.inbox.put(update)
+            self.stats['redelivered'] += 1
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        with self._cond:
+            for shard in self.shards:
+                self._spawn(shard)
+        for target, name in ((self._collect_acks, 'shard-acks'), (self._supervise, 'shard-supervisor')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Запущено шардов: {len(self.shards)}")
+
+    def _collect_acks(self):
+        while self._running:
+            try:
+                shard_id, _generation, update_id = self._acks.get(timeout=1.0)
+            except Exception:
+                continue
+            with self._cond:
+                if self.shards[shard_id].inflight.pop(update_id, None) is not None:
+                    self.stats['acked'] += 1
+                self._cond.notify_all()
+
+    def _supervise(self):
+        while self._running:
+            time.sleep(1.0)
+            with self._cond:
+                for shard in self.shards:
+                    if not self._running or shard.process.is_alive():
+                        continue
+                    # Не перезапускаем чаще restart_delay, если процесс падает сразу
+                    if time.monotonic() - shard.started_at < self.restart_delay:
+                        continue
+                    logger.error(f"Шард {shard.shard_id} завершился (код {shard.process.exitcode}), "
+                                 f"перезапуск; повторно отправляем {len(shard.inflight)} апдейтов")
+                    shard.restarts += 1
+                    self.stats['restarts'] += 1
+                    self._spawn(shard)
+
+    # --- приём ---
+
+    def submit(self, update, timeout=None):
+        """Отправить апдейт шарду его чата; блокируется, если у шарда
+        слишком много неподтверждённых апдейтов"""
+        shard = self.shards[shard_for(chat_key(update), len(self.shards))]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if len(shard.inflight) >= self.max_inflight:
+                self.stats['backpressure_waits'] += 1
+            while len(shard.inflight) >= self.max_inflight:
+                if not self._running:
+                    return False
+                wait = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+                self._cond.wait(wait)
+            if not self._running:
+                return False
+            shard.inflight[update['update_id']] = update
+            shard.inbox.put(update)
+            self.stats['routed'] += 1
+        return True
+
+    def stop(self, timeout=10):
+        """Дождаться подтверждений (не дольше timeout) и остановить воркеры"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(shard.inflight for shard in self.shards) and time.monotonic() < deadline:
+                self._cond.wait(0.5)
+            self._running = False
+            for shard in self.shards:
+                shard.inbox.put(_STOP)
+        for shard in self.shards:
+            shard.process.join(max(0.1, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                shard.process.terminate()
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self.stats, shards=[{
+                'shard': shard.shard_id,
+                'pid': shard.process.pid if shard.process else None,
+                'alive': bool(shard.process and shard.process.is_alive()),
+                'inflight': len(shard.inflight),
+                'restarts': shard.restarts,
+            } for shard in self.shards])
+
+
+def run_sharded(token, shards):
+    """Процесс приёма: polling или webhook (BOT_MODE) поверх ShardRouter"""
+    from config import BOT_CONFIG
+    from telegram_api import get_client
+    from webhook import WebhookServer, webhook_path
+
+    router = ShardRouter(token, shards, BOT_CONFIG['shard_max_inflight'])
+    state = {'running': True}
+    server = None
+
+    def on_signal(signum, frame):
+        logger.info(f"Получен сигнал {signum}, остановка шардов...")
+        state['running'] = False
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    router.start()
+    try:
+        if BOT_CONFIG['mode'] == 'webhook':
+            server = WebhookServer(router, BOT_CONFIG['webhook_secret'],
+                                   path=webhook_path(BOT_CONFIG['webhook_url']),
+                                   host=BOT_CONFIG['webhook_listen_host'],
+                                   port=BOT_CONFIG['webhook_listen_port'])
+            server.serve_forever()
+        else:
+            poll_updates(get_client(token), router, lambda: state['running'])
+    finally:
+        if server is not None:
+            server.shutdown()
+        router.stop(BOT_CONFIG['dispatch_drain_timeout'])
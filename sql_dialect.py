@@ -0,0 +1,136 @@
+"""
+Перевод SQLite-диалекта в канонический Postgres.
+
+Правила компилируются один раз при импорте. Их использует и статический
+переводчик scripts/translate_sql.py (переписывает литералы в исходниках), и
+рантайм SupabaseManager.execute_query — для динамически собранных запросов,
+с мемоизацией по тексту запроса.
+"""
+import re
+from functools import lru_cache
+
+PUBLIC_TABLES = frozenset({
+    "users", "orders", "order_items", "automation_rules", "scheduled_posts", "inventory_rules",
+    "products", "product_images", "favorites", "categories", "subcategories", "promo_codes",
+    "promo_uses", "shipments", "loyalty_points", "notifications", "suppliers", "business_expenses",
+    "automation_executions", "security_logs", "webhook_logs", "stock_reservations",
+    "stocktaking_items", "stocktaking_sessions", "user_activity_logs", "post_activity", "post_statistics",
+})
+
+# strftime-форматы SQLite -> to_char Postgres
+_STRFTIME_FORMATS = {
+    '%Y': 'YYYY', '%m': 'MM', '%d': 'DD', '%H': 'HH24', '%M': 'MI', '%S': 'SS', '%j': 'DDD',
+}
+
+# Форматы без точного аналога в to_char — отдельным выражением (текст, как у SQLite).
+# %w: день недели 0-6 с воскресенья (to_char 'D' — 1-7, на единицу больше).
+# %W: неделя года 00-53, первая неделя начинается с первого понедельника
+# (ISO-неделя 'IW' считается иначе).
+_STRFTIME_EXPRESSIONS = {
+    '%w': "EXTRACT(DOW FROM {0})::int::text",
+    '%W': "lpad(((EXTRACT(DOY FROM {0})::int + 6 - (EXTRACT(DOW FROM {0})::int + 6) % 7) / 7)::text, 2, '0')",
+}
+
+_STRFTIME_TOKEN = re.compile(r"%[a-zA-Z%]")
+
+
+def _to_char_literal(text):
+    """Текст между форматами; буквы в to_char берутся в кавычки, иначе это шаблоны"""
+    return f'"{text}"' if any(char.isalpha() for char in text) else text
+
+
+def _strftime_to_char(match):
+    target = match.group(2).strip()
+    if target.lower() in ("'now'", '"now"'):
+        target = 'NOW()'
+    parts = []
+    fmt = ''
+    position = 0
+    for token in _STRFTIME_TOKEN.finditer(match.group(1)):
+        fmt += _to_char_literal(match.group(1)[position:token.start()])
+        position = token.end()
+        if token.group() in _STRFTIME_EXPRESSIONS:
+            if fmt:
+                parts.append(f"to_char({target}, '{fmt}')")
+                fmt = ''
+            parts.append(_STRFTIME_EXPRESSIONS[token.group()].format(target))
+        else:
+            fmt += _STRFTIME_FORMATS.get(token.group(), token.group())
+    fmt += _to_char_literal(match.group(1)[position:])
+    if fmt or not parts:
+        parts.append(f"to_char({target}, '{fmt}')")
+    return parts[0] if len(parts) == 1 else '(' + ' || '.join(parts) + ')'
+
+
+def _shift(base):
+    return lambda m: f"{base} {m.group(1)} INTERVAL '{m.group(2)} {m.group(3).lower().rstrip('s')}s'"
+
+
+_RULES = (
+    # date('now', '-7 days') -> CURRENT_DATE - INTERVAL '7 days'
+    (re.compile(r"date\('now',\s*'([+-])(\d+)\s+(days?|months?|years?)'\)", re.IGNORECASE), _shift('CURRENT_DATE')),
+    # datetime('now', '-24 hours') -> NOW() - INTERVAL '24 hours'
+    (re.compile(r"datetime\('now',\s*'([+-])(\d+)\s+(minutes?|hours?|days?|months?|years?)'\)", re.IGNORECASE), _shift('NOW()')),
+    (re.compile(r"date\('now'\)", re.IGNORECASE), 'CURRENT_DATE'),
+    (re.compile(r"datetime\('now'\)", re.IGNORECASE), 'NOW()'),
+    # strftime('%Y-%m', created_at) -> to_char(created_at, 'YYYY-MM')
+    (re.compile(r"strftime\(\s*'([^']*)'\s*,\s*([\w.]+|'now')\s*\)", re.IGNORECASE), _strftime_to_char),
+    # DATE(column) -> column::date
+    (re.compile(r"\bDATE\((\w+)\)", re.IGNORECASE), r"\1::date"),
+    (re.compile(r"CURRENT_TIMESTAMP", re.IGNORECASE), "NOW()"),
+    (re.compile(r"\bIFNULL\s*\(", re.IGNORECASE), "COALESCE("),
+    # булевы флаги =1/=0
+    (re.compile(r"\b(is_[a-z_]+|[a-z_]+_flag)\s*=\s*1\b", re.IGNORECASE), r"\1 = TRUE"),
+    (re.compile(r"\b(is_[a-z_]+|[a-z_]+_flag)\s*=\s*0\b", re.IGNORECASE), r"\1 = FALSE"),
+)
+
+_QUALIFY = (
+    re.compile(r"\b(FROM|JOIN)\s+([a-zA-Z_][a-zA-Z0-9_\.]+)", re.IGNORECASE),
+    re.compile(r"\b(UPDATE|INTO|DELETE\s+FROM)\s+([a-zA-Z_][a-zA-Z0-9_\.]+)", re.IGNORECASE),
+)
+
+# Конструкции, которые правилами не переводятся и требуют ручной правки
+UNSUPPORTED = (
+    (re.compile(r"\bPRAGMA\b", re.IGNORECASE), "PRAGMA"),
+    (re.compile(r"\bjulianday\s*\(", re.IGNORECASE), "julianday()"),
+    (re.compile(r"\bstrftime\s*\(", re.IGNORECASE), "strftime()"),
+    (re.compile(r"\bdatetime\s*\(", re.IGNORECASE), "datetime()"),
+    (re.compile(r"\bdate\s*\(\s*'now'", re.IGNORECASE), "date('now', ...)"),
+    (re.compile(r"\bGROUP_CONCAT\s*\(", re.IGNORECASE), "GROUP_CONCAT()"),
+    (re.compile(r"\bINSERT\s+OR\s+(REPLACE|IGNORE)\b", re.IGNORECASE), "INSERT OR REPLACE/IGNORE"),
+    (re.compile(r"\bAUTOINCREMENT\b", re.IGNORECASE), "AUTOINCREMENT"),
+    (re.compile(r"\blast_insert_rowid\s*\(", re.IGNORECASE), "last_insert_rowid()"),
+    (re.compile(r"\bsqlite_master\b", re.IGNORECASE), "sqlite_master"),
+)
+
+
+def convert_sqlite_to_postgres(query):
+    """Применение правил перевода SQLite -> Postgres"""
+    for pattern, repl in _RULES:
+        query = pattern.sub(repl, query)
+    return query
+
+
+def _qualify_repl(match):
+    keyword, table = match.group(1), match.group(2)
+    if "." in table or table.lower() not in PUBLIC_TABLES:
+        return match.group(0)
+    return f"{keyword} public.{table}"
+
+
+def qualify_public_tables(query):
+    """Добавление схемы public. к известным таблицам"""
+    for pattern in _QUALIFY:
+        query = pattern.sub(_qualify_repl, query)
+    return query
+
+
+def unsupported_constructs(query):
+    """Список SQLite-конструкций, оставшихся в запросе после перевода"""
+    return [name for pattern, name in UNSUPPORTED if pattern.search(query)]
+
+
+@lru_cache(maxsize=2048)
+def translate_query(query):
+    """Полный перевод запроса с мемоизацией по его тексту"""
+    return qualify_public_tables(convert_sqlite_to_postgres(query))
@@ -0,0 +1,206 @@
+"""
+Параметры SQL-запросов: единая обработка плейсхолдеров %s, ? и $n.
+
+Запрос разбирается один раз (разбор кэшируется по тексту) с учётом строковых
+литералов, идентификаторов в кавычках, $$-строк и комментариев. Дальше из
+разбора собирается либо текст для серверной привязки psycopg (только %s),
+либо текст с подставленными литералами для RPC exec_sql.
+
+Операторы jsonb ?| и ?& плейсхолдерами не считаются. Одиночный ? — оператор
+jsonb, только если в запросе есть %s или $n (стили не смешиваются), поэтому
+запросы с оператором ? пишутся с %s/$n.
+"""
+import json
+import re
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from functools import lru_cache
+from uuid import UUID
+
+_DOLLAR_TAG = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)?\$")
+_DOLLAR_PARAM = re.compile(r"\$(\d+)")
+
+# Позиционная ссылка для %s и ?
+_SEQUENTIAL = -1
+
+
+@lru_cache(maxsize=1024)
+def parse_placeholders(query):
+    """Разбор запроса: (куски текста, ссылки на параметры).
+
+    Ссылка _SEQUENTIAL — очередной параметр (%s или ?), число n — параметр $n+1.
+    Кусков текста всегда на один больше, чем ссылок. Знаки % внутри текста
+    уже экранированы как %% для psycopg.
+    """
+    chunks = []
+    refs = []
+    qmarks = set()      # номера ссылок, взятых из ?
+    buf = []
+    i = 0
+    n = len(query)
+    while i < n:
+        ch = query[i]
+        nxt = query[i + 1] if i + 1 < n else ''
+
+        # Строки в одинарных кавычках и идентификаторы в двойных
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if query[end] == ch:
+                    if end + 1 < n and query[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            buf.append(query[i:end + 1].replace('%', '%%'))
+            i = end + 1
+            continue
+
+        # Комментарии
+        if ch == '-' and nxt == '-':
+            end = query.find('\n', i)
+            end = n if end == -1 else end
+            buf.append(query[i:end].replace('%', '%%'))
+            i = end
+            continue
+        if ch == '/' and nxt == '*':
+            end = query.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            buf.append(query[i:end].replace('%', '%%'))
+            i = end
+            continue
+
+        if ch == '$':
+            param = _DOLLAR_PARAM.match(query, i)
+            if param:
+                chunks.append(''.join(buf))
+                buf = []
+                refs.append(int(param.group(1)) - 1)
+                i = param.end()
+                continue
+            tag = _DOLLAR_TAG.match(query, i)
+            if tag:
+                end = query.find(tag.group(0), tag.end())
+                end = n if end == -1 else end + len(tag.group(0))
+                buf.append(query[i:end].replace('%', '%%'))
+                i = end
+                continue
+
+        if ch == '%':
+            if nxt == 's':
+                chunks.append(''.join(buf))
+                buf = []
+                refs.append(_SEQUENTIAL)
+                i += 2
+                continue
+            if nxt == '%':
+                buf.append('%%')
+                i += 2
+                continue
+            buf.append('%%')
+            i += 1
+            continue
+
+        if ch == '?':
+            if nxt in ('|', '&'):
+                # Операторы jsonb ?| и ?&
+                buf.append(ch + nxt)
+                i += 2
+                continue
+            chunks.append(''.join(buf))
+            buf = []
+            qmarks.add(len(refs))
+            refs.append(_SEQUENTIAL)
+            i += 1
+            continue
+
+        buf.append(ch)
+        i += 1
+
+    chunks.append(''.join(buf))
+    if qmarks and len(qmarks) < len(refs):
+        # Есть %s или $n — значит ? здесь оператор jsonb, а не параметр
+        merged = [chunks[0]]
+        kept = []
+        for number, ref in enumerate(refs):
+            if number in qmarks:
+                merged[-1] += '?' + chunks[number + 1]
+            else:
+                merged.append(chunks[number + 1])
+                kept.append(ref)
+        chunks, refs = merged, kept
+    return tuple(chunks), tuple(refs)
+
+
+def _ordered_params(refs, params):
+    """Параметры в порядке появления плейсхолдеров в тексте"""
+    params = tuple(params)
+    ordered = []
+    position = 0
+    for ref in refs:
+        if ref == _SEQUENTIAL:
+            index = position
+            position += 1
+        else:
+            index = ref
+        if index < 0 or index >= len(params):
+            raise ValueError(f"Недостаточно параметров для запроса: нужен №{index + 1}, передано {len(params)}")
+        ordered.append(params[index])
+    return ordered
+
+
+def _bind_value(value):
+    """Значение для серверной привязки psycopg"""
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def to_pyformat(query, params):
+    """Запрос и кортеж параметров для cursor.execute() с плейсхолдерами %s.
+
+    Без параметров запрос возвращается как есть, и psycopg не трактует в нём %.
+    """
+    if not params:
+        return query, None
+    chunks, refs = parse_placeholders(query)
+    if not refs:
+        return query, None
+    bound = tuple(_bind_value(v) for v in _ordered_params(refs, params))
+    return '%s'.join(chunks), bound
+
+
+def render_literal(value):
+    """SQL-литерал для значения (для пути через RPC exec_sql)"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        value = value.isoformat()
+    elif isinstance(value, UUID):
+        value = str(value)
+    elif isinstance(value, dict):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, (list, tuple)):
+        return 'ARRAY[' + ', '.join(render_literal(v) for v in value) + ']'
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return "'\\x" + bytes(value).hex() + "'::bytea"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(query, params):
+    """Текст запроса с подставленными литералами вместо плейсхолдеров"""
+    if not params:
+        return query
+    chunks, refs = parse_placeholders(query)
+    if not refs:
+        return query
+    values = _ordered_params(refs, params)
+    parts = [chunks[0].replace('%%', '%')]
+    for value, chunk in zip(values, chunks[1:]):
+        parts.append(render_literal(value))
+        parts.append(chunk.replace('%%', '%'))
+    return ''.join(parts)
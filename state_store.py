@@ -0,0 +1,382 @@
+"""
+Хранилище состояния диалогов (user_states, order_data, admin_states и т.п.).
+
+StateMap ведёт себя как dict по telegram_id, но:
+- запись живёт STATE_TTL секунд с последнего изменения, сверх
+  STATE_MAX_ENTRIES на пространство имён вытесняется по LRU — брошенные
+  регистрации и оформления заказа не копятся в памяти;
+- при STATE_STORE=sqlite|postgres изменения пишутся в файл/таблицу пачками
+  фоновым потоком (write-behind), а промах памяти дочитывается оттуда, так
+  что после деплоя пользователь продолжает с того же шага.
+
+Значения должны сериализоваться в JSON. Вложенный dict после изменения
+нужно присвоить заново (states[key] = data), иначе изменение останется
+только в памяти.
+
+Кэш в памяти у каждого процесса свой: согласованность между шардами
+держится на том, что апдейты одного чата всегда попадают в один шард.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from config import STATE_CONFIG
+
+logger = logging.getLogger('state_store')
+
+_MISSING = object()  # в памяти: записи нет и в хранилище (отрицательный кэш)
+_NOT_DIRTY = object()
+_RAISE = object()
+
+# Как часто удалять просроченные записи из хранилища, секунд
+PURGE_INTERVAL = 600
+
+
+class SqliteStateBackend:
+    """Файл SQLite; подходит для одного сервера"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_state ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))'
+            )
+
+    def load(self, namespace, key):
+        """JSON-текст записи; None — записи нет, False — ошибка"""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT value FROM conversation_state WHERE namespace = ? AND key = ? AND expires_at > ?',
+                    (namespace, key, time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Чтение состояния {namespace}/{key}: {e}")
+            return False
+        return row[0] if row else None
+
+    def write(self, upserts, deletes):
+        """upserts: [(namespace, key, value_json, expires_at)], deletes: {namespace: [key]}"""
+        try:
+            with self._lock, self._conn:
+                if upserts:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO conversation_state (namespace, key, value, expires_at) '
+                        'VALUES (?, ?, ?, ?)', upserts
+                    )
+                for namespace, keys in deletes.items():
+                    self._conn.executemany(
+                        'DELETE FROM conversation_state WHERE namespace = ? AND key = ?',
+                        [(namespace, key) for key in keys]
+                    )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Запись состояния: {e}")
+            return False
+
+    def purge_expired(self):
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Очистка состояния: {e}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresStateBackend:
+    """Таблица public.conversation_state (миграция 20251101_08) через SupabaseManager"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def load(self, namespace, key):
+        return self.db.state_load(namespace, key)
+
+    def write(self, upserts, deletes):
+        ok = self.db.state_upsert([
+            (namespace, key, value, datetime.fromtimestamp(expires_at, timezone.utc))
+            for namespace, key, value, expires_at in upserts
+        ])
+        for namespace, keys in deletes.items():
+            ok = self.db.state_delete(namespace, keys) and ok
+        return ok
+
+    def purge_expired(self):
+        self.db.state_purge_expired()
+
+    def close(self):
+        pass
+
+
+class StateMap:
+    """dict-подобное пространство имён: TTL + LRU в памяти, промахи — из хранилища"""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self._entries = OrderedDict()  # key -> (expires_at, value | _MISSING)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'expirations': 0}
+
+    def _remember(self, key, value, now):
+        """Запись в память под self._lock; попутно выбрасывает просроченные и лишние"""
+        self._entries[key] = (now + self.store.ttl, value)
+        self._entries.move_to_end(key)
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[oldest_key]
+            self.stats['expirations'] += 1
+        while len(self._entries) > self.store.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+        if self.store.backend is None:
+            return _MISSING
+
+        # Ещё не записанное изменение важнее того, что лежит в хранилище
+        raw = self.store._pending(self.name, key)
+        if raw is _NOT_DIRTY:
+            raw = self.store.backend.load(self.name, str(key))
+            if raw is False:
+                return _MISSING  # хранилище недоступно — не кэшируем отсутствие
+            self.stats['loads'] += 1
+        value = _MISSING if raw is None else json.loads(raw)
+        with self._lock:
+            self._remember(key, value, now)
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        # Сериализуем сразу: ошибка должна всплыть у вызывающего, а не в фоне
+        raw = json.dumps(value, ensure_ascii=False) if self.store.backend is not None else None
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if raw is not None:
+            self.store._mark(self.name, key, raw, now + self.store.ttl)
+
+    def __delitem__(self, key):
+        if self._lookup(key) is _MISSING:
+            raise KeyError(key)
+        self._forget(key)
+
+    def _forget(self, key):
+        with self._lock:
+            if self.store.backend is None:
+                self._entries.pop(key, None)
+            else:
+                self._remember(key, _MISSING, time.time())
+        if self.store.backend is not None:
+            self.store._mark(self.name, key, None, 0)
+
+    def pop(self, key, default=_RAISE):
+        value = self._lookup(key)
+        if value is _MISSING:
+            if default is _RAISE:
+                raise KeyError(key)
+            return default
+        self._forget(key)
+        return value
+
+    def setdefault(self, key, default=None):
+        value = self._lookup(key)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def merge(self, key, **fields):
+        """Обновить поля dict-значения и записать его заново"""
+        value = dict(self.get(key) or {})
+        value.update(fields)
+        self[key] = value
+        return value
+
+    def __len__(self):
+        """Число живых записей в памяти"""
+        now = time.time()
+        with self._lock:
+            return sum(1 for expires_at, value in self._entries.values()
+                       if value is not _MISSING and expires_at > now)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
+
+
+class StateStore:
+    """Набор StateMap с общим хранилищем и потоком отложенной записи"""
+
+    def __init__(self, backend=None, ttl=86400, max_entries=10000, flush_interval=1.0, flush_batch=500):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self._maps = {}
+        self._dirty = {}  # (namespace, key) -> (value_json | None, expires_at)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._last_purge = time.monotonic()
+        self.stats = {'flushed': 0, 'flush_errors': 0}
+        self._thread = None
+        if backend is not None:
+            self._thread = threading.Thread(target=self._flush_loop, name='state-flush', daemon=True)
+            self._thread.start()
+
+    def namespace(self, name):
+        with self._lock:
+            state_map = self._maps.get(name)
+            if state_map is None:
+                state_map = self._maps[name] = StateMap(self, name)
+            return state_map
+
+    def _mark(self, namespace, key, raw, expires_at):
+        with self._lock:
+            self._dirty[(namespace, key)] = (raw, expires_at)
+            backlog = len(self._dirty)
+        if backlog >= self.flush_batch:
+            self._wake.set()
+
+    def _pending(self, namespace, key):
+        with self._lock:
+            entry = self._dirty.get((namespace, key))
+        return _NOT_DIRTY if entry is None else entry[0]
+
+    def flush(self):
+        """Записать накопленные изменения; неудачная пачка вернётся в очередь"""
+        if self.backend is None:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        items = list(dirty.items())
+        for start in range(0, len(items), self.flush_batch):
+            batch = items[start:start + self.flush_batch]
+            upserts, deletes = [], {}
+            for (namespace, key), (raw, expires_at) in batch:
+                if raw is None:
+                    deletes.setdefault(namespace, []).append(str(key))
+                else:
+                    upserts.append((namespace, str(key), raw, expires_at))
+            if self.backend.write(upserts, deletes):
+                self.stats['flushed'] += len(batch)
+                continue
+            self.stats['flush_errors'] += 1
+            with self._lock:
+                for dirty_key, entry in items[start:]:
+                    # Более свежее изменение, сделанное за время записи, не затираем
+                    self._dirty.setdefault(dirty_key, entry)
+            break
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    self.backend.purge_expired()
+            except Exception as e:
+                logger.error(f"Фоновая запись состояния: {e}")
+
+    def close(self):
+        """Остановить поток и дописать изменения"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self.backend is not None:
+            self.backend.close()
+
+    def get_stats(self):
+        with self._lock:
+            maps = list(self._maps.values())
+            pending = len(self._dirty)
+        return dict(self.stats, backend=type(self.backend).__name__ if self.backend else 'memory',
+                    pending=pending, namespaces={m.name: m.get_stats() for m in maps})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_backend(db=None):
+    """Хранилище по STATE_STORE (memory | sqlite | postgres); None — только память"""
+    backend = STATE_CONFIG['backend']
+    if backend == 'sqlite':
+        path = STATE_CONFIG['sqlite_path']
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        return SqliteStateBackend(path)
+    if backend == 'postgres':
+        if db is None or not hasattr(db, 'state_load'):
+            logger.warning("STATE_STORE=postgres, но база недоступна — состояние только в памяти")
+            return None
+        return PostgresStateBackend(db)
+    if backend != 'memory':
+        logger.warning(f"Неизвестный STATE_STORE={backend!r} — состояние только в памяти")
+    return None
+
+
+def get_state_store(db=None):
+    """Общее хранилище процесса"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore(create_backend(db), ttl=STATE_CONFIG['ttl'],
+                                max_entries=STATE_CONFIG['max_entries'],
+                                flush_interval=STATE_CONFIG['flush_interval'],
+                                flush_batch=STATE_CONFIG['flush_batch'])
+        return _store
+
+
+def close_state_store():
+    """Дописать изменения при остановке процесса"""
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
@@ -0,0 +1,51 @@
+-- 20251101_01_cache_invalidation_notify.sql
+-- Инвалидация кэшей бота: триггеры шлют pg_notify('cache_invalidation', {"table","op","id"})
+-- при любом изменении каталога, автопостов и правил автоматизации.
+-- Бот слушает канал (invalidation_bus.PgNotifyBus) и перечитывает только изменённую строку.
+
+CREATE OR REPLACE FUNCTION public.notify_cache_invalidation()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  _id text;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    _id := OLD.id::text;
+  ELSE
+    _id := NEW.id::text;
+  END IF;
+
+  PERFORM pg_notify(
+    'cache_invalidation',
+    json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'id', _id)::text
+  );
+
+  -- Смена id (редкость) — сообщаем и про старый
+  IF TG_OP = 'UPDATE' AND OLD.id IS DISTINCT FROM NEW.id THEN
+    PERFORM pg_notify(
+      'cache_invalidation',
+      json_build_object('table', TG_TABLE_NAME, 'op', 'DELETE', 'id', OLD.id::text)::text
+    );
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+  _name text;
+BEGIN
+  FOREACH _name IN ARRAY ARRAY['products','categories','subcategories','scheduled_posts','automation_rules']
+  LOOP
+    IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = _name) THEN
+      EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I;', _name || '_cache_invalidation', _name);
+      EXECUTE format(
+        'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON public.%I '
+        'FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation();',
+        _name || '_cache_invalidation', _name
+      );
+    END IF;
+  END LOOP;
+END $$;
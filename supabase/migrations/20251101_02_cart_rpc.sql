@@ -0,0 +1,183 @@
+-- 20251101_02_cart_rpc.sql
+-- Атомарные операции с корзиной за один вызов RPC.
+-- Каждая функция проверяет остаток, меняет корзину одной командой
+-- (без гонки между «прочитать строку» и «обновить/вставить») и возвращает
+-- свежую корзину с итогами:
+--   {"ok": bool, "error": text|null, "cart_item_id": uuid|null, "quantity": int|null,
+--    "cart": {"items": [...], "total_amount": numeric, "total_quantity": int}}
+
+-- Одна строка корзины на пару (пользователь, товар): сливаем дубли и
+-- добавляем уникальный индекс для ON CONFLICT
+WITH dups AS (
+  SELECT user_id, product_id, MIN(created_at) AS first_created, SUM(quantity) AS total_qty
+  FROM public.cart
+  GROUP BY user_id, product_id
+  HAVING COUNT(*) > 1
+),
+keep AS (
+  SELECT DISTINCT ON (c.user_id, c.product_id) c.id, d.total_qty
+  FROM public.cart c
+  JOIN dups d ON d.user_id = c.user_id AND d.product_id = c.product_id
+  ORDER BY c.user_id, c.product_id, c.created_at, c.id
+),
+merged AS (
+  UPDATE public.cart c SET quantity = k.total_qty
+  FROM keep k WHERE c.id = k.id
+  RETURNING c.id, c.user_id, c.product_id
+)
+DELETE FROM public.cart c
+USING merged m
+WHERE c.user_id = m.user_id AND c.product_id = m.product_id AND c.id <> m.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS cart_user_product_uidx ON public.cart (user_id, product_id);
+
+-- Корзина пользователя с итогами
+CREATE OR REPLACE FUNCTION public.cart_get(p_user_id uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  SELECT jsonb_build_object(
+    'items', COALESCE(jsonb_agg(jsonb_build_object(
+        'cart_item_id', c.id,
+        'product_id', p.id,
+        'name', p.name,
+        'price', p.price,
+        'quantity', c.quantity,
+        'image_url', p.image_url,
+        'stock', p.stock,
+        'line_total', p.price * c.quantity
+      ) ORDER BY c.created_at DESC, c.id), '[]'::jsonb),
+    'total_amount', COALESCE(SUM(p.price * c.quantity), 0),
+    'total_quantity', COALESCE(SUM(c.quantity), 0)
+  )
+  FROM public.cart c
+  JOIN public.products p ON p.id = c.product_id
+  WHERE c.user_id = p_user_id;
+$$;
+
+CREATE OR REPLACE FUNCTION public._cart_result(p_user_id uuid, p_ok boolean, p_error text,
+                                               p_cart_item_id uuid, p_quantity int)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  SELECT jsonb_build_object(
+    'ok', p_ok,
+    'error', p_error,
+    'cart_item_id', p_cart_item_id,
+    'quantity', p_quantity,
+    'cart', public.cart_get(p_user_id)
+  );
+$$;
+
+-- Добавление товара: новая строка или увеличение количества, если хватает остатка
+CREATE OR REPLACE FUNCTION public.cart_add_item(p_user_id uuid, p_product_id uuid, p_quantity int DEFAULT 1)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  _stock int;
+  _id uuid;
+  _qty int;
+BEGIN
+  IF p_quantity IS NULL OR p_quantity <= 0 THEN
+    RETURN public._cart_result(p_user_id, false, 'invalid_quantity', NULL, NULL);
+  END IF;
+
+  SELECT stock INTO _stock
+  FROM public.products
+  WHERE id = p_product_id AND is_active = true;
+  IF NOT FOUND THEN
+    RETURN public._cart_result(p_user_id, false, 'product_unavailable', NULL, NULL);
+  END IF;
+  IF p_quantity > COALESCE(_stock, 0) THEN
+    RETURN public._cart_result(p_user_id, false, 'out_of_stock', NULL, NULL);
+  END IF;
+
+  INSERT INTO public.cart (user_id, product_id, quantity)
+  VALUES (p_user_id, p_product_id, p_quantity)
+  ON CONFLICT (user_id, product_id) DO UPDATE
+    SET quantity = public.cart.quantity + EXCLUDED.quantity
+    WHERE public.cart.quantity + EXCLUDED.quantity <= _stock
+  RETURNING id, quantity INTO _id, _qty;
+
+  IF _id IS NULL THEN
+    RETURN public._cart_result(p_user_id, false, 'out_of_stock', NULL, NULL);
+  END IF;
+  RETURN public._cart_result(p_user_id, true, NULL, _id, _qty);
+END;
+$$;
+
+-- Установка количества (p_relative = true — изменение на p_quantity).
+-- Абсолютное количество <= 0 удаляет строку; относительное ниже 1 — ошибка min_quantity.
+CREATE OR REPLACE FUNCTION public.cart_set_quantity(p_user_id uuid, p_cart_item_id uuid, p_quantity int,
+                                                    p_relative boolean DEFAULT false)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  _current int;
+  _stock int;
+  _target int;
+BEGIN
+  SELECT c.quantity, p.stock INTO _current, _stock
+  FROM public.cart c
+  JOIN public.products p ON p.id = c.product_id
+  WHERE c.id = p_cart_item_id AND c.user_id = p_user_id
+  FOR UPDATE OF c;
+  IF NOT FOUND THEN
+    RETURN public._cart_result(p_user_id, false, 'not_found', p_cart_item_id, NULL);
+  END IF;
+
+  _target := CASE WHEN p_relative THEN _current + p_quantity ELSE p_quantity END;
+
+  IF _target <= 0 THEN
+    IF p_relative THEN
+      RETURN public._cart_result(p_user_id, false, 'min_quantity', p_cart_item_id, _current);
+    END IF;
+    DELETE FROM public.cart WHERE id = p_cart_item_id AND user_id = p_user_id;
+    RETURN public._cart_result(p_user_id, true, NULL, p_cart_item_id, 0);
+  END IF;
+
+  IF _target > COALESCE(_stock, 0) THEN
+    RETURN public._cart_result(p_user_id, false, 'out_of_stock', p_cart_item_id, _current);
+  END IF;
+
+  UPDATE public.cart SET quantity = _target WHERE id = p_cart_item_id;
+  RETURN public._cart_result(p_user_id, true, NULL, p_cart_item_id, _target);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.cart_remove_item(p_user_id uuid, p_cart_item_id uuid)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  DELETE FROM public.cart WHERE id = p_cart_item_id AND user_id = p_user_id;
+  RETURN public._cart_result(p_user_id, FOUND, CASE WHEN FOUND THEN NULL ELSE 'not_found' END,
+                             p_cart_item_id, 0);
+END;
+$$;
+
+-- Функции принимают user_id, поэтому доступны только service_role
+REVOKE ALL ON FUNCTION public.cart_get(uuid) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public._cart_result(uuid, boolean, text, uuid, int) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.cart_add_item(uuid, uuid, int) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.cart_set_quantity(uuid, uuid, int, boolean) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.cart_remove_item(uuid, uuid) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.cart_get(uuid) TO service_role;
+GRANT EXECUTE ON FUNCTION public._cart_result(uuid, boolean, text, uuid, int) TO service_role;
+GRANT EXECUTE ON FUNCTION public.cart_add_item(uuid, uuid, int) TO service_role;
+GRANT EXECUTE ON FUNCTION public.cart_set_quantity(uuid, uuid, int, boolean) TO service_role;
+GRANT EXECUTE ON FUNCTION public.cart_remove_item(uuid, uuid) TO service_role;
@@ -0,0 +1,128 @@
+-- 20251101_03_place_order_rpc.sql
+-- Оформление заказа одной транзакцией: корзина -> резерв остатка -> заказ и
+-- позиции -> баллы лояльности -> очистка корзины.
+-- Ключ идемпотентности (из Telegram-апдейта) гарантирует, что повтор того же
+-- запроса вернёт уже созданный заказ, а не создаст второй.
+
+ALTER TABLE public.orders ADD COLUMN IF NOT EXISTS idempotency_key text;
+ALTER TABLE public.orders ADD COLUMN IF NOT EXISTS loyalty_points_earned integer DEFAULT 0;
+CREATE UNIQUE INDEX IF NOT EXISTS orders_idempotency_key_uidx
+  ON public.orders (idempotency_key) WHERE idempotency_key IS NOT NULL;
+
+-- Результат:
+--   {"ok": bool, "error": text|null, "replayed": bool, "order_id": uuid|null,
+--    "total_amount": numeric, "points_earned": int, "items_count": int,
+--    "shortages": [{"product_id", "name", "requested", "available"}]}
+CREATE OR REPLACE FUNCTION public.place_order(
+  p_user_id uuid,
+  p_idempotency_key text,
+  p_delivery_address text,
+  p_payment_method text,
+  p_latitude numeric DEFAULT NULL,
+  p_longitude numeric DEFAULT NULL,
+  p_points_rate numeric DEFAULT 0.05
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  _existing public.orders%ROWTYPE;
+  _order_id uuid;
+  _total numeric;
+  _items int;
+  _points int;
+  _shortages jsonb;
+BEGIN
+  -- Два одновременных вызова с одним ключом выполняются по очереди
+  IF p_idempotency_key IS NOT NULL THEN
+    PERFORM pg_advisory_xact_lock(hashtext('place_order:' || p_idempotency_key));
+    SELECT * INTO _existing FROM public.orders WHERE idempotency_key = p_idempotency_key;
+    IF FOUND THEN
+      RETURN jsonb_build_object(
+        'ok', true, 'error', NULL, 'replayed', true,
+        'order_id', _existing.id,
+        'total_amount', _existing.total_amount,
+        'points_earned', COALESCE(_existing.loyalty_points_earned, 0),
+        'items_count', (SELECT COUNT(*) FROM public.order_items WHERE order_id = _existing.id),
+        'shortages', '[]'::jsonb
+      );
+    END IF;
+  END IF;
+
+  -- Блокируем строки корзины и товары (в порядке id, чтобы параллельные
+  -- заказы не взаимоблокировались) до конца транзакции
+  PERFORM 1 FROM public.cart WHERE user_id = p_user_id ORDER BY id FOR UPDATE;
+  PERFORM 1 FROM public.products
+  WHERE id IN (SELECT product_id FROM public.cart WHERE user_id = p_user_id)
+  ORDER BY id
+  FOR UPDATE;
+
+  DROP TABLE IF EXISTS _checkout;
+  CREATE TEMP TABLE _checkout ON COMMIT DROP AS
+  SELECT c.product_id, c.quantity, p.name, p.price, p.stock, p.is_active
+  FROM public.cart c
+  JOIN public.products p ON p.id = c.product_id
+  WHERE c.user_id = p_user_id;
+
+  SELECT COUNT(*), COALESCE(SUM(price * quantity), 0) INTO _items, _total FROM _checkout;
+  IF _items = 0 THEN
+    RETURN jsonb_build_object('ok', false, 'error', 'empty_cart', 'replayed', false,
+                              'order_id', NULL, 'total_amount', 0, 'points_earned', 0,
+                              'items_count', 0, 'shortages', '[]'::jsonb);
+  END IF;
+
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+           'product_id', product_id, 'name', name,
+           'requested', quantity, 'available', CASE WHEN is_active THEN COALESCE(stock, 0) ELSE 0 END
+         )), '[]'::jsonb)
+  INTO _shortages
+  FROM _checkout
+  WHERE NOT is_active OR quantity > COALESCE(stock, 0);
+  IF jsonb_array_length(_shortages) > 0 THEN
+    RETURN jsonb_build_object('ok', false, 'error', 'out_of_stock', 'replayed', false,
+                              'order_id', NULL, 'total_amount', _total, 'points_earned', 0,
+                              'items_count', _items, 'shortages', _shortages);
+  END IF;
+
+  _points := floor(_total * COALESCE(p_points_rate, 0))::int;
+
+  INSERT INTO public.orders (user_id, total_amount, delivery_address, payment_method,
+                             latitude, longitude, idempotency_key, loyalty_points_earned)
+  VALUES (p_user_id, _total, p_delivery_address, p_payment_method,
+          p_latitude, p_longitude, p_idempotency_key, _points)
+  RETURNING id INTO _order_id;
+
+  INSERT INTO public.order_items (order_id, product_id, quantity, price)
+  SELECT _order_id, product_id, quantity, price FROM _checkout;
+
+  -- Резерв: списываем остаток под уже взятой блокировкой строк
+  UPDATE public.products p
+  SET stock = p.stock - c.quantity,
+      sales_count = COALESCE(p.sales_count, 0) + c.quantity
+  FROM _checkout c
+  WHERE p.id = c.product_id;
+
+  IF _points > 0 THEN
+    INSERT INTO public.loyalty_points (user_id, current_points, total_earned)
+    VALUES (p_user_id, _points, _points)
+    ON CONFLICT (user_id) DO UPDATE
+      SET current_points = public.loyalty_points.current_points + EXCLUDED.current_points,
+          total_earned = public.loyalty_points.total_earned + EXCLUDED.total_earned,
+          updated_at = now();
+  END IF;
+
+  DELETE FROM public.cart
+  WHERE user_id = p_user_id AND product_id IN (SELECT product_id FROM _checkout);
+
+  RETURN jsonb_build_object(
+    'ok', true, 'error', NULL, 'replayed', false,
+    'order_id', _order_id, 'total_amount', _total, 'points_earned', _points,
+    'items_count', _items, 'shortages', '[]'::jsonb
+  );
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.place_order(uuid, text, text, text, numeric, numeric, numeric) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.place_order(uuid, text, text, text, numeric, numeric, numeric) TO service_role;
@@ -0,0 +1,16 @@
+-- 20251101_04_keyset_pagination_indexes.sql
+-- Индексы под keyset-пагинацию (pagination.py): страница читается условием
+-- (ключ) > (курсор) ORDER BY ключ LIMIT n, и каждая страница — один проход
+-- по индексу независимо от глубины.
+
+-- Товары подкатегории в боте: ORDER BY name, id
+CREATE INDEX IF NOT EXISTS products_subcategory_name_id_idx
+  ON public.products (subcategory_id, name, id) WHERE is_active = true;
+
+-- История заказов пользователя: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS orders_user_created_id_idx
+  ON public.orders (user_id, created_at DESC, id DESC);
+
+-- Список заказов в веб-админке
+CREATE INDEX IF NOT EXISTS orders_created_id_idx
+  ON public.orders (created_at DESC, id DESC);
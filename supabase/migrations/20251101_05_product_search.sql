@@ -0,0 +1,56 @@
+-- 20251101_05_product_search.sql
+-- Ранжированный поиск товаров вместо ILIKE по name/description.
+-- search_vector: русская морфология ('russian') плюс 'simple' для узбекского
+-- и латиницы — готового стеммера для узбекского в Postgres нет, окончания
+-- добирает триграммная похожесть по названию (pg_trgm).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS search_vector tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian'::regconfig, coalesce(name, '') || ' ' || coalesce(brand, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(brand, '')), 'A') ||
+    setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'B') ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS products_search_vector_idx
+  ON public.products USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS products_name_trgm_idx
+  ON public.products USING gin (lower(name) gin_trgm_ops);
+
+-- Префиксный tsquery: каждое слово запроса как 'слово':*, через &
+CREATE OR REPLACE FUNCTION public._search_prefix_query(p_config regconfig, p_query text)
+RETURNS tsquery
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT to_tsquery(p_config, string_agg(quote_literal(word) || ':*', ' & '))
+  FROM regexp_split_to_table(lower(regexp_replace(p_query, '[‘’ʻʼ''`]', '', 'g')), '[^[:alnum:]]+') AS word
+  WHERE word <> '';
+$$;
+
+-- [{product_id, rank}] по убыванию релевантности
+CREATE OR REPLACE FUNCTION public.search_products_ranked(p_query text, p_limit int DEFAULT 10)
+RETURNS TABLE (product_id uuid, rank real)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH q AS (
+    SELECT coalesce(public._search_prefix_query('russian', p_query), ''::tsquery) ||
+           coalesce(public._search_prefix_query('simple', p_query), ''::tsquery) AS ts,
+           lower(p_query) AS raw
+  )
+  SELECT p.id,
+         (ts_rank_cd(p.search_vector, q.ts) + similarity(lower(p.name), q.raw))::real AS rank
+  FROM public.products p, q
+  WHERE p.is_active = true
+    AND (p.search_vector @@ q.ts OR lower(p.name) % q.raw)
+  ORDER BY rank DESC, p.sales_count DESC NULLS LAST, p.id
+  LIMIT GREATEST(1, LEAST(coalesce(p_limit, 10), 100));
+$$;
+
+REVOKE ALL ON FUNCTION public.search_products_ranked(text, int) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.search_products_ranked(text, int) TO authenticated, service_role;
@@ -0,0 +1,31 @@
+-- 20251101_06_push_outbox.sql
+-- Outbox push-уведомлений (notifications.py). Каждое поставленное в очередь
+-- уведомление сохраняется здесь до доставки; после рестарта бот загружает
+-- невыполненные строки своего шарда обратно в очередь с задержкой.
+-- Доставленные строки удаляются, исчерпавшие попытки остаются со status = 'failed'.
+
+CREATE TABLE IF NOT EXISTS public.push_outbox (
+  id            bigserial PRIMARY KEY,
+  user_id       uuid NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+  title         text NOT NULL,
+  message       text NOT NULL,
+  type          text NOT NULL DEFAULT 'info',
+  scheduled_at  timestamptz NOT NULL DEFAULT now(),
+  attempts      integer NOT NULL DEFAULT 0,
+  max_attempts  integer NOT NULL DEFAULT 3,
+  status        text NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'failed')),
+  owner_shard   integer NOT NULL DEFAULT 0,
+  last_error    text,
+  created_at    timestamptz NOT NULL DEFAULT now(),
+  updated_at    timestamptz NOT NULL DEFAULT now()
+);
+
+-- Восстановление при старте: pending строки шарда по id
+CREATE INDEX IF NOT EXISTS push_outbox_pending_idx
+  ON public.push_outbox (owner_shard, id) WHERE status = 'pending';
+
+-- Доступ только у сервисной роли (бот)
+ALTER TABLE public.push_outbox ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.push_outbox FROM PUBLIC, anon, authenticated;
+GRANT ALL ON public.push_outbox TO service_role;
+GRANT USAGE, SELECT ON SEQUENCE public.push_outbox_id_seq TO service_role;
@@ -0,0 +1,41 @@
+-- 20251101_07_broadcast_jobs.sql
+-- Задания массовых рассылок (broadcast.py). Получатели читаются пачками по
+-- users.id; после каждой пачки в строку задания пишется последний id и
+-- счётчики. Упавшее задание (аренда lease_until истекла) подхватывает любой
+-- процесс и продолжает с last_user_id.
+
+CREATE TABLE IF NOT EXISTS public.broadcast_jobs (
+  id            uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  kind          text NOT NULL DEFAULT 'broadcast',
+  audience      text NOT NULL,
+  message       text NOT NULL,
+  image_url     text,
+  reply_markup  jsonb,
+  post_id       uuid REFERENCES public.scheduled_posts(id) ON DELETE SET NULL,
+  time_period   text,
+  status        text NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'running', 'done', 'cancelled')),
+  last_user_id  uuid,
+  total_count   integer NOT NULL DEFAULT 0,
+  sent_count    integer NOT NULL DEFAULT 0,
+  error_count   integer NOT NULL DEFAULT 0,
+  lease_owner   text,
+  lease_until   timestamptz,
+  created_at    timestamptz NOT NULL DEFAULT now(),
+  started_at    timestamptz,
+  updated_at    timestamptz NOT NULL DEFAULT now(),
+  finished_at   timestamptz
+);
+
+-- Поиск незавершённых заданий для продолжения
+CREATE INDEX IF NOT EXISTS broadcast_jobs_unfinished_idx
+  ON public.broadcast_jobs (created_at) WHERE status IN ('pending', 'running');
+
+-- Получатели пачками: WHERE ... AND id > last_user_id ORDER BY id
+CREATE INDEX IF NOT EXISTS users_broadcast_id_idx
+  ON public.users (id) WHERE is_admin = false AND telegram_id IS NOT NULL;
+
+-- Доступ только у сервисной роли (бот и веб-админка)
+ALTER TABLE public.broadcast_jobs ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.broadcast_jobs FROM PUBLIC, anon, authenticated;
+GRANT ALL ON public.broadcast_jobs TO service_role;
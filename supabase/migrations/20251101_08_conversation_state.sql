@@ -0,0 +1,23 @@
+-- 20251101_08_conversation_state.sql
+-- Состояние диалогов бота (state_store.py, STATE_STORE=postgres): шаг
+-- регистрации/оформления заказа и введённые данные по telegram_id. Бот
+-- пишет изменения пачками (write-behind) и читает строку при промахе кэша,
+-- поэтому после деплоя пользователь продолжает с того же шага.
+
+CREATE TABLE IF NOT EXISTS public.conversation_state (
+  namespace   text NOT NULL,
+  key         text NOT NULL,
+  value       jsonb NOT NULL,
+  expires_at  timestamptz NOT NULL,
+  updated_at  timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (namespace, key)
+);
+
+-- Удаление просроченных диалогов
+CREATE INDEX IF NOT EXISTS conversation_state_expires_idx
+  ON public.conversation_state (expires_at);
+
+-- Доступ только у сервисной роли (бот)
+ALTER TABLE public.conversation_state ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.conversation_state FROM PUBLIC, anon, authenticated;
+GRANT ALL ON public.conversation_state TO service_role;
@@ -0,0 +1,217 @@
+-- 20251101_09_sales_daily_rollup.sql
+-- Дневная сводка продаж для дашборда, графиков и отчётов (analytics.py).
+-- Учитываются заказы со статусом != 'cancelled', день — created_at::date.
+--   sales_daily           — заказы, выручка и число клиентов за день;
+--   sales_daily_customers — заказы и выручка клиента за день (уникальные
+--                           клиенты за любой период считаются по ней);
+--   sales_daily_products  — количество и выручка товара за день.
+-- Триггеры на orders и order_items поддерживают таблицы при создании заказа,
+-- смене статуса/суммы и изменении позиций. Историю заполняет
+-- scripts/backfill_sales_daily.py через rebuild_sales_daily().
+
+CREATE TABLE IF NOT EXISTS public.sales_daily (
+  day              date PRIMARY KEY,
+  orders_count     integer NOT NULL DEFAULT 0,
+  revenue          numeric(14,2) NOT NULL DEFAULT 0,
+  customers_count  integer NOT NULL DEFAULT 0,
+  updated_at       timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.sales_daily_customers (
+  day           date NOT NULL,
+  user_id       uuid NOT NULL,
+  orders_count  integer NOT NULL DEFAULT 0,
+  revenue       numeric(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS public.sales_daily_products (
+  day         date NOT NULL,
+  product_id  uuid NOT NULL,
+  quantity    integer NOT NULL DEFAULT 0,
+  revenue     numeric(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, product_id)
+);
+
+-- Топ товаров/клиентов за период
+CREATE INDEX IF NOT EXISTS sales_daily_products_product_idx ON public.sales_daily_products (product_id, day);
+CREATE INDEX IF NOT EXISTS sales_daily_customers_user_idx ON public.sales_daily_customers (user_id, day);
+
+-- Вклад позиции заказа в сводку товаров (p_sign = 1 или -1)
+CREATE OR REPLACE FUNCTION public.sales_daily_apply_item(p_day date, p_product_id uuid, p_quantity integer,
+                                                         p_price numeric, p_sign integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_product_id IS NULL THEN
+    RETURN;
+  END IF;
+  INSERT INTO public.sales_daily_products AS s (day, product_id, quantity, revenue)
+  VALUES (p_day, p_product_id, p_sign * COALESCE(p_quantity, 0),
+          p_sign * COALESCE(p_quantity, 0) * COALESCE(p_price, 0))
+  ON CONFLICT (day, product_id) DO UPDATE
+    SET quantity = s.quantity + EXCLUDED.quantity, revenue = s.revenue + EXCLUDED.revenue;
+  DELETE FROM public.sales_daily_products
+  WHERE day = p_day AND product_id = p_product_id AND quantity <= 0;
+END;
+$$;
+
+-- Вклад заказа целиком: день, клиент и все его позиции
+CREATE OR REPLACE FUNCTION public.sales_daily_apply_order(p_order public.orders, p_sign integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  _day date := p_order.created_at::date;
+  _amount numeric := p_sign * COALESCE(p_order.total_amount, 0);
+  _customer_orders integer;
+  _customers_delta integer := 0;
+BEGIN
+  IF p_order.user_id IS NOT NULL THEN
+    INSERT INTO public.sales_daily_customers AS c (day, user_id, orders_count, revenue)
+    VALUES (_day, p_order.user_id, p_sign, _amount)
+    ON CONFLICT (day, user_id) DO UPDATE
+      SET orders_count = c.orders_count + EXCLUDED.orders_count, revenue = c.revenue + EXCLUDED.revenue
+    RETURNING orders_count INTO _customer_orders;
+    IF p_sign > 0 AND _customer_orders = 1 THEN
+      _customers_delta := 1;
+    ELSIF p_sign < 0 AND _customer_orders <= 0 THEN
+      _customers_delta := -1;
+      DELETE FROM public.sales_daily_customers WHERE day = _day AND user_id = p_order.user_id;
+    END IF;
+  END IF;
+
+  INSERT INTO public.sales_daily AS d (day, orders_count, revenue, customers_count, updated_at)
+  VALUES (_day, p_sign, _amount, _customers_delta, now())
+  ON CONFLICT (day) DO UPDATE
+    SET orders_count = d.orders_count + EXCLUDED.orders_count,
+        revenue = d.revenue + EXCLUDED.revenue,
+        customers_count = d.customers_count + EXCLUDED.customers_count,
+        updated_at = now();
+
+  PERFORM public.sales_daily_apply_item(_day, oi.product_id, oi.quantity, oi.price, p_sign)
+  FROM public.order_items oi
+  WHERE oi.order_id = p_order.id;
+END;
+$$;
+
+-- Триггеры пишут сводку от имени владельца: заказ может создать и роль без доступа к ней
+CREATE OR REPLACE FUNCTION public.sales_daily_orders_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  -- pending -> confirmed и т.п.: заказ как учитывался, так и учитывается
+  IF TG_OP = 'UPDATE'
+     AND (OLD.status IS DISTINCT FROM 'cancelled') = (NEW.status IS DISTINCT FROM 'cancelled')
+     AND OLD.total_amount IS NOT DISTINCT FROM NEW.total_amount
+     AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id
+     AND OLD.created_at::date IS NOT DISTINCT FROM NEW.created_at::date THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IS DISTINCT FROM 'cancelled' THEN
+    PERFORM public.sales_daily_apply_order(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IS DISTINCT FROM 'cancelled' THEN
+    PERFORM public.sales_daily_apply_order(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.sales_daily_items_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  _order public.orders%ROWTYPE;
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    SELECT * INTO _order FROM public.orders WHERE id = OLD.order_id;
+    IF FOUND AND _order.status IS DISTINCT FROM 'cancelled' THEN
+      PERFORM public.sales_daily_apply_item(_order.created_at::date, OLD.product_id, OLD.quantity, OLD.price, -1);
+    END IF;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    SELECT * INTO _order FROM public.orders WHERE id = NEW.order_id;
+    IF FOUND AND _order.status IS DISTINCT FROM 'cancelled' THEN
+      PERFORM public.sales_daily_apply_item(_order.created_at::date, NEW.product_id, NEW.quantity, NEW.price, 1);
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+-- Только изменения, влияющие на сводку
+DROP TRIGGER IF EXISTS orders_sales_daily ON public.orders;
+CREATE TRIGGER orders_sales_daily
+  AFTER INSERT OR DELETE OR UPDATE OF status, total_amount, user_id, created_at ON public.orders
+  FOR EACH ROW EXECUTE FUNCTION public.sales_daily_orders_trigger();
+
+DROP TRIGGER IF EXISTS order_items_sales_daily ON public.order_items;
+CREATE TRIGGER order_items_sales_daily
+  AFTER INSERT OR DELETE OR UPDATE OF order_id, product_id, quantity, price ON public.order_items
+  FOR EACH ROW EXECUTE FUNCTION public.sales_daily_items_trigger();
+
+-- Пересчёт сводки за [p_from, p_to] из orders/order_items. На время пересчёта
+-- запись заказов блокируется, поэтому backfill идёт короткими диапазонами.
+-- Возвращает число дней с продажами.
+CREATE OR REPLACE FUNCTION public.rebuild_sales_daily(p_from date, p_to date)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  _days integer;
+BEGIN
+  LOCK TABLE public.orders, public.order_items IN SHARE MODE;
+
+  DELETE FROM public.sales_daily WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM public.sales_daily_customers WHERE day BETWEEN p_from AND p_to;
+  DELETE FROM public.sales_daily_products WHERE day BETWEEN p_from AND p_to;
+
+  -- Диапазон по created_at, чтобы работал индекс idx_orders_created_at
+  INSERT INTO public.sales_daily_customers (day, user_id, orders_count, revenue)
+  SELECT o.created_at::date, o.user_id, COUNT(*), COALESCE(SUM(o.total_amount), 0)
+  FROM public.orders o
+  WHERE o.created_at >= p_from AND o.created_at < p_to + 1
+    AND o.status IS DISTINCT FROM 'cancelled' AND o.user_id IS NOT NULL
+  GROUP BY 1, 2;
+
+  INSERT INTO public.sales_daily (day, orders_count, revenue, customers_count, updated_at)
+  SELECT o.created_at::date, COUNT(*), COALESCE(SUM(o.total_amount), 0), COUNT(DISTINCT o.user_id), now()
+  FROM public.orders o
+  WHERE o.created_at >= p_from AND o.created_at < p_to + 1
+    AND o.status IS DISTINCT FROM 'cancelled'
+  GROUP BY 1;
+  GET DIAGNOSTICS _days = ROW_COUNT;
+
+  INSERT INTO public.sales_daily_products (day, product_id, quantity, revenue)
+  SELECT o.created_at::date, oi.product_id, SUM(COALESCE(oi.quantity, 0)),
+         SUM(COALESCE(oi.quantity, 0) * COALESCE(oi.price, 0))
+  FROM public.orders o
+  JOIN public.order_items oi ON oi.order_id = o.id
+  WHERE o.created_at >= p_from AND o.created_at < p_to + 1
+    AND o.status IS DISTINCT FROM 'cancelled' AND oi.product_id IS NOT NULL
+  GROUP BY 1, 2
+  HAVING SUM(COALESCE(oi.quantity, 0)) > 0;
+
+  RETURN _days;
+END;
+$$;
+
+-- Сводка — служебные данные: читает и пишет только сервисная роль
+ALTER TABLE public.sales_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sales_daily_customers ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sales_daily_products ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON public.sales_daily, public.sales_daily_customers, public.sales_daily_products
+  FROM PUBLIC, anon, authenticated;
+GRANT ALL ON public.sales_daily, public.sales_daily_customers, public.sales_daily_products TO service_role;
+REVOKE ALL ON FUNCTION public.rebuild_sales_daily(date, date) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.rebuild_sales_daily(date, date) TO service_role;
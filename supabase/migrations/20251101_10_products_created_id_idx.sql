@@ -0,0 +1,6 @@
+-- 20251101_10_products_created_id_idx.sql
+-- Список товаров в веб-админке: keyset по (created_at, id), новые первыми
+-- (см. 20251101_04_keyset_pagination_indexes.sql).
+
+CREATE INDEX IF NOT EXISTS products_created_id_idx
+  ON public.products (created_at DESC, id DESC);
@@ -0,0 +1,23 @@
+-- 20251101_11_products_invalidation_columns.sql
+-- Инвалидация товаров только по колонкам, которые видит каталог бота
+-- (см. 20251101_01_cache_invalidation_notify.sql).
+-- Списание остатка и sales_count в place_order, счётчик views и updated_at
+-- меняются на каждом заказе/просмотре и не должны пересобирать снимок.
+-- Остаток на карточке обновится плановой пересборкой (CATALOG_REFRESH_INTERVAL);
+-- уведомление приходит только когда товар закончился или снова появился.
+
+DROP TRIGGER IF EXISTS products_cache_invalidation ON public.products;
+DROP TRIGGER IF EXISTS products_cache_invalidation_stock ON public.products;
+
+CREATE TRIGGER products_cache_invalidation
+  AFTER INSERT OR DELETE OR UPDATE OF
+    id, name, description, price, original_price, category_id, subcategory_id,
+    brand, image_url, is_active
+  ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.notify_cache_invalidation();
+
+CREATE TRIGGER products_cache_invalidation_stock
+  AFTER UPDATE OF stock ON public.products
+  FOR EACH ROW
+  WHEN ((COALESCE(OLD.stock, 0) > 0) IS DISTINCT FROM (COALESCE(NEW.stock, 0) > 0))
+  EXECUTE FUNCTION public.notify_cache_invalidation();
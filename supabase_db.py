@@ -44,6 +44,11 @@ except Exception:
 import logging
 from supabase import create_client, Client
 from typing import Optional, List, Dict, Any
+from pg_pool import PgConnectionPool, PoolUnavailable
+from sql_params import to_pyformat, inline_params
+from sql_dialect import convert_sqlite_to_postgres, qualify_public_tables, translate_query
+from user_cache import UserIdentityCache
+from pagination import AFTER, Page, make_page, split_cursor, as_timestamp
 
 class SupabaseManager:
     def __init__(self):
@@ -72,9 +77,33 @@ class SupabaseManager:
         supabase_url_norm = assert_valid_supabase_url(normalize_supabase_url(supabase_url))
         self.admin_client: Client = create_client(supabase_url_norm, supabase_service_key)
 
+        # Строгий режим: запросы уже в каноническом Postgres, без перевода
+        self.sql_strict = os.getenv('SQL_STRICT_POSTGRES', 'false').lower() == 'true'
+
+        # Бэкенд для execute_query: auto (пул с откатом на RPC), pool или rpc
+        self.sql_backend = os.getenv('SQL_BACKEND', 'auto').strip().lower()
+        self.pg_pool = None
+        if self.sql_backend in ('auto', 'pool'):
+            try:
+                self.pg_pool = PgConnectionPool.from_env()
+            except Exception as e:
+                logging.warning(f"Postgres pool disabled: {e}")
+            if self.pg_pool:
+                self.pg_pool.warm_up()
+                logging.info("Postgres connection pool initialized")
+
+        # RPC, которых нет в базе (миграция не применена)
+        self._missing_rpcs = set()
+
+        # Кэш пользователей: в рамках апдейта и LRU с TTL между апдейтами
+        self.user_cache = UserIdentityCache.from_env()
+
         logging.info("Supabase clients initialized")
 
     def get_user_by_telegram_id(self, telegram_id: int) -> Optional[List]:
+        cached = self.user_cache.get(telegram_id)
+        if cached is not None:
+            return list(cached)
         try:
             # Use admin_client to bypass RLS for user lookup
             response = self.admin_client.table('users').select('*').eq('telegram_id', telegram_id).execute()
@@ -82,7 +111,7 @@ class SupabaseManager:
                 # Convert dict to tuple for backward compatibility
                 # Expected format: (id, telegram_id, name, phone, email, language, is_admin, created_at, is_registered)
                 user = response.data[0]
-                return [(
+                row = (
                     user.get('id'),
                     user.get('telegram_id'),
                     user.get('name'),
@@ -92,7 +121,9 @@ class SupabaseManager:
                     user.get('is_admin', False),
                     user.get('created_at'),
                     user.get('is_registered', False)
-                )]
+                )
+                self.user_cache.put(telegram_id, (row,), user_id=row[0])
+                return [row]
             return None
         except Exception as e:
             logging.error(f"Error getting user by telegram_id: {e}")
@@ -132,6 +163,7 @@ class SupabaseManager:
                 'p_telegram_id': telegram_id,
                 'p_phone': phone
             }).execute()
+            self.user_cache.invalidate(telegram_id=telegram_id)
             return True
         except Exception as e:
             logging.error(f"Error marking user as registered: {e}")
@@ -182,33 +214,36 @@ class SupabaseManager:
             logging.error(f"Error getting products by category: {e}")
             return None
 
-    def get_products_by_subcategory(self, subcategory_id: str, limit: int = 10, offset: int = 0) -> Optional[List]:
-        try:
-            response = self.admin_client.table('products').select('*').eq(
-                'subcategory_id', subcategory_id
-            ).eq('is_active', True).order('name').range(offset, offset + limit - 1).execute()
+    def get_products_by_subcategory(self, subcategory_id: str, limit: int = 10, cursor: str = None) -> Optional[List]:
+        page = self.get_products_page(subcategory_id, limit, cursor)
+        return page.items if page is not None else None
 
-            if response.data:
-                # Convert to tuple format for backward compatibility
-                # Expected: (id, name, description, price, image_url, category_id, subcategory_id, stock, is_active)
-                result = []
-                for product in response.data:
-                    result.append((
-                        product.get('id'),
-                        product.get('name'),
-                        product.get('description'),
-                        float(product.get('price', 0)),
-                        product.get('image_url'),
-                        product.get('category_id'),
-                        product.get('subcategory_id'),
-                        product.get('stock', 0),
-                        product.get('is_active', True)
-                    ))
-                return result
-            return None
-        except Exception as e:
-            logging.error(f"Error getting products by subcategory: {e}")
+    def get_products_page(self, subcategory_id: str, limit: int = 10, cursor: str = None) -> Optional[Page]:
+        """Страница активных товаров подкатегории по ключу (name, id).
+
+        Строки в формате get_product_by_id:
+        (id, name, description, price, image_url, category_id, subcategory_id, stock, is_active)
+        """
+        direction, key = split_cursor(cursor)
+        query = (
+            'SELECT id, name, description, price, image_url, category_id, subcategory_id, stock, is_active '
+            'FROM public.products WHERE subcategory_id = %s AND is_active = true'
+        )
+        params = [subcategory_id]
+        if key is not None and len(key) == 2:
+            query += ' AND (name, id) > (%s, %s)' if direction == AFTER else ' AND (name, id) < (%s, %s)'
+            params.extend(key)
+        else:
+            key = None
+        order = 'ASC' if direction == AFTER else 'DESC'
+        query += f' ORDER BY name {order}, id {order} LIMIT %s'
+        params.append(limit + 1)
+        rows = self.execute_query(query, tuple(params))
+        if rows is None:
+            logging.error("Error getting products by subcategory")
             return None
+        rows = [(r[0], r[1], r[2], float(r[3] or 0), r[4], r[5], r[6], r[7] or 0, r[8]) for r in rows]
+        return make_page(rows, limit, direction, key, lambda r: (r[1], r[0]))
 
     def get_product_by_id(self, product_id: str) -> Optional[tuple]:
         try:
@@ -234,10 +269,100 @@ class SupabaseManager:
             logging.error(f"Error getting product by id: {e}")
             return None
 
+    def _optional_rpc(self, name: str, params: Dict) -> Optional[Dict]:
+        """Вызов RPC из миграций supabase/migrations; None если функции нет
+        в базе или вызов не удался.
+
+        По старому пути вызывающий код идёт, только если функции нет
+        (rpc_available(name) == False). Другая ошибка (например, таймаут)
+        могла прийти уже после коммита — повтор изменения по старому пути
+        применил бы его дважды."""
+        if name in self._missing_rpcs:
+            return None
+        try:
+            response = self.admin_client.rpc(name, params).execute()
+            return response.data
+        except Exception as e:
+            error_str = str(e)
+            if 'PGRST202' in error_str or 'Could not find the function' in error_str:
+                # Миграция не применена — дальше работаем по-старому
+                self._missing_rpcs.add(name)
+                logging.warning(f"RPC {name} not found, using legacy path")
+            else:
+                logging.error(f"Error calling {name}: {e}")
+            return None
+
+    def rpc_available(self, name: str) -> bool:
+        """False, если функция name не найдена в базе"""
+        return name not in self._missing_rpcs
+
+    # === Корзина: атомарные RPC (supabase/migrations/20251101_02_cart_rpc.sql) ===
+
+    @staticmethod
+    def cart_items_as_tuples(cart: Dict) -> List:
+        """Позиции корзины в формате get_cart_items:
+        (cart_id, product_name, price, quantity, product_id, image_url)"""
+        return [(
+            item.get('cart_item_id'),
+            item.get('name'),
+            float(item.get('price') or 0),
+            item.get('quantity'),
+            item.get('product_id'),
+            item.get('image_url')
+        ) for item in (cart or {}).get('items') or []]
+
+    def cart_add(self, user_id: str, product_id: str, quantity: int = 1) -> Optional[Dict]:
+        """Добавление с проверкой остатка; {'ok', 'error', 'cart_item_id', 'quantity', 'cart'}"""
+        return self._optional_rpc('cart_add_item', {
+            'p_user_id': user_id,
+            'p_product_id': product_id,
+            'p_quantity': quantity
+        })
+
+    def cart_set_quantity(self, user_id: str, cart_item_id: str, quantity: int,
+                          relative: bool = False) -> Optional[Dict]:
+        """Новое количество (relative=True — изменение на quantity); 0 удаляет позицию"""
+        return self._optional_rpc('cart_set_quantity', {
+            'p_user_id': user_id,
+            'p_cart_item_id': cart_item_id,
+            'p_quantity': quantity,
+            'p_relative': relative
+        })
+
+    def cart_remove(self, user_id: str, cart_item_id: str) -> Optional[Dict]:
+        return self._optional_rpc('cart_remove_item', {
+            'p_user_id': user_id,
+            'p_cart_item_id': cart_item_id
+        })
+
+    def get_cart_with_totals(self, user_id: str) -> Optional[Dict]:
+        """{'items': [...], 'total_amount', 'total_quantity'} одним запросом"""
+        cart = self._optional_rpc('cart_get', {'p_user_id': user_id})
+        if cart is not None:
+            return cart
+        items = self._get_cart_items_legacy(user_id) or []
+        return {
+            'items': [{
+                'cart_item_id': item[0], 'name': item[1], 'price': item[2], 'quantity': item[3],
+                'product_id': item[4], 'image_url': item[5], 'line_total': item[2] * item[3]
+            } for item in items],
+            'total_amount': sum(item[2] * item[3] for item in items),
+            'total_quantity': sum(item[3] for item in items)
+        }
+
     def add_to_cart(self, user_id: str, product_id: str, quantity: int = 1) -> Optional[str]:
+        result = self.cart_add(user_id, product_id, quantity)
+        if result is not None:
+            return result.get('cart_item_id') if result.get('ok') else None
+        if self.rpc_available('cart_add_item'):
+            return None
+        return self._add_to_cart_legacy(user_id, product_id, quantity)
+
+    def _add_to_cart_legacy(self, user_id: str, product_id: str, quantity: int = 1) -> Optional[str]:
         try:
             product = self.get_product_by_id(product_id)
-            if not product or product['stock'] < quantity:
+            # (id, name, description, price, image_url, category_id, subcategory_id, stock, is_active)
+            if not product or (product[7] or 0) < quantity:
                 return None
 
             existing_response = self.admin_client.table('cart').select('id, quantity').eq(
@@ -246,7 +371,7 @@ class SupabaseManager:
 
             if existing_response.data:
                 new_quantity = existing_response.data['quantity'] + quantity
-                if new_quantity > product['stock']:
+                if new_quantity > (product[7] or 0):
                     return None
 
                 self.admin_client.table('cart').update({
@@ -265,6 +390,12 @@ class SupabaseManager:
             return None
 
     def get_cart_items(self, user_id: str) -> Optional[List]:
+        cart = self._optional_rpc('cart_get', {'p_user_id': user_id})
+        if cart is not None:
+            return self.cart_items_as_tuples(cart) or None
+        return self._get_cart_items_legacy(user_id)
+
+    def _get_cart_items_legacy(self, user_id: str) -> Optional[List]:
         try:
             response = self.admin_client.table('cart').select(
                 'id, quantity, products(id, name, price, image_url)'
@@ -298,6 +429,25 @@ class SupabaseManager:
             logging.error(f"Error clearing cart: {e}")
             return False
 
+    def place_order(self, user_id: str, idempotency_key: str, delivery_address: str,
+                    payment_method: str, latitude: Optional[float] = None,
+                    longitude: Optional[float] = None, points_rate: float = 0.05) -> Optional[Dict]:
+        """Оформление заказа из корзины одной транзакцией (RPC place_order).
+
+        Резервирует остаток, создаёт заказ с позициями, начисляет баллы и
+        очищает корзину. Повтор с тем же idempotency_key возвращает уже
+        созданный заказ с replayed=True. None — RPC недоступен.
+        """
+        return self._optional_rpc('place_order', {
+            'p_user_id': user_id,
+            'p_idempotency_key': idempotency_key,
+            'p_delivery_address': delivery_address,
+            'p_payment_method': payment_method,
+            'p_latitude': latitude,
+            'p_longitude': longitude,
+            'p_points_rate': points_rate
+        })
+
     def create_order(self, user_id: str, total_amount: float, delivery_address: str,
                      payment_method: str, latitude: Optional[float] = None,
                      longitude: Optional[float] = None) -> Optional[str]:
@@ -335,33 +485,39 @@ class SupabaseManager:
             logging.error(f"Error adding order items: {e}")
             return False
 
-    def get_user_orders(self, user_id: str) -> Optional[List]:
-        try:
-            response = self.admin_client.table('orders').select('*').eq(
-                'user_id', user_id
-            ).order('created_at', desc=True).execute()
+    def get_user_orders(self, user_id: str, limit: int = 10, cursor: str = None) -> Optional[List]:
+        page = self.get_user_orders_page(user_id, limit, cursor)
+        return page.items if page is not None else None
 
-            if response.data:
-                # Convert to tuple format for backward compatibility
-                # Expected: (id, user_id, total_amount, status, delivery_address, payment_method, payment_status, created_at, updated_at)
-                result = []
-                for order in response.data:
-                    result.append((
-                        order.get('id'),
-                        order.get('user_id'),
-                        float(order.get('total_amount', 0)),
-                        order.get('status'),
-                        order.get('delivery_address'),
-                        order.get('payment_method'),
-                        order.get('payment_status'),
-                        order.get('created_at'),
-                        order.get('updated_at')
-                    ))
-                return result
-            return None
-        except Exception as e:
-            logging.error(f"Error getting user orders: {e}")
+    def get_user_orders_page(self, user_id: str, limit: int = 10, cursor: str = None) -> Optional[Page]:
+        """Страница заказов пользователя, новые первыми, по ключу (created_at, id).
+
+        Строки: (id, user_id, total_amount, status, delivery_address, payment_method,
+        payment_status, created_at, updated_at)
+        """
+        direction, key = split_cursor(cursor)
+        # В orders нет updated_at; колонка сохраняет прежнюю форму строки
+        query = (
+            'SELECT id, user_id, total_amount, status, delivery_address, payment_method, '
+            'payment_status, created_at, NULL::timestamptz AS updated_at '
+            'FROM public.orders WHERE user_id = %s'
+        )
+        params = [user_id]
+        if key is not None and len(key) == 2:
+            # Порядок убывающий: «вперёд» — к более старым заказам
+            query += ' AND (created_at, id) < (%s, %s)' if direction == AFTER else ' AND (created_at, id) > (%s, %s)'
+            params.extend(key)
+        else:
+            key = None
+        order = 'DESC' if direction == AFTER else 'ASC'
+        query += f' ORDER BY created_at {order}, id {order} LIMIT %s'
+        params.append(limit + 1)
+        rows = self.execute_query(query, tuple(params))
+        if rows is None:
+            logging.error("Error getting user orders")
             return None
+        rows = [(r[0], r[1], float(r[2] or 0)) + tuple(r[3:9]) for r in rows]
+        return make_page(rows, limit, direction, key, lambda r: (as_timestamp(r[7]), r[0]))
 
     def get_order_details(self, order_id: str) -> Optional[Dict]:
         try:
@@ -389,15 +545,38 @@ class SupabaseManager:
             logging.error(f"Error updating order status: {e}")
             return False
 
-    def search_products(self, query: str, limit: int = 10) -> Optional[List]:
-        try:
-            response = self.admin_client.table('products').select('*').or_(
-                f'name.ilike.%{query}%,description.ilike.%{query}%'
-            ).eq('is_active', True).order('name').limit(limit).execute()
-            return response.data
-        except Exception as e:
-            logging.error(f"Error searching products: {e}")
+    def search_products_ranked(self, query: str, limit: int = 10) -> Optional[List]:
+        """[(product_id, rank)] из RPC search_products_ranked
+        (supabase/migrations/20251101_05_product_search.sql); None — RPC недоступен"""
+        data = self._optional_rpc('search_products_ranked', {'p_query': query, 'p_limit': limit})
+        if data is None:
             return None
+        return [(row.get('product_id'), float(row.get('rank') or 0)) for row in data]
+
+    def search_products(self, query: str, limit: int = 10) -> Optional[List]:
+        """Активные товары по запросу, полные строки products в порядке релевантности"""
+        ranked = self.search_products_ranked(query, limit)
+        if ranked is not None:
+            if not ranked:
+                return []
+            ids = [product_id for product_id, _ in ranked]
+            rows = self.execute_query(
+                'SELECT * FROM public.products WHERE id = ANY(%s::uuid[])', (ids,)
+            )
+            if rows is not None:
+                by_id = {str(row[0]): row for row in rows}
+                return [by_id[str(product_id)] for product_id in ids if str(product_id) in by_id]
+
+        # Без миграции — подстрока по названию и описанию, без ранжирования
+        pattern = f"%{query}%"
+        rows = self.execute_query(
+            'SELECT * FROM public.products WHERE is_active = true '
+            'AND (name ILIKE %s OR description ILIKE %s) ORDER BY name LIMIT %s',
+            (pattern, pattern, limit)
+        )
+        if rows is None:
+            logging.error("Error searching products")
+        return rows
 
     def add_review(self, user_id: str, product_id: str, rating: int, comment: str) -> Optional[str]:
         try:
@@ -532,6 +711,104 @@ class SupabaseManager:
             logging.error(f"Error marking notification read: {e}")
             return False
 
+    # --- outbox push-уведомлений (миграция 20251101_06) ---
+
+    def outbox_add(self, user_id: str, title: str, message: str, notification_type: str,
+                   scheduled_at, max_attempts: int = 3, owner_shard: int = 0) -> Optional[int]:
+        """Сохранить уведомление до доставки; id строки или None"""
+        rows = self.execute_query(
+            'INSERT INTO public.push_outbox (user_id, title, message, type, scheduled_at, max_attempts, owner_shard) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id',
+            (user_id, title, message, notification_type, scheduled_at, max_attempts, owner_shard)
+        )
+        # INSERT ... RETURNING приходит списком dict (и из пула, и из exec_sql)
+        return rows[0]['id'] if rows and isinstance(rows, list) else None
+
+    def outbox_max_id(self) -> Optional[int]:
+        """Наибольший id в outbox (0 — пусто); None — ошибка запроса"""
+        rows = self.execute_query('SELECT COALESCE(MAX(id), 0) FROM public.push_outbox')
+        return rows[0][0] if rows else None
+
+    def outbox_delete(self, outbox_id: int) -> bool:
+        """Уведомление доставлено"""
+        return self.execute_query('DELETE FROM public.push_outbox WHERE id = %s', (outbox_id,)) is not None
+
+    def outbox_reschedule(self, outbox_id: int, attempts: int, scheduled_at, error: str = None) -> bool:
+        return self.execute_query(
+            'UPDATE public.push_outbox SET attempts = %s, scheduled_at = %s, last_error = %s, '
+            'updated_at = now() WHERE id = %s',
+            (attempts, scheduled_at, error, outbox_id)
+        ) is not None
+
+    def outbox_fail(self, outbox_id: int, attempts: int, error: str = None) -> bool:
+        """Попытки исчерпаны — строка остаётся для разбора"""
+        return self.execute_query(
+            "UPDATE public.push_outbox SET status = 'failed', attempts = %s, last_error = %s, "
+            "updated_at = now() WHERE id = %s",
+            (attempts, error, outbox_id)
+        ) is not None
+
+    def outbox_pending(self, owner_shard: int, after_id: int = 0, limit: int = 5000,
+                       shard_count: int = 1, until_id: Optional[int] = None) -> Optional[List]:
+        """Пачка невыполненных уведомлений шарда по возрастанию id (не больше until_id).
+
+        Шард 0 забирает и строки шардов, которых больше нет (после уменьшения BOT_SHARDS).
+        Строки: (id, user_id, title, message, type, scheduled_at, attempts, max_attempts)
+        """
+        owner_clause = 'owner_shard = %s'
+        params = [owner_shard]
+        if owner_shard == 0:
+            owner_clause = '(owner_shard = 0 OR owner_shard >= %s)'
+            params = [shard_count]
+        if until_id is not None:
+            owner_clause += ' AND id <= %s'
+            params.append(until_id)
+        return self.execute_query(
+            'SELECT id, user_id, title, message, type, scheduled_at, attempts, max_attempts '
+            f"FROM public.push_outbox WHERE status = 'pending' AND {owner_clause} AND id > %s "
+            'ORDER BY id LIMIT %s',
+            tuple(params + [after_id, limit])
+        )
+
+    # --- состояние диалогов (миграция 20251101_08) ---
+
+    def state_load(self, namespace: str, key: str):
+        """Значение (JSON-текст) непросроченной записи; None — записи нет, False — ошибка"""
+        rows = self.execute_query(
+            'SELECT value::text FROM public.conversation_state '
+            'WHERE namespace = %s AND key = %s AND expires_at > now()',
+            (namespace, key)
+        )
+        if rows is None:
+            return False
+        return rows[0][0] if rows else None
+
+    def state_upsert(self, rows: List) -> bool:
+        """Записать пачку (namespace, key, value_json, expires_at) одним INSERT"""
+        if not rows:
+            return True
+        values = ', '.join(['(%s, %s, %s::jsonb, %s, now())'] * len(rows))
+        params = [item for row in rows for item in row]
+        return self.execute_query(
+            'INSERT INTO public.conversation_state (namespace, key, value, expires_at, updated_at) '
+            f'VALUES {values} ON CONFLICT (namespace, key) DO UPDATE SET '
+            'value = EXCLUDED.value, expires_at = EXCLUDED.expires_at, updated_at = now()',
+            tuple(params)
+        ) is not None
+
+    def state_delete(self, namespace: str, keys: List[str]) -> bool:
+        if not keys:
+            return True
+        return self.execute_query(
+            'DELETE FROM public.conversation_state WHERE namespace = %s AND key = ANY(%s::text[])',
+            (namespace, list(keys))
+        ) is not None
+
+    def state_purge_expired(self) -> bool:
+        return self.execute_query(
+            'DELETE FROM public.conversation_state WHERE expires_at <= now()'
+        ) is not None
+
     def get_user_loyalty_points(self, user_id: str) -> Optional[Dict]:
         try:
             response = self.admin_client.table('loyalty_points').select('*').eq('user_id', user_id).maybeSingle().execute()
@@ -566,7 +843,13 @@ class SupabaseManager:
             logging.error(f"Error updating loyalty points: {e}")
             return False
 
-    def remove_from_cart(self, cart_item_id: str) -> bool:
+    def remove_from_cart(self, cart_item_id: str, user_id: Optional[str] = None) -> bool:
+        if user_id:
+            result = self.cart_remove(user_id, cart_item_id)
+            if result is not None:
+                return bool(result.get('ok'))
+            if self.rpc_available('cart_remove_item'):
+                return False
         try:
             self.admin_client.table('cart').delete().eq('id', cart_item_id).execute()
             return True
@@ -574,7 +857,13 @@ class SupabaseManager:
             logging.error(f"Error removing from cart: {e}")
             return False
 
-    def update_cart_quantity(self, cart_item_id: str, quantity: int) -> bool:
+    def update_cart_quantity(self, cart_item_id: str, quantity: int, user_id: Optional[str] = None) -> bool:
+        if user_id:
+            result = self.cart_set_quantity(user_id, cart_item_id, quantity)
+            if result is not None:
+                return bool(result.get('ok'))
+            if self.rpc_available('cart_set_quantity'):
+                return False
         try:
             if quantity <= 0:
                 return self.remove_from_cart(cart_item_id)
@@ -628,6 +917,7 @@ class SupabaseManager:
     def update_user_language(self, user_id: str, language: str) -> bool:
         try:
             self.admin_client.table('users').update({'language': language}).eq('id', user_id).execute()
+            self.user_cache.invalidate(user_id=user_id)
             return True
         except Exception as e:
             logging.error(f"Error updating user language: {e}")
@@ -637,28 +927,7 @@ class SupabaseManager:
 
     def _qualify_public_tables(self, query: str) -> str:
         """Add `public.` schema for known tables when not already qualified."""
-        import re
-        tables = [
-            "users","orders","order_items","automation_rules","scheduled_posts","inventory_rules",
-            "products","product_images","favorites","categories","subcategories","promo_codes",
-            "promo_uses","shipments","loyalty_points","notifications","suppliers","business_expenses",
-            "automation_executions","security_logs","webhook_logs","stock_reservations",
-            "stocktaking_items","stocktaking_sessions","user_activity_logs","post_activity","post_statistics"
-        ]
-        def repl(m):
-            kw = m.group(1)
-            tbl = m.group(2)
-            # if already schema-qualified, leave as is
-            if "." in tbl:
-                return m.group(0)
-            if tbl.lower() in tables:
-                return f"{kw} public.{tbl}"
-            return m.group(0)
-        # Handle FROM and JOIN
-        query = re.sub(r"\b(FROM|JOIN)\s+([a-zA-Z_][a-zA-Z0-9_\.]+)", repl, query, flags=re.IGNORECASE)
-        # Handle UPDATE, INSERT INTO, DELETE FROM
-        query = re.sub(r"\b(UPDATE|INTO|DELETE\s+FROM)\s+([a-zA-Z_][a-zA-Z0-9_\.]+)", repl, query, flags=re.IGNORECASE)
-        return query
+        return qualify_public_tables(query)
 
     def _normalize_exec_sql_result(self, rpc_result, is_select: bool):
         """Normalize Supabase RPC exec_sql return shape.
@@ -700,107 +969,76 @@ class SupabaseManager:
     def execute_query(self, query: str, params: tuple = None) -> Optional[List]:
             """
             Execute raw SQL query with Postgres syntax
-            Converts SQLite-style queries to Postgres where needed
+            Converts SQLite-style queries to Postgres where needed (unless SQL_STRICT_POSTGRES)
             Returns: List of tuples for SELECT, affected rows count for INSERT/UPDATE/DELETE
             """
             try:
-                # Convert SQLite date functions to Postgres
-                query = self._convert_sqlite_to_postgres(query)
-                # Ensure public schema qualification
-                query = self._qualify_public_tables(query)
-    
-                # Execute query
-                if params:
-                    # Use parameterized query with Supabase RPC if needed
-                    # For now, simple string replacement (not secure for user input!)
-                    for i, param in enumerate(params):
-                        # Support both ? and %s placeholders
-                        if '%s' in query:
-                            placeholder = '%s'
-                        elif '?' in query:
-                            placeholder = '?'
-                        else:
-                            placeholder = f'${i+1}'
-    
-                        if placeholder in query:
-                            if isinstance(param, str):
-                                # Escape single quotes in strings
-                                safe_param = param.replace("'", "''")
-                                query = query.replace(placeholder, f"'{safe_param}'", 1)
-                            elif isinstance(param, bool):
-                                query = query.replace(placeholder, 'true' if param else 'false', 1)
-                            elif param is None:
-                                query = query.replace(placeholder, 'NULL', 1)
-                            else:
-                                query = query.replace(placeholder, str(param), 1)
+                # Queries in the modules are translated at build time by
+                # scripts/translate_sql.py; in strict mode they are sent as is.
+                # Otherwise dynamic SQL goes through the memoized translator.
+                if not self.sql_strict:
+                    query = translate_query(query)
     
                 # Determine query type
                 query_upper = query.strip().upper()
-    
-                if query_upper.startswith('SELECT'):
-                    # Execute SELECT via RPC using admin client to bypass RLS
-                    result = self.admin_client.rpc('exec_sql', {'sql': query}).execute()
-                    return self._normalize_exec_sql_result(result, True)
-    
-                elif query_upper.startswith('INSERT'):
-                    # Execute INSERT via RPC using admin client to bypass RLS
-                    result = self.admin_client.rpc('exec_sql', {'sql': query}).execute()
-                    # Return inserted row ID if available
-                    return self._normalize_exec_sql_result(result, False)
-    
-                elif query_upper.startswith(('UPDATE', 'DELETE')):
-                    # Execute UPDATE/DELETE via RPC using admin client to bypass RLS
-                    result = self.admin_client.rpc('exec_sql', {'sql': query}).execute()
-                    return self._normalize_exec_sql_result(result, False)
-    
-                else:
-                    # Generic execution using admin client
-                    result = self.admin_client.rpc('exec_sql', {'sql': query}).execute()
-                    return self._normalize_exec_sql_result(result, False)
+                is_select = query_upper.startswith('SELECT')
+                return self._execute_sql(query, is_select, params)
     
             except Exception as e:
                 logging.error(f"Error executing query: {e}\nQuery: {query}")
                 return None
     
-    def _convert_sqlite_to_postgres(self, query: str) -> str:
-        """Convert SQLite-specific syntax to Postgres"""
-        import re
-
-        # Convert date('now') -> CURRENT_DATE
-        query = re.sub(r"date\('now'\)", "CURRENT_DATE", query, flags=re.IGNORECASE)
-
-        # Convert NOW() -> NOW()
-        query = re.sub(r"datetime\('now'\)", "NOW()", query, flags=re.IGNORECASE)
-
-        # Convert (NOW() - INTERVAL '7 day') -> CURRENT_DATE - INTERVAL '7 days'
-        query = re.sub(
-            r"date\('now',\s*'([+-])(\d+)\s+days?'\)",
-            lambda m: f"CURRENT_DATE {m.group(1)} INTERVAL '{m.group(2)} days'",
-            query,
-            flags=re.IGNORECASE
-        )
+    def _execute_sql(self, query: str, is_select: bool, params=None):
+        """Run SQL on the pooled Postgres connection, falling back to the exec_sql RPC.
 
-        # Convert NOW() - INTERVAL '30 days' -> NOW() - INTERVAL '30 days'
-        query = re.sub(
-            r"datetime\('now',\s*'([+-])(\d+)\s+days?'\)",
-            lambda m: f"NOW() {m.group(1)} INTERVAL '{m.group(2)} days'",
-            query,
-            flags=re.IGNORECASE
-        )
-
-        # Convert DATE(column) -> column::date
-        query = re.sub(r"DATE\((\w+)\)", r"\1::date", query, flags=re.IGNORECASE)
-
-        # Convert CURRENT_TIMESTAMP to NOW()
-        query = re.sub(r"CURRENT_TIMESTAMP", "NOW()", query, flags=re.IGNORECASE)
-
-        # (moved conversions are now inside the function)
+        On the pool, parameters are bound server-side (%s, ? and $n are
+        normalized to %s), so the statement text stays stable and psycopg can
+        prepare it once per connection. The RPC path takes plain SQL text,
+        so there the values are rendered as quoted literals.
+        """
+        if self.pg_pool is not None and self.pg_pool.available:
+            sql, bound = to_pyformat(query, params)
+            try:
+                return self.pg_pool.execute(sql, bound, is_select=is_select)
+            except PoolUnavailable as e:
+                if self.sql_backend == 'pool':
+                    raise
+                logging.warning(f"Postgres pool unavailable, using RPC: {e}")
+
+        # Execute via RPC using admin client to bypass RLS
+        query = inline_params(query, params)
+        result = self.admin_client.rpc('exec_sql', {'sql': query}).execute()
+        return self._normalize_exec_sql_result(result, is_select)
+
+    def iter_query(self, query: str, params: tuple = None, batch_size: int = 1000):
+        """Yield SELECT rows (tuples, same values as execute_query) for large exports.
+
+        On the pool, rows come from a server-side cursor batch_size at a time,
+        so memory does not depend on the result size. The exec_sql RPC returns
+        the whole result at once; then the rows are only handed out in batches.
+        Unlike execute_query, errors are raised to the caller.
+        """
+        if not self.sql_strict:
+            query = translate_query(query)
+        if self.pg_pool is not None and self.pg_pool.available:
+            sql, bound = to_pyformat(query, params)
+            started = False
+            try:
+                for batch in self.pg_pool.iter_batches(sql, bound, batch_size):
+                    started = True
+                    yield from batch
+                return
+            except PoolUnavailable as e:
+                # Rows already handed out cannot be resumed over RPC
+                if started or self.sql_backend == 'pool':
+                    raise
+                logging.warning(f"Postgres pool unavailable, using RPC: {e}")
+
+        yield from self._execute_sql(query, True, params) or []
 
-        # Доп. конвертации: IFNULL -> COALESCE и булевы =1/0
-        query = re.sub(r'\bIFNULL\s*\(', 'COALESCE(', query, flags=re.IGNORECASE)
-        query = re.sub(r'\b(is_[a-z_]+|[a-z_]+_flag)\s*=\s*1\b', r'\1 = TRUE', query, flags=re.IGNORECASE)
-        query = re.sub(r'\b(is_[a-z_]+|[a-z_]+_flag)\s*=\s*0\b', r'\1 = FALSE', query, flags=re.IGNORECASE)
-        return query
+    def _convert_sqlite_to_postgres(self, query: str) -> str:
+        """Convert SQLite-specific syntax to Postgres"""
+        return convert_sqlite_to_postgres(query)
 
     # === SAFE UPSERTS (service_role) ===
     def upsert_user(self, telegram_id: int, name: str, language: str,
@@ -825,6 +1063,7 @@ class SupabaseManager:
                 .upsert(payload, on_conflict="telegram_id", ignore_duplicates=False) \
                 .select("id, is_admin, language, is_registered") \
                 .execute()
+            self.user_cache.invalidate(telegram_id=telegram_id)
             return res.data[0] if res.data else None
         except Exception as e:
             logging.exception("upsert_user failed: %s", e)
@@ -843,6 +1082,7 @@ class SupabaseManager:
                 .upsert(payload, on_conflict="telegram_id", ignore_duplicates=False) \
                 .select("id") \
                 .execute()
+            self.user_cache.invalidate(telegram_id=telegram_id)
             return bool(res.data)
         except Exception as e:
             logging.exception("create_or_promote_admin failed: %s", e)
@@ -850,6 +1090,13 @@ class SupabaseManager:
 
     # === low-level PG executor (SELECT/DDL/DML) ===
     def _pg_exec(self, sql: str, params=None, fetch: bool=False):
+        if self.pg_pool is not None and self.pg_pool.available:
+            with self.pg_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params or None)
+                    if fetch and cur.description is not None:
+                        return cur.fetchall()
+                    return []
         dsn = os.getenv("DATABASE_URL")
         if not dsn:
             raise RuntimeError("DATABASE_URL is not set")
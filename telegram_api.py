@@ -0,0 +1,280 @@
+"""
+Клиент Telegram Bot API с keep-alive соединениями.
+
+Один экземпляр на токен (get_client) разделяют бот, веб-админка,
+автопосты и utils.send_telegram_message. Соединения HTTP/1.1 к
+api.telegram.org переиспользуются из пула, поэтому TCP+TLS рукопожатие
+не повторяется на каждое сообщение. Запросы и ответы — JSON, через
+единственную пару encode_json/decode_json; клавиатуры из keyboards.py
+приходят уже сериализованными и не кодируются повторно.
+
+Методы возвращают ответ API как есть ({'ok': ..., 'result'/'description'})
+или None при сетевой ошибке — так же, как раньше возвращали обёртки над
+urllib.
+
+Отправка и редактирование сообщений идут через OutboundScheduler
+(outbound.py): лимиты Telegram, приоритеты и повтор после 429. С
+wait=False методы не ждут ответа и возвращают Future — так рассылки
+ставят в очередь всех получателей сразу.
+"""
+import json
+import queue
+import logging
+import threading
+import http.client
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+from config import OUTBOUND_CONFIG, TELEGRAM_API_CONFIG
+from outbound import TRANSACTIONAL, OutboundScheduler
+
+logger = logging.getLogger('telegram_api')
+
+# Ошибки «соединение закрыто сервером» — запрос повторяется на новом
+_RETRYABLE = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+              http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+
+def encode_json(payload):
+    """Тело запроса; готовые клавиатуры (keyboards.Markup) вставляются своими json_bytes"""
+    raw = {key: value.json_bytes for key, value in payload.items()
+           if getattr(value, 'json_bytes', None) is not None}
+    if not raw:
+        return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    rest = {key: value for key, value in payload.items() if key not in raw}
+    head = json.dumps(rest, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[:-1]
+    fields = b','.join(json.dumps(key).encode('utf-8') + b':' + data for key, data in raw.items())
+    return head + (b',' if rest else b'') + fields + b'}'
+
+
+def decode_json(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def _drop_none(params):
+    return {key: value for key, value in params.items() if value is not None}
+
+
+class TelegramAPI:
+    """Пул keep-alive соединений и типизированные методы Bot API"""
+
+    def __init__(self, token, base_url='https://api.telegram.org', pool_size=8,
+                 connect_timeout=5.0, read_timeout=30.0):
+        parsed = urlparse(base_url)
+        self.token = token
+        self.host = parsed.hostname or 'api.telegram.org'
+        self.port = parsed.port
+        self.secure = parsed.scheme != 'http'
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._path_prefix = f"{parsed.path.rstrip('/')}/bot{token}/"
+        self._idle = queue.LifoQueue(maxsize=max(1, pool_size))
+        self.scheduler = None
+        self.queue_timeout = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'api_errors': 0,
+                      'connections_opened': 0, 'connections_reused': 0, 'retries': 0}
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    # --- соединения ---
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        self._count('connections_opened')
+        return cls(self.host, self.port, timeout=self.connect_timeout)
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            self._count('connections_reused')
+            return conn, True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """Закрыть простаивающие соединения"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # --- вызов метода ---
+
+    def _request(self, conn, method, body, timeout):
+        if conn.sock is None:
+            conn.connect()
+        conn.sock.settimeout(timeout)
+        conn.request('POST', self._path_prefix + method, body=body, headers={
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+        })
+        response = conn.getresponse()
+        data = response.read()
+        return response, data
+
+    def call(self, method, params=None, timeout=None):
+        """POST /bot<token>/<method> с JSON; ответ API или None"""
+        body = encode_json(_drop_none(params or {}))
+        timeout = timeout or self.read_timeout
+        self._count('requests')
+        for attempt in range(2):
+            conn, reused = self._acquire()
+            try:
+                response, data = self._request(conn, method, body, timeout)
+            except _RETRYABLE as e:
+                conn.close()
+                # Сервер закрыл простаивавшее соединение — повторяем на свежем
+                if reused and attempt == 0:
+                    self._count('retries')
+                    continue
+                self._count('errors')
+                logger.warning(f"Telegram {method}: {e}")
+                return None
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._count('errors')
+                logger.warning(f"Telegram {method}: {e}")
+                return None
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            try:
+                result = decode_json(data)
+            except ValueError:
+                self._count('errors')
+                logger.warning(f"Telegram {method}: не JSON, HTTP {response.status}")
+                return None
+            if not result.get('ok'):
+                self._count('api_errors')
+            return result
+        return None
+
+    def _send(self, method, params, priority, wait):
+        """Отправка через планировщик (если он подключён)"""
+        params = _drop_none(params)
+        if self.scheduler is not None:
+            if wait:
+                return self.scheduler.call(method, params, priority, timeout=self.queue_timeout)
+            return self.scheduler.submit(method, params, priority)
+        result = self.call(method, params)
+        if wait:
+            return result
+        future = Future()
+        future.set_result(result)
+        return future
+
+    # --- методы Bot API ---
+
+    def get_me(self):
+        return self.call('getMe')
+
+    def get_updates(self, offset=None, timeout=30, allowed_updates=None):
+        # Long polling держит соединение timeout секунд — читаем с запасом
+        return self.call('getUpdates', {
+            'offset': offset, 'timeout': timeout, 'allowed_updates': allowed_updates,
+        }, timeout=timeout + self.connect_timeout + 5)
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode='HTML',
+                     disable_web_page_preview=None, priority=TRANSACTIONAL, wait=True):
+        return self._send('sendMessage', {
+            'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode,
+            'reply_markup': reply_markup, 'disable_web_page_preview': disable_web_page_preview,
+        }, priority, wait)
+
+    def send_photo(self, chat_id, photo, caption=None, reply_markup=None, parse_mode='HTML',
+                   priority=TRANSACTIONAL, wait=True):
+        return self._send('sendPhoto', {
+            'chat_id': chat_id, 'photo': photo, 'caption': caption,
+            'parse_mode': parse_mode, 'reply_markup': reply_markup,
+        }, priority, wait)
+
+    def send_media_group(self, chat_id, media, priority=TRANSACTIONAL, wait=True):
+        """media — список InputMedia ({'type': 'photo', 'media': url, ...})"""
+        return self._send('sendMediaGroup', {'chat_id': chat_id, 'media': media}, priority, wait)
+
+    def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode='HTML'):
+        return self._send('editMessageText', {
+            'chat_id': chat_id, 'message_id': message_id, 'text': text,
+            'parse_mode': parse_mode, 'reply_markup': reply_markup,
+        }, TRANSACTIONAL, True)
+
+    def edit_message_caption(self, chat_id, message_id, caption, reply_markup=None, parse_mode='HTML'):
+        return self._send('editMessageCaption', {
+            'chat_id': chat_id, 'message_id': message_id, 'caption': caption,
+            'parse_mode': parse_mode, 'reply_markup': reply_markup,
+        }, TRANSACTIONAL, True)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None):
+        return self._send('editMessageReplyMarkup', {
+            'chat_id': chat_id, 'message_id': message_id, 'reply_markup': reply_markup,
+        }, TRANSACTIONAL, True)
+
+    def answer_callback_query(self, callback_query_id, text=None, show_alert=None):
+        return self.call('answerCallbackQuery', {
+            'callback_query_id': callback_query_id, 'text': text, 'show_alert': show_alert,
+        })
+
+    def set_webhook(self, url, secret_token=None, allowed_updates=None, max_connections=None,
+                    drop_pending_updates=None):
+        return self.call('setWebhook', {
+            'url': url, 'secret_token': secret_token, 'allowed_updates': allowed_updates,
+            'max_connections': max_connections, 'drop_pending_updates': drop_pending_updates,
+        })
+
+    def delete_webhook(self, drop_pending_updates=None):
+        return self.call('deleteWebhook', {'drop_pending_updates': drop_pending_updates})
+
+    def get_webhook_info(self):
+        return self.call('getWebhookInfo')
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats, idle_connections=self._idle.qsize())
+        if self.scheduler is not None:
+            stats['outbound'] = self.scheduler.get_stats()
+        return stats
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token):
+    """Общий клиент для токена (один пул на процесс)"""
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = TelegramAPI(token, **TELEGRAM_API_CONFIG)
+            if OUTBOUND_CONFIG['enabled']:
+                client.scheduler = OutboundScheduler(
+                    client.call,
+                    global_rate=OUTBOUND_CONFIG['global_rate'],
+                    private_rate=OUTBOUND_CONFIG['private_rate'],
+                    private_burst=OUTBOUND_CONFIG['private_burst'],
+                    group_rate=OUTBOUND_CONFIG['group_rate_per_minute'] / 60,
+                    group_burst=OUTBOUND_CONFIG['group_burst'],
+                    senders=OUTBOUND_CONFIG['senders'],
+                    max_retries=OUTBOUND_CONFIG['max_retries'],
+                )
+                client.queue_timeout = OUTBOUND_CONFIG['queue_timeout']
+            _clients[token] = client
+        return client
+
+
+def get_all_stats():
+    """Статистика всех клиентов процесса (для health-check)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.get_stats() for client in clients]
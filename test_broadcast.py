@@ -0,0 +1,109 @@
+"""
+Тесты рассылок с контрольными точками (broadcast.py) на заглушке базы
+"""
+import os
+import threading
+from concurrent.futures import Future
+
+os.environ.setdefault('CHECK_ENV_VARS', 'false')
+
+from broadcast import BroadcastEngine, _job_from_row
+
+
+class StubDB:
+    """execute_query в формате пула: SELECT — кортежи, DML с RETURNING — dict"""
+
+    def __init__(self, users):
+        self.users = users
+        self.job = None
+        self.checkpoints = []
+        self.lease_lost = False
+
+    def execute_query(self, query, params=None):
+        if query.startswith('SELECT COUNT(*)'):
+            return [(len(self.users),)]
+        if query.startswith('INSERT INTO public.broadcast_jobs'):
+            kind, audience, message, image_url, reply_markup, post_id, time_period, total = params
+            self.job = {
+                'id': 'job-1', 'kind': kind, 'audience': audience, 'message': message,
+                'image_url': image_url, 'reply_markup': reply_markup, 'post_id': post_id,
+                'time_period': time_period, 'last_user_id': None, 'total_count': total,
+                'sent_count': 0, 'error_count': 0, 'started_at': '2026-10-18T00:00:00+00:00',
+            }
+            return [{'id': 'job-1'}]
+        if query.startswith("UPDATE public.broadcast_jobs SET status = 'running'"):
+            return [dict(self.job)]
+        if query.startswith('UPDATE public.broadcast_jobs SET last_user_id'):
+            self.checkpoints.append(params[0])
+            return [] if self.lease_lost else [{'id': 'job-1'}]
+        if query.startswith('SELECT u.id'):
+            after_id = params[0] if len(params) == 2 else None
+            limit = params[-1]
+            rows = [user for user in self.users if after_id is None or user[0] > after_id]
+            return rows[:limit]
+        return {'rows_affected': 1}
+
+
+class StubAPI:
+    """Отправка через очередь: Future выполняется через delay секунд"""
+
+    def __init__(self, delay=0):
+        self.sent = []
+        self.delay = delay
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.sent.append((chat_id, text))
+        future = Future()
+        if self.delay:
+            timer = threading.Timer(self.delay, self._deliver, (future,))
+            timer.daemon = True
+            timer.start()
+        else:
+            future.set_result({'ok': True})
+        return future
+
+    @staticmethod
+    def _deliver(future):
+        if future.set_running_or_notify_cancel():
+            future.set_result({'ok': True})
+
+
+def test_job_from_row_accepts_dict_and_tuple():
+    row = {'id': 5, 'audience': 'all', 'message': 'Привет'}
+    assert _job_from_row(row)['audience'] == 'all'
+    assert _job_from_row(row)['last_user_id'] is None
+    assert _job_from_row((5, 'broadcast', 'all'))['audience'] == 'all'
+
+
+def test_checkpointed_job_runs_with_pool_result_shape():
+    users = [(1, 101, 'ru'), (2, 102, 'uz'), (3, 103, None)]
+    db, api = StubDB(users), StubAPI()
+    engine = BroadcastEngine(db, api, batch_size=2)
+
+    sent, errors = engine.send('all', 'Акция')
+
+    assert (sent, errors) == (3, 0)
+    assert [chat_id for chat_id, _ in api.sent] == [101, 102, 103]
+    assert api.sent[1][1] == 'Aksiya'
+    assert db.checkpoints == [2, 3]
+
+
+def test_lease_is_renewed_while_batch_is_in_flight():
+    users = [(1, 101, 'ru'), (2, 102, 'ru')]
+    db, api = StubDB(users), StubAPI(delay=0.5)
+    engine = BroadcastEngine(db, api, batch_size=5, lease_seconds=0.3)
+
+    assert engine.send('all', 'Привет') == (2, 0)
+    # Продления посреди пачки несут прогресс прошлой пачки, затем — контрольная точка
+    assert db.checkpoints[:-1] and set(db.checkpoints[:-1]) == {None}
+    assert db.checkpoints[-1] == 2
+
+
+def test_lost_lease_cancels_rest_of_batch():
+    users = [(1, 101, 'ru'), (2, 102, 'ru')]
+    db, api = StubDB(users), StubAPI(delay=5)
+    db.lease_lost = True
+    engine = BroadcastEngine(db, api, batch_size=5, lease_seconds=0.3)
+
+    assert engine.send('all', 'Привет') == (0, 0)
+    assert db.checkpoints == [None]
@@ -0,0 +1,81 @@
+"""
+Тесты очереди с задержкой (delay_queue.py)
+"""
+import time
+import threading
+
+from delay_queue import DelayQueue
+
+
+def test_items_come_out_by_due_time_then_fifo():
+    queue = DelayQueue()
+    now = time.time()
+    queue.put('later', now + 0.05)
+    queue.put('first', now - 2)
+    queue.put('second', now - 1)
+    queue.put('second-tie', now - 1)
+
+    assert [queue.get(timeout=1) for _ in range(4)] == ['first', 'second', 'second-tie', 'later']
+    assert len(queue) == 0
+
+
+def test_get_waits_until_due():
+    queue = DelayQueue()
+    queue.put('item', time.time() + 0.2)
+
+    assert queue.get(timeout=0.05) is None
+    started = time.monotonic()
+    assert queue.get(timeout=2) == 'item'
+    assert time.monotonic() - started >= 0.1
+
+
+def test_earlier_item_wakes_sleeping_consumer():
+    queue = DelayQueue()
+    queue.put('far', time.time() + 60)
+    got = []
+    consumer = threading.Thread(target=lambda: got.append((queue.get(timeout=5), time.monotonic())))
+    consumer.start()
+    time.sleep(0.05)
+    put_at = time.monotonic()
+    queue.put('now')
+    consumer.join(2)
+
+    assert got and got[0][0] == 'now'
+    assert got[0][1] - put_at < 0.5
+    assert queue.next_due() > time.time() + 50
+
+
+def test_ready_items_are_shared_between_consumers():
+    queue = DelayQueue()
+    got = []
+    lock = threading.Lock()
+
+    def consume():
+        item = queue.get(timeout=2)
+        with lock:
+            got.append(item)
+
+    consumers = [threading.Thread(target=consume) for _ in range(3)]
+    for consumer in consumers:
+        consumer.start()
+    time.sleep(0.05)
+    for number in range(3):
+        queue.put(number)
+    for consumer in consumers:
+        consumer.join(3)
+
+    assert sorted(got) == [0, 1, 2]
+
+
+def test_close_releases_waiting_consumers():
+    queue = DelayQueue()
+    queue.put('far', time.time() + 60)
+    got = []
+    consumer = threading.Thread(target=lambda: got.append(queue.get()))
+    consumer.start()
+    time.sleep(0.05)
+    queue.close()
+    consumer.join(2)
+
+    assert got == [None]
+    assert not consumer.is_alive()
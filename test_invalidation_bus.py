@@ -0,0 +1,107 @@
+"""
+Тесты шины инвалидации (invalidation_bus.py) и точечного обновления каталога
+"""
+import time
+
+from catalog import CatalogManager
+from invalidation_bus import ALL, FileFlagBus, InMemoryBus, InvalidationEvent, decode_event, encode_event
+
+
+def test_event_round_trip():
+    assert decode_event(encode_event('products', 7, 'delete')) == InvalidationEvent('products', 'DELETE', '7')
+    assert decode_event(encode_event('categories')) == InvalidationEvent('categories', 'UPDATE', None)
+
+
+def test_broken_payload_means_full_reload():
+    assert decode_event('{oops') == InvalidationEvent(ALL, 'RELOAD', None)
+
+
+def test_in_memory_bus_delivers_to_subscribers():
+    bus = InMemoryBus()
+    received = []
+    bus.subscribe(received.append)
+    bus.subscribe(lambda event: 1 / 0)
+
+    bus.publish('products', 5)
+    bus.publish_reload()
+
+    assert received == [InvalidationEvent('products', 'UPDATE', '5'), InvalidationEvent(ALL, 'RELOAD', None)]
+    assert bus.published == received
+    assert bus.stats['published'] == 2 and bus.stats['dispatch_errors'] == 2
+
+
+def test_file_bus_reads_events_and_legacy_flags(tmp_path):
+    writer, reader = FileFlagBus(str(tmp_path)), FileFlagBus(str(tmp_path))
+    received = []
+    reader.subscribe(received.append)
+
+    writer.publish('products', 1)
+    writer.publish('scheduled_posts', 2, 'DELETE')
+    (tmp_path / FileFlagBus.UPDATE_FLAG).write_text('1')
+
+    assert reader.poll() == 3
+    assert received == [
+        InvalidationEvent(ALL, 'RELOAD', None),
+        InvalidationEvent('products', 'UPDATE', '1'),
+        InvalidationEvent('scheduled_posts', 'DELETE', '2'),
+    ]
+    assert reader.poll() == 0
+
+
+class StubDB:
+    """Каталог из трёх товаров; считает запросы"""
+
+    def __init__(self):
+        self.products = {str(i): (str(i), f'Товар {i}', '', 10 * i, 'c1', None) for i in (1, 2, 3)}
+        self.queries = []
+
+    def execute_query(self, sql, params=None):
+        self.queries.append((sql, params))
+        if 'FROM public.categories' in sql:
+            return [('c1', 'Одежда', '', '👕', True, None)]
+        if 'FROM public.subcategories' in sql:
+            return []
+        if params:
+            return [self.products[i] for i in params if i in self.products]
+        return sorted(self.products.values(), key=lambda row: row[1])
+
+
+def test_invalidation_events_are_coalesced_into_one_snapshot():
+    db = StubDB()
+    catalog = CatalogManager(db, refresh_interval=60, coalesce_delay=0.2)
+    catalog.rebuild()
+    version = catalog.snapshot.version
+    bus = InMemoryBus()
+    bus.subscribe(lambda event: catalog.invalidate(event.table, event.id))
+    catalog.start()
+    try:
+        db.queries.clear()
+        db.products['1'] = ('1', 'Товар 1', '', 99, 'c1', None)
+        del db.products['2']
+        for product_id in ('1', '2', '1'):
+            bus.publish('products', product_id)
+        deadline = time.monotonic() + 2
+        while catalog.snapshot.version == version and time.monotonic() < deadline:
+            time.sleep(0.02)
+        time.sleep(0.3)
+    finally:
+        catalog.stop()
+
+    snapshot = catalog.snapshot
+    assert snapshot.version == version + 1
+    assert len(db.queries) == 1 and sorted(db.queries[0][1]) == ['1', '2']
+    assert snapshot.product('1')[3] == 99
+    assert snapshot.product('2') is None
+    assert snapshot.product('3') is not None
+
+
+def test_too_many_changes_fall_back_to_full_rebuild():
+    db = StubDB()
+    catalog = CatalogManager(db, coalesce_limit=1)
+    catalog.rebuild()
+    catalog._pending = {'products': {'1', '2'}}
+    db.queries.clear()
+
+    catalog._apply_pending(full=False)
+
+    assert len(db.queries) == 3
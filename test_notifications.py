@@ -0,0 +1,63 @@
+"""
+Тесты push-уведомлений с outbox (notifications.py) на заглушке пула Postgres
+"""
+import os
+import time
+
+import pytest
+
+os.environ.setdefault('CHECK_ENV_VARS', 'false')
+
+supabase_db = pytest.importorskip('supabase_db')
+
+from notifications import NotificationManager
+
+
+class StubPool:
+    """pg_pool в формате PostgresPool.execute: SELECT — кортежи, DML с RETURNING — dict"""
+
+    available = True
+
+    def __init__(self):
+        self.inserted = []
+
+    def execute(self, sql, params=None, is_select=True, prepare=None):
+        if sql.startswith('INSERT INTO public.push_outbox'):
+            self.inserted.append(params)
+            return [{'id': 42}]
+        if sql.startswith('SELECT COALESCE(MAX(id), 0) FROM public.push_outbox'):
+            return [(0,)]
+        return [] if is_select else {'rows_affected': 0}
+
+
+class StubBot:
+    api = None
+    shard_id = 0
+    shard_count = 1
+
+
+def make_db():
+    db = supabase_db.SupabaseManager.__new__(supabase_db.SupabaseManager)
+    db.sql_strict = True
+    db.sql_backend = 'pool'
+    db.pg_pool = StubPool()
+    return db
+
+
+def test_outbox_add_reads_returning_id():
+    db = make_db()
+    assert db.outbox_add('user-1', 'Заказ', 'Отправлен', 'order', None) == 42
+
+
+def test_queue_push_notification_keeps_outbox_id():
+    db = make_db()
+    manager = NotificationManager(StubBot(), db)
+    try:
+        manager.queue_push_notification('user-1', 'Заказ', 'Отправлен', 'order', delay_seconds=3600)
+        assert len(db.pg_pool.inserted) == 1
+        assert len(manager.push_queue) == 1
+        due, _, notification = manager.push_queue._heap[0]
+        assert notification['outbox_id'] == 42
+        assert due > time.time()
+    finally:
+        manager.push_queue.close()
@@ -0,0 +1,142 @@
+"""
+Тесты планировщика исходящих запросов (outbound.py)
+"""
+import time
+import threading
+
+from outbound import (MARKETING, NOTIFICATION, TRANSACTIONAL, OutboundScheduler, TokenBucket,
+                      delivery_counts, process_global_rate)
+
+
+class RecordingSender:
+    """sender(method, params): пишет порядок отправок, может задержать или ответить 429"""
+
+    def __init__(self, delay=0.0, too_many=(), retry_after=0.1):
+        self.delay = delay
+        self.too_many = set(too_many)
+        self.retry_after = retry_after
+        self.calls = []
+        self.lock = threading.Lock()
+        self.gate = None
+        self.started = threading.Event()
+
+    def __call__(self, method, params):
+        with self.lock:
+            self.calls.append(params['text'])
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            if params['text'] in self.too_many:
+                self.too_many.discard(params['text'])
+                return {'ok': False, 'error_code': 429, 'parameters': {'retry_after': self.retry_after}}
+        return {'ok': True, 'result': params['text']}
+
+
+def make_scheduler(sender, **kwargs):
+    options = dict(global_rate=1000, private_rate=1000, private_burst=1000, senders=4)
+    options.update(kwargs)
+    return OutboundScheduler(sender, **options)
+
+
+def send(scheduler, chat_id, text, priority=TRANSACTIONAL):
+    return scheduler.submit('sendMessage', {'chat_id': chat_id, 'text': text}, priority)
+
+
+def test_token_bucket_waits_for_refill_and_block():
+    bucket = TokenBucket(rate=10, capacity=1)
+    now = time.monotonic()
+    assert bucket.delay(now) == 0
+    bucket.take(now)
+    assert 0.09 < bucket.delay(now) <= 0.1
+    bucket.block(now + 5)
+    assert bucket.delay(now) == 5
+
+
+def test_process_global_rate_splits_budget():
+    config = {'global_rate': 30, 'web_share': 0.2}
+    assert process_global_rate(config, 'web', 4) == 1.5
+    assert process_global_rate(config, 'bot', 2) == 12
+    assert process_global_rate({'global_rate': 0, 'web_share': 0.2}, 'web') == 0.1
+
+
+def test_higher_priority_goes_first():
+    sender = RecordingSender()
+    sender.gate = threading.Event()
+    scheduler = make_scheduler(sender, senders=1)
+    try:
+        first = send(scheduler, 1, 'busy', MARKETING)
+        assert sender.started.wait(2)
+        later = [send(scheduler, 2, 'marketing', MARKETING),
+                 send(scheduler, 3, 'notification', NOTIFICATION),
+                 send(scheduler, 4, 'reply', TRANSACTIONAL)]
+        sender.gate.set()
+        assert delivery_counts([first] + later) == (4, 0)
+    finally:
+        scheduler.stop(2)
+
+    assert sender.calls == ['busy', 'reply', 'notification', 'marketing']
+
+
+def test_chat_messages_keep_order_while_parked():
+    sender = RecordingSender(delay=0.02)
+    scheduler = make_scheduler(sender)
+    try:
+        futures = [send(scheduler, 1, f'm{number}') for number in range(6)]
+        futures += [send(scheduler, 2, f'other{number}') for number in range(3)]
+        assert delivery_counts(futures) == (9, 0)
+    finally:
+        scheduler.stop(2)
+
+    assert [text for text in sender.calls if text.startswith('m')] == [f'm{number}' for number in range(6)]
+    assert [text for text in sender.calls if text.startswith('other')] == ['other0', 'other1', 'other2']
+
+
+def test_429_is_retried_before_later_messages_of_the_chat():
+    sender = RecordingSender(too_many={'m0'})
+    scheduler = make_scheduler(sender)
+    try:
+        futures = [send(scheduler, 1, f'm{number}') for number in range(3)]
+        results = [future.result(5) for future in futures]
+    finally:
+        scheduler.stop(2)
+
+    assert [result['result'] for result in results] == ['m0', 'm1', 'm2']
+    assert sender.calls == ['m0', 'm0', 'm1', 'm2']
+    assert scheduler.stats['retried'] == 1
+
+
+def test_stop_drains_queue():
+    sender = RecordingSender(delay=0.01)
+    scheduler = make_scheduler(sender, global_rate=200)
+    futures = [send(scheduler, chat_id, f'm{chat_id}') for chat_id in range(20)]
+    scheduler.stop(5)
+
+    assert all(future.done() for future in futures)
+    assert delivery_counts(futures) == (20, 0)
+    assert scheduler.get_stats()['queued'] == 0
+
+
+def test_stop_resolves_leftovers_after_timeout():
+    sender = RecordingSender()
+    scheduler = make_scheduler(sender, global_rate=1)
+    futures = [send(scheduler, chat_id, f'm{chat_id}') for chat_id in range(10)]
+    scheduler.stop(0.2)
+
+    assert all(future.done() for future in futures)
+    sent, failed = delivery_counts(futures)
+    assert sent < 10 and sent + failed == 10
+
+
+def test_stop_resolves_pending_retry():
+    sender = RecordingSender(too_many={'m0'}, retry_after=30)
+    scheduler = make_scheduler(sender, global_pause_cap=0)
+    future = send(scheduler, 1, 'm0')
+    deadline = time.monotonic() + 2
+    while not scheduler.stats['retried'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop(0)
+
+    assert future.result(1) is None
@@ -0,0 +1,112 @@
+"""
+Тесты курсоров и страниц keyset-пагинации (pagination.py)
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pagination import AFTER, BEFORE, as_timestamp, decode_cursor, encode_cursor, make_page, split_cursor
+
+PRODUCT_ID = '6f1c2d3e-4b5a-4789-9abc-def012345678'
+CREATED = datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('values, expected', [
+    ((AFTER, CREATED, PRODUCT_ID), (AFTER, CREATED, PRODUCT_ID)),
+    ((uuid.UUID(PRODUCT_ID),), (PRODUCT_ID,)),
+    ((PRODUCT_ID.upper(),), (PRODUCT_ID,)),
+    ((datetime(2026, 1, 1, 10, 0),), (datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc),)),
+    ((datetime(1960, 5, 1, 0, 0, 0, 7, tzinfo=timezone.utc),), (datetime(1960, 5, 1, 0, 0, 0, 7, tzinfo=timezone.utc),)),
+    ((datetime(2026, 1, 1, 15, 0, tzinfo=timezone(timedelta(hours=5))),), (datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc),)),
+    ((0, -1, 2 ** 62), (0, -1, 2 ** 62)),
+    ((1.5, -0.25), (1.5, -0.25)),
+    ((None, '', 'Футболка', 'x' * 40), (None, '', 'Футболка', 'x' * 40)),
+])
+def test_cursor_round_trip(values, expected):
+    token = encode_cursor(*values)
+    assert '=' not in token and token.isascii()
+    assert decode_cursor(token) == expected
+
+
+def test_cursor_fits_callback_data():
+    token = encode_cursor(AFTER, CREATED, PRODUCT_ID)
+    assert len('pl1_' + token) <= 64
+
+
+def test_encode_rejects_bool_and_huge_strings():
+    with pytest.raises(TypeError):
+        encode_cursor(True)
+    with pytest.raises(ValueError):
+        encode_cursor('x' * 70000)
+
+
+@pytest.mark.parametrize('token', [
+    None, '', 'a', '!!!', '====', 'абв',
+    encode_cursor(AFTER, PRODUCT_ID)[:-3],            # обрезанный UUID
+    encode_cursor('abcdef')[:-2],                     # строка короче заявленной длины
+    encode_cursor(5)[:6],                             # неполное число
+    'WA',                                             # неизвестный тег 'X'
+])
+def test_corrupt_cursor_is_none(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.parametrize('token, expected', [
+    (None, (AFTER, None)),
+    ('garbage!', (AFTER, None)),
+    (encode_cursor('x', 1), (AFTER, None)),
+    (encode_cursor(AFTER), (AFTER, None)),
+    (encode_cursor(BEFORE, CREATED, 7), (BEFORE, (CREATED, 7))),
+])
+def test_split_cursor(token, expected):
+    assert split_cursor(token) == expected
+
+
+def test_as_timestamp_parses_rpc_strings():
+    assert as_timestamp('2026-10-18T12:30:15.123456Z') == CREATED
+    assert as_timestamp(CREATED) is CREATED
+    assert as_timestamp('not a date') == 'not a date'
+    assert as_timestamp(None) is None
+
+
+def _read(rows, limit, direction, key):
+    """Имитация запроса: строки по ключу в нужную сторону, LIMIT limit + 1"""
+    if key is None:
+        found = rows
+    elif direction == AFTER:
+        found = [row for row in rows if row > key[0]]
+    else:
+        found = [row for row in reversed(rows) if row < key[0]]
+    return found[:limit + 1]
+
+
+def _page(rows, limit, cursor=None):
+    direction, key = split_cursor(cursor)
+    return make_page(_read(rows, limit, direction, key), limit, direction, key, lambda row: (row,))
+
+
+def test_pages_walk_forward_and_back():
+    rows = list(range(1, 8))
+
+    first = _page(rows, 3)
+    assert first.items == [1, 2, 3] and first.prev_cursor is None
+    second = _page(rows, 3, first.next_cursor)
+    assert second.items == [4, 5, 6]
+    last = _page(rows, 3, second.next_cursor)
+    assert last.items == [7] and last.next_cursor is None
+
+    back = _page(rows, 3, last.prev_cursor)
+    assert back.items == [4, 5, 6] and back.next_cursor is not None
+    start = _page(rows, 3, back.prev_cursor)
+    assert start.items == [1, 2, 3] and start.prev_cursor is None
+
+
+@pytest.mark.parametrize('rows, limit, expected', [
+    ([], 3, ([], False, False)),
+    ([1, 2, 3], 3, ([1, 2, 3], False, False)),
+    ([1, 2, 3, 4], 3, ([1, 2, 3], True, False)),
+])
+def test_first_page_edges(rows, limit, expected):
+    page = make_page(rows, limit, key_func=lambda row: (row,))
+    assert (page.items, page.next_cursor is not None, page.prev_cursor is not None) == expected
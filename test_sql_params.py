@@ -0,0 +1,81 @@
+"""
+Тесты разбора плейсхолдеров (sql_params.py)
+"""
+from datetime import date
+from uuid import UUID
+
+import pytest
+
+from sql_params import _SEQUENTIAL as SEQ, inline_params, parse_placeholders, render_literal, to_pyformat
+
+
+@pytest.mark.parametrize('query, chunks, refs', [
+    ('SELECT 1', ('SELECT 1',), ()),
+    ('a = %s AND b = %s', ('a = ', ' AND b = ', ''), (SEQ, SEQ)),
+    ('a = ? AND b = ?', ('a = ', ' AND b = ', ''), (SEQ, SEQ)),
+    ('a = $2 OR b = $1 OR c = $2', ('a = ', ' OR b = ', ' OR c = ', ''), (1, 0, 1)),
+    # Строки, идентификаторы и комментарии не разбираются
+    ("x = '?' AND y = %s", ("x = '?' AND y = ", ''), (SEQ,)),
+    ("x = 'it''s %s' AND y = ?", ("x = 'it''s %%s' AND y = ", ''), (SEQ,)),
+    ('SELECT "we?rd" FROM t WHERE id = ?', ('SELECT "we?rd" FROM t WHERE id = ', ''), (SEQ,)),
+    ('x = ? -- why? %s\nAND y = ?', ('x = ', ' -- why? %%s\nAND y = ', ''), (SEQ, SEQ)),
+    ('x = /* ? %s */ ?', ('x = /* ? %%s */ ', ''), (SEQ,)),
+    # $$-строки с тегом и без
+    ('SELECT $fn$ ? %s $1 $fn$, $1', ('SELECT $fn$ ? %%s $1 $fn$, ', ''), (0,)),
+    ("DO $$ BEGIN PERFORM '?'; END $$", ("DO $$ BEGIN PERFORM '?'; END $$",), ()),
+    # Знак % вне плейсхолдера экранируется для psycopg
+    ("name LIKE 'a%' AND n % 2 = %s", ("name LIKE 'a%%' AND n %% 2 = ", ''), (SEQ,)),
+    ('n %% 2 = ?', ('n %% 2 = ', ''), (SEQ,)),
+    # Операторы jsonb
+    ('data ?| %s', ('data ?| ', ''), (SEQ,)),
+    ("data ?& array['a'] AND id = ?", ("data ?& array['a'] AND id = ", ''), (SEQ,)),
+    ("data ? 'key' AND id = %s", ("data ? 'key' AND id = ", ''), (SEQ,)),
+    ('data ? $1 AND id = $2', ('data ? ', ' AND id = ', ''), (0, 1)),
+])
+def test_parse_placeholders(query, chunks, refs):
+    assert parse_placeholders(query) == (chunks, refs)
+
+
+@pytest.mark.parametrize('query, params, expected', [
+    ('a = ? AND b = ?', (1, 'x'), ('a = %s AND b = %s', (1, 'x'))),
+    ('a = $1 OR b = $1', (7,), ('a = %s OR b = %s', (7, 7))),
+    ("a LIKE 'x%' AND b = ?", (2,), ("a LIKE 'x%%' AND b = %s", (2,))),
+    ('a = %s', ({'k': 'в'},), ('a = %s', ('{"k": "в"}',))),
+    ("a LIKE 'x%'", (), ("a LIKE 'x%'", None)),
+    ("a LIKE 'x%'", (1,), ("a LIKE 'x%'", None)),
+])
+def test_to_pyformat(query, params, expected):
+    assert to_pyformat(query, params) == expected
+
+
+@pytest.mark.parametrize('query, params, expected', [
+    ('a = ? AND b = ?', ("O'Brien", 3), "a = 'O''Brien' AND b = 3"),
+    ("a LIKE 'x%' AND b = $1 AND c = $1", (None,), "a LIKE 'x%' AND b = NULL AND c = NULL"),
+    ("data ?| %s AND n % 2 = 0", (['a', 'b'],), "data ?| ARRAY['a', 'b'] AND n % 2 = 0"),
+    ("x = '?'", (1,), "x = '?'"),
+])
+def test_inline_params(query, params, expected):
+    assert inline_params(query, params) == expected
+
+
+def test_missing_params_raise():
+    with pytest.raises(ValueError):
+        to_pyformat('a = ? AND b = ?', (1,))
+    with pytest.raises(ValueError):
+        inline_params('a = $2', (1,))
+
+
+@pytest.mark.parametrize('value, literal', [
+    (None, 'NULL'),
+    (True, 'true'),
+    (12, '12'),
+    (1.5, '1.5'),
+    (date(2026, 10, 18), "'2026-10-18'"),
+    (UUID('12345678-1234-5678-1234-567812345678'), "'12345678-1234-5678-1234-567812345678'"),
+    ({'a': 1}, '\'{"a": 1}\''),
+    ((1, 'b'), "ARRAY[1, 'b']"),
+    (b'\x01\xff', "'\\x01ff'::bytea"),
+    ("it's", "'it''s'"),
+])
+def test_render_literal(value, literal):
+    assert render_literal(value) == literal
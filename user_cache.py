@@ -0,0 +1,134 @@
+"""
+Кэш пользователей по telegram_id для SupabaseManager.
+
+Два уровня: кэш текущего апдейта (пользователь резолвится один раз на
+сообщение/callback, сколько бы обработчиков его ни спрашивали) и общий
+LRU с TTL между апдейтами. Методы, меняющие пользователя, сбрасывают запись.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_request_users = ContextVar('request_users', default=None)
+
+
+class UserIdentityCache:
+    """Ограниченный LRU с TTL плюс кэш в рамках одного апдейта"""
+
+    def __init__(self, max_size=5000, ttl=60):
+        self.max_size = max(0, max_size)
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (expires_at, user_row, user_id)
+        self._by_user_id = {}  # users.id -> telegram_id, для сброса по id
+        self._lock = threading.Lock()
+        self.stats = {
+            'request_hits': 0,
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Параметры из USER_CACHE_SIZE и USER_CACHE_TTL"""
+        try:
+            max_size = int(os.getenv('USER_CACHE_SIZE', 5000))
+            ttl = float(os.getenv('USER_CACHE_TTL', 60))
+        except ValueError:
+            max_size, ttl = 5000, 60
+        return cls(max_size=max_size, ttl=ttl)
+
+    @contextmanager
+    def request_scope(self):
+        """Кэш на время обработки одного апдейта"""
+        token = _request_users.set({})
+        try:
+            yield
+        finally:
+            _request_users.reset(token)
+
+    def get(self, telegram_id):
+        """Запись пользователя или None при промахе"""
+        scope = _request_users.get()
+        if scope is not None and telegram_id in scope:
+            self.stats['request_hits'] += 1
+            return scope[telegram_id]
+
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is not None:
+                expires_at, user, _ = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(telegram_id)
+                    self.stats['hits'] += 1
+                else:
+                    del self._entries[telegram_id]
+                    self._by_user_id.pop(entry[2], None)
+                    user = None
+            else:
+                user = None
+            if user is None:
+                self.stats['misses'] += 1
+                return None
+
+        if scope is not None:
+            scope[telegram_id] = user
+        return user
+
+    def put(self, telegram_id, user, user_id=None):
+        """Сохранение найденного пользователя в оба уровня"""
+        scope = _request_users.get()
+        if scope is not None:
+            scope[telegram_id] = user
+        if not self.max_size or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[telegram_id] = (time.monotonic() + self.ttl, user, user_id)
+            self._entries.move_to_end(telegram_id)
+            if user_id is not None:
+                self._by_user_id[user_id] = telegram_id
+            while len(self._entries) > self.max_size:
+                _, (_, _, old_user_id) = self._entries.popitem(last=False)
+                self._by_user_id.pop(old_user_id, None)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, telegram_id=None, user_id=None):
+        """Сброс записи по telegram_id или по users.id"""
+        with self._lock:
+            if telegram_id is None and user_id is not None:
+                telegram_id = self._by_user_id.pop(user_id, None)
+            if telegram_id is None:
+                # Пользователь не в LRU; в кэше апдейта ищем по id
+                scope = _request_users.get()
+                if scope and user_id is not None:
+                    for tid, user in list(scope.items()):
+                        if user and user[0][0] == user_id:
+                            del scope[tid]
+                return
+            entry = self._entries.pop(telegram_id, None)
+            if entry is not None:
+                self._by_user_id.pop(entry[2], None)
+            self.stats['invalidations'] += 1
+        scope = _request_users.get()
+        if scope is not None:
+            scope.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user_id.clear()
+        scope = _request_users.get()
+        if scope is not None:
+            scope.clear()
+
+    def get_stats(self):
+        """Счётчики попаданий/промахов и размер"""
+        with self._lock:
+            lookups = self.stats['request_hits'] + self.stats['hits'] + self.stats['misses']
+            hit_rate = (lookups - self.stats['misses']) / lookups if lookups else 0.0
+            return dict(self.stats, size=len(self._entries), max_size=self.max_size,
+                        ttl=self.ttl, hit_rate=round(hit_rate, 4))
@@ -46,28 +46,33 @@ def truncate_text(text, max_length=100):
         return text
     return text[:max_length-3] + "..."
 
-def create_pagination_keyboard(current_page, total_pages, callback_prefix):
-    """Создание клавиатуры для пагинации"""
+def create_pagination_keyboard(prev_cursor, next_cursor, callback_prefix, label=None):
+    """Создание клавиатуры для пагинации по курсорам.
+
+    callback_data кнопки — callback_prefix + курсор (см. pagination.py);
+    вместе они должны укладываться в 64 байта.
+    """
     keyboard = []
     
-    if total_pages > 1:
+    if prev_cursor or next_cursor:
         row = []
         
-        if current_page > 1:
+        if prev_cursor:
             row.append({
                 'text': '⬅️ Назад',
-                'callback_data': f'{callback_prefix}_{current_page - 1}'
+                'callback_data': f'{callback_prefix}{prev_cursor}'
             })
         
-        row.append({
-            'text': f'{current_page}/{total_pages}',
-            'callback_data': 'current_page'
-        })
+        if label:
+            row.append({
+                'text': label,
+                'callback_data': 'current_page'
+            })
         
-        if current_page < total_pages:
+        if next_cursor:
             row.append({
                 'text': 'Вперед ➡️',
-                'callback_data': f'{callback_prefix}_{current_page + 1}'
+                'callback_data': f'{callback_prefix}{next_cursor}'
             })
         
         keyboard.append(row)
@@ -169,30 +174,13 @@ def create_stars_display(rating):
     return stars
 
 def send_telegram_message(bot_token, chat_id, text, reply_markup=None):
-    """Универсальная функция отправки сообщений"""
-    import json
-    import urllib.request
-    import urllib.parse
-    
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    data = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'HTML'
-    }
-    
-    if reply_markup:
-        data['reply_markup'] = json.dumps(reply_markup)
+    """Универсальная функция отправки сообщений (общий keep-alive клиент)"""
+    from telegram_api import get_client
     
-    try:
-        data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-        req = urllib.request.Request(url, data=data_encoded, method='POST')
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('ok', False)
-    except Exception as e:
-        logging.info(f"Ошибка отправки сообщения: {e}")
-        return False
+    result = get_client(bot_token).send_message(chat_id, text, reply_markup)
+    if result is None:
+        logging.info("Ошибка отправки сообщения")
+    return bool(result and result.get('ok', False))
 
 def schedule_notification(notification_manager, notification_type, delay_hours=0):
     """Планирование отправки уведомлений"""
@@ -252,7 +240,7 @@ def send_push_to_user(bot, user_id, title, message, notification_type='info'):
         db = DatabaseManager()
         
         user = db.execute_query(
-            'SELECT telegram_id, language FROM users WHERE id = %s',
+            'SELECT telegram_id, language FROM public.users WHERE id = %s',
             (user_id,)
         )
         
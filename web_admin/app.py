@@ -66,7 +66,7 @@ def _triple_from_row(row):
 import os
 import sys
 import uuid
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from uuid import UUID
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory
 
@@ -75,6 +75,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from supabase_db import SupabaseManager as DatabaseManager
 from web_admin.bot_integration import TelegramBotIntegration
+from pagination import AFTER, make_page, split_cursor, as_timestamp
+from broadcast import AUDIENCES, BroadcastEngine, localize_message
+from analytics import get_daily_sales, get_sales_totals, get_top_products
+from config import EXPORT_CONFIG, WEB_CACHE_CONFIG
+from web_admin.cache import ViewCache
+from web_admin.exports import export_format, export_response
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -83,6 +89,8 @@ app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-in-produc
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 db = DatabaseManager()
 telegram_bot = TelegramBotIntegration()
+broadcasts = BroadcastEngine(db, telegram_bot.api, localize_message)
+view_cache = ViewCache(**WEB_CACHE_CONFIG)
 
 # Настройки загрузки файлов
 UPLOAD_FOLDER = 'static/uploads'
@@ -126,36 +134,42 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def _db_today():
+    """Текущая дата по часам БД — sales_daily ведётся по created_at::date"""
+    rows = db.execute_query('SELECT CURRENT_DATE')
+    if rows and rows[0][0]:
+        # И пул, и exec_sql отдают дату строкой 'YYYY-MM-DD'
+        try:
+            return date.fromisoformat(str(rows[0][0])[:10])
+        except ValueError:
+            pass
+    return datetime.now().date()
+
+
 @app.route('/')
 @login_required
 def dashboard():
-    # Собираем данные для дашборда (безопасно по нулевым значениям)
-    try:
-        _row_today = db.execute_query('''
-            SELECT COUNT(*) AS orders_today, COALESCE(SUM(total_amount),0) AS revenue_today,
-                   COUNT(DISTINCT user_id) AS customers_today
-            FROM orders
-            WHERE DATE(created_at) = DATE('now')
-        ''') or {}
-    except Exception:
-        _row_today = {}
+    today = _db_today()
+    data = view_cache.get('dashboard', {'day': today}, lambda: _dashboard_data(today),
+                          tags=('orders', 'products', 'customers'))
+    return render_template('dashboard.html', **data)
 
+
+def _dashboard_data(today):
+    # Собираем данные для дашборда из дневной сводки sales_daily (без отменённых заказов)
+    yesterday = today - timedelta(days=1)
     try:
-        _row_yesterday = db.execute_query('''
-            SELECT COUNT(*) AS orders_yesterday, COALESCE(SUM(total_amount),0) AS revenue_yesterday
-            FROM orders
-            WHERE DATE(created_at) = (NOW() - INTERVAL '1 day')
-        ''') or {}
+        _days = {str(row[0])[:10]: row for row in get_daily_sales(db, yesterday.isoformat(), today.isoformat())}
     except Exception:
-        _row_yesterday = {}
+        _days = {}
+    _today = _days.get(today.isoformat()) or (today, 0, 0, 0, 0)
+    _yesterday = _days.get(yesterday.isoformat()) or (yesterday, 0, 0, 0, 0)
+    _row_today = {'orders_today': _today[1], 'revenue_today': _today[2], 'customers_today': _today[4]}
+    _row_yesterday = {'orders_yesterday': _yesterday[1], 'revenue_yesterday': _yesterday[2]}
 
     try:
-        _row_total = db.execute_query('''
-            SELECT COUNT(DISTINCT user_id) AS total_customers,
-                   COUNT(*) AS total_orders,
-                   COALESCE(SUM(total_amount),0) AS total_revenue
-            FROM orders
-        ''') or {}
+        _customers, _orders, _revenue = get_sales_totals(db)
+        _row_total = {'total_customers': _customers, 'total_orders': _orders, 'total_revenue': _revenue}
     except Exception:
         _row_total = {}
 
@@ -177,20 +191,13 @@ def dashboard():
     # Последние заказы и топ-товары
     recent_orders = db.execute_query('''
         SELECT o.id, o.total_amount, o.status, o.created_at, u.name
-        FROM orders o
-        JOIN users u ON o.user_id = u.id
+        FROM public.orders o
+        JOIN public.users u ON o.user_id = u.id
         ORDER BY o.created_at DESC
         LIMIT 10
     ''') or []
 
-    top_products = db.execute_query('''
-        SELECT p.name, SUM(oi.quantity) AS qty, COALESCE(SUM(oi.quantity * oi.price),0) AS revenue
-        FROM order_items oi
-        JOIN products p ON p.id = oi.product_id
-        GROUP BY p.name
-        ORDER BY revenue DESC
-        LIMIT 10
-    ''') or []
+    top_products = get_top_products(db)
 
     top_products_tuples = []
     for _r in top_products:
@@ -210,7 +217,7 @@ def dashboard():
     except Exception:
         top_max = 0
 
-    return render_template('dashboard.html',
+    return dict(
         today_stats=today_stats_tuple,
         yesterday_stats=yesterday_stats_tuple,
         total_stats=total_stats_tuple,
@@ -218,10 +225,11 @@ def dashboard():
         top_products=top_products_tuples,
         top_max=top_max
     )
+
 @app.route('/orders')
 @login_required
 def orders():
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor', '')
     per_page = 20
     status_filter = request.args.get('status', '')
     search = request.args.get('search', '')
@@ -230,8 +238,8 @@ def orders():
     query = '''
         SELECT o.id, o.total_amount, o.status, o.created_at, u.name, u.phone, u.email, 
                o.delivery_address, o.payment_method
-        FROM orders o
-        JOIN users u ON o.user_id = u.id
+        FROM public.orders o
+        JOIN public.users u ON o.user_id = u.id
         WHERE 1=1
     '''
     params = []
@@ -242,25 +250,28 @@ def orders():
         params.append(status_filter)
     
     if search:
-        query += ' AND (u.name LIKE ? OR o.id = %s)'
+        query += ' AND (u.name LIKE %s OR o.id::text = %s)'
         params.extend([f'%{search}%', search])
     
-    query += ' ORDER BY o.created_at DESC'
-    
-    # Получаем все заказы для подсчета страниц
-    all_orders = db.execute_query(query, params)
-    total_orders = len(all_orders) if all_orders else 0
-    total_pages = (total_orders + per_page - 1) // per_page
+    # Keyset-пагинация: страница читается от ключа (created_at, id) из курсора,
+    # без OFFSET и без подсчёта всех заказов
+    direction, key = split_cursor(cursor)
+    if key is not None and len(key) == 2:
+        query += ' AND (o.created_at, o.id) < (%s, %s)' if direction == AFTER else ' AND (o.created_at, o.id) > (%s, %s)'
+        params.extend(key)
+    else:
+        key = None
+    order = 'DESC' if direction == AFTER else 'ASC'
+    query += f' ORDER BY o.created_at {order}, o.id {order} LIMIT %s'
+    params.append(per_page + 1)
     
-    # Получаем заказы для текущей страницы
-    offset = (page - 1) * per_page
-    paginated_query = query + f' LIMIT {per_page} OFFSET {offset}'
-    orders_data = db.execute_query(paginated_query, params)
+    page = make_page(db.execute_query(query, tuple(params)), per_page, direction, key,
+                     lambda row: (as_timestamp(row[3]), row[0]))
     
     return render_template('orders.html',
-                         orders=orders_data or [],
-                         current_page=page,
-                         total_pages=total_pages,
+                         orders=page.items,
+                         next_cursor=page.next_cursor,
+                         prev_cursor=page.prev_cursor,
                          status_filter=status_filter,
                          search=search)
 
@@ -270,80 +281,67 @@ def products():
     # Фильтры
     q = request.args.get('search', '').strip()
     category_filter = request.args.get('category', '').strip()
-    page = _int_or(request.args.get('page', 1), 1)
+    cursor = request.args.get('cursor', '')
     per_page = _int_or(request.args.get('per_page', 10), 10)
     if per_page <= 0 or per_page > 50:
         per_page = 10
-    offset = (page - 1) * per_page
 
     where = "WHERE 1=1"
     params = []
     if q:
-        where += " AND (p.name LIKE ? OR p.description LIKE %s)"
+        where += " AND (p.name LIKE %s OR p.description LIKE %s)"
         pattern = f"%{q}%"
         params.extend([pattern, pattern])
     if category_filter:
-        where += " AND p.category_id = %s"
-        params.append(int(category_filter))
-
-    # Total count
-    # Robust total extraction (handles dict/list/None)
-    try:
-        _row_total = total if isinstance(total, dict) else (total[0] if isinstance(total, (list, tuple)) and total else {})
-    except Exception:
-        _row_total = {}
-    total_num = _num_from_row(_row_total, ['total','count','cnt','total_count','total_products','items','rows'], 0)
-    try:
-        total_pages = max(1, int((total_num + per_page - 1) // per_page))
-    except Exception:
-        total_pages = 1
-    total_rows = db.execute_query(f"SELECT COUNT(*) FROM products p {where}", tuple(params)) or [(0,)]
+        where += " AND p.category_id::text = %s"
+        params.append(category_filter)
+
+    def count_products():
+        rows = db.execute_query(f"SELECT COUNT(*) FROM public.products p {where}", tuple(params))
+        return int(rows[0][0] or 0) if rows else 0
+
+    # Счётчик не пересчитывается на каждой странице: кэш до изменения товаров
+    total_num = view_cache.get('products_count', {'search': q, 'category': category_filter},
+                               count_products, tags=('products',))
+
+    # Keyset по (created_at, id), новые первыми: id — UUID и сам по времени
+    # не упорядочен, он только разводит товары с одинаковым created_at
+    direction, key = split_cursor(cursor)
+    page_where = where
+    page_params = list(params)
+    if key is not None and len(key) == 2:
+        page_where += (" AND (p.created_at, p.id) < (%s, %s)" if direction == AFTER
+                       else " AND (p.created_at, p.id) > (%s, %s)")
+        page_params.extend(key)
+    else:
+        key = None
+    order = 'DESC' if direction == AFTER else 'ASC'
 
     # Data with category name
     rows = db.execute_query(
         f"""
         SELECT p.id, p.name, p.price, p.stock, p.is_active,
                c.name as category_name,
-               p.sales_count, p.views, p.image_url
-        FROM products p
-        LEFT JOIN categories c ON c.id = p.category_id
-        {where}
-        ORDER BY p.id DESC
-        LIMIT ? OFFSET ?
+               p.sales_count, p.views, p.image_url, p.created_at
+        FROM public.products p
+        LEFT JOIN public.categories c ON c.id = p.category_id
+        {page_where}
+        ORDER BY p.created_at {order}, p.id {order}
+        LIMIT %s
         """,
-        tuple(params + [per_page, offset])
-    ) or []
+        tuple(page_params + [per_page + 1])
+    )
+    page = make_page(rows, per_page, direction, key, lambda row: (as_timestamp(row[9]), row[0]))
 
     categories = db.get_categories() or []
-    # --- Ensure total_num by COUNT query (robust) ---
-    try:
-        _row_total = total if isinstance(total, dict) else (total[0] if isinstance(total, (list, tuple)) and total else None)
-    except Exception:
-        _row_total = None
-    if not _row_total:
-        try:
-            params_cnt = list(params) if isinstance(params, list) else []
-            cnt_rows = db.execute_query(f'''
-                SELECT COUNT(*) AS total
-                FROM products p
-                {where}
-            ''', tuple(params_cnt) if params_cnt else None)
-            _row_total = cnt_rows if isinstance(cnt_rows, dict) else (cnt_rows[0] if isinstance(cnt_rows, (list, tuple)) and cnt_rows else {})
-        except Exception:
-            _row_total = {}
-    total_num = _num_from_row(_row_total, ['total','count','cnt','total_count','total_products','rows'], 0)
-    try:
-        total_pages = max(1, int((total_num + per_page - 1) // per_page))
-    except Exception:
-        total_pages = 1
     return render_template('products.html',
-                           products=rows,
+                           products=page.items,
                            categories=categories,
                            search=q,
-                           category_filter=str(category_filter) if category_filter else '',
-                           current_page=page,
+                           category_filter=category_filter,
                            per_page=per_page,
-                           total_pages=total_pages,
+                           next_cursor=page.next_cursor,
+                           prev_cursor=page.prev_cursor,
                            total=total_num)
 
 @app.route('/add_product', methods=['GET', 'POST'])
@@ -370,11 +368,12 @@ def add_product():
                 image_url = url_for('uploaded_file', filename=filename, _external=False)
 
         res = db.execute_query(
-            """INSERT INTO products (name, description, price, category_id, subcategory_id, brand, image_url, stock, is_active, cost_price)
+            """INSERT INTO public.products (name, description, price, category_id, subcategory_id, brand, image_url, stock, is_active, cost_price)
                 VALUES (%s, %s, %s, %s, NULL, %s, %s, %s, 1, %s)""",
             (name, description, price, category_id, brand, image_url, stock, cost_price)
         )
         if res:
+            view_cache.invalidate('products')
             telegram_bot.trigger_bot_data_reload()
             flash(f'Товар "{name}" успешно добавлен!')
             return redirect(url_for('products'))
@@ -408,11 +407,12 @@ def edit_product(product_id):
                 image_url = url_for('uploaded_file', filename=filename, _external=False)
 
         res = db.execute_query(
-            """UPDATE products SET name=?, description=?, price=?, category_id=?, brand=?,
+            """UPDATE public.products SET name=?, description=?, price=?, category_id=?, brand=?,
                image_url=?, stock=?, cost_price=? WHERE id=?""",
             (name, description, price, category_id, brand, image_url, stock, cost_price, product_id)
         )
         if res:
+            view_cache.invalidate('products')
             telegram_bot.trigger_bot_data_reload()
             flash(f'Товар "{name}" успешно обновлен!')
             return redirect(url_for('products'))
@@ -421,7 +421,7 @@ def edit_product(product_id):
 
     product = db.execute_query('''
         SELECT id, name, description, price, cost_price, category_id, brand, stock, image_url
-        FROM products WHERE id::text = %s
+        FROM public.products WHERE id::text = %s
     ''', (str(product_id),))
 
     if not product:
@@ -441,8 +441,8 @@ def categories():
     categories_data = db.execute_query('''
         SELECT c.id, c.name, c.description, c.emoji, c.is_active,
                COUNT(p.id) as products_count
-        FROM categories c
-        LEFT JOIN products p ON c.id = p.category_id AND p.is_active = 1
+        FROM public.categories c
+        LEFT JOIN public.products p ON c.id = p.category_id AND p.is_active = TRUE
         GROUP BY c.id, c.name, c.description, c.emoji, c.is_active
         ORDER BY c.name
     ''')
@@ -458,7 +458,7 @@ def add_category():
         emoji = request.form.get('emoji', '')
         
         category_id = db.execute_query('''
-            INSERT INTO categories (name, description, emoji)
+            INSERT INTO public.categories (name, description, emoji)
             VALUES (%s, %s, %s)
         ''', (name, description, emoji))
         
@@ -472,6 +472,7 @@ def add_category():
             telegram_bot.notify_admins(admin_message)
             
             # Сигнализируем боту о необходимости обновления
+            view_cache.invalidate('categories')
             telegram_bot.trigger_bot_data_reload()
             
             flash(f'Категория "{name}" успешно добавлена!')
@@ -494,9 +495,9 @@ def customers():
                COUNT(o.id) as orders_count,
                COALESCE(SUM(o.total_amount), 0) as total_spent,
                MAX(o.created_at) as last_order
-        FROM users u
-        LEFT JOIN orders o ON u.id = o.user_id AND o.status != 'cancelled'
-        WHERE u.is_admin = 0
+        FROM public.users u
+        LEFT JOIN public.orders o ON u.id = o.user_id AND o.status != 'cancelled'
+        WHERE u.is_admin = FALSE
     '''
     params = []
     
@@ -536,7 +537,7 @@ def customer_profile(customer_id):
         customer = db.execute_query('''
             SELECT id, telegram_id, full_name, phone, language_code,
                    created_at, is_active, is_banned
-            FROM users
+            FROM public.users
             WHERE id = %s
         ''', (customer_id,))
 
@@ -548,7 +549,7 @@ def customer_profile(customer_id):
 
         orders = db.execute_query('''
             SELECT id, created_at, total_amount, status, delivery_address
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s
             ORDER BY created_at DESC
             LIMIT 20
@@ -559,7 +560,7 @@ def customer_profile(customer_id):
                 COUNT(*) as total_orders,
                 COALESCE(SUM(CASE WHEN status != 'cancelled' THEN total_amount ELSE 0 END), 0) as total_spent,
                 COALESCE(AVG(CASE WHEN status != 'cancelled' THEN total_amount ELSE NULL END), 0) as avg_order
-            FROM orders
+            FROM public.orders
             WHERE user_id = %s
         ''', (customer_id,))
 
@@ -586,19 +587,9 @@ def analytics_page():
     }
 
     try:
-        stats = db.execute_query('''
-            SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(AVG(total_amount), 0)
-            FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
-            AND status != 'cancelled'
-        ''', (start_date, end_date))
-
-        if stats and stats[0]:
-            sales_report = {
-                'total_orders': stats[0][0],
-                'total_revenue': stats[0][1],
-                'avg_order_value': stats[0][2]
-            }
+        sales_report = view_cache.get('analytics', {'start': start_date, 'end': end_date},
+                                      lambda: _analytics_data(start_date, end_date),
+                                      tags=('orders',)) or sales_report
     except Exception as e:
         flash(f'Ошибка загрузки данных: {e}')
 
@@ -608,30 +599,49 @@ def analytics_page():
                            end=end_date)
 
 
+def _analytics_data(start_date, end_date):
+    stats = db.execute_query('''
+        SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(AVG(total_amount), 0)
+        FROM public.orders
+        WHERE created_at::date BETWEEN ? AND ?
+        AND status != 'cancelled'
+    ''', (start_date, end_date))
+
+    if stats and stats[0]:
+        return {
+            'total_orders': stats[0][0],
+            'total_revenue': stats[0][1],
+            'avg_order_value': stats[0][2]
+        }
+    return None
+
+
 @app.route('/crm')
 @login_required
 def crm_page():
+    data = view_cache.get('crm', {}, _crm_data, tags=('orders', 'customers'))
+    return render_template('crm.html', **data)
+
+
+def _crm_data():
     try:
         from crm import CRMManager
         crm_manager = CRMManager(db)
         
         segments = crm_manager.segment_customers()
         at_risk_customers = crm_manager.get_churn_risk_customers()
+        cohorts = crm_manager.get_cohort_retention()
         
-        return render_template('crm.html',
-                             segments=segments,
-                             at_risk_customers=at_risk_customers)
+        return {'segments': segments, 'at_risk_customers': at_risk_customers, 'cohorts': cohorts}
     except ImportError:
         # Фолбэк: простая сегментация RFM без внешнего модуля
         segments = {'champions': [], 'loyal': [], 'at_risk': [], 'new': []}
         rows = db.execute_query("""
             SELECT u.id, u.name, COUNT(o.id) as orders, COALESCE(SUM(o.total_amount),0) as spent,
                    MAX(o.created_at) as last_date
-            FROM users u LEFT JOIN orders o ON o.user_id=u.id AND o.status!='cancelled'
+            FROM public.users u LEFT JOIN public.orders o ON o.user_id=u.id AND o.status!='cancelled'
             GROUP BY u.id, u.name
         """) or []
-        from datetime import datetime
-        import time
         now = datetime.now()
         for r in rows:
             uid, name, orders, spent, last_date = r
@@ -648,7 +658,7 @@ def crm_page():
                 segments['loyal'].append((uid, name, orders, spent))
             else:
                 segments['new'].append((uid, name, orders, spent))
-        return render_template('crm.html', segments=segments, at_risk_customers=segments['at_risk'])
+        return {'segments': segments, 'at_risk_customers': segments['at_risk']}
 
 @app.route('/scheduled_posts')
 @login_required
@@ -657,15 +667,15 @@ def scheduled_posts():
         posts = db.execute_query('''
             SELECT id, title, content, time_morning, time_afternoon, time_evening,
                    target_audience, is_active, created_at, updated_at
-            FROM scheduled_posts
+            FROM public.scheduled_posts
             ORDER BY created_at DESC
         ''')
         
         # Статистика за последние 7 дней
         stats = db.execute_query('''
             SELECT sp.title, ps.time_period, ps.sent_count, ps.error_count
-            FROM post_statistics ps
-            JOIN scheduled_posts sp ON ps.post_id = sp.id
+            FROM public.post_statistics ps
+            JOIN public.scheduled_posts sp ON ps.post_id = sp.id
             WHERE ps.sent_at >= (NOW() - INTERVAL '7 day')
             ORDER BY ps.sent_at DESC
             LIMIT 10
@@ -705,7 +715,7 @@ def create_post():
             image_url = request.form['image_url']
         
         post_id = db.execute_query('''
-            INSERT INTO scheduled_posts (
+            INSERT INTO public.scheduled_posts (
                 title, content, time_morning, time_afternoon, time_evening,
                 target_audience, image_url, is_active, created_at
             ) VALUES (%s, %s, %s, %s, %s, %s, %s, 1, %s)
@@ -750,7 +760,7 @@ def edit_post(post_id):
                 image_url = f'/static/uploads/{filename}'
         
         result = db.execute_query('''
-            UPDATE scheduled_posts 
+            UPDATE public.scheduled_posts 
             SET title = %s, content = %s, time_morning = %s, time_afternoon = %s, 
                 time_evening = %s, target_audience = %s, image_url = %s, updated_at = %s
             WHERE id = %s
@@ -769,7 +779,7 @@ def edit_post(post_id):
             flash('Ошибка обновления поста')
     
     # Получаем данные поста
-    post = db.execute_query('SELECT * FROM scheduled_posts WHERE id = %s', (post_id,))
+    post = db.execute_query('SELECT * FROM public.scheduled_posts WHERE id = %s', (post_id,))
     if not post:
         flash('Пост не найден')
         return redirect(url_for('scheduled_posts'))
@@ -783,7 +793,7 @@ def send_now_post():
     
     # Получаем данные поста
     post_data = db.execute_query(
-        'SELECT title, content, target_audience, image_url FROM scheduled_posts WHERE id = %s',
+        'SELECT title, content, target_audience, image_url FROM public.scheduled_posts WHERE id = %s',
         (post_id,)
     )
     if not post_data:
@@ -819,24 +829,12 @@ def send_now_post():
             else:
                 error_count = 1
         else:
-            # Отправка пользователям
-            recipients = posts_manager.get_recipients(target_audience)
-            logging.info(f"send_now_post recipients count={len(recipients) if recipients else 0}")
-            for recipient in recipients:
-                try:
-                    telegram_id = recipient[0] if isinstance(recipient, (list, tuple)) else recipient.get('telegram_id')
-                    if image_url:
-                        result = telegram_bot.send_photo(telegram_id, image_url, message_text, keyboard)
-                    else:
-                        result = telegram_bot.send_message(telegram_id, message_text, keyboard)
-                    ok = bool(result and isinstance(result, dict) and result.get('ok'))
-                    if ok:
-                        success_count += 1
-                    else:
-                        error_count += 1
-                except Exception as e:
-                    error_count += 1
-                    logging.info(f"Ошибка отправки пользователю: {e}")
+            # Отправка пользователям — фоновым заданием рассылки (прогресс: /broadcast_jobs/<id>)
+            segment = target_audience if target_audience in AUDIENCES else 'all'
+            job_id = broadcasts.start(segment, message_text, kind='post', image_url=image_url,
+                                      reply_markup=keyboard, post_id=post_id, time_period='manual')
+            flash(f'📨 Рассылка запущена (задание {job_id or "без сохранения прогресса"}).')
+            return redirect(url_for('scheduled_posts'))
         
         # Триггерим перезагрузку данных у бота — чтобы в админ-чат пришло "Данные обновлены"
         try:
@@ -901,7 +899,7 @@ def toggle_post_status():
     new_status = not current_status
 
     result = db.execute_query(
-        'UPDATE scheduled_posts SET is_active = %s WHERE id = %s',
+        'UPDATE public.scheduled_posts SET is_active = %s WHERE id = %s',
         (new_status, post_id)
     )
 
@@ -923,7 +921,7 @@ def toggle_post_status():
 def delete_post():
     post_id = request.form['post_id']
     
-    result = db.execute_query('DELETE FROM scheduled_posts WHERE id = %s', (post_id,))
+    result = db.execute_query('DELETE FROM public.scheduled_posts WHERE id = %s', (post_id,))
     
     if result and result > 0:
         # Сигнализируем боту о необходимости обновления
@@ -944,12 +942,13 @@ def update_order_status():
     result = db.update_order_status(order_id, status)
     
     if result and result > 0:
+        view_cache.invalidate('orders')
         # Уведомляем клиента об изменении статуса
         try:
             order_details = db.get_order_details(order_id)
             if order_details:
                 user_id = order_details['order'][1]
-                user = db.execute_query('SELECT telegram_id, name FROM users WHERE id = %s', (user_id,))
+                user = db.execute_query('SELECT telegram_id, name FROM public.users WHERE id = %s', (user_id,))
                 
                 if user:
                     status_messages = {
@@ -988,7 +987,7 @@ def order_detail(order_id):
 @app.route('/toggle_product/<string:product_id>', methods=['POST'])
 @login_required
 def toggle_product(product_id):
-    product = db.execute_query('SELECT is_active FROM products WHERE id::text = %s', (str(product_id),))
+    product = db.execute_query('SELECT is_active FROM public.products WHERE id::text = %s', (str(product_id),))
     if not product:
         flash('Товар не найден')
         return redirect(url_for('products'))
@@ -998,11 +997,12 @@ def toggle_product(product_id):
     current_status = str(current_raw).strip().lower() in ('1','true','on','yes')
     new_status = not current_status
     result = db.execute_query(
-        'UPDATE products SET is_active = %s WHERE id = %s',
+        'UPDATE public.products SET is_active = %s WHERE id = %s',
         (new_status, product_id)
     )
 
     if result and result > 0:
+        view_cache.invalidate('products')
         telegram_bot.trigger_bot_data_reload()
         status_text = "активирован" if new_status else "скрыт"
         flash(f'Товар {status_text}!')
@@ -1020,11 +1020,12 @@ def toggle_product_status():
     current_status = str(current_raw).strip().lower() in ('1','true','on','yes')
     new_status = not current_status
     result = db.execute_query(
-        'UPDATE products SET is_active = %s WHERE id = %s',
+        'UPDATE public.products SET is_active = %s WHERE id = %s',
         (new_status, product_id)
     )
 
     if result and result > 0:
+        view_cache.invalidate('products')
         telegram_bot.trigger_bot_data_reload()
         status_text = "активирован" if new_status else "скрыт"
         flash(f'Товар {status_text}!')
@@ -1036,12 +1037,13 @@ def toggle_product_status():
 @app.route('/delete_product/<string:product_id>', methods=['POST'])
 @login_required
 def delete_product(product_id):
-    product = db.execute_query('SELECT name FROM products WHERE id::text = %s', (str(product_id),))
+    product = db.execute_query('SELECT name FROM public.products WHERE id::text = %s', (str(product_id),))
     product_name = (product.get('name') if isinstance(product, dict) else ( (product[0].get('name') if isinstance(product[0], dict) else (str((str(product[0][0]) if isinstance(product, (list, tuple)) and product and isinstance(product[0], (list, tuple)) and len(product[0])>0 else None)) if isinstance(product[0], (list, tuple)) and len(product[0])>0 else None) ) if isinstance(product, (list, tuple)) and product else None)) or f"ID {product_id}"
 
-    result = db.execute_query('DELETE FROM products WHERE id::text = %s', (str(product_id),))
+    result = db.execute_query('DELETE FROM public.products WHERE id::text = %s', (str(product_id),))
 
     if result and result > 0:
+        view_cache.invalidate('products')
         telegram_bot.trigger_bot_data_reload()
         flash(f'Товар "{product_name}" удален!')
     else:
@@ -1054,12 +1056,13 @@ def delete_product(product_id):
 def delete_product_old():
     product_id = request.form['product_id']
 
-    product = db.execute_query('SELECT name FROM products WHERE id::text = %s', (str(product_id),))
+    product = db.execute_query('SELECT name FROM public.products WHERE id::text = %s', (str(product_id),))
     product_name = product[0][0] if product else f"ID {product_id}"
 
-    result = db.execute_query('DELETE FROM products WHERE id::text = %s', (str(product_id),))
+    result = db.execute_query('DELETE FROM public.products WHERE id::text = %s', (str(product_id),))
 
     if result and result > 0:
+        view_cache.invalidate('products')
         telegram_bot.trigger_bot_data_reload()
         flash(f'Товар "{product_name}" удален!')
     else:
@@ -1108,33 +1111,10 @@ def send_broadcast():
     target_audience = request.form['target_audience']
     
     try:
-        # Получаем список получателей
-        if target_audience == 'all':
-            recipients = db.execute_query(
-                'SELECT telegram_id, name, language FROM users WHERE is_admin = FALSE'
-            )
-        elif target_audience == 'active':
-            recipients = db.execute_query('''
-                SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
-                WHERE u.is_admin = 0 AND o.created_at >= NOW() - INTERVAL '30 days'
-            ''')
-        elif target_audience == 'vip':
-            recipients = db.execute_query('''
-                SELECT DISTINCT u.telegram_id, u.name, u.language
-                FROM users u
-                JOIN orders o ON u.id = o.user_id
-                WHERE u.is_admin = 0
-                GROUP BY u.id
-                HAVING SUM(o.total_amount) >= 500
-            ''')
-        else:
-            recipients = []
-        
-        if recipients:
-            success_count, error_count = telegram_bot.send_broadcast(message, recipients)
-            flash(f'Рассылка завершена! Отправлено: {success_count}, Ошибок: {error_count}')
+        if target_audience in ('all', 'active', 'vip'):
+            # Фоновое задание: получатели пачками, прогресс сохраняется после каждой пачки
+            job_id = broadcasts.start(target_audience, message, kind='admin')
+            flash(f'📨 Рассылка запущена (задание {job_id or "без сохранения прогресса"}).')
         else:
             flash('Нет получателей для рассылки')
             
@@ -1143,6 +1123,21 @@ def send_broadcast():
     
     return redirect(url_for('customers'))
 
+@app.route('/broadcast_jobs/<job_id>')
+@login_required
+def broadcast_job_progress(job_id):
+    """Прогресс рассылки: обработано, отправлено, ошибок, сообщений в секунду"""
+    progress = broadcasts.get_progress(job_id)
+    if progress is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(progress)
+
+@app.route('/broadcast_jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_broadcast_job(job_id):
+    broadcasts.cancel(job_id)
+    return jsonify({'ok': True})
+
 @app.route('/toggle_category_status', methods=['POST'])
 @login_required
 def toggle_category_status():
@@ -1152,12 +1147,13 @@ def toggle_category_status():
     current_status = str(current_raw).strip().lower() in ('1','true','on','yes')
     new_status = not current_status
     result = db.execute_query(
-        'UPDATE categories SET is_active = %s WHERE id = %s',
+        'UPDATE public.categories SET is_active = %s WHERE id = %s',
         (new_status, category_id)
     )
     
     if result and result > 0:
         # Сигнализируем боту о необходимости обновления
+        view_cache.invalidate('categories')
         telegram_bot.trigger_bot_data_reload()
         
         status_text = "активирована" if new_status else "скрыта"
@@ -1176,13 +1172,14 @@ def edit_category():
     emoji = request.form.get('emoji', '')
     
     result = db.execute_query('''
-        UPDATE categories 
+        UPDATE public.categories 
         SET name = %s, description = %s, emoji = %s
         WHERE id = %s
     ''', (name, description, emoji, category_id))
     
     if result and result > 0:
         # Сигнализируем боту о необходимости обновления
+        view_cache.invalidate('categories')
         telegram_bot.trigger_bot_data_reload()
         
         flash(f'Категория "{name}" обновлена!')
@@ -1207,7 +1204,7 @@ def delete_category():
     try:
         # Проверяем, есть ли товары в этой категории
         products = db.execute_query(
-            'SELECT COUNT(*) FROM products WHERE category_id = %s',
+            'SELECT COUNT(*) FROM public.products WHERE category_id = %s',
             (category_id,)
         )
 
@@ -1217,11 +1214,12 @@ def delete_category():
 
         # Удаляем категорию
         result = db.execute_query(
-            'DELETE FROM categories WHERE id = %s',
+            'DELETE FROM public.categories WHERE id = %s',
             (category_id,)
         )
 
         if result:
+            view_cache.invalidate('categories')
             telegram_bot.trigger_bot_data_reload()
             flash('Категория успешно удалена!')
         else:
@@ -1235,6 +1233,7 @@ def delete_category():
 @login_required
 def reload_bot_data():
     """Принудительная перезагрузка данных в боте"""
+    view_cache.clear()
     try:
         # Сигнализируем боту о необходимости обновления
         if telegram_bot.trigger_bot_data_reload():
@@ -1251,11 +1250,11 @@ def reload_bot_data():
 @login_required
 def force_reload_bot():
     """Принудительная перезагрузка всех данных в боте"""
+    view_cache.clear()
     try:
-        # Создаем специальный флаг для полной перезагрузки
-        force_reload_flag = '../force_reload_flag.txt'
-        with open(force_reload_flag, 'w') as f:
-            f.write(datetime.now().isoformat())
+        # Сигнал полной перезагрузки через шину инвалидации
+        if not telegram_bot.force_bot_reload():
+            raise RuntimeError('сигнал перезагрузки не отправлен')
         
         # Уведомляем админов
         reload_message = "🔄 <b>ПРИНУДИТЕЛЬНОЕ ОБНОВЛЕНИЕ</b>\n\n"
@@ -1281,46 +1280,29 @@ def chart_data():
     end_date = datetime.now()
     start_date = end_date - timedelta(days=period)
     
-    if chart_type == 'sales':
-        # Данные продаж по дням
-        sales_data = db.execute_query('''
-            SELECT 
-                DATE(created_at) as date,
-                COALESCE(SUM(total_amount), 0) as daily_revenue
-            FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
-            AND status != 'cancelled'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        
-        labels = [item[0] for item in sales_data] if sales_data else []
-        data = [float(item[1]) for item in sales_data] if sales_data else []
-        
-    elif chart_type == 'orders':
-        # Количество заказов по дням
-        orders_data = db.execute_query('''
-            SELECT 
-                DATE(created_at) as date,
-                COUNT(*) as daily_orders
-            FROM orders
-            WHERE DATE(created_at) BETWEEN ? AND ?
-            AND status != 'cancelled'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        
-        labels = [item[0] for item in orders_data] if orders_data else []
-        data = [item[1] for item in orders_data] if orders_data else []
+    return jsonify(view_cache.get('chart_data', {'type': chart_type, 'period': period, 'day': end_date.date()},
+                                  lambda: _chart_data(chart_type, start_date, end_date),
+                                  tags=('orders',)))
+
+
+def _chart_data(chart_type, start_date, end_date):
+    if chart_type in ('sales', 'orders'):
+        # Выручка или количество заказов по дням из sales_daily
+        daily = get_daily_sales(db, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        labels = [str(row[0]) for row in daily]
+        if chart_type == 'sales':
+            data = [float(row[2]) for row in daily]
+        else:
+            data = [row[1] for row in daily]
     
     else:
         labels = []
         data = []
     
-    return jsonify({
+    return {
         'labels': labels,
         'data': data
-    })
+    }
 
 @app.route('/api/test_telegram')
 @login_required
@@ -1342,32 +1324,27 @@ def test_telegram():
             'error': str(e)
         })
 
+def _export(rows, header, filename, default_format='csv', sheet_name=None):
+    """Потоковая выгрузка в формате из ?format= (csv | xlsx)"""
+    return export_response(rows, header, filename,
+                           fmt=export_format(request.args.get('format'), default_format),
+                           accept_encoding=request.headers.get('Accept-Encoding', ''),
+                           sheet_name=sheet_name)
+
 @app.route('/export_orders')
 @login_required
 def export_orders():
     try:
-        import csv
-        from io import StringIO
-
-        orders = db.execute_query('''
-            SELECT o.id, o.created_at, u.full_name, u.phone,
+        orders = db.iter_query('''
+            SELECT o.id, o.created_at, u.name, u.phone,
                    o.total_amount, o.status, o.delivery_address
-            FROM orders o
-            LEFT JOIN users u ON u.id = o.user_id
+            FROM public.orders o
+            LEFT JOIN public.users u ON u.id = o.user_id
             ORDER BY o.created_at DESC
-        ''') or []
-
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['ID', 'Дата', 'Клиент', 'Телефон', 'Сумма', 'Статус', 'Адрес'])
-
-        for order in orders:
-            writer.writerow(order)
+        ''', batch_size=EXPORT_CONFIG['batch_size'])
 
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = 'attachment; filename=orders.csv'
-        return response
+        return _export(orders, ['ID', 'Дата', 'Клиент', 'Телефон', 'Сумма', 'Статус', 'Адрес'],
+                       'orders', sheet_name='Заказы')
     except Exception as e:
         flash(f'Ошибка экспорта: {e}')
         return redirect(url_for('orders'))
@@ -1376,28 +1353,16 @@ def export_orders():
 @login_required
 def export_products():
     try:
-        import csv
-        from io import StringIO
-
-        products = db.execute_query('''
+        products = db.iter_query('''
             SELECT p.id, p.name, p.price, p.stock, p.is_active,
-                   c.name as category, p.sales_count, p.views_count
-            FROM products p
-            LEFT JOIN categories c ON c.id = p.category_id
+                   c.name as category, p.sales_count, p.views
+            FROM public.products p
+            LEFT JOIN public.categories c ON c.id = p.category_id
             ORDER BY p.id
-        ''') or []
+        ''', batch_size=EXPORT_CONFIG['batch_size'])
 
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['ID', 'Название', 'Цена', 'Остаток', 'Активен', 'Категория', 'Продаж', 'Просмотров'])
-
-        for product in products:
-            writer.writerow(product)
-
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = 'attachment; filename=products.csv'
-        return response
+        return _export(products, ['ID', 'Название', 'Цена', 'Остаток', 'Активен', 'Категория', 'Продаж', 'Просмотров'],
+                       'products', sheet_name='Товары')
     except Exception as e:
         flash(f'Ошибка экспорта: {e}')
         return redirect(url_for('products'))
@@ -1406,31 +1371,19 @@ def export_products():
 @login_required
 def export_customers():
     try:
-        import csv
-        from io import StringIO
-
-        customers = db.execute_query('''
-            SELECT u.id, u.full_name, u.phone, u.language_code,
-                   u.created_at, u.is_active, u.is_banned,
+        customers = db.iter_query('''
+            SELECT u.id, u.name, u.phone, u.language,
+                   u.created_at, u.is_registered,
                    COUNT(DISTINCT o.id) as orders_count,
                    COALESCE(SUM(o.total_amount), 0) as total_spent
-            FROM users u
-            LEFT JOIN orders o ON o.user_id = u.id AND o.status != 'cancelled'
+            FROM public.users u
+            LEFT JOIN public.orders o ON o.user_id = u.id AND o.status != 'cancelled'
             GROUP BY u.id
             ORDER BY total_spent DESC
-        ''') or []
+        ''', batch_size=EXPORT_CONFIG['batch_size'])
 
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['ID', 'Имя', 'Телефон', 'Язык', 'Регистрация', 'Активен', 'Заблокирован', 'Заказов', 'Потрачено'])
-
-        for customer in customers:
-            writer.writerow(customer)
-
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = 'attachment; filename=customers.csv'
-        return response
+        return _export(customers, ['ID', 'Имя', 'Телефон', 'Язык', 'Регистрация', 'Зарегистрирован', 'Заказов', 'Потрачено'],
+                       'customers', sheet_name='Клиенты')
     except Exception as e:
         flash(f'Ошибка экспорта: {e}')
         return redirect(url_for('customers'))
@@ -1439,101 +1392,70 @@ def export_customers():
 @login_required
 def export_analytics():
     try:
-        import csv
-        from io import StringIO
-
-        period = request.args.get('period', '7')
-
-        analytics_data = db.execute_query(f'''
-            SELECT DATE(o.created_at) as date,
-                   COUNT(DISTINCT o.id) as orders,
-                   COALESCE(SUM(o.total_amount), 0) as revenue,
-                   COALESCE(AVG(o.total_amount), 0) as avg_order,
-                   COUNT(DISTINCT o.user_id) as customers
-            FROM orders o
-            WHERE o.created_at >= NOW() - INTERVAL '{period} days'
-                  AND o.status != 'cancelled'
-            GROUP BY DATE(o.created_at)
-            ORDER BY date DESC
-        ''') or []
-
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Дата', 'Заказов', 'Выручка', 'Средний чек', 'Клиентов'])
+        try:
+            period = max(1, int(request.args.get('period', '7')))
+        except ValueError:
+            period = 7
 
-        for row in analytics_data:
-            writer.writerow(row)
+        # Дневная сводка: строк не больше, чем дней в периоде
+        today = datetime.now().date()
+        analytics_data = get_daily_sales(db, (today - timedelta(days=period)).isoformat(), today.isoformat(),
+                                         newest_first=True)
 
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename=analytics_{period}days.csv'
-        return response
+        return _export(analytics_data, ['Дата', 'Заказов', 'Выручка', 'Средний чек', 'Клиентов'],
+                       f'analytics_{period}days', sheet_name='Аналитика')
     except Exception as e:
         flash(f'Ошибка экспорта аналитики: {e}')
         return redirect(url_for('analytics_page'))
 
+def _financial_export_rows(categories):
+    """Строки финансового отчёта с маржой и итогом в конце"""
+    for row in categories:
+        margin = ((row[3] / row[1] * 100) if row[1] > 0 else 0)
+        yield [row[0], row[1], row[2], row[3], f'{margin:.1f}%', row[4]]
+
+    total_row = db.execute_query('''
+        SELECT
+            COALESCE(SUM(oi.quantity * COALESCE(oi.price, 0)), 0) as revenue,
+            COALESCE(SUM(oi.quantity * COALESCE(p.cost_price, 0)), 0) as cost,
+            COUNT(DISTINCT o.id) as orders
+        FROM public.orders o
+        JOIN public.order_items oi ON oi.order_id = o.id
+        JOIN public.products p ON p.id = oi.product_id
+        WHERE o.status != 'cancelled'
+    ''')
+
+    if total_row and total_row[0]:
+        total_revenue = total_row[0][0]
+        total_cost = total_row[0][1]
+        total_profit = total_revenue - total_cost
+        total_margin = ((total_profit / total_revenue * 100) if total_revenue > 0 else 0)
+        total_orders = total_row[0][2]
+
+        yield []
+        yield ['ИТОГО', total_revenue, total_cost, total_profit, f'{total_margin:.1f}%', total_orders]
+
 @app.route('/export_financial')
 @login_required
 def export_financial():
     try:
-        import csv
-        from io import StringIO
-
-        format_type = request.args.get('format', 'excel')
-
-        financial_data = db.execute_query('''
+        financial_data = db.iter_query('''
             SELECT c.name as category,
                    COALESCE(SUM(oi.quantity * COALESCE(oi.price, 0)), 0) as revenue,
                    COALESCE(SUM(oi.quantity * COALESCE(p.cost_price, 0)), 0) as cost,
                    COALESCE(SUM(oi.quantity * COALESCE(oi.price, 0)) - SUM(oi.quantity * COALESCE(p.cost_price, 0)), 0) as profit,
                    COUNT(DISTINCT o.id) as orders
-            FROM categories c
-            LEFT JOIN products p ON p.category_id = c.id
-            LEFT JOIN order_items oi ON oi.product_id = p.id
-            LEFT JOIN orders o ON o.id = oi.order_id AND o.status != 'cancelled'
+            FROM public.categories c
+            LEFT JOIN public.products p ON p.category_id = c.id
+            LEFT JOIN public.order_items oi ON oi.product_id = p.id
+            LEFT JOIN public.orders o ON o.id = oi.order_id AND o.status != 'cancelled'
             GROUP BY c.id, c.name
             ORDER BY revenue DESC
-        ''') or []
+        ''', batch_size=EXPORT_CONFIG['batch_size'])
 
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Категория', 'Выручка', 'Себестоимость', 'Прибыль', 'Маржа %', 'Заказов'])
-
-        for row in financial_data:
-            margin = ((row[3] / row[1] * 100) if row[1] > 0 else 0)
-            writer.writerow([row[0], row[1], row[2], row[3], f'{margin:.1f}%', row[4]])
-
-        total_row = db.execute_query('''
-            SELECT
-                COALESCE(SUM(oi.quantity * COALESCE(oi.price, 0)), 0) as revenue,
-                COALESCE(SUM(oi.quantity * COALESCE(p.cost_price, 0)), 0) as cost,
-                COUNT(DISTINCT o.id) as orders
-            FROM orders o
-            JOIN order_items oi ON oi.order_id = o.id
-            JOIN products p ON p.id = oi.product_id
-            WHERE o.status != 'cancelled'
-        ''')
-
-        if total_row and total_row[0]:
-            total_revenue = total_row[0][0]
-            total_cost = total_row[0][1]
-            total_profit = total_revenue - total_cost
-            total_margin = ((total_profit / total_revenue * 100) if total_revenue > 0 else 0)
-            total_orders = total_row[0][2]
-
-            writer.writerow([])
-            writer.writerow(['ИТОГО', total_revenue, total_cost, total_profit, f'{total_margin:.1f}%', total_orders])
-
-        response = make_response(output.getvalue())
-
-        if format_type == 'csv':
-            response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-            response.headers['Content-Disposition'] = 'attachment; filename=financial_report.csv'
-        else:
-            response.headers['Content-Type'] = 'application/vnd.ms-excel; charset=utf-8'
-            response.headers['Content-Disposition'] = 'attachment; filename=financial_report.xls'
-
-        return response
+        return _export(_financial_export_rows(financial_data),
+                       ['Категория', 'Выручка', 'Себестоимость', 'Прибыль', 'Маржа %', 'Заказов'],
+                       'financial_report', default_format='xlsx', sheet_name='Финансы')
     except Exception as e:
         flash(f'Ошибка экспорта финансового отчёта: {e}')
         return redirect(url_for('financial_page'))
@@ -1548,6 +1470,11 @@ def _int_or(v, default=0):
 @app.route('/reports/profit')
 @login_required
 def profit_report():
+    data = view_cache.get('profit_report', {}, _profit_data, tags=('orders', 'products', 'categories'))
+    return render_template('report_profit.html', **data)
+
+
+def _profit_data():
     # Определяем колонку цены в order_items, если таблица существует
     price_col = None
     try:
@@ -1579,8 +1506,8 @@ def profit_report():
                    0 as revenue,
                    COALESCE(SUM(oi.quantity * COALESCE(p.cost_price,0)), 0) as cost,
                    0 - COALESCE(SUM(oi.quantity * COALESCE(p.cost_price,0)), 0) as profit
-            FROM products p
-            LEFT JOIN order_items oi ON oi.product_id = p.id
+            FROM public.products p
+            LEFT JOIN public.order_items oi ON oi.product_id = p.id
             GROUP BY p.id, p.name
             ORDER BY profit DESC
             LIMIT 200
@@ -1606,9 +1533,9 @@ def profit_report():
                    0 as revenue,
                    COALESCE(SUM(oi.quantity * COALESCE(p.cost_price,0)), 0) as cost,
                    0 - COALESCE(SUM(oi.quantity * COALESCE(p.cost_price,0)), 0) as profit
-            FROM categories c
-            LEFT JOIN products p ON p.category_id = c.id
-            LEFT JOIN order_items oi ON oi.product_id = p.id
+            FROM public.categories c
+            LEFT JOIN public.products p ON p.category_id = c.id
+            LEFT JOIN public.order_items oi ON oi.product_id = p.id
             GROUP BY c.id, c.name
             ORDER BY profit DESC
             LIMIT 100
@@ -1617,11 +1544,10 @@ def profit_report():
     # Топ-10 для графиков
     top_products = [{"name": r[1], "profit": r[4]} for r in product_rows[:10]]
     top_categories = [{"name": r[1], "profit": r[4]} for r in cat_rows[:10]]
-    return render_template('report_profit.html',
-                           product_rows=product_rows,
-                           category_rows=cat_rows,
-                           top_products=top_products,
-                           top_categories=top_categories)
+    return dict(product_rows=product_rows,
+                category_rows=cat_rows,
+                top_products=top_products,
+                top_categories=top_categories)
 
 
 @app.route('/crm/quick_action', methods=['POST'])
@@ -1635,34 +1561,36 @@ def crm_quick_action():
     try:
         if action == 'send_coupon':
             code = f'PROMO{int(datetime.now().timestamp())%100000}'
-            db.execute_query('INSERT INTO promo_codes (code, discount_type, discount_value, is_active, created_at) VALUES (%s, %s, %s, 1, NOW())', (code, 'percent', 10))
+            db.execute_query('INSERT INTO public.promo_codes (code, discount_type, discount_value, is_active, created_at) VALUES (%s, %s, %s, 1, NOW())', (code, 'percent', 10))
             # try notify user
-            user = db.execute_query('SELECT telegram_id FROM users WHERE id=?', (user_id,))
+            user = db.execute_query('SELECT telegram_id FROM public.users WHERE id=?', (user_id,))
             if user and user[0][0]:
                 telegram_bot.send_message(user[0][0], f'🎁 Для вас промокод: <b>{code}</b> на скидку 10%')
             flash('Промокод отправлен')
         elif action == 'ban_user':
-            db.execute_query('UPDATE users SET is_banned=1 WHERE id=?', (user_id,))
+            db.execute_query('UPDATE public.users SET is_banned = TRUE WHERE id=?', (user_id,))
             flash('Пользователь заблокирован')
         elif action == 'mark_vip':
-            db.execute_query('UPDATE users SET is_vip=1 WHERE id=?', (user_id,))
+            db.execute_query('UPDATE public.users SET is_vip = TRUE WHERE id=?', (user_id,))
             flash('Пользователь отмечен как VIP')
         else:
             flash('Неизвестное действие')
     except Exception as e:
         flash(f'Ошибка действия: {e}')
+    view_cache.invalidate('customers')
     return redirect(url_for('crm_page'))
 
 
 @app.route('/categories/toggle/<string:cid>', methods=['POST'])
 @login_required
 def toggle_category(cid):
-    row = db.execute_query('SELECT is_active FROM categories WHERE id=?', (cid,))
+    row = db.execute_query('SELECT is_active FROM public.categories WHERE id=?', (cid,))
     if not row:
         flash('Категория не найдена')
     else:
         newv = 0 if (row[0][0] or 0)==1 else 1
-        db.execute_query('UPDATE categories SET is_active=? WHERE id=?', (newv, cid))
+        db.execute_query('UPDATE public.categories SET is_active=? WHERE id=?', (newv, cid))
+        view_cache.invalidate('categories')
         flash('Категория ' + ('скрыта' if newv==0 else 'показана'))
     return redirect(url_for('categories'))
 
@@ -1671,64 +1599,73 @@ def toggle_category(cid):
 @login_required
 def inventory_page():
     try:
-        rows = db.execute_query('''
-            SELECT COUNT(*), COALESCE(SUM(stock),0), COALESCE(SUM(stock*COALESCE(cost_price,0)),0)
-            FROM products WHERE is_active=TRUE
-        ''') or [(0,0,0)]
-        product_count, total_stock, stock_cost = rows[0]
-
-        low_stock_rows = db.execute_query('''
-            SELECT id, name, stock FROM products
-            WHERE is_active=TRUE AND stock<=5
-            ORDER BY stock ASC LIMIT 20
-        ''') or []
+        data = view_cache.get('inventory', {}, _inventory_data, tags=('products',))
+        return render_template('inventory.html', **data)
+    except Exception as e:
+        flash(f'Ошибка загрузки склада: {e}')
+        return redirect(url_for('dashboard'))
 
-        low_stock = {
-            'critical': [row for row in low_stock_rows if row[2] == 0],
-            'low': [row for row in low_stock_rows if row[2] > 0]
-        }
 
-        top_products = db.execute_query('''
-            SELECT name, stock, COALESCE(cost_price, 0),
-                   stock * COALESCE(cost_price, 0) as total_value
-            FROM products
-            WHERE is_active=TRUE AND stock > 0
-            ORDER BY total_value DESC
-            LIMIT 10
-        ''') or []
+def _inventory_data():
+    rows = db.execute_query('''
+        SELECT COUNT(*), COALESCE(SUM(stock),0), COALESCE(SUM(stock*COALESCE(cost_price,0)),0)
+        FROM public.products WHERE is_active=TRUE
+    ''') or [(0,0,0)]
+    product_count, total_stock, stock_cost = rows[0]
 
-        inventory_summary = {
-            'total_products': product_count,
-            'total_units': total_stock,
-            'total_value': stock_cost,
-            'top_value_products': top_products
-        }
+    low_stock_rows = db.execute_query('''
+        SELECT id, name, stock FROM public.products
+        WHERE is_active=TRUE AND stock<=5
+        ORDER BY stock ASC LIMIT 20
+    ''') or []
 
-        abc_analysis = {
-            'total_value': stock_cost,
-            'categories': {'A': [], 'B': [], 'C': []}
-        }
+    low_stock = {
+        'critical': [row for row in low_stock_rows if row[2] == 0],
+        'low': [row for row in low_stock_rows if row[2] > 0]
+    }
 
-        return render_template('inventory.html',
-                               inventory_summary=inventory_summary,
-                               low_stock=low_stock,
-                               abc_analysis=abc_analysis)
-    except Exception as e:
-        flash(f'Ошибка загрузки склада: {e}')
-        return redirect(url_for('dashboard'))
+    top_products = db.execute_query('''
+        SELECT name, stock, COALESCE(cost_price, 0),
+               stock * COALESCE(cost_price, 0) as total_value
+        FROM public.products
+        WHERE is_active=TRUE AND stock > 0
+        ORDER BY total_value DESC
+        LIMIT 10
+    ''') or []
+
+    inventory_summary = {
+        'total_products': product_count,
+        'total_units': total_stock,
+        'total_value': stock_cost,
+        'top_value_products': top_products
+    }
+
+    abc_analysis = {
+        'total_value': stock_cost,
+        'categories': {'A': [], 'B': [], 'C': []}
+    }
+
+    return dict(inventory_summary=inventory_summary,
+                low_stock=low_stock,
+                abc_analysis=abc_analysis)
 
 
 
 @app.route('/financial', methods=['GET'], endpoint='financial_page')
 @login_required
 def financial_page():
+    data = view_cache.get('financial', {}, _financial_data, tags=('orders', 'products', 'categories'))
+    return render_template('financial.html', **data)
+
+
+def _financial_data():
     # Compute sales KPIs robustly
     try:
         sales = db.execute_query("""
             SELECT
                 COALESCE(SUM(total_amount), 0) AS revenue,
                 COUNT(*) AS orders
-            FROM orders
+            FROM public.orders
             WHERE status!='cancelled'
         """) or []
     except Exception:
@@ -1746,8 +1683,8 @@ def financial_page():
     try:
         cost_row = db.execute_query("""
             SELECT COALESCE(SUM(oi.quantity * oi.price), 0) AS cost
-            FROM order_items oi
-            JOIN orders o ON o.id = oi.order_id
+            FROM public.order_items oi
+            JOIN public.orders o ON o.id = oi.order_id
             WHERE o.status!='cancelled'
         """) or []
     except Exception:
@@ -1763,10 +1700,10 @@ def financial_page():
             SELECT
                 c.name AS name,
                 COALESCE(SUM(oi.quantity * oi.price), 0) AS rev
-            FROM order_items oi
-            JOIN products p ON p.id = oi.product_id
-            JOIN categories c ON c.id = p.category_id
-            JOIN orders o ON o.id = oi.order_id
+            FROM public.order_items oi
+            JOIN public.products p ON p.id = oi.product_id
+            JOIN public.categories c ON c.id = p.category_id
+            JOIN public.orders o ON o.id = oi.order_id
             WHERE o.status!='cancelled'
             GROUP BY c.id, c.name
             ORDER BY rev DESC
@@ -1783,5 +1720,5 @@ def financial_page():
         'aov': aov or 0,
     }
 
-    return render_template('financial.html', metrics=metrics, by_cat=by_cat,
-                           revenue=revenue, orders_count=orders_count, aov=aov)
\ No newline at end of file
+    return dict(metrics=metrics, by_cat=by_cat,
+                revenue=revenue, orders_count=orders_count, aov=aov)
\ No newline at end of file
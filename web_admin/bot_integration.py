@@ -5,56 +5,51 @@ import logging
 
 import sys
 import os
-import json
-import urllib.request
-import urllib.parse
 import time
 
 # Добавляем путь к модулям бота
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BOT_TOKEN, POST_CHANNEL_ID
+from config import BOT_TOKEN, POST_CHANNEL_ID, OUTBOUND_CONFIG
+from invalidation_bus import create_bus, PgNotifyBus
+from telegram_api import get_client
+from outbound import MARKETING, NOTIFICATION, delivery_counts, process_global_rate
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 class TelegramBotIntegration:
     def __init__(self):
         self.token = BOT_TOKEN
-        self.base_url = f"https://api.telegram.org/bot{self.token}"
+        self.api = get_client(self.token)
+        if self.api.scheduler is not None:
+            # Доля общего лимита Telegram на этот воркер админки
+            self.api.scheduler.set_global_rate(
+                process_global_rate(OUTBOUND_CONFIG, 'web', OUTBOUND_CONFIG['web_processes']))
         self.channel_id = POST_CHANNEL_ID
+        self.invalidation_bus = create_bus(directory=BASE_DIR)
     
     def trigger_bot_data_reload(self):
         """Сигнал боту о необходимости перезагрузки данных"""
+        # С LISTEN/NOTIFY изменённые строки приходят боту из триггеров базы,
+        # полная перезагрузка не нужна
+        if isinstance(self.invalidation_bus, PgNotifyBus):
+            return True
+        return self.force_bot_reload()
+
+    def force_bot_reload(self):
+        """Полная перезагрузка кэшей бота"""
         try:
-            # Создаем файл-флаг для бота
-            update_flag_file = os.path.join(BASE_DIR, 'data_update_flag.txt')
-            with open(update_flag_file, 'w') as f:
-                f.write(str(time.time()))
+            self.invalidation_bus.publish_reload()
             return True
         except Exception as e:
-            logging.info(f"Ошибка создания флага обновления: {e}")
+            logging.error(f"Ошибка отправки сигнала обновления: {e}")
             return False
     
-    def send_message(self, chat_id, text, reply_markup=None):
-        """Отправка сообщения через Telegram API"""
-        url = f"{self.base_url}/sendMessage"
-        data = {
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': 'HTML'
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        try:
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_encoded, method='POST')
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result
-        except Exception as e:
-            logging.info(f"Ошибка отправки сообщения: {e}")
-            return None
+    def send_message(self, chat_id, text, reply_markup=None, priority=NOTIFICATION, wait=True):
+        """Отправка сообщения через Telegram API (wait=False — Future)"""
+        result = self.api.send_message(chat_id, text, reply_markup, priority=priority, wait=wait)
+        if wait and result is None:
+            logging.info("Ошибка отправки сообщения")
+        return result
     
     def send_to_channel(self, message):
         """Отправка сообщения в канал"""
@@ -64,47 +59,22 @@ class TelegramBotIntegration:
         """Отправка фото в канал"""
         return self.send_photo(self.channel_id, photo_url, caption, reply_markup)
     
-    def send_photo(self, chat_id, photo_url, caption="", reply_markup=None):
-        """Отправка фото"""
-        url = f"https://api.telegram.org/bot{self.token}/sendPhoto"
-        data = {
-            'chat_id': chat_id,
-            'photo': photo_url,
-            'caption': caption,
-            'parse_mode': 'HTML'
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        try:
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            req = urllib.request.Request(url, data=data_encoded, method='POST')
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result
-        except Exception as e:
-            logging.info(f"Ошибка отправки фото: {e}")
-            return None
+    def send_photo(self, chat_id, photo_url, caption="", reply_markup=None, priority=NOTIFICATION, wait=True):
+        """Отправка фото (wait=False — Future)"""
+        result = self.api.send_photo(chat_id, photo_url, caption, reply_markup, priority=priority, wait=wait)
+        if wait and result is None:
+            logging.info("Ошибка отправки фото")
+        return result
     
     def send_broadcast(self, message, user_list):
         """Массовая рассылка"""
-        success_count = 0
-        error_count = 0
-        
+        # Все получатели сразу в очередь отправки; лимиты соблюдает планировщик
+        pending = []
         for user in user_list:
             telegram_id = user[0] if isinstance(user, (list, tuple)) else user.get('telegram_id')
-            try:
-                result = self.send_message(telegram_id, message)
-                if result and result.get('ok'):
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                error_count += 1
-                logging.info(f"Ошибка отправки пользователю {telegram_id}: {e}")
+            pending.append(self.send_message(telegram_id, message, priority=MARKETING, wait=False))
         
-        return success_count, error_count
+        return delivery_counts(pending)
     
     def notify_admins(self, message):
         """Уведомление всех админов"""
@@ -113,7 +83,7 @@ class TelegramBotIntegration:
             db = DatabaseManager()
             
             admins = db.execute_query(
-                'SELECT telegram_id FROM users WHERE is_admin = 1'
+                'SELECT telegram_id FROM public.users WHERE is_admin = TRUE'
             )
             
             for admin in admins:
@@ -124,14 +94,8 @@ class TelegramBotIntegration:
     
     def test_connection(self):
         """Тестирование соединения с Telegram"""
-        try:
-            url = f"{self.base_url}/getMe"
-            with urllib.request.urlopen(url) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result.get('ok', False)
-        except Exception as e:
-            logging.info(f"Ошибка тестирования соединения: {e}")
-            return False
+        result = self.api.get_me()
+        return bool(result and result.get('ok', False))
 
 # Глобальный экземпляр для использования в Flask
 telegram_bot = TelegramBotIntegration()
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Кэш данных тяжёлых страниц веб-админки (дашборд, аналитика, CRM, склад,
+финансы, отчёт о прибыли).
+
+Кэшируется не готовый HTML, а результат функции, которая собирает данные
+для шаблона: ключ — имя страницы и её параметры (период, тип графика).
+- Запись свежая ttl секунд; ещё stale_ttl секунд после этого отдаётся
+  устаревшее значение, а пересчёт идёт в фоновом потоке.
+- Пересчёт одного ключа выполняет один запрос (single-flight): остальные
+  ждут его результата, а не дублируют агрегаты в базе.
+- Изменяющие маршруты сбрасывают записи по тегам ('orders', 'products',
+  'categories', 'customers'); имя страницы — тоже тег. Результат расчёта,
+  начатого до сброса, в кэш не попадает.
+
+Кэш у каждого процесса свой. Заказы, которые создаёт бот, видны в админке
+с задержкой не больше ttl.
+
+Значения общие для всех запросов — изменять их после получения нельзя.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('web_admin.cache')
+
+
+class _Entry:
+    __slots__ = ('value', 'fresh_until', 'stale_until', 'tags')
+
+    def __init__(self, value, fresh_until, stale_until, tags):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.tags = tags
+
+
+class _Flight:
+    """Идущий пересчёт ключа; generation — номер сброса на момент старта"""
+    __slots__ = ('event', 'value', 'error', 'generation')
+
+    def __init__(self, generation):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.generation = generation
+
+
+def cache_key(view, params=None):
+    """Ключ записи: страница + отсортированные параметры"""
+    return (view, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+
+
+class ViewCache:
+    """TTL-кэш с single-flight и stale-while-revalidate"""
+
+    def __init__(self, ttl=60, stale_ttl=300, max_entries=256, wait_timeout=30, enabled=True):
+        self.ttl = ttl
+        self.stale_ttl = max(0, stale_ttl)
+        self.max_entries = max(1, max_entries)
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled and ttl > 0
+        self._entries = OrderedDict()  # key -> _Entry
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._tag_generation = {}  # tag -> номер последнего сброса
+        self._cleared_generation = 0
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'waits': 0, 'refreshes': 0,
+                      'errors': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, view, params, compute, tags=(), ttl=None):
+        """Значение для view/params; при промахе — compute() без аргументов.
+
+        Ошибка compute() пробрасывается вызывающему (и всем, кто ждал тот же
+        ключ) и в кэш не попадает.
+        """
+        if not self.enabled:
+            return compute()
+        key = cache_key(view, params)
+        tags = frozenset((view,) + tuple(tags))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry.value
+            flight = self._flights.get(key)
+            if flight is not None and self._stale_flight(flight, tags):
+                flight = None  # начат до сброса — его результат уже неактуален
+            if entry is not None and now < entry.stale_until:
+                self.stats['stale_hits'] += 1
+                if flight is None:
+                    flight = self._flights[key] = _Flight(self._generation)
+                    self.stats['refreshes'] += 1
+                    threading.Thread(target=self._refresh, args=(key, flight, compute, tags, ttl),
+                                     name=f'view-cache-{view}', daemon=True).start()
+                return entry.value
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight(self._generation)
+                self.stats['misses'] += 1
+            else:
+                self.stats['waits'] += 1
+
+        if owner:
+            self._run(key, flight, compute, tags, ttl)
+        elif not flight.event.wait(self.wait_timeout):
+            logger.warning(f"Пересчёт {view} идёт дольше {self.wait_timeout}s — считаем без кэша")
+            return compute()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _stale_flight(self, flight, tags):
+        """Под self._lock: был ли сброс по tags после старта пересчёта"""
+        if self._cleared_generation > flight.generation:
+            return True
+        return any(self._tag_generation.get(tag, 0) > flight.generation for tag in tags)
+
+    def _run(self, key, flight, compute, tags, ttl):
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if flight.error is not None:
+                self.stats['errors'] += 1
+            elif not self._stale_flight(flight, tags):
+                self._store(key, flight.value, tags, ttl)
+        flight.event.set()
+
+    def _refresh(self, key, flight, compute, tags, ttl):
+        """Фоновый пересчёт устаревшей записи; при ошибке остаётся старое значение"""
+        self._run(key, flight, compute, tags, ttl)
+        if flight.error is not None:
+            logger.warning(f"Фоновый пересчёт {key[0]}: {flight.error}")
+
+    def _store(self, key, value, tags, ttl):
+        """Под self._lock"""
+        now = time.monotonic()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        self._entries[key] = _Entry(value, fresh_until, fresh_until + self.stale_ttl, tags)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, *tags):
+        """Сбросить записи с любым из тегов; возвращает число удалённых"""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._tag_generation[tag] = self._generation
+            wanted = set(tags)
+            dropped = [key for key, entry in self._entries.items() if entry.tags & wanted]
+            for key in dropped:
+                del self._entries[key]
+            self.stats['invalidations'] += 1
+        return len(dropped)
+
+    def clear(self):
+        """Сбросить всё"""
+        with self._lock:
+            self._generation += 1
+            self._cleared_generation = self._generation
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), inflight=len(self._flights),
+                        enabled=self.enabled, ttl=self.ttl, stale_ttl=self.stale_ttl)
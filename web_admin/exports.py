@@ -0,0 +1,198 @@
+"""
+Потоковые выгрузки веб-админки: CSV (со сжатием gzip) и XLSX.
+
+Строки приходят итератором (SupabaseManager.iter_query читает их серверным
+курсором пачками) и кодируются в ответ кусками по CHUNK_SIZE, поэтому
+память воркера не зависит от числа строк, а скачивание начинается сразу
+после первой пачки. XLSX пишется стандартным zipfile прямо в поток — без
+openpyxl и временных файлов.
+"""
+import re
+import csv
+import io
+import math
+import zlib
+import zipfile
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from flask import Response
+
+from config import EXPORT_CONFIG
+
+CHUNK_SIZE = 64 * 1024
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_SHEET_NAME_ILLEGAL = re.compile(r'[\[\]:*?/\\]')
+
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_DOC_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+_CONTENT_TYPES = _XML_HEAD + (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = _XML_HEAD + (
+    f'<Relationships xmlns="{_REL_NS}">'
+    f'<Relationship Id="rId1" Type="{_DOC_REL}/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = _XML_HEAD + (
+    f'<Relationships xmlns="{_REL_NS}">'
+    f'<Relationship Id="rId1" Type="{_DOC_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+    f'<Relationship Id="rId2" Type="{_DOC_REL}/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES = _XML_HEAD + (
+    f'<styleSheet xmlns="{_MAIN_NS}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (_XML_HEAD + f'<worksheet xmlns="{_MAIN_NS}"><sheetData>').encode('utf-8')
+_SHEET_TAIL = b'</sheetData></worksheet>'
+
+
+class _Sink:
+    """Файл только для записи: zipfile пишет сюда, генератор забирает куски"""
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        self.size = 0
+        return data
+
+
+def iter_csv(header, rows):
+    """CSV кусками байт UTF-8"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Сжатие потока кусков в формат gzip"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)) and not (isinstance(value, float) and not math.isfinite(value)):
+        return f'<c><v>{value!r}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return ('<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>').encode('utf-8')
+
+
+def iter_xlsx(header, rows, sheet_name='Export'):
+    """Книга XLSX с одним листом кусками байт"""
+    sheet_name = _SHEET_NAME_ILLEGAL.sub('_', sheet_name)[:31] or 'Export'
+    workbook = _XML_HEAD + (
+        f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_DOC_REL}"><sheets>'
+        f'<sheet name="{escape(sheet_name, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/>'
+        '</sheets></workbook>'
+    )
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', workbook)
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _STYLES)
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(_SHEET_HEAD)
+            sheet.write(_xlsx_row(header))
+            for row in rows:
+                sheet.write(_xlsx_row(row))
+                if sink.size >= CHUNK_SIZE:
+                    yield sink.take()
+            sheet.write(_SHEET_TAIL)
+    yield sink.take()
+
+
+def _primed(rows):
+    """Читаем первую строку заранее: ошибка запроса всплывёт до начала ответа"""
+    rows = iter(rows)
+    for first in rows:
+        return chain((first,), rows)
+    return iter(())
+
+
+def export_response(rows, header, filename, fmt='csv', accept_encoding='', sheet_name=None):
+    """Потоковый ответ-файл. filename — без расширения; fmt: csv | xlsx.
+
+    CSV отдаётся с Content-Encoding: gzip, если это разрешено EXPORT_GZIP и
+    браузер его принимает; XLSX уже сжат.
+    """
+    rows = _primed(rows)
+    headers = {'X-Accel-Buffering': 'no'}  # nginx не должен копить ответ целиком
+    if fmt == 'xlsx':
+        body = iter_xlsx(header, rows, sheet_name or filename)
+        content_type = XLSX_CONTENT_TYPE
+        headers['Content-Disposition'] = f'attachment; filename={filename}.xlsx'
+    else:
+        body = iter_csv(header, rows)
+        content_type = CSV_CONTENT_TYPE
+        headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+        headers['Vary'] = 'Accept-Encoding'
+        if EXPORT_CONFIG['gzip'] and 'gzip' in (accept_encoding or '').lower():
+            body = gzip_chunks(body)
+            headers['Content-Encoding'] = 'gzip'
+    return Response(body, content_type=content_type, headers=headers)
+
+
+def export_format(value, default='csv'):
+    """Формат из параметра запроса: csv | xlsx (excel/xls — тоже xlsx)"""
+    value = (value or default).strip().lower()
+    return 'xlsx' if value in ('xlsx', 'excel', 'xls') else 'csv'
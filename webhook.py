@@ -0,0 +1,143 @@
+"""
+Приём апдейтов Telegram через webhook.
+
+HTTP-сервер (stdlib, по потоку на соединение) принимает POST от Telegram,
+сверяет заголовок X-Telegram-Bot-Api-Secret-Token с BOT_CONFIG['webhook_secret']
+и сразу отвечает 200, передав апдейт в тот же UpdateDispatcher, что и
+polling. Если очереди диспетчера заполнены, отвечает 503 — Telegram
+повторит доставку позже.
+
+Повторные доставки одного update_id (ретраи Telegram, несколько процессов
+за балансировщиком) отбрасываются по короткой памяти последних id.
+"""
+import hmac
+import json
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+logger = logging.getLogger('webhook')
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY = 1024 * 1024
+
+
+class RecentUpdates:
+    """Множество последних update_id ограниченного размера"""
+
+    def __init__(self, size=10000):
+        self.size = size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, update_id):
+        """True, если id уже встречался; иначе запоминает его"""
+        with self._lock:
+            if update_id in self._ids:
+                return True
+            self._ids[update_id] = None
+            if len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            return False
+
+    def forget(self, update_id):
+        with self._lock:
+            self._ids.pop(update_id, None)
+
+
+class WebhookServer:
+    """Сервер webhook поверх UpdateDispatcher"""
+
+    def __init__(self, dispatcher, secret, path='/', host='0.0.0.0', port=8443,
+                 submit_timeout=2.0):
+        self.dispatcher = dispatcher
+        self.secret = secret or ''
+        self.path = path or '/'
+        self.host = host
+        self.port = port
+        self.submit_timeout = submit_timeout
+        self.recent = RecentUpdates()
+        self.stats = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'busy': 0, 'bad_requests': 0}
+        self._server = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body=b''):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                # Проверка живости для балансировщика
+                if self.path == '/health':
+                    self._reply(200, json.dumps(server.dispatcher.get_stats()).encode('utf-8'))
+                else:
+                    self._reply(404)
+
+            def do_POST(self):
+                status = server.handle_post(self.path, self.headers, self.rfile)
+                self._reply(status)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def handle_post(self, path, headers, body_stream):
+        """HTTP-статус ответа на POST от Telegram"""
+        if urlparse(path).path != self.path:
+            return 404
+        token = headers.get(SECRET_HEADER, '')
+        if not self.secret or not hmac.compare_digest(token.encode('utf-8'), self.secret.encode('utf-8')):
+            self.stats['rejected'] += 1
+            return 403
+        try:
+            length = int(headers.get('Content-Length') or 0)
+            if length <= 0 or length > MAX_BODY:
+                raise ValueError(f"Content-Length {length}")
+            update = json.loads(body_stream.read(length).decode('utf-8'))
+            update_id = update['update_id']
+        except (ValueError, KeyError, TypeError) as e:
+            self.stats['bad_requests'] += 1
+            logger.warning(f"Некорректный апдейт webhook: {e}")
+            # 200 — иначе Telegram будет бесконечно повторять битый апдейт
+            return 200
+        if self.recent.seen(update_id):
+            self.stats['duplicates'] += 1
+            return 200
+        if not self.dispatcher.submit(update, timeout=self.submit_timeout):
+            # Не приняли — забываем id, чтобы повторная доставка прошла
+            self.recent.forget(update_id)
+            self.stats['busy'] += 1
+            return 503
+        self.stats['accepted'] += 1
+        return 200
+
+    def serve_forever(self):
+        if not self.secret:
+            raise RuntimeError("WEBHOOK_SECRET не задан — webhook без проверки заголовка не запускается")
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        logger.info(f"Webhook слушает {self.host}:{self.port}{self.path}")
+        self._server.serve_forever()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+def webhook_path(webhook_url):
+    """Путь из публичного URL webhook (https://host/tg/hook -> /tg/hook)"""
+    return urlparse(webhook_url or '').path or '/'
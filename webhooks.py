@@ -80,13 +80,13 @@ class WebhookManager:
         try:
             # Обновляем статус заказа
             self.db.execute_query(
-                'UPDATE orders SET payment_status = "paid", status = "confirmed" WHERE id = %s',
+                'UPDATE public.orders SET payment_status = "paid", status = "confirmed" WHERE id = %s',
                 (order_id,)
             )
             
             # Получаем данные заказа
             order = self.db.execute_query(
-                'SELECT user_id FROM orders WHERE id = %s',
+                'SELECT user_id FROM public.orders WHERE id = %s',
                 (order_id,)
             )
             
@@ -98,7 +98,7 @@ class WebhookManager:
                 
                 # Уведомляем клиента
                 user = self.db.execute_query(
-                    'SELECT telegram_id, name FROM users WHERE id = %s',
+                    'SELECT telegram_id, name FROM public.users WHERE id = %s',
                     (user_id,)
                 )
                 
@@ -127,7 +127,7 @@ class WebhookManager:
         """Логирование успешного webhook'а"""
         try:
             self.db.execute_query('''
-                INSERT INTO webhook_logs (provider, order_id, user_id, status, created_at)
+                INSERT INTO public.webhook_logs (provider, order_id, user_id, status, created_at)
                 VALUES (%s, %s, %s, %s, %s)
             ''', (
                 provider,
@@ -143,7 +143,7 @@ class WebhookManager:
         """Логирование ошибки webhook'а"""
         try:
             self.db.execute_query('''
-                INSERT INTO webhook_logs (provider, status, error_message, payload_preview, created_at)
+                INSERT INTO public.webhook_logs (provider, status, error_message, payload_preview, created_at)
                 VALUES (%s, %s, %s, %s, %s)
             ''', (
                 provider,